@@ -18,7 +18,9 @@ from app.config.network_config import (
     NETWORK_LOGGING
 )
 from app.utils import LogoGenerator
-from app.middleware import init_timeout_middleware, init_logging_middleware
+from app.middleware import (
+    init_timeout_middleware, init_logging_middleware, init_profiling_middleware
+)
 
 db = SQLAlchemy()
 login_manager = LoginManager()
@@ -86,6 +88,18 @@ def create_app():
     csrf.init_app(app)
     limiter.init_app(app)
 
+    # Prometheus /metrics: count SQLAlchemy pool checkouts
+    from app.utils.metrics_registry import instrument_db_pools
+    instrument_db_pools()
+
+    # Per-request / per-statement SQL timing and the slow-query log
+    from app.utils.query_stats import instrument_queries
+    instrument_queries()
+
+    # Statement timeouts matching each request's deadline
+    from app.utils.deadline import instrument_statement_timeouts
+    instrument_statement_timeouts()
+
     # Configure CORS for local network access
     CORS(app,
          origins=CORS_CONFIG['origins'],
@@ -100,11 +114,14 @@ def create_app():
     login_manager.login_message = '请先登录以访问此页面'
 
     # Initialize services and attach to app
-    from app.services import SimulationService, FileService, ComparisonService, WorkOrderService
+    from app.services import (
+        SimulationService, FileService, ComparisonService, WorkOrderService, JobService
+    )
     app.simulation_service = SimulationService(db)
     app.file_service = FileService(db)
     app.comparison_service = ComparisonService()
     app.work_order_service = WorkOrderService(db)
+    app.job_service = JobService(db, app)
 
     # Generate system logos if they don't exist
     try:
@@ -120,6 +137,9 @@ def create_app():
     # Initialize logging middleware for system logging
     init_logging_middleware(app)
 
+    # Opt-in sampling profiler for slow requests (REQUEST_PROFILER)
+    init_profiling_middleware(app)
+
     # Update last_seen_at for authenticated users (throttled to once per minute)
     @app.before_request
     def update_last_seen():
@@ -131,7 +151,7 @@ def create_app():
                 db.session.commit()
 
     # Register blueprints
-    from app.routes import auth, main, admin, simulation
+    from app.routes import auth, main, admin, simulation, jobs
     from app.routes import work_order
 
     app.register_blueprint(auth.bp)
@@ -139,6 +159,7 @@ def create_app():
     app.register_blueprint(admin.bp)
     app.register_blueprint(simulation.bp)
     app.register_blueprint(work_order.wp)
+    app.register_blueprint(jobs.bp)
 
     # Create database tables and seed default admin
     with app.app_context():
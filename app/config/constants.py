@@ -10,6 +10,72 @@ UPLOAD_FOLDER = 'app/static/uploads'
 SIMULATION_TIMEOUT = 30  # seconds
 SUBPROCESS_TIMEOUT = 30  # seconds
 
+# Response surface: forward simulations answered by interpolating P-T curves
+# precomputed on a dense nc_usage_1 grid (see app/utils/response_surface.py)
+RESPONSE_SURFACE = {
+    'enabled': True,
+    'grid_step_mg': 0.5,         # grid spacing for nc_usage_1
+    'range_padding_mg': 100.0,   # grid extends this far beyond the training range
+    'tolerance': 1e-4,           # max |interp - exact| / peak pressure on the sample
+    'sample_size': 64,           # random inputs used for the tolerance check
+}
+# Presence of this file in models/ forces exact inference (toggled from admin)
+EXACT_INFERENCE_FLAG = 'exact_inference.flag'
+# Upper bound on points in one /simulation/sweep request
+SWEEP_MAX_POINTS = 2000
+# Points per batched inference call; a sweep job reports progress between them
+SWEEP_CHUNK_POINTS = 200
+
+# Binary storage of TestResult curves (see app/utils/curve_codec.py)
+CURVE_STORAGE = {
+    'dtype': 'float64',       # 'float32' halves the size at ~7 significant digits
+    'compression': 'zlib',    # 'none' | 'zlib' | 'zstd' (zstd needs `zstandard`)
+    'level': 6,
+}
+
+# Parsed-upload cache shared by validate_upload / upload (see app/utils/parse_cache.py)
+PARSE_CACHE = {
+    'dir': 'parse_cache',            # under demo/temp
+    'max_bytes': 256 * 1024 * 1024,  # LRU eviction above this total size
+}
+
+# Parallel parsing of /simulation/experiment batches (see app/utils/parse_pool.py)
+EXPERIMENT_PARSE = {
+    'max_workers': None,     # parser processes per app worker; None = CPU count (started on demand, at most one per file)
+    'in_flight_per_worker': 2,  # queued files per process — bounds parent memory
+    'min_files': 3,          # smaller batches are parsed in the request thread
+    'idle_shutdown': 60,     # seconds without a batch before the pool's processes exit
+}
+
+# Warm loader processes behind /simulation/load_test_data (see app/utils/loader_pool.py)
+DATA_LOADER_POOL = {
+    'workers': 1,            # loader processes per app worker (each holds pandas + plotly)
+    'warm_on_start': True,   # start them from gunicorn's post_worker_init
+}
+
+# Background jobs (see app/services/job_service.py)
+JOBS = {
+    'threads': 2,               # job worker threads per app process
+    'progress_interval': 0.5,   # min seconds between progress writes of one job
+    'orphan_after': 300,        # queued jobs left this long are adopted on startup
+    'keep_days': 7,             # finished jobs older than this are purged
+}
+
+# Admin monitor aggregation (see app/utils/metrics_aggregator.py)
+MONITOR = {
+    'sample_interval': 2.0,       # seconds between background CPU/memory samples
+    'recent_errors': 20,          # 4xx/5xx requests kept for the dashboard
+    'crash_events': 50,           # ERROR/CRITICAL entries kept since last startup
+    'recent_login_failures': 10,  # failed logins kept for the dashboard
+    'disk_interval': 60.0,        # seconds an uploads/backups directory scan is reused
+    'ring_size': 1800,            # in-memory samples (1 h at sample_interval)
+    'history_resolution': 60,     # seconds per bucket of the on-disk history
+    'history_days': 7,            # on-disk history length (fixed-size file)
+    'history_points': 300,        # default max points per /admin/monitor/history series
+    'history_path': os.environ.get('MGG_MONITOR_HISTORY') or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'instance', 'monitor_history.npy'),
+}
+
 # Directory names
 DEMO_DIR = 'demo'
 DATA_DIR = 'data'
@@ -31,6 +97,7 @@ ERROR_MESSAGES = {
     'load_data_failed': 'Error loading test data',
     'simulation_timeout': 'Simulation timeout (exceeded 30 seconds)',
     'file_processing_timeout': 'File processing timeout (exceeded 30 seconds)',
+    'request_timeout': '请求处理超时（超过 {seconds:g} 秒），请缩小数据范围后重试',
     'script_execution_failed': 'Script execution failed',
     'file_process_failed': 'Failed to process file',
     'simulation_error': 'Error running simulation',
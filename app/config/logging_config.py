@@ -17,6 +17,28 @@ LOG_ROTATION = {
     'max_folder_size_bytes': 30 * 1024 * 1024 * 1024,  # 30GB in bytes
 }
 
+# Background CSV writer (LogManager): requests only enqueue entries
+LOG_WRITER = {
+    'queue_size': 10000,        # pending entries; beyond this new entries are dropped
+    'batch_size': 200,          # write as soon as this many entries are pending
+    'flush_interval': 1.0,      # ...or this many seconds after the oldest pending one
+    'cleanup_interval': 300,    # seconds between folder-size rescans / cleanup runs
+    'shutdown_timeout': 5.0,    # max seconds to drain the queue at exit
+}
+
+# Cross-process log sink: under gunicorn the master runs a collector
+# (app/utils/log_collector.py) that owns the CSV files; workers send it their
+# batches over a UNIX datagram socket.  Without a collector (run.py, Windows,
+# mode 'file') each process appends to the files directly.
+LOG_SINK = {
+    'mode': os.environ.get('MGG_LOG_SINK', 'auto'),   # 'auto' | 'file'
+    'socket_path': os.environ.get('MGG_LOG_SOCKET') or os.path.join(LOG_DIR, '.collector.sock'),
+    'max_datagram': 60000,      # bytes per datagram (batches are split)
+    'send_timeout': 1.0,        # seconds; a stuck collector → write locally
+    'reorder_window': 2.0,      # collector holds entries this long to sort them
+    'receive_buffer': 4 * 1024 * 1024,
+}
+
 # CSV log format
 CSV_HEADERS = [
     'timestamp',           # ISO format timestamp
@@ -70,6 +92,33 @@ LOG_EVENTS = {
 # Slow request threshold (milliseconds)
 SLOW_REQUEST_THRESHOLD_MS = 5000  # 5 seconds
 
+# SQL statement statistics (app/utils/query_stats.py).  Statements at least
+# slow_threshold_ms long are also written, normalized, to a dedicated daily
+# slow-query log (same CSV columns, SLOW_QUERY_LOG_PREFIX file names).
+QUERY_LOG = {
+    'enabled': True,
+    'slow_threshold_ms': 200,
+    'slowest_per_request': 3,   # slowest statements kept per request
+    'max_statements': 500,      # distinct normalized statements tracked per process
+    'top_statements': 20,       # rows in the admin monitor table
+    'max_sql_length': 2000,     # normalized SQL is cut to this many characters
+}
+SLOW_QUERY_LOG_PREFIX = 'mgg_slow_query_log'
+
+# Sampling profiler for slow requests (app/utils/request_profiler.py), opt-in.
+# A sample_rate fraction of requests has its stack sampled every `interval`
+# seconds; the folded stacks are kept only if the request took threshold_ms.
+REQUEST_PROFILER = {
+    'enabled': os.environ.get('MGG_PROFILER', '0') == '1',
+    'sample_rate': float(os.environ.get('MGG_PROFILER_RATE', '0.1')),
+    'interval': 0.005,          # seconds between stack samples
+    'max_samples': 6000,        # per request (30 s at 5 ms); later samples are skipped
+    'threshold_ms': SLOW_REQUEST_THRESHOLD_MS,
+    'max_profiles': 200,        # oldest kept profiles are deleted beyond this
+    'directory': os.environ.get('MGG_PROFILE_DIR') or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'instance', 'profiles'),
+}
+
 # Log file retention
 LOG_RETENTION = {
     'keep_days': 90,  # Keep logs for 90 days minimum before cleanup
@@ -81,6 +130,7 @@ LOG_EXCLUSIONS = {
     'endpoints': [
         '/static/*',  # Don't log static file requests
         '/health',    # Don't log health check requests (too frequent)
+        'main.metrics',  # Prometheus scrapes
     ],
     'user_agents': [
         'HealthChecker',  # Exclude health check monitoring
@@ -94,10 +144,13 @@ ADMIN_LOG_VIEW = {
     'download_enabled': True,  # Allow downloading log files
 }
 
-def get_current_log_filename():
+def get_current_log_filename(prefix: str = LOG_FILE_PREFIX):
     """
     Get the current log filename based on rotation frequency.
 
+    Args:
+        prefix: File name prefix (LOG_FILE_PREFIX or SLOW_QUERY_LOG_PREFIX)
+
     Returns:
         str: Log filename (without path)
     """
@@ -110,7 +163,7 @@ def get_current_log_filename():
     else:  # on_reboot
         date_str = now.strftime('%Y-%m-%d_%H-%M-%S')
 
-    return f"{LOG_FILE_PREFIX}_{date_str}{LOG_FILE_EXTENSION}"
+    return f"{prefix}_{date_str}{LOG_FILE_EXTENSION}"
 
 def get_current_log_filepath():
     """
@@ -10,6 +10,22 @@ TIMEOUTS = {
     'static_files': 5,              # Static file serving
 }
 
+# Endpoints whose TIMEOUTS category is not evident from their name
+# (app/middleware/timeout.get_timeout_for_endpoint falls back to name patterns)
+ENDPOINT_TIMEOUTS = {
+    'simulation.run_simulation': 'simulation',
+    'simulation.sweep': 'simulation',
+    'simulation.predict': 'simulation',
+    'simulation.search_similar': 'simulation',
+    'simulation.generate_comparison_chart': 'simulation',
+    'wp.compare_run': 'simulation',
+    'simulation.experiment': 'file_upload',
+    'simulation.upload_test_result': 'file_upload',
+    'simulation.validate_upload': 'file_upload',
+    'simulation.load_test_data': 'file_upload',
+    'simulation.save_to_data_folder': 'file_upload',
+}
+
 # Connection pool settings
 CONNECTION_POOL = {
     'max_connections': 100,          # Maximum number of connections
@@ -74,6 +90,16 @@ HEALTH_CHECK = {
     'check_file_system': True,
 }
 
+# Prometheus /metrics export (see app/utils/metrics_registry.py)
+METRICS_EXPORT = {
+    'enabled': True,
+    'token': os.environ.get('MGG_METRICS_TOKEN', ''),   # if set, scrapes send "Authorization: Bearer <token>"
+    # Per-process value files, aggregated at scrape time; shared by all gunicorn workers
+    'multiproc_dir': os.environ.get('PROMETHEUS_MULTIPROC_DIR') or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'instance', 'prometheus'),
+    'latency_buckets': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 120.0),
+}
+
 # Gunicorn production server configuration
 GUNICORN_CONFIG = {
     'bind': '0.0.0.0:5001',
@@ -7,6 +7,7 @@ from .logging_middleware import (
     log_simulation_run,
     log_file_upload
 )
+from .profiling_middleware import init_profiling_middleware
 
 __all__ = [
     'init_timeout_middleware',
@@ -17,4 +18,5 @@ __all__ = [
     'log_user_logout',
     'log_simulation_run',
     'log_file_upload',
+    'init_profiling_middleware',
 ]
@@ -11,6 +11,8 @@ from app.config.logging_config import (
     LOG_EXCLUSIONS
 )
 from app.utils.log_manager import log_manager
+from app.utils.metrics_registry import HTTP_LATENCY, HTTP_REQUESTS
+from app.utils.query_stats import request_queries
 
 
 def should_log_request(endpoint: str, user_agent: str) -> bool:
@@ -85,12 +87,17 @@ def init_logging_middleware(app):
             user_agent = g.request_info.get('user_agent') if hasattr(g, 'request_info') else request.headers.get('User-Agent', '')
             request_id = g.request_id if hasattr(g, 'request_id') else None
 
+            # Prometheus: every request, logged or not (404s share one label)
+            status_code = response.status_code
+            endpoint_label = endpoint or 'unmatched'
+            HTTP_REQUESTS.labels(endpoint_label, method, status_code).inc()
+            HTTP_LATENCY.labels(endpoint_label, status_code).observe(duration_ms / 1000)
+
             # Check if we should log this request
             if not should_log_request(endpoint or path, user_agent):
                 return response
 
             # Determine if we should log based on settings
-            status_code = response.status_code
             is_error = status_code >= 400
             is_slow = duration_ms >= SLOW_REQUEST_THRESHOLD_MS
 
@@ -101,6 +108,7 @@ def init_logging_middleware(app):
             )
 
             if should_log:
+                db = request_queries()
                 log_manager.log_request(
                     method=method,
                     path=path,
@@ -112,6 +120,9 @@ def init_logging_middleware(app):
                     endpoint=endpoint,
                     user_agent=user_agent,
                     request_id=request_id,
+                    db_queries=db.count if db else 0,
+                    db_time_ms=db.time_ms if db else 0.0,
+                    db_slowest=db.slowest if db else None,
                 )
 
         except Exception as e:
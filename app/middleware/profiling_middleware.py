@@ -0,0 +1,56 @@
+"""Profiling middleware: sample the stacks of slow requests (app/utils/request_profiler.py)"""
+import random
+import sys
+
+from flask import g, request
+
+from app.config.logging_config import REQUEST_PROFILER
+from app.utils.request_profiler import get_stack_sampler, save_profile
+
+
+def init_profiling_middleware(app):
+    """
+    Initialize the opt-in request profiler for the Flask app.
+
+    Must be registered after the logging middleware, whose request_id names
+    the kept profiles.
+
+    Args:
+        app: Flask application instance
+    """
+
+    @app.before_request
+    def start_profiling():
+        """Profile a REQUEST_PROFILER['sample_rate'] fraction of requests"""
+        if REQUEST_PROFILER['enabled'] and random.random() < REQUEST_PROFILER['sample_rate']:
+            g.profile = get_stack_sampler().start()
+
+    @app.after_request
+    def note_profiled_status(response):
+        if 'profile' in g:
+            g.profile_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_profiling(error=None):
+        """Keep the stacks only if the request was slow"""
+        session = g.pop('profile', None)
+        if session is None:
+            return
+        get_stack_sampler().stop(session)
+        duration_ms = session.elapsed_ms()
+        if duration_ms < REQUEST_PROFILER['threshold_ms'] or not session.samples:
+            return
+        try:
+            save_profile(session, g.get('request_id'), {
+                'method':      request.method,
+                'path':        request.path,
+                'endpoint':    request.endpoint or '',
+                'status_code': g.get('profile_status', 500 if error else None),
+                'duration_ms': round(duration_ms, 1),
+            })
+        except Exception as e:
+            # Profiling must never break a request
+            print(f'[PROFILER ERROR] {e}', file=sys.stderr)
+
+    app.logger.info('Request profiling middleware initialized')
@@ -1,17 +1,16 @@
-"""Request timeout middleware for MGG_SYS"""
-import signal
-from flask import request, jsonify, current_app
+"""Request timeout middleware for MGG_SYS (cooperative deadlines, app/utils/deadline.py)"""
+import time
 from functools import wraps
 
+from flask import request, jsonify, current_app, g
 
-class TimeoutError(Exception):
-    """Request timeout exception"""
-    pass
+from app.config.constants import ERROR_MESSAGES
+from app.config.network_config import ENDPOINT_TIMEOUTS
+from app.utils.deadline import Deadline
+from app.utils.errors import DeadlineExceededError
 
-
-def timeout_handler(signum, frame):
-    """Signal handler for timeout"""
-    raise TimeoutError("Request timed out")
+# Kept for imports of the signal-based middleware's exception
+TimeoutError = DeadlineExceededError
 
 
 def get_timeout_for_endpoint(endpoint: str) -> int:
@@ -19,12 +18,17 @@ def get_timeout_for_endpoint(endpoint: str) -> int:
     Get appropriate timeout for a specific endpoint.
 
     Args:
-        endpoint: Flask endpoint name
+        endpoint: Flask endpoint name (None for unmatched URLs)
 
     Returns:
         int: Timeout in seconds
     """
     timeouts = current_app.config.get('TIMEOUTS', {})
+    endpoint = endpoint or ''
+
+    if endpoint in ENDPOINT_TIMEOUTS:
+        category = ENDPOINT_TIMEOUTS[endpoint]
+        return timeouts.get(category, timeouts.get('default_request', 30))
 
     # Map endpoint patterns to timeout categories
     if 'simulation' in endpoint and 'run' in endpoint:
@@ -39,9 +43,22 @@ def get_timeout_for_endpoint(endpoint: str) -> int:
         return timeouts.get('default_request', 30)
 
 
+def _timeout_response(error: DeadlineExceededError):
+    current_app.logger.warning(
+        f'Request deadline exceeded: {request.method} {request.path} ({error.budget:g}s)'
+    )
+    return jsonify({
+        'success': False,
+        'message': ERROR_MESSAGES['request_timeout'].format(seconds=error.budget)
+    }), 504
+
+
 def with_timeout(f):
     """
-    Decorator to apply request timeout to a Flask route.
+    Decorator to give a route its own deadline budget.
+
+    Every request already gets one from init_timeout_middleware; use this
+    for views called outside that middleware or to restart the budget.
 
     Usage:
         @bp.route('/endpoint')
@@ -51,26 +68,14 @@ def with_timeout(f):
     """
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # Get timeout for this endpoint
-        timeout = get_timeout_for_endpoint(request.endpoint)
-
-        # Set up signal alarm for timeout
-        signal.signal(signal.SIGALRM, timeout_handler)
-        signal.alarm(timeout)
-
+        previous = g.get('deadline')
+        g.deadline = Deadline(get_timeout_for_endpoint(request.endpoint))
         try:
-            result = f(*args, **kwargs)
-            signal.alarm(0)  # Cancel alarm
-            return result
-        except TimeoutError:
-            signal.alarm(0)  # Cancel alarm
-            return jsonify({
-                'success': False,
-                'error': f'Request timed out after {timeout} seconds'
-            }), 504
-        except Exception as e:
-            signal.alarm(0)  # Cancel alarm
-            raise e
+            return f(*args, **kwargs)
+        except DeadlineExceededError as e:
+            return _timeout_response(e)
+        finally:
+            g.deadline = previous
 
     return decorated_function
 
@@ -79,25 +84,54 @@ def init_timeout_middleware(app):
     """
     Initialize timeout middleware for the Flask app.
 
-    This adds request timeout tracking to all requests.
+    Every request gets a Deadline on ``g`` from get_timeout_for_endpoint;
+    checkpoints in long loops and SQL statements raise DeadlineExceededError
+    once it passes, answered here with a 504.  The deadline covers the
+    before_request hooks and the view — not after_request hooks or a
+    streamed response body.
 
     Args:
         app: Flask application instance
     """
     @app.before_request
     def before_request():
-        """Log request start time"""
+        """Start the request's deadline and log its start time"""
+        g.deadline = Deadline(get_timeout_for_endpoint(request.endpoint))
         request._start_time = None
         # Store start time if logging is enabled
         if app.config.get('NETWORK_LOGGING', {}).get('log_slow_requests', False):
-            import time
             request._start_time = time.time()
 
+    # DeadlineExceededError is a BaseException, which Flask's error handlers
+    # never see: catch it around the before_request hooks and the view (the
+    # user_loader query and update_last_seen's commit run in those hooks).
+    # The routes' own `except Exception` rollbacks did not run, so roll back
+    # here; after_request hooks still run, without a deadline.
+    full_dispatch_request = app.full_dispatch_request
+    dispatch_request = app.dispatch_request
+
+    def full_dispatch_with_deadline():
+        try:
+            return full_dispatch_request()
+        except DeadlineExceededError as e:
+            from app import db
+            g.pop('deadline', None)
+            db.session.rollback()
+            return app.finalize_request(_timeout_response(e))
+
+    def dispatch_with_deadline():
+        try:
+            return dispatch_request()
+        finally:
+            g.pop('deadline', None)
+
+    app.full_dispatch_request = full_dispatch_with_deadline
+    app.dispatch_request = dispatch_with_deadline
+
     @app.after_request
     def after_request(response):
         """Log slow requests"""
         if hasattr(request, '_start_time') and request._start_time:
-            import time
             elapsed = time.time() - request._start_time
             threshold = app.config.get('NETWORK_LOGGING', {}).get('slow_request_threshold', 5.0)
 
@@ -2,6 +2,9 @@ from app import db, login_manager, bcrypt
 from flask_login import UserMixin
 from flask import session
 from datetime import datetime
+import json
+import numpy as np
+from app.utils.curve_codec import decode_curve, encode_curve
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -117,9 +120,168 @@ class TestResult(db.Model):
 
     filename = db.Column(db.String(255), nullable=False)
     file_path = db.Column(db.String(500), nullable=False)
-    data = db.Column(db.Text)  # JSON formatted test data
+    data = db.Column(db.Text)  # Legacy JSON test data — superseded by `curve`
+    curve = db.Column(db.LargeBinary)  # Binary P-T curve (app/utils/curve_codec.py)
 
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    def set_curve(self, time, pressure):
+        """Store the P-T curve in binary form and drop any legacy JSON copy."""
+        self.curve = encode_curve(time, pressure)
+        self.data = None
+
+    def get_curve(self):
+        """
+        Return {'time': ndarray, 'pressure': ndarray}, or None when the row has
+        no usable curve.  Reads the binary column and falls back to the legacy
+        JSON `data` for rows not yet converted by
+        migrations/convert_test_result_curves.py.
+        """
+        if self.curve:
+            try:
+                time, pressure = decode_curve(self.curve)
+            except Exception:
+                return None
+        elif self.data:
+            try:
+                d = json.loads(self.data)
+                time = np.asarray(d.get('time') or [], dtype=float)
+                pressure = np.asarray(d.get('pressure') or [], dtype=float)
+            except (json.JSONDecodeError, TypeError, ValueError, AttributeError):
+                return None
+        else:
+            return None
+        if not time.size or not pressure.size:
+            return None
+        return {'time': time, 'pressure': pressure}
+
     def __repr__(self):
         return f'<TestResult {self.id} - {self.filename}>'
+
+
+class WorkOrderSummary(db.Model):
+    """
+    One row per work order, maintained on write by WorkOrderSummaryService so
+    the 工单查询 list is a single indexed SELECT.
+
+    Peak statistics are kept as running mean / M2 (Welford) so a dataset can be
+    added or removed without re-reading the other curves of the work order.
+    """
+    __tablename__ = 'work_order_summary'
+    __table_args__ = (
+        # List page: newest work order (by owner simulation) first
+        db.Index('ix_work_order_summary_created_at', 'created_at'),
+    )
+
+    work_order = db.Column(db.String(50), primary_key=True)
+    # Owner = earliest simulation carrying this work order (no FK: the row is
+    # rebuilt whenever simulations of the work order change)
+    simulation_id = db.Column(db.Integer)
+    owner_id = db.Column(db.Integer)
+    recipe_summary = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime)  # owner simulation's created_at
+
+    dataset_count = db.Column(db.Integer, nullable=False, default=0)
+    mean_peak_pressure = db.Column(db.Float)  # MPa
+    m2_peak_pressure = db.Column(db.Float)    # Σ (x - mean)²
+    mean_peak_time = db.Column(db.Float)      # ms
+    m2_peak_time = db.Column(db.Float)
+    last_upload_at = db.Column(db.DateTime)
+
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @staticmethod
+    def _std(m2, count):
+        """Sample standard deviation (ddof=1), 0.0 for fewer than two datasets."""
+        if count is None or count < 2 or m2 is None:
+            return 0.0
+        return float(max(m2, 0.0) / (count - 1)) ** 0.5
+
+    @property
+    def std_peak_pressure(self):
+        return self._std(self.m2_peak_pressure, self.dataset_count)
+
+    @property
+    def std_peak_time(self):
+        return self._std(self.m2_peak_time, self.dataset_count)
+
+    def __repr__(self):
+        return f'<WorkOrderSummary {self.work_order} ({self.dataset_count})>'
+
+
+class WorkOrderCurve(db.Model):
+    """
+    Cached averaged P-T curve of a work order (ComparisonService.average_datasets
+    over all its test results) plus its similarity feature vector.
+
+    `source_hash` fingerprints the contributing TestResult ids; readers rebuild
+    the row lazily when it no longer matches (see WorkOrderSummaryService).
+    """
+    __tablename__ = 'work_order_curve'
+
+    work_order = db.Column(db.String(50), primary_key=True)
+    source_hash = db.Column(db.String(64), nullable=False)
+    dataset_count = db.Column(db.Integer, nullable=False, default=0)
+    curve = db.Column(db.LargeBinary)  # curve_codec blob; NULL when no usable data
+    features = db.Column(db.Text)      # JSON: similarity.compute_features output
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<WorkOrderCurve {self.work_order} ({self.dataset_count})>'
+
+
+class Job(db.Model):
+    """
+    Background job run by JobService (app/services/job_service.py).
+
+    The row is the job's only shared state: any app process can report its
+    status, and cancellation is a flag the running handler polls.
+    """
+    __tablename__ = 'job'
+    __table_args__ = (
+        db.Index('ix_job_user_created', 'user_id', 'created_at'),
+    )
+
+    STATUSES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+    FINISHED = ('succeeded', 'failed', 'cancelled')
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    kind = db.Column(db.String(50), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    progress = db.Column(db.Float, nullable=False, default=0.0)  # 0..1
+    message = db.Column(db.String(255))
+    params = db.Column(db.Text)   # JSON handler arguments
+    result = db.Column(db.Text)   # JSON handler return value
+    error = db.Column(db.Text)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    worker = db.Column(db.String(100))  # host:pid of the process running it
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # last progress report
+
+    @property
+    def finished(self):
+        return self.status in self.FINISHED
+
+    def to_dict(self, include_result=True):
+        data = {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': round(self.progress or 0.0, 4),
+            'message': self.message,
+            'error': self.error,
+            'cancel_requested': bool(self.cancel_requested),
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+        if include_result:
+            data['result'] = json.loads(self.result) if self.result else None
+        return data
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
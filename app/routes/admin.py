@@ -1,16 +1,26 @@
 import os
 import pathlib
+import time
 
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, send_file
+from flask import (
+    Blueprint, render_template, request, jsonify, flash, redirect, url_for, send_file, current_app
+)
 from flask_login import login_required, current_user
 from functools import wraps
 from werkzeug.utils import secure_filename as sanitize
 
 from app import db
 from app.models import User
+from app.routes.jobs import job_accepted, wants_async
+from app.services.job_service import job_handler
 from app.utils import log_manager
+from app.utils.log_index import parse_clock
+from app.utils.metrics_aggregator import get_resource_sampler
+from app.utils.metrics_history import FIELDS as HISTORY_FIELDS, get_metrics_history
+from app.utils.request_profiler import list_profiles, profile_path
 from app.utils.system_monitor import get_system_metrics
-from app.config.logging_config import ADMIN_LOG_VIEW, LOG_DIR
+from app.config.constants import MONITOR
+from app.config.logging_config import ADMIN_LOG_VIEW, LOG_DIR, REQUEST_PROFILER
 
 bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -157,22 +167,32 @@ def logs():
     # Get statistics
     stats = log_manager.get_log_statistics()
 
-    return render_template('admin/logs.html', log_files=log_files, stats=stats)
+    return render_template('admin/logs.html', log_files=log_files, stats=stats,
+                           profiles=list_profiles(limit=50), profiler=REQUEST_PROFILER)
 
 @bp.route('/logs/view')
 @login_required
 @admin_required
 def view_log():
-    """View specific log file contents"""
+    """View specific log file contents, newest first, optionally filtered by
+    level, user_id, status_code and a start/end time of day (HH:MM[:SS])"""
     raw_filename = request.args.get('filename')
     filename = sanitize(raw_filename) if raw_filename else None
     max_rows = min(max(int(request.args.get('max_rows', ADMIN_LOG_VIEW.get('max_rows_display', 1000))), 1), 10000)
 
+    try:
+        filters = {
+            'level': [lv for lv in request.args.getlist('level') if lv] or None,
+            'user_id': request.args.get('user_id', type=int),
+            'status_code': request.args.get('status_code', type=int),
+            'start': parse_clock(request.args.get('start')),
+            'end': parse_clock(request.args.get('end')),
+        }
+    except ValueError:
+        return jsonify({'success': False, 'message': '无效的时间格式，应为 HH:MM 或 HH:MM:SS'}), 400
+
     # Read log entries
-    if filename:
-        entries = log_manager.read_log_file(filename, max_rows=max_rows)
-    else:
-        entries = log_manager.read_log_file(max_rows=max_rows)
+    entries = log_manager.query_logs(filename, max_rows=max_rows, **filters)
 
     return jsonify({
         'success': True,
@@ -208,11 +228,38 @@ def download_log(filename):
 
     return send_file(filepath, as_attachment=True, download_name=safe_filename)
 
+@bp.route('/profiles')
+@login_required
+@admin_required
+def profiles():
+    """Kept slow-request profiles (JSON), newest first"""
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    return jsonify({'success': True, 'profiles': list_profiles(limit=limit)})
+
+@bp.route('/profiles/<request_id>/download')
+@login_required
+@admin_required
+def download_profile(request_id):
+    """Download a request's folded stacks (flamegraph.pl / speedscope input)"""
+    path = profile_path(request_id)
+    if path is None:
+        return jsonify({'success': False, 'message': '剖析文件不存在'}), 404
+    return send_file(path, as_attachment=True, download_name=f'{request_id}.folded',
+                     mimetype='text/plain')
+
 @bp.route('/logs/statistics')
 @login_required
 @admin_required
 def log_statistics():
-    """Get log statistics as JSON"""
+    """
+    Get log statistics as JSON.
+
+    Scans every log file; with ``async=1`` the scan runs as a
+    'log_statistics' background job (202 with its job_id).
+    """
+    if wants_async(request.args):
+        job = current_app.job_service.submit('log_statistics', current_user.id)
+        return job_accepted(job)
     stats = log_manager.get_log_statistics()
     return jsonify({
         'success': True,
@@ -220,6 +267,13 @@ def log_statistics():
     })
 
 
+@job_handler('log_statistics')
+def log_statistics_job(job, args):
+    """Background /logs/statistics."""
+    return {'statistics': log_manager.get_log_statistics(
+        progress=lambda done, total: job.progress(done / total))}
+
+
 # ============================================================
 # System Monitor Routes
 # ============================================================
@@ -240,6 +294,57 @@ def monitor_data():
     return jsonify({'success': True, 'metrics': get_system_metrics()})
 
 
+@bp.route('/monitor/history')
+@login_required
+@admin_required
+def monitor_history():
+    """Time series for the monitor charts.
+
+    Query: fields (comma-separated, default all), minutes (default 60, up to
+    the stored history), points (max points per series).
+    """
+    history = get_metrics_history()
+    fields = [f for f in request.args.get('fields', '').split(',') if f] or list(HISTORY_FIELDS)
+    max_minutes = MONITOR['history_days'] * 24 * 60
+    minutes = min(max(request.args.get('minutes', 60, type=int), 1), max_minutes)
+    points = min(max(request.args.get('points', MONITOR['history_points'], type=int), 1), 2000)
+
+    get_resource_sampler()   # make sure this process is recording
+    now = time.time()
+    try:
+        data = history.series(fields, since=now - minutes * 60, until=now, points=points)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'无效的指标: {e}'}), 400
+    return jsonify({'success': True, 'minutes': minutes, 'fields': fields, **data})
+
+
+@bp.route('/inference/mode', methods=['POST'])
+@login_required
+@admin_required
+def set_inference_mode():
+    """Switch forward simulation between the response surface and exact inference."""
+    from app.utils.model_runner import set_exact_inference
+
+    mode = request.form.get('mode')
+    if mode not in ('surface', 'exact'):
+        return jsonify({'success': False, 'message': '无效的推理模式'}), 400
+
+    try:
+        set_exact_inference(mode == 'exact')
+    except OSError as e:
+        return jsonify({'success': False, 'message': f'无法切换推理模式: {e}'}), 500
+
+    log_manager.log_info(
+        message=f'Admin set inference mode: {mode}',
+        action='admin_inference_mode',
+        username=current_user.username,
+        user_id=current_user.id,
+        ip_address=request.remote_addr,
+    )
+    label = '响应面插值' if mode == 'surface' else '精确推理'
+    return jsonify({'success': True, 'message': f'推理模式已切换为{label}'})
+
+
 @bp.route('/user/<int:user_id>/kick', methods=['POST'])
 @login_required
 @admin_required
@@ -0,0 +1,62 @@
+"""Background job status, progress and cancellation (see app/services/job_service.py)."""
+from flask import Blueprint, jsonify, current_app, request, url_for
+from flask_login import login_required, current_user
+
+bp = Blueprint('jobs', __name__, url_prefix='/jobs')
+
+
+def wants_async(params) -> bool:
+    """True when a request asks to run as a background job (``async=1``)."""
+    return str(params.get('async', '')).lower() in ('1', 'true', 'yes', 'on')
+
+
+def job_accepted(job, message='任务已提交，正在后台处理'):
+    """202 response pointing the client at the job's status URL."""
+    return jsonify({
+        'success': True,
+        'message': message,
+        'job_id': job.id,
+        'status_url': url_for('jobs.status', job_id=job.id),
+    }), 202
+
+
+def _visible_job(job_id):
+    job = current_app.job_service.get(job_id)
+    if job is None or (job.user_id != current_user.id and not current_user.is_admin):
+        return None
+    return job
+
+
+@bp.route('/')
+@login_required
+def list_jobs():
+    """Recent jobs of the current user (admins: ?all=1 for everyone's)."""
+    show_all = current_user.is_admin and request.args.get('all') == '1'
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    jobs = current_app.job_service.list_jobs(None if show_all else current_user.id, limit)
+    return jsonify({
+        'success': True,
+        'jobs': [job.to_dict(include_result=False) for job in jobs],
+    })
+
+
+@bp.route('/<job_id>')
+@login_required
+def status(job_id):
+    """Status, progress and (once succeeded) result of one job."""
+    job = _visible_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': '任务不存在'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+
+@bp.route('/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel(job_id):
+    """Cancel a queued job, or ask a running one to stop."""
+    job = _visible_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': '任务不存在'}), 404
+    if not current_app.job_service.cancel(job_id):
+        return jsonify({'success': False, 'message': '任务已结束，无法取消'}), 409
+    return jsonify({'success': True, 'message': '已请求取消任务'})
@@ -1,5 +1,6 @@
-from flask import Blueprint, render_template, redirect, url_for, jsonify, current_app
+from flask import Blueprint, Response, abort, render_template, redirect, request, url_for, jsonify, current_app
 from flask_login import login_required, current_user
+import hmac
 import os
 
 bp = Blueprint('main', __name__)
@@ -53,3 +54,16 @@ def health_check():
     status_code = 200 if health_status['status'] == 'healthy' else 503
 
     return jsonify(health_status), status_code
+
+@bp.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint — totals across all gunicorn workers"""
+    from app.config.network_config import METRICS_EXPORT
+    from app.utils.metrics_registry import CONTENT_TYPE, REGISTRY
+
+    if not METRICS_EXPORT.get('enabled', True):
+        abort(404)
+    token = METRICS_EXPORT.get('token')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return Response('unauthorized\n', status=401, mimetype='text/plain')
+    return Response(REGISTRY.exposition(), content_type=CONTENT_TYPE)
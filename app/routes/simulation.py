@@ -2,23 +2,39 @@ import json
 import os
 from io import BytesIO
 
-from flask import Blueprint, render_template, request, jsonify, current_app, flash, redirect, url_for, send_file
+from flask import (
+    Blueprint, render_template, request, jsonify, current_app, flash, redirect, url_for,
+    send_file, Response, stream_with_context
+)
 from flask_login import login_required, current_user
-from werkzeug.utils import secure_filename
 from app import db
-from app.models import Simulation, TestResult
 from app.utils.errors import (
     FileValidationError,
     SimulationError,
     SubprocessError,
     SubprocessTimeoutError,
-    DataProcessingError
+    DataProcessingError,
+    JobCancelledError
 )
 from app.middleware import log_simulation_run, log_file_upload
+from app.routes.jobs import job_accepted, wants_async
+from app.services.job_service import job_handler
 from app.utils.decorators import research_required, lab_required
+from app.utils.similarity import SEARCH_MODES
 
 bp = Blueprint('simulation', __name__, url_prefix='/simulation')
 
+
+def _stream_size(file) -> int:
+    """Size of an uploaded file in bytes, without reading it."""
+    stream = file.stream
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
 @bp.route('/')
 @login_required
 @research_required
@@ -91,6 +107,117 @@ def run_simulation():
             'message': '服务器内部错误，请稍后重试'
         }), 500
 
+@bp.route('/sweep', methods=['POST'])
+@login_required
+@research_required
+def sweep():
+    """
+    Run the forward model over a range of nc_usage_1 values.
+
+    Body (JSON or form): recipe fields as for /run plus either
+    ``values`` (list / comma-separated) or ``start``, ``stop``, ``step``.
+
+    Streams NDJSON (application/x-ndjson), one object per line:
+      {"type": "meta",    "count", "time": [...], "inference_mode"}
+      {"type": "point",   "index", "nc_usage_1", "peak_pressure", "peak_time", "pressure": [...]}
+      {"type": "summary", "simulation_ids": [...], "created", "reused"}
+    A failure while saving is reported as a final {"type": "error"} line.
+
+    With ``async=1`` the sweep runs as a 'sweep' background job instead and
+    the response is 202 with its job_id (result: see run_sweep_job).
+    """
+    params = request.get_json(silent=True) or request.form.to_dict()
+    user_id, username = current_user.id, current_user.username
+    service = current_app.simulation_service
+
+    if wants_async(params):
+        params = {k: v for k, v in params.items() if k != 'async'}
+        try:
+            service.parse_sweep_values(params)
+        except SimulationError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        job = current_app.job_service.submit('sweep', user_id,
+                                             {'params': params, 'username': username})
+        return job_accepted(job)
+
+    try:
+        result = service.run_sweep(params)
+    except SimulationError as e:
+        log_simulation_run(username=username, user_id=user_id,
+                           simulation_params=params, success=False, error=str(e))
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    def generate():
+        values = result['values']
+        yield json.dumps({
+            'type': 'meta',
+            'count': len(values),
+            'time': result['times'].tolist(),
+            'inference_mode': result['mode'],
+        }) + '\n'
+        for i, nc in enumerate(values):
+            yield json.dumps({
+                'type': 'point',
+                'index': i,
+                'nc_usage_1': nc,
+                'peak_pressure': float(result['peak_pressure'][i]),
+                'peak_time': float(result['peak_time'][i]),
+                'pressure': result['pressures'][i].tolist(),
+            }) + '\n'
+
+        # Persist after the curves are out: one bulk INSERT for the whole sweep
+        try:
+            saved = service.persist_sweep(user_id, params, result)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error('Sweep persistence error: %s', e, exc_info=True)
+            log_simulation_run(username=username, user_id=user_id,
+                               simulation_params=params, success=False, error=str(e))
+            yield json.dumps({'type': 'error', 'message': '扫描结果保存失败'}) + '\n'
+            return
+
+        log_simulation_run(username=username, user_id=user_id,
+                           simulation_params={'sweep_points': len(values), **params},
+                           success=True)
+        yield json.dumps({'type': 'summary', **saved}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@job_handler('sweep')
+def run_sweep_job(job, args):
+    """
+    Background /sweep: evaluate and persist the sweep.
+
+    Result: {'count', 'values', 'peak_pressure', 'peak_time', 'inference_mode',
+    'simulation_ids', 'created', 'reused'} — the curves themselves are stored
+    with the simulations.
+    """
+    params, username = args['params'], args.get('username')
+    service = current_app.simulation_service
+    try:
+        result = service.run_sweep(params, progress=lambda done, total: job.progress(
+            0.5 * done / total, f'已计算 {done}/{total} 个点'))
+        job.progress(0.5, f'已计算 {len(result["values"])} 个点，正在保存', force=True)
+        saved = service.persist_sweep(job.user_id, params, result)
+    except JobCancelledError:
+        raise
+    except Exception as e:
+        log_simulation_run(username=username, user_id=job.user_id,
+                           simulation_params=params, success=False, error=str(e))
+        raise
+    log_simulation_run(username=username, user_id=job.user_id,
+                       simulation_params={'sweep_points': len(result['values']), **params},
+                       success=True)
+    return {
+        'count': len(result['values']),
+        'values': list(result['values']),
+        'peak_pressure': result['peak_pressure'].tolist(),
+        'peak_time': result['peak_time'].tolist(),
+        'inference_mode': result['mode'],
+        **saved,
+    }
+
 @bp.route('/upload', methods=['POST'])
 @login_required
 @research_required
@@ -129,12 +256,9 @@ def upload_test_result():
             username=current_user.username,
             user_id=current_user.id,
             filename=file.filename,
-            file_size=len(file.read()) if hasattr(file, 'read') else 0,
+            file_size=_stream_size(file),
             success=True
         )
-        # Reset file pointer after reading size
-        if hasattr(file, 'seek'):
-            file.seek(0)
 
         return jsonify(result)
 
@@ -184,7 +308,12 @@ def history():
 @login_required
 @lab_required
 def experiment():
-    """Submit experiment data with batch file upload"""
+    """
+    Submit experiment data with batch file upload.
+
+    With ``async=1`` the files are saved and the parsing/recording runs as an
+    'experiment_upload' background job (202 with its job_id).
+    """
     try:
         ticket_number = request.form.get('ticket_number', '').strip()
 
@@ -194,57 +323,24 @@ def experiment():
 
         upload_folder = os.path.join(current_app.root_path, 'static', 'uploads', 'experiments')
         os.makedirs(upload_folder, exist_ok=True)
+        service = current_app.file_service
 
-        # Resolve linked simulation via ticket_number (work order).
-        # If no simulation exists for this work order, create a stub so the
-        # work order appears in 工单查询.
-        linked_sim_id = None
-        if ticket_number:
-            sim = (
-                Simulation.query
-                .filter_by(work_order=ticket_number)
-                .order_by(Simulation.created_at.desc())
-                .first()
-            )
-            if sim:
-                linked_sim_id = sim.id
-            else:
-                stub = Simulation(user_id=current_user.id, work_order=ticket_number)
-                db.session.add(stub)
-                db.session.flush()
-                linked_sim_id = stub.id
-
-        saved_files = []
-        for file in files:
-            if file.filename == '':
-                continue
-            filename = secure_filename(file.filename)
-            if ticket_number:
-                filename = f"{ticket_number}_{filename}"
-            filepath = os.path.join(upload_folder, filename)
-            file.save(filepath)
-            saved_files.append(filename)
-
-            # Create TestResult DB record so 工单查询 can find this upload
-            try:
-                data_dict = current_app.file_service.file_handler.load_excel_data_as_dict(filepath)
-                test_result = TestResult(
-                    user_id=current_user.id,
-                    simulation_id=linked_sim_id,
-                    filename=filename,
-                    file_path=filepath,
-                    data=json.dumps(data_dict)
-                )
-                db.session.add(test_result)
-            except Exception as parse_err:
-                current_app.logger.warning('Could not parse experiment file %s: %s', filename, parse_err)
-
-        db.session.commit()
+        if wants_async(request.form):
+            saved = service.save_experiment_files(files, ticket_number, upload_folder)
+            job = current_app.job_service.submit('experiment_upload', current_user.id, {
+                'saved': saved, 'ticket_number': ticket_number,
+            })
+            return job_accepted(job, f'已接收 {len(saved)} 个文件，正在后台解析')
 
+        result = service.process_experiment_upload(
+            files, current_user.id, ticket_number, upload_folder
+        )
+        _log_experiment_failures(result)
         return jsonify({
             'success': True,
-            'message': f'成功上传 {len(saved_files)} 个文件',
-            'files': saved_files
+            'message': _experiment_message(result),
+            'files': result['files'],
+            'failed': result['failed'],
         })
 
     except Exception as e:
@@ -252,6 +348,32 @@ def experiment():
         current_app.logger.error('Experiment submission error: %s', e, exc_info=True)
         return jsonify({'success': False, 'message': '服务器内部错误，请稍后重试'}), 500
 
+
+def _log_experiment_failures(result):
+    for failure in result['failed']:
+        current_app.logger.warning('Could not parse experiment file %s: %s',
+                                   failure['filename'], failure['error'])
+
+
+def _experiment_message(result):
+    message = f'成功上传 {len(result["files"])} 个文件'
+    if result['failed']:
+        message += f'，其中 {len(result["failed"])} 个文件解析失败'
+    return message
+
+
+@job_handler('experiment_upload')
+def record_experiment_job(job, args):
+    """Background /experiment: parse the saved files and record them."""
+    def progress(done, total):
+        job.progress(done / total, f'已解析 {done}/{total} 个文件')
+
+    result = current_app.file_service.record_experiment_files(
+        [tuple(item) for item in args['saved']], job.user_id, args['ticket_number'],
+        progress=progress)
+    _log_experiment_failures(result)
+    return {**result, 'message': _experiment_message(result)}
+
 @bp.route('/predict', methods=['POST'])
 @login_required
 @research_required
@@ -435,6 +557,7 @@ def search_similar():
     """
     Find the top-N work orders whose averaged PT curves are most similar to
     the user-supplied PT curve, after pre-filtering by input parameters.
+    Optional `mode`: 'features' (default), 'l2' or 'dtw' (whole-curve shape).
     """
     try:
         body = request.get_json()
@@ -442,12 +565,15 @@ def search_similar():
         query_pressure = body.get('pressure', [])
         filters = body.get('filters', {})
         top_n = min(int(body.get('top_n', 5)), 20)
+        mode = body.get('mode') or 'features'
 
         if not query_time or not query_pressure:
             return jsonify({'success': False, 'message': '未提供PT曲线数据'}), 400
+        if mode not in SEARCH_MODES:
+            return jsonify({'success': False, 'message': f'不支持的相似度模式: {mode}'}), 400
 
         result = current_app.work_order_service.search_similar_work_orders(
-            query_time, query_pressure, filters, top_n
+            query_time, query_pressure, filters, top_n, mode
         )
         return jsonify({'success': True, **result})
 
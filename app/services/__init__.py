@@ -3,10 +3,12 @@ from .simulation_service import SimulationService
 from .file_service import FileService
 from .comparison_service import ComparisonService
 from .work_order_service import WorkOrderService
+from .job_service import JobService
 
 __all__ = [
     'SimulationService',
     'FileService',
     'ComparisonService',
     'WorkOrderService',
+    'JobService',
 ]
@@ -1,6 +1,7 @@
 """Comparison service for PT curve analysis"""
 import numpy as np
 from typing import Dict, List, Tuple, Optional
+from app.utils.deadline import check_deadline
 from app.utils.errors import DataProcessingError
 from app.utils.plotter import Plotter
 
@@ -24,7 +25,7 @@ class ComparisonService:
         peak_idx = np.argmax(pressure_array)
         peak_pressure = float(pressure_array[peak_idx])
 
-        if time:
+        if time is not None and len(time):
             peak_time = float(time[peak_idx])
         else:
             peak_time = float(peak_idx)
@@ -64,26 +65,29 @@ class ComparisonService:
         return the element-wise average.
 
         Args:
-            datasets: List of dicts, each with 'time' and 'pressure' lists.
-                      Must contain at least one entry.
+            datasets: List of dicts, each with 'time' and 'pressure' lists or
+                      NumPy arrays.  Must contain at least one entry.
 
         Returns:
             Dict with 'time' and 'pressure' lists representing the average curve.
         """
         if len(datasets) == 1:
-            return datasets[0]
+            return {
+                'time': np.asarray(datasets[0]['time']).tolist(),
+                'pressure': np.asarray(datasets[0]['pressure']).tolist(),
+            }
 
         # Overlap region shared by all datasets
-        min_t = max(min(d['time']) for d in datasets)
-        max_t = min(max(d['time']) for d in datasets)
+        min_t = max(np.min(d['time']) for d in datasets)
+        max_t = min(np.max(d['time']) for d in datasets)
         n_pts = max(len(d['time']) for d in datasets)
 
         common_time = np.linspace(min_t, max_t, n_pts)
 
-        all_pressures = [
-            np.interp(common_time, d['time'], d['pressure'])
-            for d in datasets
-        ]
+        all_pressures = []
+        for d in datasets:
+            check_deadline()
+            all_pressures.append(np.interp(common_time, d['time'], d['pressure']))
         avg_pressure = np.mean(all_pressures, axis=0)
 
         return {
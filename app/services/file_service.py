@@ -1,12 +1,16 @@
 """File service for handling file operations and test data"""
-import json
 import os
-from typing import Dict
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import insert
 from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
 
 from app.models import TestResult, Simulation
+from app.services.work_order_summary_service import WorkOrderSummaryService
 from app.utils.file_handler import FileHandler
+from app.utils.parse_cache import ParseCache, hash_stream
+from app.utils.parse_pool import parse_files
 from app.utils.subprocess_runner import SubprocessRunner
 from app.utils.paths import (
     get_upload_directory,
@@ -14,8 +18,12 @@ from app.utils.paths import (
     get_temp_directory,
     ensure_directory_exists
 )
-from app.utils.errors import FileValidationError, DataProcessingError, SubprocessError
-from app.config.constants import ERROR_MESSAGES, SUCCESS_MESSAGES, DEFAULT_CUSTOM_NAME
+from app.utils.errors import (
+    FileValidationError, DataProcessingError, SubprocessError, DeadlineExceededError
+)
+from app.config.constants import (
+    ERROR_MESSAGES, SUCCESS_MESSAGES, DEFAULT_CUSTOM_NAME, PARSE_CACHE
+)
 
 
 class FileService:
@@ -30,6 +38,43 @@ class FileService:
         """
         self.db = db
         self.file_handler = FileHandler()
+        self.summaries = WorkOrderSummaryService(db)
+        self.parse_cache = ParseCache(
+            os.path.join(get_temp_directory(), PARSE_CACHE['dir']),
+            PARSE_CACHE['max_bytes'],
+        )
+
+    def parse_upload(self, file: FileStorage, saved_path: str = None) -> Dict:
+        """
+        Parsed content of an uploaded workbook, from the parse cache when the
+        same bytes were parsed before (e.g. by validate_upload).
+
+        Args:
+            file: Uploaded file; its stream is hashed and rewound.
+            saved_path: Where the file was already saved, if it was.
+                Otherwise it is written to the temp directory for parsing
+                and removed again.
+
+        Returns:
+            FileHandler.parse_test_data_file result plus 'sha256' and 'size'.
+        """
+        key, size = hash_stream(file.stream)
+        parsed = self.parse_cache.get(key)
+        if parsed is None:
+            path = saved_path
+            if path is None:
+                temp_dir = get_temp_directory()
+                ensure_directory_exists(temp_dir)
+                path = os.path.join(temp_dir, f'{key}.xlsx')
+                file.save(path)
+                file.stream.seek(0)
+            try:
+                parsed = self.file_handler.parse_test_data_file(path)
+            finally:
+                if saved_path is None:
+                    self.file_handler.delete_file(path)
+            self.parse_cache.put(key, parsed)
+        return {**parsed, 'sha256': key, 'size': size}
 
     def process_test_result_upload(self, file: FileStorage, user_id: int, simulation_id=None, work_order=None, recipe_params=None) -> Dict:
         """
@@ -61,11 +106,13 @@ class FileService:
 
         # Save file
         filepath = os.path.join(upload_dir, filename)
+        file.stream.seek(0)
         file.save(filepath)
 
         try:
-            # Load Excel data
-            data_dict = self.file_handler.load_excel_data_as_dict(filepath)
+            # Load Excel data (parsed once per content, see parse_upload)
+            time_arr, pressure_arr = self.file_handler.curve_from_parsed(
+                self.parse_upload(file, saved_path=filepath))
 
             # Resolve simulation_id
             linked_sim_id = None
@@ -147,10 +194,11 @@ class FileService:
                 simulation_id=linked_sim_id,
                 filename=filename,
                 file_path=filepath,
-                data=json.dumps(data_dict)
             )
+            test_result.set_curve(time_arr, pressure_arr)
 
             self.db.session.add(test_result)
+            self.summaries.add_datasets([test_result])
             self.db.session.commit()
 
             return {
@@ -158,35 +206,142 @@ class FileService:
                 'test_result_id': test_result.id,
                 'filename': filename,
                 'work_order': work_order or '',
-                'data': data_dict
+                'data': {'time': time_arr.tolist(), 'pressure': pressure_arr.tolist()}
             }
 
-        except Exception as e:
+        except (Exception, DeadlineExceededError) as e:
             # Roll back any partial DB changes so the session stays usable.
             self.db.session.rollback()
-            # Clean up file if database operation fails
+            # Clean up file if parsing or the database operation fails
             self.file_handler.delete_file(filepath)
+            if isinstance(e, DeadlineExceededError):
+                raise
             raise DataProcessingError(f'{ERROR_MESSAGES["file_parse_error"]}: {str(e)}')
 
-    def validate_upload_file(self, file: FileStorage) -> Dict:
+    def process_experiment_upload(self, files: List[FileStorage], user_id: int,
+                                  ticket_number: str, upload_folder: str) -> Dict:
         """
-        Save file to temp directory, validate it, then delete the temp file.
+        Save a batch of experiment captures and record them as TestResults.
 
-        Returns the validation result dict from FileHandler.validate_test_data_file.
+        Files are saved in the request thread, parsed in parallel
+        (parse_pool.parse_files) and all successfully parsed ones inserted
+        with one bulk INSERT. A file that cannot be parsed stays saved and
+        is reported in 'failed' with its error.
+
+        Args:
+            files: Uploaded files (request.files.getlist('files'))
+            user_id: ID of the uploading user
+            ticket_number: Work order; a stub Simulation is created when no
+                simulation carries it yet, so it appears in 工单查询
+            upload_folder: Directory the files are saved to
+
+        Returns:
+            Dict: {'files': [saved filenames], 'failed': [{'filename', 'error'}],
+                   'test_result_ids': [...]}
         """
-        temp_dir = get_temp_directory()
-        ensure_directory_exists(temp_dir)
+        saved = self.save_experiment_files(files, ticket_number, upload_folder)
+        return self.record_experiment_files(saved, user_id, ticket_number)
 
-        filename = secure_filename(file.filename)
-        temp_path = os.path.join(temp_dir, filename)
-        file.save(temp_path)
+    def save_experiment_files(self, files: List[FileStorage], ticket_number: str,
+                              upload_folder: str) -> List[Tuple[str, str]]:
+        """
+        Save uploaded experiment files, prefixed with the work order.
 
-        try:
-            result = self.file_handler.validate_test_data_file(temp_path)
-        finally:
-            self.file_handler.delete_file(temp_path)
+        Returns:
+            [(filename, filepath), ...] in upload order
+        """
+        saved = []
+        for file in files:
+            if file.filename == '':
+                continue
+            filename = secure_filename(file.filename)
+            if ticket_number:
+                filename = f"{ticket_number}_{filename}"
+            filepath = os.path.join(upload_folder, filename)
+            file.save(filepath)
+            saved.append((filename, filepath))
+        return saved
+
+    def record_experiment_files(self, saved: List[Tuple[str, str]], user_id: int,
+                                ticket_number: str,
+                                progress: Callable[[int, int], None] = None) -> Dict:
+        """
+        Parse saved experiment files and insert them as TestResults (the
+        second half of process_experiment_upload; also run as the
+        'experiment_upload' background job).
+
+        Args:
+            progress: Optional callback(parsed, total) after each file
+
+        Returns:
+            Same dict as process_experiment_upload
+        """
+        blobs, errors = {}, {}
+        for done, (index, blob, error) in enumerate(
+                parse_files([path for _, path in saved]), start=1):
+            if blob is None:
+                errors[index] = error
+            else:
+                blobs[index] = blob
+            if progress is not None:
+                progress(done, len(saved))
+
+        # Written after parsing, so no write transaction is open while it runs
+        linked_sim_id = None
+        if ticket_number:
+            sim = (
+                Simulation.query
+                .filter_by(work_order=ticket_number)
+                .order_by(Simulation.created_at.desc())
+                .first()
+            )
+            if sim:
+                linked_sim_id = sim.id
+            else:
+                stub = Simulation(user_id=user_id, work_order=ticket_number)
+                self.db.session.add(stub)
+                self.db.session.flush()
+                linked_sim_id = stub.id
+                self.summaries.on_simulation_saved(stub)
+
+        rows = [
+            {
+                'user_id': user_id,
+                'simulation_id': linked_sim_id,
+                'filename': filename,
+                'file_path': filepath,
+                'curve': blobs[i],
+            }
+            for i, (filename, filepath) in enumerate(saved) if i in blobs
+        ]
+        ids = []
+        if rows:
+            ids = list(self.db.session.scalars(
+                insert(TestResult).returning(TestResult.id, sort_by_parameter_order=True),
+                rows,
+            ))
+            self.summaries.add_datasets(
+                TestResult.query.filter(TestResult.id.in_(ids)).all())
+        self.db.session.commit()
+
+        return {
+            'files': [filename for filename, _ in saved],
+            'failed': [{'filename': saved[i][0], 'error': errors[i]} for i in sorted(errors)],
+            'test_result_ids': ids,
+        }
+
+    def validate_upload_file(self, file: FileStorage) -> Dict:
+        """
+        Validate an uploaded file without persisting it. The parse is kept in
+        the parse cache, so a following /simulation/upload of the same file
+        does not parse it again.
 
-        return result
+        Returns the validation result dict from FileHandler.validate_test_data_file.
+        """
+        try:
+            return self.parse_upload(file)['validation']
+        except DataProcessingError as e:
+            return {'valid': False, 'errors': [f'文件解析失败：{str(e)}']}
 
     def save_to_demo_data_folder(self, file: FileStorage, nc_value: str, custom_name: str = None) -> Dict:
         """
@@ -233,7 +388,7 @@ class FileService:
 
     def load_test_data_file(self, file: FileStorage) -> Dict:
         """
-        Load test data from uploaded file using subprocess (temporary file handling).
+        Load test data from uploaded file via the warm loader pool (temporary file handling).
 
         Args:
             file: Uploaded file from request.files
@@ -259,17 +414,10 @@ class FileService:
 
         try:
             # Run data loader script
-            response_data = SubprocessRunner.run_data_loader_script(temp_path)
-
-            # Clean up temp file on success
-            self.file_handler.delete_file(temp_path)
-
-            return response_data
-
-        except Exception as e:
-            # Clean up temp file on error
+            return SubprocessRunner.run_data_loader_script(temp_path)
+        finally:
+            # Clean up temp file — also when loading fails or runs out of time
             self.file_handler.delete_file(temp_path)
-            raise
 
     def get_test_result_by_id(self, test_result_id: int, user_id: int) -> TestResult:
         """
@@ -311,11 +459,8 @@ class FileService:
         """
         test_result = self.get_test_result_by_id(test_result_id, user_id)
 
-        if not test_result.data:
-            return {}
-
-        try:
-            return json.loads(test_result.data)
-        except json.JSONDecodeError:
+        curve = test_result.get_curve()
+        if curve is None:
             return {}
+        return {'time': curve['time'].tolist(), 'pressure': curve['pressure'].tolist()}
 
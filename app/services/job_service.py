@@ -0,0 +1,295 @@
+"""Background jobs — long uploads, sweeps and exports run off the request
+thread.
+
+A job is a row of the `job` table (app.models.Job) plus a call on a
+per-process thread pool.  The request that submits it gets the job id back
+immediately; status, progress and the result are read from the row, so any
+app process can answer /jobs/<id>.  Cancellation sets `cancel_requested`,
+which the handler sees the next time it reports progress.
+
+Handlers are plain functions registered by kind with `job_handler`:
+
+    @job_handler('sweep')
+    def run_sweep_job(job, params):
+        job.progress(0.5, '...')    # raises JobCancelledError when cancelled
+        return {...}                # JSON-serialisable, stored as the result
+
+They run inside a fresh app context with the submitting user's id in
+`job.user_id`.  Status rows are written on their own short connection, so a
+handler's session transaction is never committed by a progress report.
+
+No broker is involved: SQLite and PostgreSQL both work, and a job is claimed
+with a conditional UPDATE so at most one process runs it.  A process
+restarting after a crash fails the `running` jobs it left behind and adopts
+`queued` jobs nobody picked up (JOBS['orphan_after']).
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import select, update
+
+from app.config.constants import JOBS
+from app.models import Job
+from app.utils.errors import JobCancelledError
+
+logger = logging.getLogger(__name__)
+
+# kind → handler(job: JobContext, params: dict) -> dict
+JOB_HANDLERS: Dict[str, Callable] = {}
+
+
+def job_handler(kind: str):
+    """Decorator registering a background job handler under `kind`."""
+    def register(fn):
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def _worker_name(pid: int = None) -> str:
+    return f'{socket.gethostname()}:{pid or os.getpid()}'
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:   # exists but not ours (EPERM)
+        return True
+    return True
+
+
+class JobContext:
+    """Handle passed to a running handler: progress reports and cancellation."""
+
+    def __init__(self, service: 'JobService', job_id: str, user_id: Optional[int]):
+        self.service = service
+        self.id = job_id
+        self.user_id = user_id
+        self._last_report = 0.0
+
+    def progress(self, fraction: float, message: str = None, force: bool = False) -> None:
+        """
+        Record progress (0..1) and honour a pending cancellation.
+
+        Writes are throttled to one per JOBS['progress_interval'] seconds.
+
+        Raises:
+            JobCancelledError: when cancellation was requested.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_report < JOBS['progress_interval']:
+            return
+        self._last_report = now
+        values = {'progress': min(max(float(fraction), 0.0), 1.0),
+                  'heartbeat_at': datetime.utcnow()}
+        if message is not None:
+            values['message'] = message[:255]
+        try:
+            self.service._write(self.id, values)
+            cancelled = self.service._cancel_requested(self.id)
+        except Exception as e:
+            # e.g. SQLite busy while the handler holds a write transaction
+            logger.warning('Job %s: progress not recorded: %s', self.id, e)
+            return
+        if cancelled:
+            raise JobCancelledError()
+
+    def check_cancelled(self) -> None:
+        """Raise JobCancelledError if cancellation was requested."""
+        if self.service._cancel_requested(self.id):
+            raise JobCancelledError()
+
+
+class JobService:
+    """Submit, run, inspect and cancel background jobs."""
+
+    def __init__(self, db, app=None):
+        self.db = db
+        self.app = app
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app) -> None:
+        self.app = app
+
+    def start(self) -> None:
+        """
+        Start this process's worker threads and recover jobs left behind by
+        a dead process.  Called when a server process starts (gunicorn's
+        post_worker_init, run.py), so orphaned jobs are settled without
+        waiting for the next submission.
+        """
+        self._pool()
+
+    # ── submission ───────────────────────────────────────────────────────────
+
+    def submit(self, kind: str, user_id: Optional[int], params: Dict = None) -> Job:
+        """
+        Store a queued job and hand it to this process's worker threads.
+
+        Raises:
+            ValueError: for an unknown job kind.
+        """
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f'Unknown job kind: {kind}')
+        job = Job(id=uuid.uuid4().hex, kind=kind, user_id=user_id, status='queued',
+                  progress=0.0, params=json.dumps(params or {}),
+                  created_at=datetime.utcnow())
+        self.db.session.add(job)
+        self.db.session.commit()
+        self._pool().submit(self._run, job.id)
+        return job
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Created lazily and per process: gunicorn --preload forks after import
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(
+                    max_workers=JOBS['threads'], thread_name_prefix='job')
+                self._executor_pid = os.getpid()
+                first = True
+            else:
+                first = False
+        if first:
+            self._executor.submit(self._recover)
+        return self._executor
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+    # ── reads ────────────────────────────────────────────────────────────────
+
+    def get(self, job_id: str) -> Optional[Job]:
+        # Always re-read: the row is written by worker threads and other processes
+        return self.db.session.get(Job, job_id, populate_existing=True)
+
+    def list_jobs(self, user_id: Optional[int] = None, limit: int = 50) -> List[Job]:
+        """Most recent jobs, optionally only those of one user."""
+        query = Job.query
+        if user_id is not None:
+            query = query.filter_by(user_id=user_id)
+        return query.order_by(Job.created_at.desc()).limit(limit).all()
+
+    # ── cancellation ─────────────────────────────────────────────────────────
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Request cancellation. A queued job is cancelled at once; a running one
+        stops at its next progress report.
+
+        Returns:
+            False if the job does not exist or has already finished.
+        """
+        now = datetime.utcnow()
+        if self._write(job_id, {'status': 'cancelled', 'cancel_requested': True,
+                                'finished_at': now, 'message': '已取消'},
+                       status='queued'):
+            return True
+        return bool(self._write(job_id, {'cancel_requested': True}, status='running'))
+
+    def _cancel_requested(self, job_id: str) -> bool:
+        with self.db.engine.connect() as conn:
+            return bool(conn.scalar(select(Job.cancel_requested).where(Job.id == job_id)))
+
+    # ── execution ────────────────────────────────────────────────────────────
+
+    def _write(self, job_id: str, values: Dict, status: str = None) -> int:
+        """UPDATE the job row on its own connection; returns the row count."""
+        stmt = update(Job.__table__).where(Job.id == job_id).values(**values)
+        if status is not None:
+            stmt = stmt.where(Job.status == status)
+        with self.db.engine.begin() as conn:
+            return conn.execute(stmt).rowcount
+
+    def _run(self, job_id: str) -> None:
+        with self.app.app_context():
+            try:
+                self._execute(job_id)
+            finally:
+                self.db.session.remove()
+
+    def _execute(self, job_id: str) -> None:
+        now = datetime.utcnow()
+        claimed = self._write(job_id, {'status': 'running', 'worker': _worker_name(),
+                                       'started_at': now, 'heartbeat_at': now},
+                              status='queued')
+        if not claimed:
+            return   # cancelled while queued, or adopted by another process
+        job = self.db.session.get(Job, job_id)
+        handler = JOB_HANDLERS.get(job.kind)
+        context = JobContext(self, job_id, job.user_id)
+        params = json.loads(job.params or '{}')
+        self.db.session.expunge(job)
+
+        try:
+            if handler is None:
+                raise ValueError(f'Unknown job kind: {job.kind}')
+            result = handler(context, params)
+        except JobCancelledError:
+            self.db.session.rollback()
+            self._write(job_id, {'status': 'cancelled', 'message': '已取消',
+                                 'finished_at': datetime.utcnow()})
+            return
+        except Exception as e:
+            self.db.session.rollback()
+            logger.error('Job %s (%s) failed: %s', job_id, job.kind, e, exc_info=True)
+            self._write(job_id, {'status': 'failed', 'error': str(e)[:2000],
+                                 'finished_at': datetime.utcnow()})
+            return
+
+        self._write(job_id, {'status': 'succeeded', 'progress': 1.0,
+                             'result': json.dumps(result) if result is not None else None,
+                             'finished_at': datetime.utcnow()})
+
+    # ── crash recovery ───────────────────────────────────────────────────────
+
+    def _recover(self) -> None:
+        """
+        Runs once per process when its worker threads start (start() or the
+        first submission): fails jobs whose process on this host has exited,
+        adopts long-queued orphans and purges old rows.
+        """
+        with self.app.app_context():
+            try:
+                self._recover_jobs()
+            except Exception as e:
+                logger.warning('Job recovery failed: %s', e)
+            finally:
+                self.db.session.remove()
+
+    def _recover_jobs(self) -> None:
+        host = socket.gethostname()
+        now = datetime.utcnow()
+        running = self.db.session.execute(
+            select(Job.id, Job.worker).where(Job.status == 'running')).all()
+        for job_id, worker in running:
+            worker_host, _, pid = (worker or '').rpartition(':')
+            if worker_host == host and pid.isdigit() and not _pid_alive(int(pid)):
+                self._write(job_id, {'status': 'failed', 'finished_at': now,
+                                     'error': '任务中断：工作进程已退出'},
+                            status='running')
+
+        cutoff = now - timedelta(seconds=JOBS['orphan_after'])
+        orphans = self.db.session.scalars(
+            select(Job.id).where(Job.status == 'queued', Job.created_at < cutoff)).all()
+        for job_id in orphans:
+            self._executor.submit(self._run, job_id)
+
+        purge_before = now - timedelta(days=JOBS['keep_days'])
+        with self.db.engine.begin() as conn:
+            conn.execute(Job.__table__.delete().where(
+                Job.status.in_(Job.FINISHED), Job.finished_at < purge_before))
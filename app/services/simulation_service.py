@@ -1,11 +1,23 @@
 """Simulation service for handling simulation business logic"""
 import json
-from typing import Dict, List
+import math
+from typing import Callable, Dict, List
+import numpy as np
+from sqlalchemy import insert
 from sqlalchemy.exc import IntegrityError
+from app.config.constants import SWEEP_CHUNK_POINTS, SWEEP_MAX_POINTS
 from app.models import Simulation, TestResult
-from app.utils.model_runner import run_forward_inference
+from app.utils.model_runner import (
+    build_forward_result,
+    expand_forward_result,
+    get_common_times,
+    predict_pressure_curves,
+    run_forward_inference,
+)
+from app.utils.deadline import check_deadline
 from app.utils.errors import SimulationError
 from app.services.comparison_service import ComparisonService
+from app.services.work_order_summary_service import WorkOrderSummaryService
 
 
 class SimulationService:
@@ -19,6 +31,7 @@ class SimulationService:
             db: SQLAlchemy database instance
         """
         self.db = db
+        self.summaries = WorkOrderSummaryService(db)
 
     # Recipe fields that define a unique simulation (excludes metadata)
     _RECIPE_STRING_FIELDS = (
@@ -43,6 +56,29 @@ class SimulationService:
                     pass
         return query
 
+    @staticmethod
+    def _simulation_columns(user_id: int, params: Dict) -> Dict:
+        """Column values for a new Simulation row built from request params."""
+        return {
+            'user_id': user_id,
+            'ignition_model': params.get('ignition_model'),
+            'nc_type_1': params.get('nc_type_1'),
+            'nc_usage_1': float(params.get('nc_usage_1', 0)),
+            'nc_type_2': params.get('nc_type_2'),
+            'nc_usage_2': float(params.get('nc_usage_2', 0)),
+            'gp_type': params.get('gp_type'),
+            'gp_usage': float(params.get('gp_usage', 0)),
+            'shell_model': params.get('shell_model'),
+            'current': float(params.get('current', 0)),
+            'sensor_model': params.get('sensor_model'),
+            'body_model': params.get('body_model'),
+            'equipment': params.get('equipment'),
+            'employee_id': params.get('employee_id'),
+            'test_name': params.get('test_name'),
+            'notes': params.get('notes'),
+            'work_order': params.get('work_order'),
+        }
+
     def run_forward_simulation(self, user_id: int, params: Dict) -> Dict:
         """
         Run forward simulation with provided parameters.
@@ -70,36 +106,22 @@ class SimulationService:
                     return {
                         'success': True,
                         'simulation_id': existing.id,
-                        'data': json.loads(existing.result_data)
+                        'data': expand_forward_result(json.loads(existing.result_data))
                     }
                 except (json.JSONDecodeError, TypeError):
                     pass  # corrupted result_data — fall through to create a fresh one
 
             # No existing record: run inference and persist
-            simulation = Simulation(
-                user_id=user_id,
-                ignition_model=params.get('ignition_model'),
-                nc_type_1=params.get('nc_type_1'),
-                nc_usage_1=nc_usage_1,
-                nc_type_2=params.get('nc_type_2'),
-                nc_usage_2=float(params.get('nc_usage_2', 0)),
-                gp_type=params.get('gp_type'),
-                gp_usage=float(params.get('gp_usage', 0)),
-                shell_model=params.get('shell_model'),
-                current=float(params.get('current', 0)),
-                sensor_model=params.get('sensor_model'),
-                body_model=params.get('body_model'),
-                equipment=params.get('equipment'),
-                employee_id=params.get('employee_id'),
-                test_name=params.get('test_name'),
-                notes=params.get('notes'),
-                work_order=params.get('work_order')
-            )
-
-            response_data = run_forward_inference(nc_usage_1)
-
-            simulation.result_data = json.dumps(response_data)
+            simulation = Simulation(**self._simulation_columns(user_id, params))
+
+            curves, mode = predict_pressure_curves([nc_usage_1])
+            record = build_forward_result(nc_usage_1, curves[0], mode)
+            response_data = expand_forward_result(record)
+
+            # Only the curve and statistics are stored; the chart is rebuilt on read
+            simulation.result_data = json.dumps(record)
             self.db.session.add(simulation)
+            self.summaries.on_simulation_saved(simulation)
             
             try:
                 self.db.session.commit()
@@ -117,7 +139,7 @@ class SimulationService:
                     return {
                         'success': True,
                         'simulation_id': existing.id,
-                        'data': json.loads(existing.result_data)
+                        'data': expand_forward_result(json.loads(existing.result_data))
                     }
                 # If still not found, re-raise (should never happen)
                 raise SimulationError('Duplicate recipe detected but cannot find existing record')
@@ -128,6 +150,142 @@ class SimulationService:
         except Exception as e:
             raise SimulationError(f'Error running simulation: {str(e)}')
 
+    @staticmethod
+    def parse_sweep_values(params: Dict) -> List[float]:
+        """
+        Resolve the nc_usage_1 points of a sweep request.
+
+        Accepts either an explicit ``values`` list (JSON list or comma-separated
+        string) or an inclusive ``start``/``stop``/``step`` range.  Duplicates
+        are dropped, order is preserved.
+
+        Raises:
+            SimulationError: on malformed, negative or too many values.
+        """
+        raw = params.get('values')
+        try:
+            if raw not in (None, '', []):
+                if isinstance(raw, str):
+                    raw = [v for v in raw.split(',') if v.strip()]
+                values = [float(v) for v in raw]
+            else:
+                start = float(params['start'])
+                stop = float(params['stop'])
+                step = float(params['step'])
+                if not step > 0 or stop < start:
+                    raise SimulationError('扫描范围无效：需要 step > 0 且 stop ≥ start')
+                # Tolerance keeps `stop` inclusive despite float rounding
+                count = int(math.floor((stop - start) / step + 1e-9)) + 1
+                if count > SWEEP_MAX_POINTS:
+                    raise SimulationError(f'扫描点数过多（最多 {SWEEP_MAX_POINTS} 个）')
+                values = np.round(start + step * np.arange(count), 6).tolist()
+        except (KeyError, TypeError, ValueError):
+            raise SimulationError('请提供 values 列表或 start/stop/step 扫描范围')
+
+        values = list(dict.fromkeys(values))
+        if not values:
+            raise SimulationError('扫描点列表为空')
+        if len(values) > SWEEP_MAX_POINTS:
+            raise SimulationError(f'扫描点数过多（最多 {SWEEP_MAX_POINTS} 个）')
+        if not all(math.isfinite(v) and v >= 0 for v in values):
+            raise SimulationError('NC用量1 必须为非负数')
+        return values
+
+    def run_sweep(self, params: Dict, progress: Callable[[int, int], None] = None) -> Dict:
+        """
+        Evaluate a parameter sweep over nc_usage_1 in batched inference calls
+        of SWEEP_CHUNK_POINTS points.
+
+        Args:
+            params: Sweep request (see parse_sweep_values)
+            progress: Optional callback(evaluated, total) after each batch
+
+        Returns:
+            {'values': [...], 'times': (T,), 'pressures': (N, T),
+             'peak_pressure': (N,), 'peak_time': (N,), 'mode': str}
+
+        Raises:
+            SimulationError: on invalid sweep parameters or inference failure.
+        """
+        values = self.parse_sweep_values(params)
+        chunks, modes = [], set()
+        for start in range(0, len(values), SWEEP_CHUNK_POINTS):
+            try:
+                chunk, chunk_mode = predict_pressure_curves(values[start:start + SWEEP_CHUNK_POINTS])
+            except SimulationError:
+                raise
+            except Exception as e:
+                raise SimulationError(f'Error running sweep: {str(e)}')
+            chunks.append(chunk)
+            modes.add(chunk_mode)
+            if progress:
+                progress(start + len(chunk), len(values))
+        times = get_common_times()
+        pressures = np.concatenate(chunks)
+        mode = modes.pop() if len(modes) == 1 else 'mixed'
+
+        peak_idx = np.argmax(pressures, axis=1)
+        return {
+            'values': values,
+            'times': times,
+            'pressures': pressures,
+            'peak_pressure': pressures[np.arange(len(values)), peak_idx],
+            'peak_time': times[peak_idx],
+            'mode': mode,
+        }
+
+    def persist_sweep(self, user_id: int, params: Dict, sweep: Dict) -> Dict:
+        """
+        Store the points of a sweep that do not exist yet with one bulk INSERT.
+
+        Recipes already in the database (any user) are reused, exactly as in
+        run_forward_simulation.
+
+        Returns:
+            {'simulation_ids': [id per sweep value], 'created': N, 'reused': N}
+        """
+        values = sweep['values']
+        recipe = {k: v for k, v in params.items() if k != 'nc_usage_1'}
+
+        def existing_ids():
+            rows = (self._build_recipe_query(recipe)
+                    .filter(Simulation.nc_usage_1.in_(values))
+                    .with_entities(Simulation.nc_usage_1, Simulation.id)
+                    .all())
+            return {nc: sim_id for nc, sim_id in rows}
+
+        known = existing_ids()
+        rows = []
+        for i, nc in enumerate(values):
+            if nc in known:
+                continue
+            columns = self._simulation_columns(user_id, {**params, 'nc_usage_1': nc})
+            columns['result_data'] = json.dumps(build_forward_result(
+                nc, sweep['pressures'][i], sweep['mode']))
+            rows.append(columns)
+
+        if rows:
+            try:
+                self.db.session.execute(insert(Simulation), rows)
+                self.summaries.refresh(params.get('work_order'))
+                self.db.session.commit()
+            except IntegrityError:
+                # A concurrent /run or sweep inserted some of the same recipes
+                self.db.session.rollback()
+                known_now = existing_ids()
+                rows = [r for r in rows if r['nc_usage_1'] not in known_now]
+                if rows:
+                    self.db.session.execute(insert(Simulation), rows)
+                self.summaries.refresh(params.get('work_order'))
+                self.db.session.commit()
+
+        ids = existing_ids()
+        return {
+            'simulation_ids': [ids.get(nc) for nc in values],
+            'created': len(rows),
+            'reused': len(values) - len(rows),
+        }
+
     def run_prediction(self, nc_usage_1: float) -> Dict:
         """
         Run quick prediction without authentication (for demo page).
@@ -211,7 +369,7 @@ class SimulationService:
             return {}
 
         try:
-            return json.loads(simulation.result_data)
+            return expand_forward_result(json.loads(simulation.result_data))
         except json.JSONDecodeError:
             return {}
 
@@ -255,14 +413,10 @@ class SimulationService:
         # Parse data from each linked test result
         datasets = []
         for tr in test_results:
-            if not tr.data:
-                continue
-            try:
-                d = json.loads(tr.data)
-                if d.get('time') and d.get('pressure'):
-                    datasets.append(d)
-            except (json.JSONDecodeError, TypeError):
-                continue
+            check_deadline()
+            d = tr.get_curve()
+            if d:
+                datasets.append(d)
 
         if not datasets:
             return {'found': False}
@@ -1,11 +1,17 @@
 """Work order service — browse, detail, statistics, and delete for 工单查询"""
-import json
 import os
+import threading
 import numpy as np
 from typing import Dict, List, Optional, Tuple
 
-from app.models import Simulation, TestResult
+from sqlalchemy import Float, func, select
+
+from app.models import Simulation, TestResult, WorkOrderCurve
 from app.services.comparison_service import ComparisonService
+from app.services.work_order_summary_service import WorkOrderSummaryService
+from app.utils.deadline import check_deadline
+from app.utils.feature_index import FeatureIndex
+from app.utils.metrics_registry import SIMILARITY_SEARCH
 from app.utils.plotter import Plotter
 
 
@@ -14,6 +20,11 @@ class WorkOrderService:
 
     def __init__(self, db):
         self.db = db
+        self.summaries = WorkOrderSummaryService(db)
+        # Similarity-search index, shared by all requests of this process
+        self._index: Optional[FeatureIndex] = None
+        self._index_token = None
+        self._index_lock = threading.Lock()
 
     def get_all_work_orders(self) -> List[Dict]:
         """
@@ -22,58 +33,16 @@ class WorkOrderService:
         Each entry also includes mean_peak_pressure and mean_peak_time so
         the frontend can sort client-side without extra round trips.
 
+        Served from the work_order_summary table, which is maintained on
+        every upload/delete (see WorkOrderSummaryService).
+
         Returns:
             List of dicts: {work_order, simulation_id, owner_id, recipe_summary,
-                            created_at, mean_peak_pressure, mean_peak_time}
+                            created_at, dataset_count, mean_peak_pressure,
+                            mean_peak_time, std_peak_pressure, std_peak_time,
+                            last_upload_at}
         """
-        sims = (
-            Simulation.query
-            .filter(Simulation.work_order.isnot(None))
-            .filter(Simulation.work_order != '')
-            .order_by(Simulation.created_at)  # oldest first so first-seen = owner
-            .all()
-        )
-        if not sims:
-            return []
-
-        # Deduplicate: one entry per unique work_order; earliest sim is the owner
-        seen: Dict[str, Simulation] = {}
-        for s in sims:
-            if s.work_order not in seen:
-                seen[s.work_order] = s
-
-        # Build work_order → [sim_ids] mapping (all sims, not just the owner)
-        sim_id_to_wo: Dict[int, str] = {s.id: s.work_order for s in sims}
-        wo_datasets: Dict[str, List] = {wo: [] for wo in seen}
-
-        # Batch-load all test results in one query and group by work_order
-        all_sim_ids = [s.id for s in sims]
-        test_results = TestResult.query.filter(
-            TestResult.simulation_id.in_(all_sim_ids)
-        ).all()
-        for tr in test_results:
-            wo = sim_id_to_wo.get(tr.simulation_id)
-            if wo and tr.data:
-                try:
-                    d = json.loads(tr.data)
-                    if d.get('time') and d.get('pressure'):
-                        wo_datasets[wo].append(d)
-                except (json.JSONDecodeError, TypeError):
-                    pass
-
-        # Sort descending by created_at for default display order
-        unique_sims = sorted(seen.values(), key=lambda x: x.created_at, reverse=True)
-        return [
-            {
-                'work_order': s.work_order,
-                'simulation_id': s.id,
-                'owner_id': s.user_id,
-                'recipe_summary': WorkOrderService._recipe_summary(s),
-                'created_at': s.created_at.strftime('%Y-%m-%d %H:%M') if s.created_at else '',
-                **WorkOrderService._compute_peak_summary(wo_datasets[s.work_order]),
-            }
-            for s in unique_sims
-        ]
+        return self.summaries.list_summaries()
 
     def get_work_order_detail(self, work_order: str) -> Dict:
         """
@@ -115,14 +84,10 @@ class WorkOrderService:
                 'filename': tr.filename,
                 'uploaded_at': tr.uploaded_at.strftime('%Y-%m-%d %H:%M') if tr.uploaded_at else '',
             })
-            if tr.data:
-                try:
-                    d = json.loads(tr.data)
-                    if d.get('time') and d.get('pressure'):
-                        datasets.append(d)
-                        labels.append(tr.filename)
-                except (json.JSONDecodeError, TypeError):
-                    pass
+            d = tr.get_curve()
+            if d:
+                datasets.append(d)
+                labels.append(tr.filename)
 
         chart = Plotter.create_multi_run_chart(datasets, labels)
         statistics = self._compute_statistics(datasets, labels)
@@ -202,6 +167,7 @@ class WorkOrderService:
             except OSError:
                 pass  # Non-fatal — still remove the DB record
 
+        self.summaries.remove_datasets([tr])
         self.db.session.delete(tr)
         self.db.session.commit()
         return {'success': True}
@@ -246,6 +212,7 @@ class WorkOrderService:
         for s in sims:
             self.db.session.delete(s)
 
+        self.summaries.refresh(work_order)
         self.db.session.commit()
         return {'success': True}
 
@@ -266,76 +233,46 @@ class WorkOrderService:
         query_pressure: List[float],
         filters: Dict,
         top_n: int = 5,
+        mode: str = 'features',
     ) -> Dict:
         """
         Find the top-N work orders whose averaged PT curves are most similar
         to the query curve, after optionally filtering by recipe parameters.
+        Filtering and scoring run on the in-memory FeatureIndex.
+
+        `mode` selects the metric (similarity.SEARCH_MODES): 'features'
+        compares peak and slope features, 'l2' / 'dtw' the whole curve shape.
 
         Returns:
             {'results': [{work_order, score, score_pct, recipe_summary,
                           max_pressure, max_pressure_time, ...}, ...]}
         """
-        from app.utils.similarity import rank_candidates
-
-        # Build base query — only work orders with a non-empty work_order field
-        query = Simulation.query.filter(
-            Simulation.work_order.isnot(None),
-            Simulation.work_order != '',
-        )
-        for fk, field_name in self._FILTER_FIELD.items():
-            val = filters.get(fk)
-            if val not in (None, '', 'None'):
-                query = query.filter(getattr(Simulation, field_name) == str(val))
-        sims = query.all()
-
-        if not sims:
-            return {'results': []}
-
-        # Group test datasets by work_order
-        sim_id_to_wo = {s.id: s.work_order for s in sims}
-        wo_to_sim = {}
-        for s in sims:
-            wo_to_sim.setdefault(s.work_order, s)   # earliest sim per WO
-
-        all_sim_ids = list(sim_id_to_wo.keys())
-        test_results = TestResult.query.filter(
-            TestResult.simulation_id.in_(all_sim_ids)
-        ).all()
+        from app.utils.similarity import compute_features, resample_shape
 
-        wo_datasets: Dict[str, List[Dict]] = {}
-        for tr in test_results:
-            wo = sim_id_to_wo.get(tr.simulation_id)
-            if not wo or not tr.data:
-                continue
-            try:
-                d = json.loads(tr.data)
-                if d.get('time') and d.get('pressure'):
-                    wo_datasets.setdefault(wo, []).append(d)
-            except (json.JSONDecodeError, TypeError):
-                pass
-
-        # Build averaged candidates
-        candidates = []
-        for wo, datasets in wo_datasets.items():
-            if not datasets:
-                continue
-            avg = ComparisonService.average_datasets(datasets)
-            candidates.append((wo, avg['time'], avg['pressure']))
-
-        if not candidates:
+        active = {
+            fk: val for fk, val in (filters or {}).items()
+            if fk in self._FILTER_FIELD and val not in (None, '', 'None')
+        }
+        whole_curve = mode != 'features'
+        with SIMILARITY_SEARCH.labels(mode).time():
+            hits = self._feature_index(with_shapes=whole_curve).search(
+                compute_features(query_time, query_pressure), active, top_n, mode=mode,
+                query_shape=resample_shape(query_time, query_pressure) if whole_curve else None)
+        if not hits:
             return {'results': []}
 
-        ranked = rank_candidates(query_time, query_pressure, candidates)
-
+        sims = {
+            s.id: s for s in
+            Simulation.query.filter(Simulation.id.in_([h['simulation_id'] for h in hits])).all()
+        }
         results = []
-        for item in ranked[:top_n]:
-            wo = item['label']
-            sim = wo_to_sim.get(wo)
-            feat = item['features']
+        for hit in hits:
+            sim = sims.get(hit['simulation_id'])
+            feat = hit['features']
             results.append({
-                'work_order':       wo,
-                'score':            round(item['score'], 4),
-                'score_pct':        round(item['score'] * 100, 1),
+                'work_order':       hit['work_order'],
+                'score':            round(hit['score'], 4),
+                'score_pct':        round(hit['score'] * 100, 1),
                 'recipe_summary':   self._recipe_summary(sim) if sim else '',
                 'max_pressure':     round(feat['max_pressure'], 3),
                 'max_pressure_time': round(feat['max_pressure_time'], 3),
@@ -344,6 +281,51 @@ class WorkOrderService:
             })
         return {'results': results}
 
+    def _feature_index(self, with_shapes: bool = False) -> FeatureIndex:
+        """
+        The process's FeatureIndex, rebuilt when simulations, test results or
+        cached work-order curves changed since it was built. Resampled curve
+        shapes are attached on first use by a whole-curve search.
+        """
+        from app.utils.similarity import resample_shape
+
+        token = self._index_generation()
+        with self._index_lock:
+            if self._index is None or self._index_token != token:
+                self._index = self._build_feature_index()
+                # Building may itself refresh stale work_order_curve rows
+                self._index_token = self._index_generation()
+            index = self._index
+            if with_shapes and index.shapes is None:
+                curves = self.summaries.get_averaged_curves(index.work_orders)
+                index.set_shapes({wo: resample_shape(c['time'], c['pressure'])
+                                  for wo, c in curves.items() if c})
+            return index
+
+    def _index_generation(self) -> Tuple:
+        """Cheap change marker: row counts and high-water marks of the source tables."""
+        def scalar(expr):
+            return select(expr).scalar_subquery()
+
+        return tuple(self.db.session.execute(select(
+            scalar(func.count(Simulation.id)), scalar(func.max(Simulation.id)),
+            scalar(func.count(TestResult.id)), scalar(func.max(TestResult.id)),
+            scalar(func.count(WorkOrderCurve.work_order)), scalar(func.max(WorkOrderCurve.updated_at)),
+        )).one())
+
+    def _build_feature_index(self) -> FeatureIndex:
+        columns = [getattr(Simulation, f) for f in self._FILTER_FIELD.values()]
+        rows = (
+            self.db.session.query(Simulation.id, Simulation.work_order, *columns)
+            .filter(Simulation.work_order.isnot(None), Simulation.work_order != '')
+            .order_by(Simulation.id)
+            .all()
+        )
+        sims = [(r[0], r[1], dict(zip(self._FILTER_FIELD, r[2:]))) for r in rows]
+        features = self.summaries.get_curve_features(wo for _, wo, _ in sims)
+        numeric = [fk for fk, col in zip(self._FILTER_FIELD, columns) if isinstance(col.type, Float)]
+        return FeatureIndex(sims, features, numeric_columns=numeric)
+
     def get_work_order_averaged_curve(self, work_order: str) -> Dict:
         """
         Return the averaged time/pressure arrays for all test results linked
@@ -353,31 +335,10 @@ class WorkOrderService:
             {'found': True, 'time': [...], 'pressure': [...]}
             {'found': False} if no test data exists.
         """
-        sims = Simulation.query.filter_by(work_order=work_order).all()
-        if not sims:
+        curve = self.summaries.get_averaged_curves([work_order]).get(work_order)
+        if curve is None:
             return {'found': False}
-
-        sim_ids = [s.id for s in sims]
-        test_results = TestResult.query.filter(
-            TestResult.simulation_id.in_(sim_ids)
-        ).all()
-
-        datasets = []
-        for tr in test_results:
-            if not tr.data:
-                continue
-            try:
-                d = json.loads(tr.data)
-                if d.get('time') and d.get('pressure'):
-                    datasets.append(d)
-            except (json.JSONDecodeError, TypeError):
-                pass
-
-        if not datasets:
-            return {'found': False}
-
-        avg = ComparisonService.average_datasets(datasets)
-        return {'found': True, 'time': avg['time'], 'pressure': avg['pressure']}
+        return {'found': True, 'time': curve['time'].tolist(), 'pressure': curve['pressure'].tolist()}
 
     # ── Comparison (工单对比) ──────────────────────────────────────────────────
 
@@ -463,44 +424,22 @@ class WorkOrderService:
         }
         unit = dim_units.get(dimension, '')
 
+        # Work orders are averaged once and cached (work_order_curve)
+        cached = (self.summaries.get_averaged_curves(values)
+                  if dimension == 'work_order' else {})
+
         for raw_val in values:
-            # Query matching simulations
-            if dimension in ('nc_usage_1', 'gp_usage'):
-                try:
-                    num_val = float(raw_val)
-                except ValueError:
+            if dimension == 'work_order':
+                entry = cached.get(raw_val)
+                if entry is None:
                     continue
-                sims = Simulation.query.filter(
-                    getattr(Simulation, field_name) == num_val
-                ).all()
+                count = entry['count']
+                averaged = {'time': entry['time'].tolist(), 'pressure': entry['pressure'].tolist()}
             else:
-                sims = Simulation.query.filter(
-                    getattr(Simulation, field_name) == raw_val
-                ).all()
-
-            sim_ids = [s.id for s in sims]
-            if not sim_ids:
-                continue
-
-            test_results = TestResult.query.filter(
-                TestResult.simulation_id.in_(sim_ids)
-            ).all()
-
-            datasets = []
-            for tr in test_results:
-                if not tr.data:
+                averaged, count = self._average_for_value(field_name, dimension, raw_val)
+                if averaged is None:
                     continue
-                try:
-                    d = json.loads(tr.data)
-                    if d.get('time') and d.get('pressure'):
-                        datasets.append(d)
-                except (json.JSONDecodeError, TypeError):
-                    pass
-
-            if not datasets:
-                continue
 
-            averaged = ComparisonService.average_datasets(datasets)
             suffix = f' {unit}' if unit else ''
             label = f'{raw_val}{suffix}' if dimension != 'work_order' else raw_val
 
@@ -513,7 +452,7 @@ class WorkOrderService:
             )
             table.append({
                 'label': label,
-                'count': len(datasets),
+                'count': count,
                 'peak_pressure': round(peak_p, 3),
                 'peak_time': round(peak_t, 3),
             })
@@ -521,6 +460,46 @@ class WorkOrderService:
         chart = Plotter.create_multi_run_chart(curves, labels)
         return {'chart': chart, 'table': table}
 
+    @staticmethod
+    def _average_for_value(field_name: str, dimension: str, raw_val: str) -> Tuple[Optional[Dict], int]:
+        """
+        Average every dataset whose simulation has `field_name == raw_val`.
+
+        Returns:
+            (averaged {'time', 'pressure'} or None, number of datasets)
+        """
+        if dimension in ('nc_usage_1', 'gp_usage'):
+            try:
+                num_val = float(raw_val)
+            except ValueError:
+                return None, 0
+            sims = Simulation.query.filter(
+                getattr(Simulation, field_name) == num_val
+            ).all()
+        else:
+            sims = Simulation.query.filter(
+                getattr(Simulation, field_name) == raw_val
+            ).all()
+
+        sim_ids = [s.id for s in sims]
+        if not sim_ids:
+            return None, 0
+
+        test_results = TestResult.query.filter(
+            TestResult.simulation_id.in_(sim_ids)
+        ).all()
+
+        datasets = []
+        for tr in test_results:
+            check_deadline()
+            d = tr.get_curve()
+            if d:
+                datasets.append(d)
+
+        if not datasets:
+            return None, 0
+        return ComparisonService.average_datasets(datasets), len(datasets)
+
     # ── private helpers ──────────────────────────────────────────────────────
 
     @staticmethod
@@ -562,39 +541,6 @@ class WorkOrderService:
             'cv_t': round(cv_t, 2),
         }
 
-    @staticmethod
-    def _compute_peak_summary(datasets: List[Dict]) -> Dict:
-        """
-        Return mean_peak_pressure (MPa) and mean_peak_time (ms) across all
-        datasets for one work order.  Both values are None when there is no
-        test data.
-
-        Returns:
-            {'mean_peak_pressure': float|None, 'mean_peak_time': float|None}
-        """
-        if not datasets:
-            return {'mean_peak_pressure': None, 'mean_peak_time': None}
-        pressures, times = [], []
-        for d in datasets:
-            peak_p, peak_t = ComparisonService.find_peak_pressure(
-                d['pressure'], d['time']
-            )
-            pressures.append(peak_p)
-            times.append(peak_t)
-        return {
-            'mean_peak_pressure': round(float(np.mean(pressures)), 3),
-            'mean_peak_time': round(float(np.mean(times)), 3),
-        }
-
     @staticmethod
     def _recipe_summary(sim: Simulation) -> str:
-        parts = []
-        if sim.ignition_model:
-            parts.append(f'点火具:{sim.ignition_model}')
-        if sim.nc_type_1:
-            parts.append(f'NC1:{sim.nc_type_1}/{sim.nc_usage_1}mg')
-        if sim.shell_model:
-            parts.append(f'管壳:{sim.shell_model}mm')
-        if sim.current:
-            parts.append(f'通电:{sim.current}A')
-        return ' · '.join(parts)
+        return WorkOrderSummaryService.recipe_summary(sim)
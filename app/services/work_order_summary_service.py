@@ -0,0 +1,433 @@
+"""Work order summary maintenance — keeps the work_order_summary table in step
+with Simulation / TestResult writes so 工单查询 never recomputes on read, and
+serves the per-work-order averaged curve cache (work_order_curve)."""
+import hashlib
+import json
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models import Simulation, TestResult, WorkOrderCurve, WorkOrderSummary
+from app.services.comparison_service import ComparisonService
+from app.utils.curve_codec import decode_curve, encode_curve
+from app.utils.similarity import compute_features_batch, features_to_dicts
+
+# Bump when the averaging or feature extraction changes: every cached
+# work_order_curve row then fails its hash check and is rebuilt on next read.
+CURVE_CACHE_VERSION = 1
+
+
+class WorkOrderSummaryService:
+    """
+    Incremental maintenance of WorkOrderSummary rows.
+
+    All methods only stage changes on the session; the caller commits them in
+    the same transaction as the write they describe.  The exception is the
+    averaged-curve cache, which readers rebuild and store themselves (see
+    _store_curves).
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    # ── reads ────────────────────────────────────────────────────────────────
+
+    def list_summaries(self) -> List[Dict]:
+        """All work orders, newest owner simulation first (one indexed SELECT)."""
+        rows = (
+            WorkOrderSummary.query
+            .order_by(WorkOrderSummary.created_at.desc())
+            .all()
+        )
+        return [self.to_dict(r) for r in rows]
+
+    @staticmethod
+    def to_dict(row: WorkOrderSummary) -> Dict:
+        has_data = bool(row.dataset_count)
+        return {
+            'work_order': row.work_order,
+            'simulation_id': row.simulation_id,
+            'owner_id': row.owner_id,
+            'recipe_summary': row.recipe_summary or '',
+            'created_at': row.created_at.strftime('%Y-%m-%d %H:%M') if row.created_at else '',
+            'dataset_count': row.dataset_count or 0,
+            'mean_peak_pressure': round(row.mean_peak_pressure, 3) if has_data else None,
+            'mean_peak_time': round(row.mean_peak_time, 3) if has_data else None,
+            'std_peak_pressure': round(row.std_peak_pressure, 3) if has_data else None,
+            'std_peak_time': round(row.std_peak_time, 3) if has_data else None,
+            'last_upload_at': (row.last_upload_at.strftime('%Y-%m-%d %H:%M')
+                               if row.last_upload_at else ''),
+        }
+
+    # ── writes ───────────────────────────────────────────────────────────────
+
+    def refresh(self, work_order: str) -> Optional[WorkOrderSummary]:
+        """
+        Recompute one work order's row from its simulations and test results.
+        Used when the set of simulations changes (new work order, relinked or
+        deleted simulations); removes the row when no simulation is left.
+        """
+        if not work_order:
+            return None
+        self.db.session.flush()
+        self._invalidate_curve(work_order)
+        row = self.db.session.get(WorkOrderSummary, work_order)
+
+        sims = (
+            Simulation.query
+            .filter_by(work_order=work_order)
+            .order_by(Simulation.created_at)
+            .all()
+        )
+        if not sims:
+            if row is not None:
+                self.db.session.delete(row)
+            return None
+
+        if row is None:
+            row = WorkOrderSummary(work_order=work_order)
+            self.db.session.add(row)
+        self._set_owner(row, sims[0])
+        self._reset_stats(row)
+
+        test_results = TestResult.query.filter(
+            TestResult.simulation_id.in_([s.id for s in sims])
+        ).all()
+        for tr in test_results:
+            self._add_one(row, tr)
+        return row
+
+    def add_datasets(self, test_results: Iterable[TestResult]) -> None:
+        """
+        Account for newly uploaded TestResults (already added to the session).
+
+        Work orders that have no summary row yet are built with refresh(),
+        which already includes the new rows; existing rows are updated in O(1)
+        per dataset.
+        """
+        self.db.session.flush()
+        refreshed = set()
+        for tr in test_results:
+            work_order = self._work_order_of(tr)
+            if not work_order or work_order in refreshed:
+                continue
+            row = self._locked_row(work_order)
+            if row is None:
+                self.refresh(work_order)
+                refreshed.add(work_order)
+            else:
+                self._add_one(row, tr)
+                self._invalidate_curve(work_order)
+
+    def remove_datasets(self, test_results: Iterable[TestResult]) -> None:
+        """Account for TestResults about to be deleted (call before delete)."""
+        for tr in test_results:
+            work_order = self._work_order_of(tr)
+            if not work_order:
+                continue
+            self._invalidate_curve(work_order)
+            row = self._locked_row(work_order)
+            if row is not None:
+                self._remove_one(row, tr)
+
+    def on_simulation_saved(self, sim: Simulation) -> None:
+        """New simulation carrying a work order: create/re-own the row if needed."""
+        if not sim.work_order:
+            return
+        row = self._locked_row(sim.work_order)
+        if row is None or (sim.created_at and row.created_at
+                           and _naive(sim.created_at) < _naive(row.created_at)):
+            self.refresh(sim.work_order)
+
+    def rebuild_all(self) -> int:
+        """Rebuild every row from scratch (backfill). Returns the row count."""
+        work_orders = [
+            wo for (wo,) in Simulation.query
+            .with_entities(Simulation.work_order)
+            .filter(Simulation.work_order.isnot(None), Simulation.work_order != '')
+            .distinct()
+            .all()
+        ]
+        WorkOrderSummary.query.filter(
+            WorkOrderSummary.work_order.notin_(work_orders)
+        ).delete(synchronize_session=False)
+        for wo in work_orders:
+            self.refresh(wo)
+        return len(work_orders)
+
+    # ── averaged-curve cache ─────────────────────────────────────────────────
+
+    def get_averaged_curves(self, work_orders: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        """
+        Averaged curve of each work order, read from work_order_curve.
+
+        Entries whose source hash no longer matches the work order's current
+        TestResult ids (or that were invalidated by a write) are rebuilt here
+        and stored for the next reader.
+
+        Returns:
+            {work_order: {'time': ndarray, 'pressure': ndarray,
+                          'features': dict, 'count': int}
+                         or None when the work order has no usable test data}
+        """
+        return self._resolve_curves(work_orders, decode=True)
+
+    def get_curve_features(self, work_orders: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        """
+        Feature dict of each work order's averaged curve (None when it has no
+        usable test data). Same freshness rules as get_averaged_curves, but
+        cached curves are not decoded.
+        """
+        resolved = self._resolve_curves(work_orders, decode=False)
+        return {wo: (entry['features'] if entry else None) for wo, entry in resolved.items()}
+
+    def _resolve_curves(self, work_orders: Iterable[str], decode: bool) -> Dict[str, Optional[Dict]]:
+        work_orders = list(dict.fromkeys(wo for wo in work_orders if wo))
+        if not work_orders:
+            return {}
+
+        ids_by_wo: Dict[str, List[int]] = {wo: [] for wo in work_orders}
+        linked = (
+            self.db.session.query(Simulation.work_order, TestResult.id)
+            .join(TestResult, TestResult.simulation_id == Simulation.id)
+            .filter(Simulation.work_order.in_(work_orders))
+            .order_by(TestResult.id)
+            .all()
+        )
+        for wo, tr_id in linked:
+            ids_by_wo[wo].append(tr_id)
+        hashes = {wo: _source_hash(ids) for wo, ids in ids_by_wo.items()}
+
+        cached = {
+            c.work_order: c for c in
+            WorkOrderCurve.query.filter(WorkOrderCurve.work_order.in_(work_orders)).all()
+        }
+        result = {}
+        stale = []
+        for wo in work_orders:
+            row = cached.get(wo)
+            if row is not None and row.source_hash == hashes[wo]:
+                result[wo] = self._decode_cached(row) if decode else self._cached_features(row)
+            else:
+                stale.append(wo)
+        if stale:
+            result.update(self._rebuild_curves(stale, ids_by_wo, hashes, cached))
+        return result
+
+    def _rebuild_curves(self, work_orders, ids_by_wo, hashes, cached) -> Dict[str, Optional[Dict]]:
+        all_ids = [i for wo in work_orders for i in ids_by_wo[wo]]
+        by_id = {}
+        if all_ids:
+            by_id = {tr.id: tr for tr in TestResult.query.filter(TestResult.id.in_(all_ids)).all()}
+
+        rebuilt = {}
+        values = {}     # work_order → WorkOrderCurve column values
+        averaged = {}
+        for wo in work_orders:
+            datasets = [d for d in (by_id[i].get_curve() for i in ids_by_wo[wo] if i in by_id) if d]
+            values[wo] = {'source_hash': hashes[wo], 'dataset_count': len(datasets),
+                          'curve': None, 'features': None}
+            rebuilt[wo] = None
+            if datasets:
+                avg = ComparisonService.average_datasets(datasets)
+                time, pressure = np.asarray(avg['time']), np.asarray(avg['pressure'])
+                if len(time):
+                    averaged[wo] = (time, pressure, len(datasets))
+
+        if averaged:
+            entries = list(averaged.items())
+            features = features_to_dicts(compute_features_batch(
+                [e[1][0] for e in entries], [e[1][1] for e in entries]))
+            for (wo, (time, pressure, count)), feat in zip(entries, features):
+                values[wo]['curve'] = encode_curve(time, pressure, dtype='float64')
+                values[wo]['features'] = json.dumps(feat)
+                rebuilt[wo] = {'time': time, 'pressure': pressure,
+                               'features': feat, 'count': count}
+
+        self._store_curves(values, cached)
+        return rebuilt
+
+    def _store_curves(self, values: Dict[str, Dict], cached: Dict[str, WorkOrderCurve]) -> None:
+        """
+        Write rebuilt cache rows without committing or rolling back the
+        caller's transaction (the readers above run inside search and list
+        requests).
+
+        The rows go through a session of their own.  On SQLite, whose single
+        writer lock the caller's transaction may already hold, they go into a
+        SAVEPOINT of the caller's session instead and are kept if it commits.
+        """
+        session = self.db.session
+        if self._caller_holds_write_lock():
+            try:
+                with session.begin_nested():
+                    _write_curve_rows(session, values)
+            except IntegrityError:
+                pass   # another worker rebuilt the same work order first — its row is as good
+            return
+
+        with Session(self.db.engine) as own:
+            _write_curve_rows(own, values)
+            try:
+                own.commit()
+            except IntegrityError:
+                own.rollback()   # another worker rebuilt it first
+        for row in cached.values():
+            if row.work_order in values:
+                session.expire(row)   # reload the new values on next access
+
+    def _caller_holds_write_lock(self) -> bool:
+        session = self.db.session()   # the scoped session's current Session
+        if self.db.engine.dialect.name != 'sqlite' or not session.in_transaction():
+            return False
+        return session.connection().connection.dbapi_connection.in_transaction
+
+    @staticmethod
+    def _decode_cached(row: WorkOrderCurve) -> Optional[Dict]:
+        if not row.curve:
+            return None
+        time, pressure = decode_curve(row.curve)
+        return {'time': time, 'pressure': pressure,
+                'features': json.loads(row.features) if row.features else None,
+                'count': row.dataset_count}
+
+    @staticmethod
+    def _cached_features(row: WorkOrderCurve) -> Optional[Dict]:
+        if not row.curve:
+            return None
+        return {'features': json.loads(row.features) if row.features else None,
+                'count': row.dataset_count}
+
+    def _invalidate_curve(self, work_order: str) -> None:
+        WorkOrderCurve.query.filter_by(work_order=work_order).delete(synchronize_session=False)
+
+    # ── helpers ──────────────────────────────────────────────────────────────
+
+    def _locked_row(self, work_order: str) -> Optional[WorkOrderSummary]:
+        """Summary row with a row lock (PostgreSQL) against concurrent uploads."""
+        return (
+            WorkOrderSummary.query
+            .filter_by(work_order=work_order)
+            .with_for_update()
+            .first()
+        )
+
+    def _work_order_of(self, tr: TestResult) -> Optional[str]:
+        if tr.simulation_id is None:
+            return None
+        sim = self.db.session.get(Simulation, tr.simulation_id)
+        return sim.work_order if sim and sim.work_order else None
+
+    def _set_owner(self, row: WorkOrderSummary, sim: Simulation) -> None:
+        row.simulation_id = sim.id
+        row.owner_id = sim.user_id
+        row.recipe_summary = self.recipe_summary(sim)
+        row.created_at = sim.created_at
+
+    @staticmethod
+    def _reset_stats(row: WorkOrderSummary) -> None:
+        row.dataset_count = 0
+        row.mean_peak_pressure = row.m2_peak_pressure = None
+        row.mean_peak_time = row.m2_peak_time = None
+        row.last_upload_at = None
+
+    @staticmethod
+    def _peaks(tr: TestResult):
+        curve = tr.get_curve()
+        if curve is None:
+            return None
+        return ComparisonService.find_peak_pressure(curve['pressure'], curve['time'])
+
+    def _add_one(self, row: WorkOrderSummary, tr: TestResult) -> None:
+        peaks = self._peaks(tr)
+        if peaks is None:
+            return
+        n = (row.dataset_count or 0) + 1
+        row.dataset_count = n
+        row.mean_peak_pressure, row.m2_peak_pressure = _welford_add(
+            row.mean_peak_pressure, row.m2_peak_pressure, n, peaks[0])
+        row.mean_peak_time, row.m2_peak_time = _welford_add(
+            row.mean_peak_time, row.m2_peak_time, n, peaks[1])
+        uploaded = _naive(tr.uploaded_at or datetime.utcnow())
+        if row.last_upload_at is None or uploaded > _naive(row.last_upload_at):
+            row.last_upload_at = uploaded
+
+    def _remove_one(self, row: WorkOrderSummary, tr: TestResult) -> None:
+        peaks = self._peaks(tr)
+        if peaks is None or not row.dataset_count:
+            return
+        n = row.dataset_count
+        if n == 1:
+            self._reset_stats(row)
+            return
+        row.dataset_count = n - 1
+        row.mean_peak_pressure, row.m2_peak_pressure = _welford_remove(
+            row.mean_peak_pressure, row.m2_peak_pressure, n, peaks[0])
+        row.mean_peak_time, row.m2_peak_time = _welford_remove(
+            row.mean_peak_time, row.m2_peak_time, n, peaks[1])
+        if (tr.uploaded_at and row.last_upload_at
+                and _naive(tr.uploaded_at) >= _naive(row.last_upload_at)):
+            row.last_upload_at = (
+                TestResult.query
+                .join(Simulation, TestResult.simulation_id == Simulation.id)
+                .filter(Simulation.work_order == row.work_order, TestResult.id != tr.id)
+                .with_entities(self.db.func.max(TestResult.uploaded_at))
+                .scalar()
+            )
+
+    @staticmethod
+    def recipe_summary(sim: Simulation) -> str:
+        parts = []
+        if sim.ignition_model:
+            parts.append(f'点火具:{sim.ignition_model}')
+        if sim.nc_type_1:
+            parts.append(f'NC1:{sim.nc_type_1}/{sim.nc_usage_1}mg')
+        if sim.shell_model:
+            parts.append(f'管壳:{sim.shell_model}mm')
+        if sim.current:
+            parts.append(f'通电:{sim.current}A')
+        return ' · '.join(parts)
+
+
+def _write_curve_rows(session, values: Dict[str, Dict]) -> None:
+    existing = {
+        c.work_order: c for c in
+        session.query(WorkOrderCurve).filter(WorkOrderCurve.work_order.in_(list(values))).all()
+    }
+    for wo, columns in values.items():
+        row = existing.get(wo)
+        if row is None:
+            row = WorkOrderCurve(work_order=wo)
+            session.add(row)
+        for name, value in columns.items():
+            setattr(row, name, value)
+
+
+def _source_hash(test_result_ids: List[int]) -> str:
+    """Fingerprint of the TestResult ids (and cache version) behind a curve."""
+    key = f'v{CURVE_CACHE_VERSION}:' + ','.join(str(i) for i in sorted(test_result_ids))
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _naive(dt: datetime) -> datetime:
+    """Columns are stored as naive UTC; drop tzinfo before comparing."""
+    return dt.replace(tzinfo=None) if dt.tzinfo else dt
+
+
+def _welford_add(mean, m2, n, x):
+    """Running mean/M2 after adding x as the n-th value."""
+    if n == 1:
+        return float(x), 0.0
+    delta = x - mean
+    mean = mean + delta / n
+    return float(mean), float(m2 + delta * (x - mean))
+
+
+def _welford_remove(mean, m2, n, x):
+    """Running mean/M2 after removing x from n values (n ≥ 2)."""
+    new_mean = (n * mean - x) / (n - 1)
+    m2 = m2 - (x - mean) * (x - new_mean)
+    return float(new_mean), float(max(m2, 0.0))
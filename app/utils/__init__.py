@@ -14,7 +14,8 @@ from .errors import (
     SimulationError,
     SubprocessError,
     SubprocessTimeoutError,
-    DataProcessingError
+    DataProcessingError,
+    DeadlineExceededError
 )
 
 from .responses import (
@@ -54,6 +55,7 @@ __all__ = [
     'SubprocessError',
     'SubprocessTimeoutError',
     'DataProcessingError',
+    'DeadlineExceededError',
 
     # Responses
     'success_response',
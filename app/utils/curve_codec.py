@@ -0,0 +1,120 @@
+"""Binary encoding of P-T curves for TestResult.curve.
+
+A curve is stored as one self-describing blob instead of a JSON text of
+Python floats, so readers get NumPy arrays straight from the bytes
+(``np.frombuffer``) without building Python lists.
+
+Layout (little-endian)::
+
+    offset  size  field
+    0       4     magic  b'MGGC'
+    4       1     format version (1)
+    5       1     dtype code       1 = float32, 2 = float64
+    6       1     compression      0 = none, 1 = zlib, 2 = zstd
+    7       1     reserved (0)
+    8       4     n — samples per series (uint32)
+    12      ...   payload: time[n] followed by pressure[n], optionally compressed
+
+zstd needs the optional ``zstandard`` package; without it encoding falls back
+to zlib and zstd blobs cannot be decoded.
+"""
+import struct
+import zlib
+from typing import Tuple
+
+import numpy as np
+
+from app.config.constants import CURVE_STORAGE
+from .errors import DataProcessingError
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+MAGIC = b'MGGC'
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('<4sBBBBI')
+_DTYPES = {1: np.dtype('<f4'), 2: np.dtype('<f8')}
+_DTYPE_CODES = {'float32': 1, 'float64': 2}
+_COMPRESSION_CODES = {'none': 0, 'zlib': 1, 'zstd': 2}
+
+
+def is_encoded_curve(blob) -> bool:
+    """True if blob starts with the curve header magic."""
+    return bool(blob) and bytes(blob[:4]) == MAGIC
+
+
+def encode_curve(time, pressure, dtype: str = None, compression: str = None,
+                 level: int = None) -> bytes:
+    """
+    Encode a curve into the binary format.
+
+    Args:
+        time, pressure: Equal-length sequences or arrays.
+        dtype: 'float32' or 'float64' (default CURVE_STORAGE['dtype']).
+        compression: 'none', 'zlib' or 'zstd' (default CURVE_STORAGE['compression']).
+        level: Compression level (default CURVE_STORAGE['level']).
+
+    Raises:
+        DataProcessingError: on mismatched lengths or unknown options.
+    """
+    dtype = dtype or CURVE_STORAGE['dtype']
+    compression = compression or CURVE_STORAGE['compression']
+    level = CURVE_STORAGE['level'] if level is None else level
+    if dtype not in _DTYPE_CODES or compression not in _COMPRESSION_CODES:
+        raise DataProcessingError(f'Unsupported curve encoding: {dtype}/{compression}')
+    if compression == 'zstd' and zstandard is None:
+        compression = 'zlib'
+
+    dtype_code = _DTYPE_CODES[dtype]
+    t = np.asarray(time, dtype=_DTYPES[dtype_code]).ravel()
+    p = np.asarray(pressure, dtype=_DTYPES[dtype_code]).ravel()
+    if t.size != p.size:
+        raise DataProcessingError(
+            f'Curve length mismatch: {t.size} time vs {p.size} pressure samples')
+
+    payload = t.tobytes() + p.tobytes()
+    if compression == 'zlib':
+        payload = zlib.compress(payload, level)
+    elif compression == 'zstd':
+        payload = zstandard.ZstdCompressor(level=level).compress(payload)
+
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, dtype_code,
+                          _COMPRESSION_CODES[compression], 0, t.size)
+    return header + payload
+
+
+def decode_curve(blob) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Decode a blob written by encode_curve.
+
+    Returns:
+        (time, pressure) as float64 arrays (float32 blobs are upcast).
+
+    Raises:
+        DataProcessingError: on a malformed or unsupported blob.
+    """
+    blob = bytes(blob)
+    if len(blob) < _HEADER.size:
+        raise DataProcessingError('Curve blob is truncated')
+    magic, version, dtype_code, comp_code, _, n = _HEADER.unpack_from(blob)
+    if magic != MAGIC or version != FORMAT_VERSION or dtype_code not in _DTYPES:
+        raise DataProcessingError('Unrecognised curve blob header')
+
+    payload = memoryview(blob)[_HEADER.size:]
+    if comp_code == 1:
+        payload = zlib.decompress(payload)
+    elif comp_code == 2:
+        if zstandard is None:
+            raise DataProcessingError('zstd-compressed curve requires the zstandard package')
+        payload = zstandard.ZstdDecompressor().decompress(payload)
+    elif comp_code != 0:
+        raise DataProcessingError(f'Unknown curve compression code {comp_code}')
+
+    dtype = _DTYPES[dtype_code]
+    if len(payload) != 2 * n * dtype.itemsize:
+        raise DataProcessingError('Curve payload size does not match its header')
+    values = np.frombuffer(payload, dtype=dtype).astype(np.float64, copy=False)
+    return values[:n], values[n:]
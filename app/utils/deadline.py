@@ -0,0 +1,150 @@
+"""Cooperative request deadlines.
+
+timeout middleware gives every request a `Deadline` on ``g`` sized from
+TIMEOUTS (see get_timeout_for_endpoint).  Nothing interrupts the request
+thread — it works under gunicorn's threaded workers, where ``signal.alarm``
+cannot — so long loops call `check_deadline()` between units of work (Excel
+rows, ranked candidates, averaged datasets, sweep models) and blocking waits
+are capped with `remaining_time()`.  Past the deadline `check_deadline()`
+raises DeadlineExceededError, which the middleware answers with a 504.
+
+SQL statements get a matching limit from `instrument_statement_timeouts()`
+(called by create_app): at most TIMEOUTS['database_query'] and never past the
+request's deadline —
+
+* PostgreSQL: ``SET statement_timeout`` on the connection, only when the
+  limit changed (whole seconds, so a request normally sets it once).
+* SQLite: a progress handler interrupts the statement once its limit passed.
+
+A statement cancelled because the request's deadline passed raises
+DeadlineExceededError too.  Outside a request (background jobs, CLI) there is
+no deadline and statements run unlimited.
+"""
+import math
+import time
+from typing import Optional
+
+from flask import g, has_request_context
+
+from app.config.network_config import TIMEOUTS
+from .errors import DeadlineExceededError
+
+_SQLITE_PROGRESS_OPS = 10000   # VM instructions between progress handler calls
+_PG_QUERY_CANCELED = '57014'
+
+
+class Deadline:
+    """A time budget started now (time.monotonic based)."""
+
+    __slots__ = ('budget', 'expires')
+
+    def __init__(self, seconds: float):
+        self.budget = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Seconds left (0 once expired)."""
+        return max(self.expires - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires
+
+    def check(self) -> None:
+        """Raise DeadlineExceededError once the budget is spent."""
+        if time.monotonic() >= self.expires:
+            raise DeadlineExceededError(self.budget)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """The current request's deadline (None outside a request or without one)."""
+    return g.get('deadline') if has_request_context() else None
+
+
+def check_deadline() -> None:
+    """Checkpoint for long loops: raise if the current request ran out of time."""
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.check()
+
+
+def remaining_time(cap: float = None) -> Optional[float]:
+    """
+    Time a blocking wait may take: the request's remaining time, at most cap.
+
+    Returns cap unchanged outside a request.
+    """
+    deadline = current_deadline()
+    if deadline is None:
+        return cap
+    remaining = deadline.remaining()
+    return remaining if cap is None else min(cap, remaining)
+
+
+def statement_budget() -> Optional[float]:
+    """Seconds the next SQL statement may run (None: unlimited)."""
+    if current_deadline() is None:
+        return None
+    return remaining_time(TIMEOUTS['database_query'])
+
+
+# ── SQLAlchemy events ────────────────────────────────────────────────────────
+
+def instrument_statement_timeouts() -> None:
+    """Limit every statement to statement_budget() (idempotent)."""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from sqlalchemy.pool import Pool
+    if not event.contains(Engine, 'before_cursor_execute', _limit_statement):
+        event.listen(Pool, 'connect', _install_progress_handler)
+        event.listen(Pool, 'checkin', _clear_connection_limit)
+        event.listen(Engine, 'before_cursor_execute', _limit_statement)
+        event.listen(Engine, 'rollback', _forget_statement_timeout)
+        event.listen(Engine, 'handle_error', _translate_cancel)
+
+
+def _install_progress_handler(dbapi_connection, connection_record) -> None:
+    if not hasattr(dbapi_connection, 'set_progress_handler'):   # not sqlite3
+        return
+    limit = connection_record.info['statement_deadline'] = [0.0]   # monotonic, 0: none
+    dbapi_connection.set_progress_handler(
+        lambda: bool(limit[0]) and time.monotonic() > limit[0], _SQLITE_PROGRESS_OPS)
+
+
+def _clear_connection_limit(dbapi_connection, connection_record) -> None:
+    connection_record.info.pop('statement_timeout_ms', None)   # reset-on-return rolled back the SET
+    limit = connection_record.info.get('statement_deadline')
+    if limit is not None:
+        limit[0] = 0.0
+
+
+def _limit_statement(conn, cursor, statement, parameters, context, executemany) -> None:
+    budget = statement_budget()
+    limit = conn.info.get('statement_deadline')
+    if limit is not None:
+        limit[0] = time.monotonic() + budget if budget is not None else 0.0
+    elif conn.dialect.name == 'postgresql':
+        # Whole seconds (rounded up) so the SET is repeated only when it changes
+        timeout_ms = max(math.ceil(budget), 1) * 1000 if budget is not None else 0
+        if conn.info.get('statement_timeout_ms') != timeout_ms:
+            setter = conn.connection.cursor()
+            try:
+                setter.execute(f'SET statement_timeout = {timeout_ms}')
+            finally:
+                setter.close()
+            conn.info['statement_timeout_ms'] = timeout_ms
+
+
+def _forget_statement_timeout(conn) -> None:
+    conn.info.pop('statement_timeout_ms', None)   # a rolled-back SET is undone
+
+
+def _translate_cancel(exception_context):
+    """A statement cancelled at the request's deadline raises DeadlineExceededError."""
+    deadline = current_deadline()
+    if deadline is None or not deadline.expired():
+        return None
+    error = exception_context.original_exception
+    if getattr(error, 'pgcode', None) == _PG_QUERY_CANCELED or (
+            exception_context.dialect.name == 'sqlite' and str(error) == 'interrupted'):
+        return DeadlineExceededError(deadline.budget)
+    return None
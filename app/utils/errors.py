@@ -23,9 +23,9 @@ class SimulationError(AppError):
 
 class SubprocessError(AppError):
     """Exception raised when subprocess execution fails"""
-    def __init__(self, message, stderr=None):
+    def __init__(self, message, stderr=None, code=500):
         self.stderr = stderr
-        super().__init__(message, code=500)
+        super().__init__(message, code=code)
 
 
 class SubprocessTimeoutError(SubprocessError):
@@ -45,3 +45,25 @@ class ValidationError(AppError):
     def __init__(self, message, errors=None):
         self.errors = errors or []
         super().__init__(message, code=400)
+
+
+class JobCancelledError(AppError):
+    """Raised inside a background job handler once cancellation was requested"""
+    def __init__(self, message='Job cancelled'):
+        super().__init__(message, code=409)
+
+
+class DeadlineExceededError(BaseException):
+    """
+    Raised at a checkpoint once the request's deadline has passed
+    (app/utils/deadline.py).
+
+    Like asyncio.CancelledError it derives from BaseException, so the
+    ``except Exception`` fallbacks of routes and services let it through; the
+    timeout middleware turns it into a 504 response.
+    """
+    def __init__(self, budget, message=None):
+        self.budget = budget
+        self.code = 504
+        self.message = message or f'Request deadline exceeded ({budget:g} s)'
+        super().__init__(self.message)
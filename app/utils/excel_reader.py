@@ -0,0 +1,95 @@
+"""Streaming reader for P-T curve workbooks (.xlsx).
+
+Uploads are two-column sheets (time, pressure) that can run to hundreds of
+thousands of rows.  Instead of building a DataFrame and coercing each column
+with ``pd.to_numeric``, the first worksheet is iterated with openpyxl in
+``read_only`` mode and numeric pairs are appended to typed float64 buffers
+(``array.array('d')``, 8 bytes per value, grown geometrically) that NumPy
+then wraps without a copy.  Rows where either of the first two cells is not a
+number (header/comment rows such as '[ms]' or '注释') are skipped, exactly as
+the pandas-based loader did.  Every 1024 rows the request's deadline is
+checked (app/utils/deadline.py).
+"""
+import math
+from array import array
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+from openpyxl import load_workbook
+
+from .deadline import check_deadline
+from .metrics_registry import EXCEL_PARSE
+
+
+def to_number(value) -> Optional[float]:
+    """Cell value as float, or None where pd.to_numeric(errors='coerce') gave NaN."""
+    if type(value) is float:   # the common case: a numeric cell
+        return None if value != value else value
+    if isinstance(value, (int, float)):
+        number = float(value)
+    elif isinstance(value, str):
+        try:
+            number = float(value.strip())
+        except ValueError:
+            return None
+    else:
+        return None
+    return None if math.isnan(number) else number
+
+
+class CurveRows:
+    """
+    Iterator over the numeric (time, pressure) pairs of a workbook's first
+    sheet.
+
+    `width` — the sheet's column count (last non-empty cell of the widest row
+    seen so far) — is final once iteration has finished.
+    """
+
+    def __init__(self, file_path: str, skip_rows: int = 0):
+        self.file_path = file_path
+        self.skip_rows = skip_rows
+        self.width = 0
+
+    def __iter__(self) -> Iterator[Tuple[float, float]]:
+        wb = load_workbook(self.file_path, read_only=True, data_only=True, keep_links=False)
+        try:
+            ws = wb.worksheets[0]
+            ws.reset_dimensions()   # don't trust the file's <dimension> tag
+            for row_no, row in enumerate(ws.iter_rows(values_only=True)):
+                if not row_no & 1023:
+                    check_deadline()
+                if row_no < self.skip_rows:
+                    continue
+                used = len(row)
+                if used and row[-1] is None:
+                    while used and row[used - 1] is None:
+                        used -= 1
+                if used > self.width:
+                    self.width = used
+                if used < 2:
+                    continue
+                t = to_number(row[0])
+                p = to_number(row[1])
+                if t is not None and p is not None:
+                    yield t, p
+        finally:
+            wb.close()
+
+
+def read_curve(file_path: str, skip_rows: int = 0) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Load all numeric pairs of a workbook.
+
+    Returns:
+        (time, pressure, width) — float64 arrays and the sheet's column count.
+    """
+    rows = CurveRows(file_path, skip_rows)
+    time_buf, pressure_buf = array('d'), array('d')
+    append_t, append_p = time_buf.append, pressure_buf.append
+    with EXCEL_PARSE.time():
+        for t, p in rows:
+            append_t(t)
+            append_p(p)
+    return (np.frombuffer(time_buf, dtype=np.float64),
+            np.frombuffer(pressure_buf, dtype=np.float64), rows.width)
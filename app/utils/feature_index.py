@@ -0,0 +1,220 @@
+"""In-memory feature index for work-order similarity search (逆向搜索).
+
+One row per work order holds the `similarity.FEATURE_KEYS` of its averaged
+curve; one row per simulation holds the recipe columns the search can filter
+on, dictionary-encoded so a filter is a single integer comparison per column.
+A query masks the simulations, keeps the work orders they belong to and
+scores all of them with `similarity.combined_errors` in one vectorized pass;
+only the top-N (found with `np.argpartition`) are converted to scores.
+
+Results are identical to ranking with `similarity.rank_features`: same
+scores, same order, ties resolved by the work order's earliest matching
+simulation.
+
+The whole-curve modes ('l2', 'dtw') additionally need the resampled averaged
+curves, attached with `set_shapes`.  'l2' scores every candidate in one
+pass; 'dtw' keeps the DTW_PREFILTER best by feature score, orders them by
+LB_Keogh and runs full DTW only while the bound can still beat the current
+top N.
+"""
+import heapq
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from .deadline import check_deadline
+from .similarity import (
+    DTW_PREFILTER, FEATURE_KEYS, SEARCH_MODES, combined_errors, dtw_distance,
+    dtw_error, dtw_radius, error_to_score, l2_errors, lb_keogh,
+)
+
+
+class FeatureIndex:
+    """
+    Snapshot of the searchable work orders.
+
+    Args:
+        sims: (simulation_id, work_order, {column: value}) tuples in ascending
+            id order; every work order must appear at least once.
+        features: {work_order: feature dict or None}. Work orders without
+            features are never returned.
+        numeric_columns: Filter columns compared as floats (Float columns in
+            the database); all others are compared as strings.
+    """
+
+    def __init__(self, sims: Sequence, features: Dict[str, Optional[Dict]],
+                 numeric_columns: Iterable[str] = ()):
+        self._numeric = frozenset(numeric_columns)
+
+        self.work_orders: List[str] = []
+        wo_pos: Dict[str, int] = {}
+        sim_ids, sim_wo = [], []
+        raw_columns: Dict[str, list] = {}
+        for sim_id, wo, values in sims:
+            if wo not in wo_pos:
+                wo_pos[wo] = len(self.work_orders)
+                self.work_orders.append(wo)
+            sim_ids.append(sim_id)
+            sim_wo.append(wo_pos[wo])
+            for col, val in values.items():
+                raw_columns.setdefault(col, []).append(val)
+
+        self.sim_ids = np.asarray(sim_ids, dtype=np.int64)
+        self.sim_wo = np.asarray(sim_wo, dtype=np.int64)
+
+        n = len(self.work_orders)
+        self.features: List[Optional[Dict]] = [features.get(wo) for wo in self.work_orders]
+        self.matrix = np.zeros((n, len(FEATURE_KEYS)), dtype=np.float64)
+        self.valid = np.zeros(n, dtype=bool)
+        for i, feat in enumerate(self.features):
+            if feat:
+                self.matrix[i] = [feat[k] for k in FEATURE_KEYS]
+                self.valid[i] = True
+
+        # column → (codes per simulation, {normalised value: code})
+        self._columns = {col: self._encode(col, vals) for col, vals in raw_columns.items()}
+
+        # (n_work_orders, SHAPE_SAMPLES) resampled curves, see set_shapes
+        self.shapes: Optional[np.ndarray] = None
+        self.shape_valid = np.zeros(n, dtype=bool)
+
+    def set_shapes(self, shapes: Dict[str, np.ndarray]) -> None:
+        """
+        Attach resample_shape() curves by work order. Work orders without a
+        shape are dropped from the whole-curve modes.
+        """
+        width = len(next(iter(shapes.values()))) if shapes else 0
+        matrix = np.zeros((len(self.work_orders), width), dtype=np.float64)
+        for i, wo in enumerate(self.work_orders):
+            if wo in shapes:
+                matrix[i] = shapes[wo]
+                self.shape_valid[i] = True
+        self.shapes = matrix
+
+    def __len__(self) -> int:
+        return int(self.valid.sum())
+
+    def _key(self, col: str, value):
+        if value is None:
+            return None
+        return float(value) if col in self._numeric else str(value)
+
+    def _encode(self, col: str, values: list):
+        vocab: Dict = {}
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, val in enumerate(values):
+            key = self._key(col, val)
+            # NULL never equals a filter value, so it gets no vocabulary entry
+            codes[i] = -1 if key is None else vocab.setdefault(key, len(vocab))
+        return codes, vocab
+
+    def _sim_mask(self, filters: Dict) -> np.ndarray:
+        mask = np.ones(len(self.sim_ids), dtype=bool)
+        for col, value in filters.items():
+            codes, vocab = self._columns[col]
+            try:
+                code = vocab.get(self._key(col, value), -2)
+            except (TypeError, ValueError):
+                code = -2   # not a number: matches nothing, like the SQL filter
+            mask &= codes == code
+        return mask
+
+    def search(self, query_features: Dict, filters: Dict, top_n: int,
+               mode: str = 'features', query_shape: np.ndarray = None) -> List[Dict]:
+        """
+        Top-N work orders for the query among those with at least one
+        simulation matching every filter (exact match per column).
+
+        Args:
+            mode: One of similarity.SEARCH_MODES; 'l2' and 'dtw' need
+                query_shape (similarity.resample_shape of the query) and
+                set_shapes() on the index.
+
+        Returns:
+            [{'work_order', 'simulation_id', 'score', 'features'}, ...] best
+            first; simulation_id is the earliest matching simulation.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f'Unknown similarity mode: {mode}')
+        if mode != 'features' and (self.shapes is None or query_shape is None):
+            raise ValueError(f"Mode '{mode}' needs curve shapes")
+        if top_n <= 0 or not len(self.sim_ids):
+            return []
+        mask = self._sim_mask(filters)
+        # Work orders in order of their first matching simulation
+        wo_idx, first = np.unique(self.sim_wo[mask], return_index=True)
+        order = np.argsort(first, kind='stable')
+        wo_idx, first = wo_idx[order], first[order]
+        keep = self.valid[wo_idx]
+        if mode != 'features':
+            keep &= self.shape_valid[wo_idx]
+        wo_idx, first = wo_idx[keep], first[keep]
+        if not len(wo_idx):
+            return []
+
+        if mode == 'features':
+            errors = combined_errors(query_features, self.matrix[wo_idx])
+            scored = _top_k(errors, np.arange(len(wo_idx)), top_n)
+        elif mode == 'l2':
+            errors = l2_errors(query_shape, self.shapes[wo_idx])
+            scored = _top_k(errors, np.arange(len(wo_idx)), top_n)
+        else:
+            scored = self._dtw_top_k(query_features, query_shape, wo_idx, top_n)
+
+        sim_ids = self.sim_ids[mask][first]
+        return [
+            {
+                'work_order': self.work_orders[wo_idx[j]],
+                'simulation_id': int(sim_ids[j]),
+                'score': score,
+                'features': self.features[wo_idx[j]],
+            }
+            for score, j in scored
+        ]
+
+    def _dtw_top_k(self, query_features, query_shape, wo_idx, top_n):
+        # Stage 1: cheap feature score
+        feature_errors = combined_errors(query_features, self.matrix[wo_idx])
+        pool = np.arange(len(wo_idx))
+        if len(pool) > DTW_PREFILTER:
+            pool = np.sort(np.argpartition(feature_errors, DTW_PREFILTER - 1)[:DTW_PREFILTER])
+
+        # Stage 2: lower bound, cheapest candidates first
+        radius = dtw_radius()
+        shapes = self.shapes[wo_idx[pool]]
+        bounds = lb_keogh(query_shape, shapes, radius)
+
+        # Stage 3: full DTW until the bound exceeds the current k-th distance
+        k = min(top_n, len(pool))
+        best = []   # max-heap of (-distance, -position)
+        for p in np.argsort(bounds, kind='stable'):
+            check_deadline()
+            kth = -best[0][0] if len(best) == k else np.inf
+            if bounds[p] > kth:
+                break
+            dist = dtw_distance(query_shape, shapes[p], radius, cutoff=kth)
+            item = (-dist, -int(pool[p]))
+            if len(best) < k:
+                heapq.heappush(best, item)
+            elif item > best[0]:
+                heapq.heapreplace(best, item)
+
+        errors = np.array([dtw_error(-d, query_shape) for d, _ in best])
+        return _top_k(errors, np.array([-j for _, j in best]), k)
+
+
+def _top_k(errors: np.ndarray, positions: np.ndarray, k: int) -> List:
+    """
+    (score, position) of the k smallest errors, best first; equal scores keep
+    ascending position, like a stable sort of the full candidate list.
+    """
+    k = min(k, len(errors))
+    if k < len(errors):
+        kth = errors[np.argpartition(errors, k - 1)[k - 1]]
+        # Everything tied with the k-th error stays in so ties break by position
+        selected = np.flatnonzero(errors <= kth)
+    else:
+        selected = np.arange(len(errors))
+    scored = sorted(((error_to_score(errors[i]), int(positions[i])) for i in selected),
+                    key=lambda s: (-s[0], s[1]))
+    return scored[:k]
@@ -0,0 +1,78 @@
+"""Plotly figure specs built from plain dicts.
+
+``go.Figure`` validates every property on assignment and ``fig.to_json()``
+re-serialises the whole object tree, which made figure construction the most
+expensive step of a cached-model forward simulation.  The builders here emit
+the identical JSON structure (``{'data': [...], 'layout': {...}}``) directly.
+
+The only part that still comes from plotly is the expanded ``plotly_white``
+template; it is resolved once per process and reused, so callers must treat
+the returned ``layout['template']`` as read-only.
+"""
+import json
+from functools import lru_cache
+
+import numpy as np
+
+# Layout of the forward-simulation chart (same values the go.Figure used)
+FORWARD_CHART = {
+    'line': {'color': '#667eea', 'width': 2},
+    'xaxis_title': '时间 (ms)',
+    'yaxis_title': '压力 (MPa)',
+    'hovermode': 'x unified',
+    'template': 'plotly_white',
+    'margin': {'l': 50, 'r': 50, 't': 30, 'b': 50},
+}
+
+# Uploaded comparison curve (demo/load_test_data.py's create_plotly_json)
+TEST_DATA_CHART = {
+    **FORWARD_CHART,
+    'line': {'color': '#e74c3c', 'width': 2},
+    'mode': 'lines+markers',
+    'marker': {'size': 4},
+}
+
+
+@lru_cache(maxsize=None)
+def _template_json(name: str) -> dict:
+    """Expanded plotly template exactly as ``fig.to_json()`` embeds it."""
+    import plotly.graph_objects as go
+    return json.loads(go.Figure(layout={'template': name}).to_json())['layout']['template']
+
+
+def _as_list(values) -> list:
+    return values.tolist() if isinstance(values, np.ndarray) else list(values)
+
+
+def line_figure(x, y, name: str, spec: dict = FORWARD_CHART) -> dict:
+    """
+    Single-trace line chart in plotly's JSON form.
+
+    Args:
+        x, y: Sequences or NumPy arrays of equal length.
+        name: Legend label of the trace.
+        spec: Styling, see FORWARD_CHART; optional 'mode' (default 'lines')
+            and 'marker'.
+
+    Returns:
+        dict equal to ``json.loads(fig.to_json())`` of the equivalent go.Figure.
+    """
+    trace = {
+        'line': dict(spec['line']),
+        'mode': spec.get('mode', 'lines'),
+        'name': name,
+        'x': _as_list(x),
+        'y': _as_list(y),
+        'type': 'scatter',
+    }
+    if 'marker' in spec:
+        trace['marker'] = dict(spec['marker'])
+    layout = {
+        'template': _template_json(spec['template']),
+        'margin': dict(spec['margin']),
+        'xaxis': {'title': {'text': spec['xaxis_title']}},
+        'yaxis': {'title': {'text': spec['yaxis_title']}},
+        'hovermode': spec['hovermode'],
+        'showlegend': True,
+    }
+    return {'data': [trace], 'layout': layout}
@@ -3,13 +3,14 @@ import logging
 import os
 import time
 
-import pandas as pd
+import numpy as np
 from typing import Tuple, List
 from werkzeug.utils import secure_filename
 from werkzeug.datastructures import FileStorage
 
 from app.config.constants import ERROR_MESSAGES
 from .errors import FileValidationError, DataProcessingError
+from .excel_reader import CurveRows, read_curve
 from .validators import is_valid_excel_file
 from .paths import ensure_directory_exists
 
@@ -82,28 +83,28 @@ class FileHandler:
         Returns:
             Tuple[List, List]: (time_data, pressure_data)
 
+        Raises:
+            DataProcessingError: If file cannot be read or parsed
+        """
+        time_arr, pressure_arr = FileHandler.load_excel_arrays(file_path, skip_rows)
+        return time_arr.tolist(), pressure_arr.tolist()
+
+    @staticmethod
+    def load_excel_arrays(file_path: str, skip_rows=0):
+        """
+        Like load_excel_data, but returns float64 NumPy arrays without ever
+        building Python lists (streamed, see excel_reader).
+
         Raises:
             DataProcessingError: If file cannot be read or parsed
         """
         try:
-            df = pd.read_excel(file_path, skiprows=skip_rows, header=None)
-
-            # Assume first column is time, second column is pressure.
-            # Drop any rows where either column is not a real number
-            # (catches header/comment rows like '[ms]', '注释', etc.)
-            col_t = df.iloc[:, 0]
-            col_p = df.iloc[:, 1]
-            numeric_mask = (
-                pd.to_numeric(col_t, errors='coerce').notna() &
-                pd.to_numeric(col_p, errors='coerce').notna()
-            )
-            time_data = pd.to_numeric(col_t[numeric_mask], errors='coerce').tolist()
-            pressure_data = pd.to_numeric(col_p[numeric_mask], errors='coerce').tolist()
-
-            if not time_data:
+            time_arr, pressure_arr, width = read_curve(file_path, skip_rows)
+            if width < 2:
+                raise DataProcessingError('文件必须包含2列数据（时间列和压力列）')
+            if not len(time_arr):
                 raise DataProcessingError('文件中未找到有效的数值数据，请检查文件格式')
-
-            return time_data, pressure_data
+            return time_arr, pressure_arr
 
         except FileNotFoundError:
             raise DataProcessingError(f'File not found: {file_path}')
@@ -129,65 +130,132 @@ class FileHandler:
                         rows, time_range [min, max], pressure_range [min, max]
         """
         try:
-            df = pd.read_excel(file_path, header=None)
-
-            # Column count check (before stripping header rows)
-            if df.shape[1] < 2:
-                return {'valid': False, 'errors': ['文件必须包含2列数据（时间列和压力列）']}
-            if df.shape[1] > 2:
-                return {
-                    'valid': False,
-                    'errors': [f'文件包含 {df.shape[1]} 列，请确保只有2列数据（时间列和压力列）']
-                }
-
-            # Strip non-numeric header rows
-            col_t = df.iloc[:, 0]
-            col_p = df.iloc[:, 1]
-            numeric_mask = (
-                pd.to_numeric(col_t, errors='coerce').notna() &
-                pd.to_numeric(col_p, errors='coerce').notna()
-            )
-            time_data = pd.to_numeric(col_t[numeric_mask], errors='coerce').tolist()
-            pressure_data = pd.to_numeric(col_p[numeric_mask], errors='coerce').tolist()
-
-            if len(time_data) < 2:
-                return {'valid': False, 'errors': ['文件中有效数值行数不足，请检查文件内容']}
-
-            # Column 1 must start from near 0
-            if time_data[0] > 1.0:
-                return {
-                    'valid': False,
-                    'errors': [f'时间列第一个值为 {time_data[0]:.4f}，必须从 0 开始']
-                }
-
-            # Column 1 must be non-decreasing
-            for i in range(len(time_data) - 1):
-                if time_data[i] > time_data[i + 1]:
-                    return {
-                        'valid': False,
-                        'errors': [
-                            f'时间列在第 {i + 2} 行出现下降（{time_data[i]:.4f} → '
-                            f'{time_data[i+1]:.4f}），时间列必须单调递增'
-                        ]
-                    }
-
-            return {
-                'valid': True,
-                'stats': {
-                    'rows': len(time_data),
-                    'time_range': [round(time_data[0], 4), round(time_data[-1], 4)],
-                    'pressure_range': [
-                        round(min(pressure_data), 4),
-                        round(max(pressure_data), 4)
-                    ]
-                }
-            }
+            # Single streaming pass; the column count is only final at the end,
+            # so the first time-column violation is remembered and reported
+            # after it, in the same order of precedence as the checks below.
+            rows = CurveRows(file_path)
+            count = 0
+            first_t = prev_t = None
+            p_min = p_max = None
+            descent = None
+            for t, p in rows:
+                if count == 0:
+                    first_t = t
+                    p_min = p_max = p
+                else:
+                    if descent is None and prev_t > t:
+                        descent = (count + 1, prev_t, t)   # 1-based numeric row
+                    if p < p_min:
+                        p_min = p
+                    if p > p_max:
+                        p_max = p
+                prev_t = t
+                count += 1
+
+            return FileHandler._validation_result(
+                rows.width, count, first_t, prev_t, descent, p_min, p_max)
 
         except FileNotFoundError:
             return {'valid': False, 'errors': ['文件未找到，请重新上传']}
         except Exception as e:
             return {'valid': False, 'errors': [f'文件解析失败：{str(e)}']}
 
+    @staticmethod
+    def parse_test_data_file(file_path: str) -> dict:
+        """
+        Load and validate a test-data file in one pass (for the parse cache).
+
+        Returns:
+            dict: {'time': ndarray, 'pressure': ndarray, 'width': int,
+                   'validation': validate_test_data_file result}
+
+        Raises:
+            DataProcessingError: If the workbook cannot be read at all
+        """
+        try:
+            time_arr, pressure_arr, width = read_curve(file_path)
+        except FileNotFoundError:
+            raise DataProcessingError(f'File not found: {file_path}')
+        except Exception as e:
+            raise DataProcessingError(str(e))
+
+        count = len(time_arr)
+        descent = None
+        if count:
+            drops = np.flatnonzero(time_arr[1:] < time_arr[:-1])
+            if len(drops):
+                i = int(drops[0])
+                descent = (i + 2, float(time_arr[i]), float(time_arr[i + 1]))
+        validation = FileHandler._validation_result(
+            width, count,
+            float(time_arr[0]) if count else None,
+            float(time_arr[-1]) if count else None,
+            descent,
+            float(pressure_arr.min()) if count else None,
+            float(pressure_arr.max()) if count else None,
+        )
+        return {'time': time_arr, 'pressure': pressure_arr,
+                'width': width, 'validation': validation}
+
+    @staticmethod
+    def curve_from_parsed(parsed: dict):
+        """
+        (time, pressure) arrays of a parse_test_data_file result, with the
+        same checks as load_excel_arrays.
+
+        Raises:
+            DataProcessingError: If the file holds no usable curve
+        """
+        if parsed['width'] < 2:
+            message = '文件必须包含2列数据（时间列和压力列）'
+        elif not len(parsed['time']):
+            message = '文件中未找到有效的数值数据，请检查文件格式'
+        else:
+            return parsed['time'], parsed['pressure']
+        raise DataProcessingError(f'{ERROR_MESSAGES["file_parse_error"]}: {message}')
+
+    @staticmethod
+    def _validation_result(width, count, first_t, last_t, descent, p_min, p_max) -> dict:
+        """validate_test_data_file rules applied to the collected statistics."""
+        # Column count check (header rows included)
+        if width < 2:
+            return {'valid': False, 'errors': ['文件必须包含2列数据（时间列和压力列）']}
+        if width > 2:
+            return {
+                'valid': False,
+                'errors': [f'文件包含 {width} 列，请确保只有2列数据（时间列和压力列）']
+            }
+
+        if count < 2:
+            return {'valid': False, 'errors': ['文件中有效数值行数不足，请检查文件内容']}
+
+        # Column 1 must start from near 0
+        if first_t > 1.0:
+            return {
+                'valid': False,
+                'errors': [f'时间列第一个值为 {first_t:.4f}，必须从 0 开始']
+            }
+
+        # Column 1 must be non-decreasing
+        if descent is not None:
+            row, before, after = descent
+            return {
+                'valid': False,
+                'errors': [
+                    f'时间列在第 {row} 行出现下降（{before:.4f} → '
+                    f'{after:.4f}），时间列必须单调递增'
+                ]
+            }
+
+        return {
+            'valid': True,
+            'stats': {
+                'rows': count,
+                'time_range': [round(first_t, 4), round(last_t, 4)],
+                'pressure_range': [round(p_min, 4), round(p_max, 4)]
+            }
+        }
+
     @staticmethod
     def load_excel_data_as_dict(file_path: str, skip_rows=0) -> dict:
         """
@@ -0,0 +1,273 @@
+"""Warm process pool for the comparison-file loader (demo/load_test_data.py).
+
+/simulation/load_test_data used to start a fresh interpreter per request
+(``SubprocessRunner.execute_script``), paying for the pandas and plotly
+imports every time and then parsing the curve back out of JSON on stdout.
+Here each app process keeps ``DATA_LOADER_POOL['workers']`` loader processes
+alive.  A loader imports the script module once — and with it pandas and
+plotly — then serves requests over a pipe:
+
+    parent → loader   file path (str), or None to stop
+    loader → parent   ('ok', shared-memory name, n)  or  ('error', stderr text)
+
+The curve travels as a (2, n) float64 block in
+``multiprocessing.shared_memory``; the parent copies it out and unlinks the
+block.  The response dict is then built in the parent exactly as the script
+builds it (statistics from the same Python lists, plot via figure_spec).
+
+Errors follow ``execute_script``: a failed load raises SubprocessError with
+the loader's stderr, and a request not answered within the timeout raises
+SubprocessTimeoutError — the loader is killed and replaced on next use.
+"""
+import atexit
+import contextlib
+import importlib.util
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.config.constants import DATA_LOADER_POOL, ERROR_MESSAGES, SUBPROCESS_TIMEOUT
+from .deadline import check_deadline, remaining_time
+from .errors import SubprocessError, SubprocessTimeoutError
+from .paths import get_load_test_data_script_path
+
+logger = logging.getLogger(__name__)
+
+
+# ── loader process ───────────────────────────────────────────────────────────
+
+def _import_script(script_path: str):
+    spec = importlib.util.spec_from_file_location('_mgg_load_test_data', script_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _load_to_shared_memory(module, path: str):
+    """One request: load the workbook and publish it as a shared-memory block."""
+    if not os.path.exists(path):
+        return 'error', f'File not found: {path}'
+    stderr = io.StringIO()
+    with contextlib.redirect_stderr(stderr):
+        time_vals, pressure_vals = module.load_test_data(path)
+    if time_vals is None or pressure_vals is None:
+        return 'error', stderr.getvalue() + 'Failed to load test data'
+    try:
+        curve = np.array([time_vals, pressure_vals], dtype=np.float64)
+    except (TypeError, ValueError) as e:
+        return 'error', f'Non-numeric test data: {e}'
+    if curve.shape[1] == 0:
+        return 'error', 'Failed to load test data: no data rows'
+
+    shm = SharedMemory(create=True, size=curve.nbytes)
+    try:
+        np.ndarray(curve.shape, dtype=np.float64, buffer=shm.buf)[:] = curve
+        # The parent unlinks the block; stop this process's tracker from
+        # reporting it as leaked (and unlinking it) when the loader exits.
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return 'ok', shm.name, curve.shape[1]
+    finally:
+        shm.close()
+
+
+def _loader_main(conn, script_path: str) -> None:
+    module = _import_script(script_path)   # pandas + plotly, once per loader
+    while True:
+        try:
+            path = conn.recv()
+        except EOFError:   # parent went away
+            return
+        if path is None:
+            return
+        try:
+            reply = _load_to_shared_memory(module, path)
+        except Exception as e:
+            reply = ('error', str(e))
+        conn.send(reply)
+
+
+class _Loader:
+    """One loader process and the parent's end of its pipe."""
+
+    def __init__(self, ctx, script_path: str):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_loader_main, args=(child_conn, script_path),
+                                   name='mgg-data-loader', daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def request(self, path: str, timeout: float):
+        """Send a path and wait for the reply; None on timeout."""
+        self.conn.send(path)
+        if not self.conn.poll(timeout):
+            return None
+        return self.conn.recv()
+
+    def stop(self, kill: bool = False) -> None:
+        try:
+            if kill:
+                self.process.kill()
+            else:
+                self.conn.send(None)
+            self.process.join(timeout=2)
+            if self.process.is_alive():
+                self.process.kill()
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.conn.close()
+
+
+# ── pool ─────────────────────────────────────────────────────────────────────
+
+def build_test_data_response(time_vals: List[float], pressure_vals: List[float],
+                             file_name: str) -> Dict:
+    """The JSON document demo/load_test_data.py prints for a loaded curve."""
+    from .figure_spec import TEST_DATA_CHART, line_figure
+    peak_pressure = max(pressure_vals)
+    return {
+        'success': True,
+        'plot_data': line_figure(time_vals, pressure_vals,
+                                 f'实际测试数据: {file_name}', TEST_DATA_CHART),
+        'statistics': {
+            'peak_pressure': float(peak_pressure),
+            'peak_time': float(time_vals[pressure_vals.index(peak_pressure)]),
+            'avg_pressure': float(sum(pressure_vals) / len(pressure_vals)),
+            'num_points': len(time_vals),
+            'file_name': file_name,
+        },
+        'data': {'time': time_vals, 'pressure': pressure_vals},
+    }
+
+
+class LoaderPool:
+    """
+    Fixed-size pool of warm loader processes.
+
+    Args:
+        size: Loader processes (default DATA_LOADER_POOL['workers']).
+        script_path: Loader script (default demo/load_test_data.py).
+    """
+
+    def __init__(self, size: int = None, script_path: str = None):
+        self.size = size or DATA_LOADER_POOL['workers']
+        self.script_path = script_path or get_load_test_data_script_path()
+        self._ctx = multiprocessing.get_context('spawn')
+        self._idle: List[_Loader] = []
+        self._busy = 0
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+
+    def warm(self) -> None:
+        """Start every loader not running yet (they import in the background)."""
+        with self._lock:
+            self._idle = [w for w in self._idle if w.alive()]
+            while len(self._idle) + self._busy < self.size:
+                self._idle.append(_Loader(self._ctx, self.script_path))
+
+    def _checkout(self, deadline: float) -> _Loader:
+        if not self._slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            check_deadline()   # the request's deadline, not the load timeout, ran out
+            raise SubprocessTimeoutError(ERROR_MESSAGES['simulation_timeout'])
+        with self._lock:
+            self._busy += 1
+            while self._idle:
+                loader = self._idle.pop()
+                if loader.alive():
+                    return loader
+                loader.stop(kill=True)
+        try:
+            return _Loader(self._ctx, self.script_path)
+        except Exception:
+            self._checkin(None)
+            raise
+
+    def _checkin(self, loader: Optional[_Loader]) -> None:
+        with self._lock:
+            self._busy -= 1
+            if loader is not None:
+                self._idle.append(loader)
+        self._slots.release()
+
+    def load(self, file_path: str, timeout: float = None) -> Dict:
+        """
+        Load a test-data workbook; same result and errors as running
+        demo/load_test_data.py through SubprocessRunner.execute_script.
+
+        Raises:
+            SubprocessTimeoutError: no reply within timeout (default SUBPROCESS_TIMEOUT)
+            SubprocessError: the loader failed or died
+            DeadlineExceededError: the request's deadline passed first
+        """
+        timeout = remaining_time(SUBPROCESS_TIMEOUT if timeout is None else timeout)
+        deadline = time.monotonic() + timeout
+        loader = self._checkout(deadline)
+        try:
+            reply = loader.request(file_path, max(deadline - time.monotonic(), 0))
+        except (EOFError, OSError) as e:
+            loader.stop(kill=True)
+            self._checkin(None)
+            raise SubprocessError(f"{ERROR_MESSAGES['script_execution_failed']}: "
+                                  f"loader process exited ({e})")
+        if reply is None:
+            loader.stop(kill=True)   # may be stuck mid-parse
+            self._checkin(None)
+            check_deadline()
+            raise SubprocessTimeoutError(ERROR_MESSAGES['simulation_timeout'])
+        self._checkin(loader)
+
+        if reply[0] != 'ok':
+            stderr = reply[1]
+            raise SubprocessError(f"{ERROR_MESSAGES['script_execution_failed']}: {stderr}",
+                                  stderr=stderr)
+        _, name, n = reply
+        shm = SharedMemory(name=name)
+        try:
+            curve = np.ndarray((2, n), dtype=np.float64, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+        return build_test_data_response(curve[0].tolist(), curve[1].tolist(),
+                                        os.path.basename(file_path))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for loader in idle:
+            loader.stop()
+
+
+_pool: Optional[LoaderPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def get_loader_pool() -> LoaderPool:
+    """This process's pool (a forked child never reuses its parent's loaders)."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool, _pool_pid = LoaderPool(), os.getpid()
+        return _pool
+
+
+def _shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown()
+        _pool = None
+
+
+atexit.register(_shutdown_pool)
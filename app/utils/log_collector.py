@@ -0,0 +1,164 @@
+"""Log collector: the single writer of the CSV system logs under gunicorn.
+
+Every worker's LogManager sends its batches here over a UNIX datagram socket
+(LOG_SINK['socket_path']) instead of appending to the daily CSV itself, so
+rows from different processes can no longer interleave or tear.  The
+collector runs as a thread in the gunicorn master (gunicorn.conf.py starts it
+in `when_ready` and stops it in `on_exit`).
+
+Workers flush at least every LOG_WRITER['flush_interval'] seconds, so
+entries reach the collector slightly out of order.  They are held in a heap
+for LOG_SINK['reorder_window'] seconds and written ordered by
+(timestamp, request_id).  Size tracking and cleanup are those of LogManager,
+run by the collector only.
+"""
+import heapq
+import itertools
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from app.config.logging_config import CSV_HEADERS, LOG_DIR, LOG_SINK, LOG_WRITER
+from .log_manager import LogManager
+
+_TIMESTAMP = CSV_HEADERS.index('timestamp')
+_REQUEST_ID = CSV_HEADERS.index('request_id')
+
+
+class LogCollector:
+    """
+    Receives (filename, row) entries from LogManager writers and appends them
+    to the log files in timestamp order.
+
+    Args:
+        log_dir: Log directory (default LOG_DIR).
+        socket_path: Datagram socket to bind (default LOG_SINK['socket_path']).
+    """
+
+    def __init__(self, log_dir: Optional[str] = None, socket_path: Optional[str] = None):
+        self.writer = LogManager(log_dir=log_dir or LOG_DIR)
+        self.socket_path = socket_path or LOG_SINK['socket_path']
+        self.received = 0
+        self.written = 0
+        self._heap: List = []
+        self._seq = itertools.count()
+        self._handles: Dict[str, tuple] = {}
+        self._sock: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        """Bind the socket (replacing a stale one) and start the collector thread."""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, LOG_SINK['receive_buffer'])
+        except OSError:
+            pass
+        sock.bind(self.socket_path)
+        sock.settimeout(0.2)
+        self._sock = sock
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='log-collector', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = None) -> None:
+        """Stop accepting entries, write everything still held and close."""
+        if self._thread is None:
+            return
+        # Remove the socket first so writers fall back to local files
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+        self._stop.set()
+        self._thread.join(LOG_WRITER['shutdown_timeout'] if timeout is None else timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        self.writer._total_size = self.writer._get_total_log_size()
+        next_cleanup = time.monotonic() + LOG_WRITER['cleanup_interval']
+        try:
+            while not self._stop.is_set():
+                self._receive()
+                self._write_ready(flush_all=False)
+                if time.monotonic() >= next_cleanup:
+                    next_cleanup = time.monotonic() + LOG_WRITER['cleanup_interval']
+                    self.writer._check_and_cleanup()
+            # Drain what is already queued on the socket, then everything held
+            self._sock.settimeout(0)
+            while self._receive():
+                pass
+            self._write_ready(flush_all=True)
+        except Exception as e:
+            print(f'[LOG_COLLECTOR ERROR] {e}', file=sys.stderr)
+        finally:
+            for f, idx in self._handles.values():
+                f.close()
+                idx.close()
+            self._handles.clear()
+            self._sock.close()
+
+    def _receive(self) -> bool:
+        """Read one datagram into the reorder heap. False when none arrived."""
+        try:
+            datagram = self._sock.recv(65536)
+        except (socket.timeout, BlockingIOError):
+            return False
+        try:
+            entries = json.loads(datagram)
+        except ValueError:
+            print('[LOG_COLLECTOR ERROR] Malformed datagram dropped', file=sys.stderr)
+            return True
+        for filename, row in entries:
+            if len(row) != len(CSV_HEADERS):
+                continue
+            heapq.heappush(self._heap, (row[_TIMESTAMP], row[_REQUEST_ID],
+                                        next(self._seq), filename, row))
+        self.received += len(entries)
+        return True
+
+    def _write_ready(self, flush_all: bool) -> None:
+        """Write held entries older than the reorder window, oldest first."""
+        if not self._heap:
+            return
+        if flush_all:
+            ready = [heapq.heappop(self._heap) for _ in range(len(self._heap))]
+        else:
+            cutoff = (datetime.now() - timedelta(seconds=LOG_SINK['reorder_window'])).isoformat()
+            ready = []
+            while self._heap and self._heap[0][0] <= cutoff:
+                ready.append(heapq.heappop(self._heap))
+        if ready:
+            self.writer._write_batch([(item[3], item[4]) for item in ready], self._handles)
+            self.written += len(ready)
+
+
+_collector: Optional[LogCollector] = None
+
+
+def start_log_collector() -> Optional[LogCollector]:
+    """
+    Start the process-wide collector (gunicorn master). Returns None when the
+    sink is disabled or the platform has no UNIX sockets.
+    """
+    global _collector
+    if LOG_SINK['mode'] != 'auto' or not hasattr(socket, 'AF_UNIX'):
+        return None
+    if _collector is None:
+        _collector = LogCollector()
+        _collector.start()
+    return _collector
+
+
+def stop_log_collector() -> None:
+    global _collector
+    if _collector is not None:
+        _collector.stop()
+        _collector = None
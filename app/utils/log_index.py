@@ -0,0 +1,241 @@
+"""Sidecar index for the CSV system logs and the queries that use it.
+
+Next to every ``mgg_system_log_<day>.csv`` the log writer keeps
+``<file>.csv.idx``: an 8-byte magic followed by one fixed-size record per CSV
+row, appended in the same locked write as the row itself::
+
+    offset   uint64   byte offset of the row in the CSV
+    length   uint32   row length in bytes (rows may span lines: tracebacks)
+    second   uint32   seconds since midnight of the row's `time`
+    level    uint8    LOG_LEVELS value of `level` (0 = unknown)
+    status   uint16   status_code (0 = none)
+    user_id  int32    user_id (-1 = none)
+
+A query loads the index with NumPy, filters it in one vectorized pass and
+reads only the matching rows, newest first.  Rows the index does not cover —
+files written before the index existed, or the part of today's file written
+before an upgrade — are read backwards from their end in blocks, so "newest
+N" never reads a large file from the start.
+"""
+import csv
+import io
+import os
+import re
+import struct
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.config.logging_config import CSV_HEADERS, LOG_LEVELS
+
+MAGIC = b'MGGLIDX1'
+INDEX_SUFFIX = '.idx'
+RECORD = struct.Struct('<QIIBHi')
+INDEX_DTYPE = np.dtype([('offset', '<u8'), ('length', '<u4'), ('second', '<u4'),
+                        ('level', 'u1'), ('status', '<u2'), ('user_id', '<i4')])
+assert INDEX_DTYPE.itemsize == RECORD.size
+
+_COL = {name: i for i, name in enumerate(CSV_HEADERS)}
+# A row starts at a line beginning with its ISO timestamp
+ROW_START = re.compile(rb'\n(?=\d{4}-\d{2}-\d{2}T\d{2}:)')
+_BLOCK = 64 * 1024
+
+
+def index_path(csv_path: str) -> str:
+    return csv_path + INDEX_SUFFIX
+
+
+def _int(value: str, default: int) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_clock(value: Optional[str]) -> Optional[int]:
+    """'HH:MM' or 'HH:MM:SS' → seconds since midnight; None for empty input.
+
+    Raises:
+        ValueError: on a malformed time.
+    """
+    if not value:
+        return None
+    parts = [int(p) for p in value.split(':')]
+    if not 2 <= len(parts) <= 3 or not 0 <= parts[0] <= 23 or not all(0 <= p <= 59 for p in parts[1:]):
+        raise ValueError(f'Invalid time: {value}')
+    return parts[0] * 3600 + parts[1] * 60 + (parts[2] if len(parts) == 3 else 0)
+
+
+def row_record(row: List[str], offset: int, length: int) -> bytes:
+    """Index record for a CSV row (list in CSV_HEADERS order)."""
+    second = parse_clock(row[_COL['time']]) if row[_COL['time']] else 0
+    return RECORD.pack(offset, length, second or 0,
+                       LOG_LEVELS.get(row[_COL['level']], 0),
+                       _int(row[_COL['status_code']], 0) & 0xFFFF,
+                       _int(row[_COL['user_id']], -1))
+
+
+def load_index(csv_path: str, csv_size: int, start: int = 0) -> np.ndarray:
+    """
+    Index records of a CSV file from record number `start` on, or an empty
+    array when there is no usable index. Records past the end of the CSV (a
+    torn write) are dropped.
+    """
+    try:
+        with open(index_path(csv_path), 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return np.empty(0, dtype=INDEX_DTYPE)
+            if start:
+                f.seek(len(MAGIC) + start * INDEX_DTYPE.itemsize)
+            data = f.read()
+    except OSError:
+        return np.empty(0, dtype=INDEX_DTYPE)
+    usable = len(data) - len(data) % INDEX_DTYPE.itemsize
+    records = np.frombuffer(data[:usable], dtype=INDEX_DTYPE)
+    ends = records['offset'] + records['length']
+    if len(records) and (np.any(np.diff(records['offset'].astype(np.int64)) <= 0)):
+        return np.empty(0, dtype=INDEX_DTYPE)   # not written by one ordered writer
+    return records[ends <= csv_size]
+
+
+class LogQuery:
+    """
+    Row filter shared by the index mask and the unindexed fallback.
+
+    Args:
+        level: Level name or list of names.
+        user_id, status_code: Exact match.
+        start, end: Seconds since midnight, inclusive.
+    """
+
+    def __init__(self, level=None, user_id: int = None, status_code: int = None,
+                 start: int = None, end: int = None):
+        levels = [level] if isinstance(level, str) else list(level or [])
+        self.levels = [lv.upper() for lv in levels]
+        self.user_id = user_id
+        self.status_code = status_code
+        self.start = start
+        self.end = end
+
+    def __bool__(self):
+        return bool(self.levels) or any(v is not None for v in
+                                        (self.user_id, self.status_code, self.start, self.end))
+
+    def mask(self, records: np.ndarray) -> np.ndarray:
+        keep = np.ones(len(records), dtype=bool)
+        if self.levels:
+            keep &= np.isin(records['level'], [LOG_LEVELS.get(lv, -1) for lv in self.levels])
+        if self.user_id is not None:
+            keep &= records['user_id'] == self.user_id
+        if self.status_code is not None:
+            keep &= records['status'] == self.status_code
+        if self.start is not None:
+            keep &= records['second'] >= self.start
+        if self.end is not None:
+            keep &= records['second'] <= self.end
+        return keep
+
+    def matches(self, entry: Dict) -> bool:
+        if self.levels and entry.get('level', '').upper() not in self.levels:
+            return False
+        if self.user_id is not None and _int(entry.get('user_id'), -1) != self.user_id:
+            return False
+        if self.status_code is not None and _int(entry.get('status_code'), 0) != self.status_code:
+            return False
+        if self.start is not None or self.end is not None:
+            try:
+                second = parse_clock(entry.get('time'))
+            except ValueError:
+                return False
+            if second is None:
+                return False
+            if self.start is not None and second < self.start:
+                return False
+            if self.end is not None and second > self.end:
+                return False
+        return True
+
+
+def parse_rows(raw: bytes) -> List[Dict]:
+    """CSV bytes (complete rows, no header) → list of entry dicts."""
+    reader = csv.reader(io.StringIO(raw.decode('utf-8', errors='replace'), newline=''))
+    return [dict(zip(CSV_HEADERS, row)) for row in reader if len(row) == len(CSV_HEADERS)]
+
+
+def reverse_rows(f, lo: int, hi: int) -> Iterator[Tuple[int, bytes]]:
+    """
+    (offset, raw row) for the rows in byte range [lo, hi) of a binary file,
+    newest first, reading backwards in blocks.
+    """
+    tail = b''
+    pos = hi
+    while pos > lo:
+        step = min(_BLOCK, pos - lo)
+        pos -= step
+        f.seek(pos)
+        buf = f.read(step) + tail
+        starts = [m.start() + 1 for m in ROW_START.finditer(buf)]
+        # Everything before the first boundary may be the middle of a row
+        for start in reversed(starts):
+            yield pos + start, buf[start:]
+            buf = buf[:start]
+        tail = buf
+    if tail:
+        # Range start is a row start (after the header / an indexed row)
+        yield lo, tail
+
+
+def header_length(f) -> int:
+    """Length of the CSV header line (0 for an empty file)."""
+    f.seek(0)
+    line = f.readline()
+    return len(line) if line.startswith(CSV_HEADERS[0].encode()) else 0
+
+
+def query_file(csv_path: str, query: Optional[LogQuery] = None,
+               max_rows: int = 1000) -> List[Dict]:
+    """
+    Up to max_rows entries of one log file matching query, newest first.
+    """
+    query = query or LogQuery()
+    results: List[Dict] = []
+    try:
+        size = os.path.getsize(csv_path)
+    except OSError:
+        return results
+    records = load_index(csv_path, size)
+
+    with open(csv_path, 'rb') as f:
+        head = header_length(f)
+        if len(records):
+            covered_lo = int(records['offset'][0])
+            covered_hi = int(records['offset'][-1] + records['length'][-1])
+        else:
+            covered_lo = covered_hi = size
+
+        # 1. Unindexed rows after the index (newest)
+        _scan(f, max(covered_hi, head), size, query, max_rows, results)
+
+        # 2. Indexed rows
+        if len(results) < max_rows and len(records):
+            picked = records[query.mask(records)] if query else records
+            picked = picked[::-1][:max_rows - len(results)]
+            for offset, length in zip(picked['offset'].tolist(), picked['length'].tolist()):
+                f.seek(offset)
+                results.extend(parse_rows(f.read(length)))
+
+        # 3. Unindexed rows before the index (oldest)
+        if len(results) < max_rows:
+            _scan(f, head, covered_lo, query, max_rows, results)
+    return results[:max_rows]
+
+
+def _scan(f, lo: int, hi: int, query: LogQuery, max_rows: int, results: List) -> None:
+    if hi <= lo:
+        return
+    for _, raw in reverse_rows(f, lo, hi):
+        for entry in parse_rows(raw):
+            if not query or query.matches(entry):
+                results.append(entry)
+        if len(results) >= max_rows:
+            return
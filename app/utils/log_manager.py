@@ -1,19 +1,63 @@
-"""Log manager for CSV-based system logging with rotation and cleanup"""
+"""Log manager for CSV-based system logging with rotation and cleanup
+
+Writing is asynchronous: `write_log` only formats the entry and puts it on a
+bounded in-memory queue, so the request path never touches the filesystem.
+A background writer thread (one per process, started on first use) appends
+queued entries in batches — as soon as LOG_WRITER['batch_size'] are pending
+or LOG_WRITER['flush_interval'] seconds after the oldest one — through a
+file handle kept open for the current day's file.  The folder size is
+tracked from the bytes written and re-measured (and cleanup run) every
+LOG_WRITER['cleanup_interval'] seconds instead of on every entry.  Pending
+entries are written at interpreter exit; `flush()` forces them out earlier.
+
+When a log collector is listening (LOG_SINK, app/utils/log_collector.py —
+started in the gunicorn master), batches are sent to it instead, so a single
+process owns the CSV files and rows from different workers never interleave.
+Anything the collector cannot take is written locally as before.
+
+Every row is also recorded in a sidecar index (``<file>.csv.idx``, see
+app/utils/log_index.py) in the same locked append, and `query_logs` uses it
+to read the newest matching rows without scanning the file from the start.
+
+Slow SQL statements (app/utils/query_stats.py) go through the same queue to
+a second daily file, ``mgg_slow_query_log_<date>.csv``, with the same columns.
+"""
+import atexit
+import errno
+import io
+import json
 import os
 import csv
+import queue
+import socket
+import sys
 import time
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 import threading
+
+try:
+    import fcntl
+except ImportError:   # Windows: single-process dev server only
+    fcntl = None
+
 from app.config.logging_config import (
     LOG_DIR,
+    LOG_FILE_PREFIX,
+    SLOW_QUERY_LOG_PREFIX,
     CSV_HEADERS,
     LOG_ROTATION,
     LOG_RETENTION,
-    get_current_log_filepath,
+    LOG_SINK,
+    LOG_WRITER,
     get_current_log_filename
 )
+from .log_index import MAGIC, RECORD, LogQuery, index_path, query_file, row_record
+from .metrics_registry import LOG_DROPPED, LOG_QUEUE_DEPTH
+
+_STOP = object()   # writer-thread sentinel
+_MAX_OPEN_FILES = 4   # system log + slow-query log, plus yesterday's across midnight
 
 
 class LogManager:
@@ -22,26 +66,39 @@ class LogManager:
     _instance = None
     _lock = threading.Lock()
 
-    def __new__(cls):
-        """Singleton pattern to ensure only one log manager instance"""
+    def __new__(cls, log_dir: Optional[str] = None):
+        """Singleton pattern to ensure only one log manager instance
+        (an explicit log_dir gives a separate instance, e.g. for the collector)"""
+        if log_dir is not None:
+            return super(LogManager, cls).__new__(cls)
         if cls._instance is None:
             with cls._lock:
                 if cls._instance is None:
                     cls._instance = super(LogManager, cls).__new__(cls)
         return cls._instance
 
-    def __init__(self):
+    def __init__(self, log_dir: Optional[str] = None):
         """Initialize the log manager"""
         if not hasattr(self, 'initialized'):
             self.initialized = True
-            self.log_dir = Path(LOG_DIR)
+            self.log_dir = Path(log_dir or LOG_DIR)
             self.log_dir.mkdir(parents=True, exist_ok=True)
             self.current_log_file = None
+            self.dropped = 0   # entries lost to a full queue
+            self._writer_lock = threading.Lock()
+            self._writer_pid = None
+            self._queue = None
+            self._thread = None
+            self._sink = None   # datagram socket to the collector (writer thread only)
             self._ensure_log_file_exists()
+            atexit.register(self.close)
+
+    def _log_filepath(self) -> str:
+        return str(self.log_dir / get_current_log_filename())
 
     def _ensure_log_file_exists(self):
         """Ensure current log file exists with headers"""
-        log_filepath = get_current_log_filepath()
+        log_filepath = self._log_filepath()
 
         if not os.path.exists(log_filepath):
             # Create new log file with headers
@@ -115,32 +172,243 @@ class LogManager:
             'request_id': request_id or '',
         }
 
-    def write_log(self, **kwargs):
+    def write_log(self, log_prefix: str = LOG_FILE_PREFIX, **kwargs):
         """
-        Write a log entry to the current log file.
+        Queue a log entry for the current log file. Never blocks: when the
+        queue is full the entry is dropped and counted in `dropped`.
 
         Args:
+            log_prefix: Which log (LOG_FILE_PREFIX or SLOW_QUERY_LOG_PREFIX)
             **kwargs: Log entry parameters (see _get_log_entry_dict)
         """
         try:
-            # Ensure we're using the current log file (handles daily rotation)
-            self._ensure_log_file_exists()
-
-            # Create log entry
             log_entry = self._get_log_entry_dict(**kwargs)
+            row = [log_entry[k] for k in CSV_HEADERS]
+            # Target file is fixed now, so entries near midnight rotate correctly
+            self._writer_queue().put_nowait((get_current_log_filename(log_prefix), row))
+        except queue.Full:
+            self.dropped += 1
+            LOG_DROPPED.inc()
+        except Exception as e:
+            # If logging fails, print to stderr but don't crash the application
+            print(f'[LOG_MANAGER ERROR] Failed to write log: {str(e)}', file=sys.stderr)
 
-            # Write to CSV file
-            with open(self.current_log_file, 'a', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=CSV_HEADERS)
-                writer.writerow(log_entry)
-
-            # Check if cleanup is needed
-            self._check_and_cleanup()
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Write every entry queued so far. Returns False on timeout.
+        """
+        if self._queue is None or self._writer_pid != os.getpid():
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self) -> None:
+        """Drain the queue and stop the writer thread (registered with atexit)."""
+        with self._writer_lock:
+            thread, q = self._thread, self._queue
+            if thread is None or self._writer_pid != os.getpid():
+                return
+            self._thread = self._queue = None
+        try:
+            q.put(_STOP, timeout=LOG_WRITER['shutdown_timeout'])
+        except queue.Full:
+            pass
+        thread.join(LOG_WRITER['shutdown_timeout'])
+
+    # ── background writer ────────────────────────────────────────────────────
+
+    def _writer_queue(self) -> queue.Queue:
+        """This process's queue, starting the writer thread on first use."""
+        q = self._queue
+        if q is not None and self._writer_pid == os.getpid():
+            return q
+        with self._writer_lock:
+            if self._queue is None or self._writer_pid != os.getpid():
+                # Fresh state after a fork: the parent's thread did not survive
+                self._queue = queue.Queue(maxsize=LOG_WRITER['queue_size'])
+                self._writer_pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._writer_loop, args=(self._queue,),
+                    name='log-writer', daemon=True)
+                self._thread.start()
+            return self._queue
+
+    def _writer_loop(self, q: queue.Queue) -> None:
+        handles: Dict[str, tuple] = {}   # path → (csv file, index file)
+        pending: List = []
+        waiters: List[threading.Event] = []
+        first_pending = None
+        try:
+            self._total_size = self._get_total_log_size()
+        except OSError:
+            self._total_size = 0
+        next_cleanup = time.monotonic() + LOG_WRITER['cleanup_interval']
+        over_at_scan = False
+        stopping = False
+
+        while not stopping:
+            now = time.monotonic()
+            wait = next_cleanup - now
+            if first_pending is not None:
+                wait = min(wait, first_pending + LOG_WRITER['flush_interval'] - now)
+            try:
+                item = q.get(timeout=max(wait, 0))
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                stopping = True
+            elif isinstance(item, threading.Event):
+                waiters.append(item)
+            elif item is not None:
+                pending.append(item)
+                if first_pending is None:
+                    first_pending = time.monotonic()
+
+            now = time.monotonic()
+            due = first_pending is not None and now - first_pending >= LOG_WRITER['flush_interval']
+            if pending and (stopping or waiters or due or len(pending) >= LOG_WRITER['batch_size']):
+                unsent = self._send_to_collector(pending)
+                if unsent:
+                    self._write_batch(unsent, handles)
+                pending, first_pending = [], None
+            for event in waiters:
+                event.set()
+            waiters = []
+            LOG_QUEUE_DEPTH.set(q.qsize() + len(pending))
+
+            # Rescan on the timer, or early when our own writes cross the limit
+            over = self._total_size > LOG_ROTATION['max_folder_size_bytes']
+            if now >= next_cleanup or (over and not over_at_scan):
+                next_cleanup = now + LOG_WRITER['cleanup_interval']
+                if not self._collector_available():   # the collector cleans up itself
+                    self._check_and_cleanup()
+                over_at_scan = self._total_size > LOG_ROTATION['max_folder_size_bytes']
+
+        for f, idx in handles.values():
+            f.close()
+            idx.close()
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+
+    @staticmethod
+    def _collector_available() -> bool:
+        return (LOG_SINK['mode'] == 'auto' and hasattr(socket, 'AF_UNIX')
+                and os.path.exists(LOG_SINK['socket_path']))
+
+    def _send_to_collector(self, batch: List) -> List:
+        """
+        Send (filename, row) entries to the log collector as JSON datagrams.
 
+        Returns:
+            The entries that were not delivered (all of them when no
+            collector is listening) — the caller writes those itself.
+        """
+        if not self._collector_available():
+            return batch
+        try:
+            if self._sink is None:
+                self._sink = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                self._sink.settimeout(LOG_SINK['send_timeout'])
+        except OSError:
+            return batch
+
+        unsent = []
+        start = 0
+        for end, datagram in _datagrams(batch, LOG_SINK['max_datagram']):
+            try:
+                self._sink.sendto(datagram, LOG_SINK['socket_path'])
+            except OSError as e:
+                if e.errno == errno.EMSGSIZE:   # one oversized entry: keep it local
+                    unsent.extend(batch[start:end])
+                    start = end
+                    continue
+                # Collector gone or stuck: the rest of the batch stays local
+                self._sink.close()
+                self._sink = None
+                return unsent + batch[start:]
+            start = end
+        return unsent
+
+    def _write_batch(self, batch: List, handles: Dict) -> None:
+        """
+        Append queued (filename, row) pairs and their index records, one pair
+        of open handles per file. Each run of rows for a file is appended
+        under an exclusive lock, so offsets stay correct when several
+        processes write the same file.
+        """
+        try:
+            start = 0
+            while start < len(batch):
+                filename = batch[start][0]
+                end = start
+                while end < len(batch) and batch[end][0] == filename:
+                    end += 1
+                path = str(self.log_dir / os.path.basename(filename))
+                handle = handles.get(path)
+                if handle is None:
+                    if len(handles) >= _MAX_OPEN_FILES:   # day rolled over
+                        for f, idx in handles.values():
+                            f.close()
+                            idx.close()
+                        handles.clear()
+                    handle = handles[path] = (open(path, 'ab'), open(index_path(path), 'ab'))
+                    if os.path.basename(path).startswith(LOG_FILE_PREFIX):
+                        self.current_log_file = path
+                self._append_rows(handle, [row for _, row in batch[start:end]])
+                start = end
         except Exception as e:
-            # If logging fails, print to stderr but don't crash the application
-            import sys
             print(f'[LOG_MANAGER ERROR] Failed to write log: {str(e)}', file=sys.stderr)
+            for f, idx in handles.values():
+                try:
+                    f.close()
+                    idx.close()
+                except OSError:
+                    pass
+            handles.clear()
+
+    def _append_rows(self, handle: tuple, rows: List[List[str]]) -> None:
+        f, idx = handle
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        encoded = []
+        for row in rows:
+            writer.writerow(row)
+            encoded.append(buf.getvalue().encode('utf-8'))
+            buf.seek(0)
+            buf.truncate()
+
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            offset = f.seek(0, os.SEEK_END)
+            written = 0
+            if offset == 0:
+                writer.writerow(CSV_HEADERS)
+                header = buf.getvalue().encode('utf-8')
+                f.write(header)
+                offset = written = len(header)
+            if idx.seek(0, os.SEEK_END) == 0:
+                idx.write(MAGIC)
+                written += len(MAGIC)
+            records = []
+            for row, data in zip(rows, encoded):
+                records.append(row_record(row, offset, len(data)))
+                offset += len(data)
+                written += len(data)
+            f.write(b''.join(encoded))
+            f.flush()
+            idx.write(b''.join(records))
+            idx.flush()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        self._total_size += written + len(records) * RECORD.size
 
     def log_info(self, message: str, **kwargs):
         """Log an INFO level message"""
@@ -170,6 +438,9 @@ class LogManager:
         endpoint: Optional[str] = None,
         user_agent: Optional[str] = None,
         request_id: Optional[str] = None,
+        db_queries: int = 0,
+        db_time_ms: float = 0.0,
+        db_slowest: Optional[List[Tuple[str, float]]] = None,
     ):
         """
         Log an HTTP request.
@@ -185,6 +456,9 @@ class LogManager:
             endpoint: Flask endpoint
             user_agent: User agent
             request_id: Request ID
+            db_queries: SQL statements the request executed
+            db_time_ms: Their total duration in milliseconds
+            db_slowest: (normalized SQL, ms) of the slowest ones, slowest first
         """
         # Determine log level based on status code
         if status_code >= 500:
@@ -196,6 +470,9 @@ class LogManager:
         else:
             level = 'INFO'
             message = f'Request: {method} {path}'
+        if db_queries:
+            slowest = ''.join(f' | {ms:.1f} ms: {sql}' for sql, ms in db_slowest or ())
+            message += f' [DB: {db_queries} queries, {db_time_ms:.1f} ms{slowest}]'
 
         self.write_log(
             level=level,
@@ -212,17 +489,35 @@ class LogManager:
             request_id=request_id,
         )
 
+    def log_slow_query(self, statement: str, duration_ms: float, **kwargs):
+        """
+        Log a slow SQL statement to the slow-query log (not the system log).
+
+        Args:
+            statement: Normalized SQL
+            duration_ms: Statement duration in milliseconds
+            **kwargs: request_id, method, path, endpoint, ... of the request
+                that ran it (see _get_log_entry_dict)
+        """
+        self.write_log(
+            log_prefix=SLOW_QUERY_LOG_PREFIX,
+            level='WARNING',
+            message=statement,
+            duration_ms=duration_ms,
+            action='slow_query',
+            **kwargs,
+        )
+
     def _check_and_cleanup(self):
-        """Check log folder size and cleanup old files if needed"""
+        """Re-measure the log folder and cleanup old files if needed"""
         try:
-            total_size = self._get_total_log_size()
+            total_size = self._total_size = self._get_total_log_size()
 
             # If total size exceeds limit, remove oldest files
             if total_size > LOG_ROTATION['max_folder_size_bytes']:
                 self._cleanup_old_logs(total_size)
 
         except Exception as e:
-            import sys
             print(f'[LOG_MANAGER ERROR] Cleanup failed: {str(e)}', file=sys.stderr)
 
     def _get_total_log_size(self) -> int:
@@ -235,6 +530,8 @@ class LogManager:
         total_size = 0
         for log_file in self.log_dir.glob('*.csv'):
             total_size += log_file.stat().st_size
+        for index_file in self.log_dir.glob('*.csv.idx'):
+            total_size += index_file.stat().st_size
         return total_size
 
     def _cleanup_old_logs(self, current_size: int):
@@ -266,10 +563,14 @@ class LogManager:
                 # Don't delete files newer than retention period
                 continue
 
-            # Delete the file
+            # Delete the file and its index
             file_size = log_file.stat().st_size
             log_file.unlink()
             current_size -= file_size
+            index_file = Path(index_path(str(log_file)))
+            if index_file.exists():
+                current_size -= index_file.stat().st_size
+                index_file.unlink()
 
             # Log the deletion
             self.log_info(
@@ -281,16 +582,22 @@ class LogManager:
             if current_size <= target_size:
                 break
 
-    def get_log_files(self) -> List[Dict]:
+    def get_log_files(self, progress: Callable[[int, int], None] = None) -> List[Dict]:
         """
         Get list of all log files with metadata.
 
+        Args:
+            progress: Optional callback(done, total) after each file
+
         Returns:
             List[Dict]: List of log file information
         """
         log_files = []
 
-        for log_file in sorted(self.log_dir.glob('*.csv'), key=lambda f: f.stat().st_mtime, reverse=True):
+        paths = sorted(self.log_dir.glob('*.csv'), key=lambda f: f.stat().st_mtime, reverse=True)
+        for i, log_file in enumerate(paths):
+            if progress:
+                progress(i, len(paths))
             stat = log_file.stat()
             log_files.append({
                 'filename': log_file.name,
@@ -306,15 +613,32 @@ class LogManager:
 
     def read_log_file(self, filename: Optional[str] = None, max_rows: int = 1000) -> List[Dict]:
         """
-        Read a log file and return entries.
+        Read the newest entries of a log file.
 
         Args:
             filename: Log filename (defaults to current log file)
             max_rows: Maximum number of rows to return
 
         Returns:
-            List[Dict]: List of log entries
+            List[Dict]: List of log entries, newest first
         """
+        return self.query_logs(filename, max_rows=max_rows)
+
+    def query_logs(self, filename: Optional[str] = None, max_rows: int = 1000, **filters) -> List[Dict]:
+        """
+        Newest entries of a log file matching filters, read through the
+        file's index where it has one.
+
+        Args:
+            filename: Log filename (defaults to current log file)
+            max_rows: Maximum number of rows to return
+            **filters: level, user_id, status_code, start, end (see LogQuery;
+                start/end are seconds since midnight)
+
+        Returns:
+            List[Dict]: List of log entries, newest first
+        """
+        self.flush(timeout=LOG_WRITER['shutdown_timeout'])
         if filename:
             filepath = self.log_dir / filename
         else:
@@ -323,27 +647,20 @@ class LogManager:
         if not filepath.exists():
             return []
 
-        entries = []
+        return query_file(str(filepath), LogQuery(**filters), max_rows)
 
-        with open(filepath, 'r', newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                entries.append(row)
-                if len(entries) >= max_rows:
-                    break
-
-        # Return in reverse order (newest first)
-        return list(reversed(entries))
-
-    def get_log_statistics(self) -> Dict:
+    def get_log_statistics(self, progress: Callable[[int, int], None] = None) -> Dict:
         """
         Get statistics about the log system.
 
+        Args:
+            progress: Optional callback(done, total) between log files
+
         Returns:
             Dict: Log statistics
         """
         total_size = self._get_total_log_size()
-        log_files = self.get_log_files()
+        log_files = self.get_log_files(progress)
 
         return {
             'total_files': len(log_files),
@@ -358,5 +675,20 @@ class LogManager:
         }
 
 
+def _datagrams(batch: List, limit: int):
+    """Split (filename, row) entries into JSON-array datagrams of at most
+    `limit` bytes; yields (index after the last entry, payload)."""
+    parts, size = [], 2
+    for i, item in enumerate(batch):
+        encoded = json.dumps(item, ensure_ascii=False).encode('utf-8')
+        if parts and size + len(encoded) + 1 > limit:
+            yield i, b'[' + b','.join(parts) + b']'
+            parts, size = [], 2
+        parts.append(encoded)
+        size += len(encoded) + 1
+    if parts:
+        yield len(batch), b'[' + b','.join(parts) + b']'
+
+
 # Global singleton instance
 log_manager = LogManager()
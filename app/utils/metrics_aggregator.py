@@ -0,0 +1,326 @@
+"""Incremental log metrics and background resource sampling for the admin monitor.
+
+`/admin/monitor/data` used to parse today's CSV log three times per refresh
+(request stats, crash events, access failures — each through
+``read_log_file(max_rows=50000)``) and to block 0.5 s in
+``psutil.cpu_percent``.  Both now come from per-process state that is only
+topped up:
+
+* `LogMetrics` remembers how far into today's log it has read and, on each
+  refresh, parses only the rows appended since — using the sidecar index
+  (app/utils/log_index.py) to find where complete rows end.  It keeps running
+  counters plus bounded ring buffers (``collections.deque``) of the newest
+  errors, crash events and failed logins.  A new day's file starts it afresh.
+* `ResourceSampler` is a daemon thread reading CPU and memory every
+  MONITOR['sample_interval'] seconds; readers get the latest sample.  Each
+  tick also records CPU, memory, disk usage, request rate and p95 latency
+  into the monitor's time-series history (app/utils/metrics_history.py).
+  The request figures come from the growth of the HTTP latency histogram
+  (app/utils/metrics_registry.py) since the previous tick, which counts
+  every request of every worker — the CSV log holds only failed and slow
+  ones by default.
+
+Both are per process (a forked gunicorn worker starts its own), created on
+first use by `get_log_metrics()` / `get_resource_sampler()`.
+"""
+import math
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, Optional
+
+import psutil
+
+from app.config.constants import MONITOR
+from app.config.network_config import NETWORK_LOGGING
+from .log_index import ROW_START, header_length, index_path, load_index, parse_rows
+from .metrics_history import get_metrics_history
+from .metrics_registry import HTTP_LATENCY, Histogram
+
+# Slow-request threshold in milliseconds (config stores it in seconds)
+_SLOW_MS = NETWORK_LOGGING['slow_request_threshold'] * 1000
+
+
+def _mb(byte_count: int) -> float:
+    return round(byte_count / (1024 ** 2), 2)
+
+
+def _bucket_quantile(q: float, counts: Dict[float, float]) -> float:
+    """
+    Quantile of histogram bucket counts (upper bound → observations), as
+    Prometheus' histogram_quantile: linear within the bucket holding the
+    rank; the +Inf bucket yields the largest finite bound.  NaN when empty.
+    """
+    total = sum(counts.values())
+    if total <= 0:
+        return float('nan')
+    rank = q * total
+    lower = cumulative = 0.0
+    for bound in sorted(counts):
+        count = counts[bound]
+        if count and cumulative + count >= rank:
+            if math.isinf(bound):
+                return lower
+            return lower + (bound - lower) * (rank - cumulative) / count
+        cumulative += count
+        if not math.isinf(bound):
+            lower = bound
+    return lower
+
+
+class LogMetrics:
+    """
+    Running request / crash / login-failure statistics over one day's log.
+
+    Args:
+        log_dir: Log directory (default: log_manager's).
+    """
+
+    def __init__(self, log_dir: Optional[str] = None):
+        self.log_dir = log_dir
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, path: Optional[str]) -> None:
+        self.path = path
+        self.offset = 0          # bytes of the CSV parsed so far
+        self.indexed = 0         # index records consumed so far
+        self.total = self.errors = self.slow = 0
+        self.recent_errors = deque(maxlen=MONITOR['recent_errors'])
+        self.crashes = deque(maxlen=MONITOR['crash_events'])
+        self.login_failures = deque(maxlen=MONITOR['recent_login_failures'])
+        self.failure_count = 0
+        self.failures_by_ip: Dict[str, int] = defaultdict(int)
+
+    def _current_path(self) -> str:
+        from app.config.logging_config import get_current_log_filename
+        from .log_manager import log_manager
+        return os.path.join(self.log_dir or str(log_manager.log_dir), get_current_log_filename())
+
+    def refresh(self) -> None:
+        """Parse the rows appended to today's log since the last refresh."""
+        with self._lock:
+            path = self._current_path()
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                self._reset(path)
+                return
+            if path != self.path or size < self.offset:
+                self._reset(path)   # new day, or the file was replaced
+
+            with open(path, 'rb') as f:
+                if self.offset == 0:
+                    self.offset = header_length(f)
+                end = self._complete_end(f, path, size)
+                if end <= self.offset:
+                    return
+                f.seek(self.offset)
+                raw = f.read(end - self.offset)
+            self.offset = end
+            for row in parse_rows(raw):
+                self._add(row)
+
+    def _complete_end(self, f, path: str, size: int) -> int:
+        """Byte offset up to which the file holds complete rows."""
+        records = load_index(path, size, start=self.indexed)
+        if len(records):
+            self.indexed += len(records)
+            return int(records['offset'][-1] + records['length'][-1])
+        if os.path.exists(index_path(path)):
+            return self.offset   # rows past the index are still being written
+        # No index (file from an older writer): stop before a possibly torn last row
+        if size <= self.offset:
+            return self.offset
+        f.seek(self.offset)
+        raw = f.read(size - self.offset)
+        if raw.endswith(b'\r\n'):
+            return size
+        starts = [m.start() + 1 for m in ROW_START.finditer(raw)]
+        return self.offset + starts[-1] if starts else self.offset
+
+    def _add(self, row: Dict) -> None:
+        action = row.get('action')
+        if action == 'system_startup':
+            self.crashes.clear()
+        elif action == 'user_login_failed':
+            self.failure_count += 1
+            self.failures_by_ip[row.get('ip_address') or 'unknown'] += 1
+            self.login_failures.append({
+                'time':     row.get('time', ''),
+                'ip':       row.get('ip_address', ''),
+                'username': row.get('username', ''),
+            })
+
+        if row.get('level') in ('ERROR', 'CRITICAL'):
+            self.crashes.append({
+                'time':     row.get('time', ''),
+                'level':    row.get('level', ''),
+                'message':  row.get('message', ''),
+                'error':    row.get('error', ''),
+                'path':     row.get('path', ''),
+                'username': row.get('username', ''),
+            })
+
+        sc = row.get('status_code', '')
+        if not sc:
+            return
+        self.total += 1
+        try:
+            if int(sc) >= 400:
+                self.errors += 1
+                self.recent_errors.append({
+                    'time':        row.get('time', ''),
+                    'method':      row.get('method', ''),
+                    'path':        row.get('path', ''),
+                    'status_code': sc,
+                    'username':    row.get('username', ''),
+                    'message':     row.get('message', ''),
+                })
+        except ValueError:
+            pass
+        try:
+            duration = float(row.get('duration_ms', ''))
+        except (ValueError, TypeError):
+            return
+        if duration >= _SLOW_MS:
+            self.slow += 1
+
+    # ── snapshots (newest first) ─────────────────────────────────────────────
+
+    def request_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'total_requests':     self.total,
+                'error_count':        self.errors,
+                'slow_request_count': self.slow,
+                'error_rate_percent': round(self.errors / self.total * 100, 1) if self.total else 0.0,
+                'recent_errors':      list(reversed(self.recent_errors)),
+            }
+
+    def crash_events(self) -> list:
+        with self._lock:
+            return list(reversed(self.crashes))
+
+    def access_failures(self) -> Dict:
+        with self._lock:
+            return {
+                'total_failures':  self.failure_count,
+                'failures_by_ip':  dict(self.failures_by_ip),
+                'recent_failures': list(reversed(self.login_failures)),
+            }
+
+
+class ResourceSampler:
+    """
+    Daemon thread sampling CPU and memory every `interval` seconds.
+
+    Args:
+        interval: Seconds between samples (default MONITOR['sample_interval']).
+        history: MetricsHistory to record every sample into (optional).
+        latency: Request latency Histogram supplying the request rate and
+            p95 of each interval (optional, used with history).
+    """
+
+    def __init__(self, interval: float = None, history=None,
+                 latency: Optional[Histogram] = None):
+        self.interval = interval or MONITOR['sample_interval']
+        self.history = history
+        self.latency = latency
+        self._latency_counts: Dict[float, float] = {}
+        self._sample: Optional[Dict] = None
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._window_start = time.monotonic()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='resource-sampler', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        psutil.cpu_percent(interval=None)   # first call only sets the baseline
+        if self.latency is not None:
+            try:   # requests before the first tick are not its traffic
+                self._latency_counts = self.latency.bucket_counts()
+            except OSError:
+                pass
+            self._window_start = time.monotonic()
+        delay = min(self.interval, 0.5)
+        while not self._stop.wait(delay):
+            try:
+                self._tick()
+            except Exception as e:
+                print(f'[MONITOR SAMPLER ERROR] {e}', file=sys.stderr)
+            delay = self.interval
+
+    def _tick(self) -> None:
+        sample = self._sample = self._read()
+        self._ready.set()
+        if self.history is None:
+            return
+        from .system_monitor import sample_disk_usage
+        values = {'cpu_percent': sample['cpu_percent'], 'memory_percent': sample['memory_percent']}
+        values.update(sample_disk_usage())
+        if self.latency is not None:
+            counts = self.latency.bucket_counts()
+            window = {bound: max(count - self._latency_counts.get(bound, 0.0), 0.0)
+                      for bound, count in counts.items()}
+            now = time.monotonic()
+            values['requests_per_s'] = sum(window.values()) / max(now - self._window_start, 1e-6)
+            values['p95_ms'] = _bucket_quantile(0.95, window) * 1000
+            self._latency_counts, self._window_start = counts, now
+        self.history.record(values)
+
+    @staticmethod
+    def _read() -> Dict:
+        mem = psutil.virtual_memory()
+        return {
+            'cpu_percent':         round(psutil.cpu_percent(interval=None), 1),
+            'memory_percent':      round(mem.percent, 1),
+            'memory_used_mb':      _mb(mem.used),
+            'memory_total_mb':     _mb(mem.total),
+            'memory_available_mb': _mb(mem.available),
+        }
+
+    def latest(self, timeout: float = 1.0) -> Dict:
+        """The newest sample; waits up to timeout for the very first one."""
+        self.start()
+        self._ready.wait(timeout)
+        sample = self._sample
+        return dict(sample) if sample is not None else self._read()
+
+
+_state_lock = threading.Lock()
+_state_pid: Optional[int] = None
+_log_metrics: Optional[LogMetrics] = None
+_sampler: Optional[ResourceSampler] = None
+
+
+def _ensure_state() -> None:
+    global _state_pid, _log_metrics, _sampler
+    with _state_lock:
+        if _state_pid != os.getpid():
+            _state_pid = os.getpid()
+            _log_metrics = LogMetrics()
+            _sampler = ResourceSampler(history=get_metrics_history(), latency=HTTP_LATENCY)
+
+
+def get_log_metrics() -> LogMetrics:
+    """This process's log aggregator, refreshed with the rows written since last call."""
+    _ensure_state()
+    _log_metrics.refresh()
+    return _log_metrics
+
+
+def get_resource_sampler() -> ResourceSampler:
+    """This process's resource sampler (started on first use)."""
+    _ensure_state()
+    _sampler.start()
+    return _sampler
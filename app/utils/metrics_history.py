@@ -0,0 +1,270 @@
+"""Time-series history of the admin monitor's metrics.
+
+The background sampler (metrics_aggregator.ResourceSampler) records one row
+of FIELDS every MONITOR['sample_interval'] seconds into `MetricsHistory`:
+
+* an in-memory ring buffer of the last MONITOR['ring_size'] samples (a
+  preallocated NumPy array, oldest overwritten), and
+* `HistoryStore`, a fixed-size ``.npy`` file of MONITOR['history_days'] days
+  at MONITOR['history_resolution'] seconds per bucket.  A bucket's slot is
+  ``(bucket_start // resolution) % slots``, so the file never grows and old
+  buckets are simply overwritten; column 0 holds the bucket start so stale
+  slots are recognised.  Buckets store the mean of their samples, except
+  p95 latency, which keeps the maximum.
+
+Every app process samples, but only the one holding an exclusive ``flock`` on
+``<store>.lock`` writes the store; the others retry at each bucket.
+`/admin/monitor/history` answers from memory when the ring covers the
+requested range and from the store otherwise, downsampled to a point budget.
+"""
+import atexit
+import math
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:   # Windows: single process, always the writer
+    fcntl = None
+
+from app.config.constants import MONITOR
+
+FIELDS = (
+    'cpu_percent',      # %
+    'memory_percent',   # %
+    'disk_percent',     # % of the partition holding the app
+    'uploads_mb',
+    'backups_mb',
+    'requests_per_s',   # HTTP requests, all workers
+    'p95_ms',           # 95th percentile request duration in the interval
+)
+_MAX_FIELDS = {'p95_ms'}   # aggregated with max instead of mean
+
+
+def _downsample(rows: np.ndarray, fields: List[str], since: float, until: float,
+                points: int) -> Dict:
+    """rows (ts + FIELDS columns, oldest first) → at most `points` time buckets."""
+    if len(rows) > points:
+        width = (until - since) / points
+        bucket = np.floor((rows[:, 0] - since) / width).astype(np.int64)
+        first = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    else:
+        first = np.arange(len(rows))
+    series = {}
+    for name in fields:
+        values = rows[:, 1 + FIELDS.index(name)]
+        if not len(rows):
+            out = values
+        elif name in _MAX_FIELDS:
+            out = np.fmax.reduceat(values, first)
+        else:
+            present = ~np.isnan(values)
+            sums = np.add.reduceat(np.where(present, values, 0.0), first)
+            counts = np.add.reduceat(present.astype(np.int64), first)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                out = np.where(counts > 0, sums / counts, np.nan)
+        series[name] = [None if math.isnan(v) else round(v, 2) for v in out.tolist()]
+    return {'t': [round(t, 3) for t in rows[first, 0].tolist()], 'series': series}
+
+
+class HistoryStore:
+    """
+    Fixed-size on-disk ring of downsampled buckets.
+
+    Args:
+        path: .npy file (default MONITOR['history_path']).
+        resolution: Seconds per bucket (default MONITOR['history_resolution']).
+        days: History length (default MONITOR['history_days']).
+    """
+
+    def __init__(self, path: str = None, resolution: int = None, days: int = None):
+        self.path = path or MONITOR['history_path']
+        self.resolution = resolution or MONITOR['history_resolution']
+        self.slots = int((days or MONITOR['history_days']) * 86400 // self.resolution)
+        self._lock_file = None
+        self._bucket: Optional[int] = None
+        self._sums = np.zeros(len(FIELDS))
+        self._counts = np.zeros(len(FIELDS))
+        self._maxes = np.full(len(FIELDS), np.nan)
+
+    @property
+    def shape(self):
+        return self.slots, 1 + len(FIELDS)
+
+    def _is_writer(self) -> bool:
+        if self._lock_file is not None:
+            return True
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            f = open(self.path + '.lock', 'a')
+        except OSError:
+            return False
+        if fcntl is not None:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return False   # another process writes the store
+        self._lock_file = f
+        return True
+
+    def _open(self, mode: str) -> Optional[np.ndarray]:
+        try:
+            data = np.lib.format.open_memmap(self.path, mode=mode)
+        except (OSError, ValueError):
+            data = None
+        if data is not None and data.shape == self.shape and data.dtype == np.float64:
+            return data
+        if mode == 'r':
+            return None
+        # Missing, or written with other settings: start a fresh file
+        data = np.lib.format.open_memmap(self.path, mode='w+', dtype=np.float64, shape=self.shape)
+        data[:, 0] = 0
+        return data
+
+    def add(self, ts: float, row: np.ndarray) -> None:
+        """Fold one sample into its bucket; a finished bucket is written out."""
+        bucket = int(ts // self.resolution) * self.resolution
+        if self._bucket is not None and bucket != self._bucket:
+            self.flush()
+        self._bucket = bucket
+        present = ~np.isnan(row)
+        self._sums[present] += row[present]
+        self._counts[present] += 1
+        self._maxes = np.fmax(self._maxes, row)
+
+    def flush(self) -> None:
+        """Write the bucket being filled (if this process is the writer)."""
+        if self._bucket is None or not self._counts.any():
+            return
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = self._sums / self._counts
+        for name in _MAX_FIELDS:
+            values[FIELDS.index(name)] = self._maxes[FIELDS.index(name)]
+        bucket = self._bucket
+        self._sums[:] = 0
+        self._counts[:] = 0
+        self._maxes[:] = np.nan
+        if not self._is_writer():
+            return
+        try:
+            data = self._open('r+')
+            slot = (bucket // self.resolution) % self.slots
+            data[slot, 0] = bucket
+            data[slot, 1:] = values
+            data.flush()
+            del data
+        except OSError as e:
+            print(f'[MONITOR HISTORY ERROR] {e}', file=sys.stderr)
+
+    def read(self, since: float, until: float) -> np.ndarray:
+        """Buckets starting in [since, until], oldest first."""
+        data = self._open('r')
+        if data is None:
+            return np.empty((0, 1 + len(FIELDS)))
+        rows = np.array(data[(data[:, 0] >= since) & (data[:, 0] <= until) & (data[:, 0] > 0)])
+        return rows[np.argsort(rows[:, 0], kind='stable')]
+
+    def close(self) -> None:
+        self.flush()
+        if self._lock_file is not None:
+            self._lock_file.close()   # releases the flock
+            self._lock_file = None
+
+
+class MetricsHistory:
+    """
+    In-memory ring of recent samples in front of a HistoryStore.
+
+    Args:
+        ring_size: Samples kept in memory (default MONITOR['ring_size']).
+        store: On-disk store (default a HistoryStore with MONITOR settings;
+            pass False for memory only).
+    """
+
+    def __init__(self, ring_size: int = None, store=None):
+        self.ring_size = ring_size or MONITOR['ring_size']
+        self.store = HistoryStore() if store is None else (store or None)
+        self._ring = np.full((self.ring_size, 1 + len(FIELDS)), np.nan)
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def record(self, values: Dict[str, float], ts: float = None) -> None:
+        ts = time.time() if ts is None else ts
+        row = np.array([values.get(name, np.nan) for name in FIELDS], dtype=np.float64)
+        with self._lock:
+            self._ring[self._next, 0] = ts
+            self._ring[self._next, 1:] = row
+            self._next = (self._next + 1) % self.ring_size
+            self._count = min(self._count + 1, self.ring_size)
+            if self.store is not None:
+                self.store.add(ts, row)
+
+    def recent(self) -> np.ndarray:
+        """Ring contents, oldest first."""
+        with self._lock:
+            if self._count < self.ring_size:
+                return self._ring[:self._count].copy()
+            return np.roll(self._ring, -self._next, axis=0)
+
+    def series(self, fields: List[str], since: float, until: float = None,
+               points: int = None) -> Dict:
+        """
+        Time series of `fields` between since and until (epoch seconds).
+
+        Returns:
+            {'source': 'memory'|'disk', 't': [...], 'series': {field: [...]}}
+            — values are None where nothing was sampled.
+
+        Raises:
+            ValueError: on an unknown field.
+        """
+        unknown = [name for name in fields if name not in FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown metric(s): {', '.join(unknown)}")
+        until = time.time() if until is None else until
+        points = points or MONITOR['history_points']
+        rows = self.recent()
+        if self.store is None or (len(rows) and rows[0, 0] <= since):
+            source = 'memory'
+            rows = rows[(rows[:, 0] >= since) & (rows[:, 0] <= until)]
+        else:
+            source = 'disk'
+            rows = self.store.read(since, until)
+        result = _downsample(rows, fields, since, until, points)
+        result['source'] = source
+        return result
+
+    def close(self) -> None:
+        if self.store is not None:
+            with self._lock:
+                self.store.close()
+
+
+_history: Optional[MetricsHistory] = None
+_history_pid: Optional[int] = None
+_history_lock = threading.Lock()
+
+
+def get_metrics_history() -> MetricsHistory:
+    """This process's history (a forked child never shares its parent's ring)."""
+    global _history, _history_pid
+    with _history_lock:
+        if _history is None or _history_pid != os.getpid():
+            _history, _history_pid = MetricsHistory(), os.getpid()
+        return _history
+
+
+def _close_history() -> None:
+    with _history_lock:
+        if _history is not None and _history_pid == os.getpid():
+            _history.close()
+
+
+atexit.register(_close_history)
@@ -0,0 +1,463 @@
+"""Multiprocess Prometheus metrics for /metrics.
+
+Every process (gunicorn worker, parse-pool child, the master) keeps its metric
+values in its own memory-mapped file, ``<multiproc_dir>/values_<pid>.db``,
+updated in place: an increment is a dict lookup and a ``struct.pack_into``, no
+syscall and no cross-process lock.  The worker answering ``/metrics`` reads
+every file and sums the values:
+
+* counters and histograms — summed over all files.  Files of processes that
+  have exited are folded into ``merged.json`` on the next scrape (under an
+  exclusive ``flock``), so counts survive worker recycling.
+* gauges — summed over live processes only (their files' values are
+  dropped when folded).
+
+File layout: 8-byte header (magic, bytes used), then records of
+``uint32 key length | key (UTF-8, padded to 8) | float64 value``.  The key
+is ``<family>|<sample name>|<label text>``.
+
+The metric families exported by MGG_SYS are defined at the bottom of this
+module; instrumented code imports them from here.
+"""
+import contextlib
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:   # Windows: single process, no compaction races
+    fcntl = None
+
+from app.config.network_config import METRICS_EXPORT
+
+_MAGIC = b'MGGM'
+_HEADER = struct.Struct('<4sI')
+_INITIAL_SIZE = 64 * 1024
+_MERGED = 'merged.json'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# ── per-process value file ───────────────────────────────────────────────────
+
+class _ValueFile:
+    """This process's mmap'd key → float64 store."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._f = open(path, 'w+b')   # a reused pid starts from zero
+        self._f.truncate(_INITIAL_SIZE)
+        self._map = mmap.mmap(self._f.fileno(), 0)
+        self._used = _HEADER.size
+        self._offsets: Dict[str, int] = {}
+        _HEADER.pack_into(self._map, 0, _MAGIC, self._used)
+
+    def _grow(self, needed: int) -> None:
+        size = len(self._map)
+        while size < needed:
+            size *= 2
+        self._map.close()
+        self._f.truncate(size)
+        self._map = mmap.mmap(self._f.fileno(), 0)
+
+    def _offset(self, key: str) -> int:
+        offset = self._offsets.get(key)
+        if offset is None:
+            encoded = key.encode('utf-8')
+            padded = len(encoded) + (-(4 + len(encoded)) % 8)
+            record = 4 + padded + 8
+            if self._used + record > len(self._map):
+                self._grow(self._used + record)
+            struct.pack_into(f'<I{padded}sd', self._map, self._used, len(encoded), encoded, 0.0)
+            offset = self._offsets[key] = self._used + 4 + padded
+            self._used += record
+            _HEADER.pack_into(self._map, 0, _MAGIC, self._used)   # publish after the record
+        return offset
+
+    def add(self, key: str, amount: float) -> None:
+        offset = self._offset(key)
+        value, = struct.unpack_from('<d', self._map, offset)
+        struct.pack_into('<d', self._map, offset, value + amount)
+
+    def set(self, key: str, value: float) -> None:
+        struct.pack_into('<d', self._map, self._offset(key), value)
+
+    def close(self) -> None:
+        self._map.close()
+        self._f.close()
+
+
+def read_value_file(path: str) -> Dict[str, float]:
+    """All key → value pairs of a value file (any process's)."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < _HEADER.size:
+        return {}
+    magic, used = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC:
+        return {}
+    values, pos = {}, _HEADER.size
+    while pos + 4 <= min(used, len(data)):
+        length, = struct.unpack_from('<I', data, pos)
+        padded = length + (-(4 + length) % 8)
+        key = data[pos + 4:pos + 4 + length].decode('utf-8')
+        values[key], = struct.unpack_from('<d', data, pos + 4 + padded)
+        pos += 4 + padded + 8
+    return values
+
+
+# ── registry ─────────────────────────────────────────────────────────────────
+
+class Registry:
+    """
+    Metric families plus this process's value file.
+
+    Args:
+        directory: Shared directory of value files (default
+            METRICS_EXPORT['multiproc_dir']).
+    """
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or METRICS_EXPORT['multiproc_dir']
+        self.families: Dict[str, '_Family'] = {}
+        self._lock = threading.Lock()
+        self._file: Optional[_ValueFile] = None
+        self._pid: Optional[int] = None
+
+    def register(self, family: '_Family') -> '_Family':
+        self.families[family.name] = family
+        return family
+
+    def _values(self) -> Optional[_ValueFile]:
+        if self._pid != os.getpid():   # first use, or a forked child: own file, zero values
+            self._pid = os.getpid()
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                self._file = _ValueFile(os.path.join(self.directory, f'values_{self._pid}.db'))
+            except OSError:
+                self._file = None   # metrics are best-effort; never fail a request
+        return self._file
+
+    def add(self, key: str, amount: float) -> None:
+        with self._lock:
+            values = self._values()
+            if values is not None:
+                values.add(key, amount)
+
+    def set(self, key: str, value: float) -> None:
+        with self._lock:
+            values = self._values()
+            if values is not None:
+                values.set(key, value)
+
+    # ── scrape side ──────────────────────────────────────────────────────────
+
+    @contextlib.contextmanager
+    def _dir_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.lock'), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def _value_files(self) -> List[Tuple[int, str]]:
+        files = []
+        for path in glob.glob(os.path.join(self.directory, 'values_*.db')):
+            try:
+                files.append((int(os.path.basename(path)[7:-3]), path))
+            except ValueError:
+                pass
+        return files
+
+    def _is_gauge(self, key: str) -> bool:
+        family = self.families.get(key.split('|', 1)[0])
+        return family is not None and family.kind == 'gauge'
+
+    def collect(self) -> Dict[str, float]:
+        """Values summed across processes; folds exited processes into merged.json."""
+        merged_path = os.path.join(self.directory, _MERGED)
+        with self._dir_lock():
+            try:
+                with open(merged_path) as f:
+                    merged = json.load(f)
+            except (OSError, ValueError):
+                merged = {}
+            live: List[Dict[str, float]] = []
+            folded = False
+            for pid, path in self._value_files():
+                try:
+                    values = read_value_file(path)
+                except OSError:
+                    continue
+                if pid == os.getpid() or _alive(pid):
+                    live.append(values)
+                    continue
+                for key, value in values.items():
+                    if not self._is_gauge(key):
+                        merged[key] = merged.get(key, 0.0) + value
+                os.unlink(path)
+                folded = True
+            if folded:
+                tmp = merged_path + '.tmp'
+                with open(tmp, 'w') as f:
+                    json.dump(merged, f)
+                os.replace(tmp, merged_path)
+
+        totals = dict(merged)
+        for values in live:
+            for key, value in values.items():
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+    def exposition(self) -> str:
+        """All families in the Prometheus text format (version 0.0.4)."""
+        totals = self.collect()
+        by_family: Dict[str, List[Tuple[str, str, float]]] = {}
+        for key, value in totals.items():
+            family, sample, labels = key.split('|', 2)
+            by_family.setdefault(family, []).append((sample, labels, value))
+
+        lines = []
+        for name in sorted(self.families):
+            family = self.families[name]
+            lines.append(f'# HELP {name} {_escape_help(family.help)}')
+            lines.append(f'# TYPE {name} {family.kind}')
+            samples = by_family.get(name, [])
+            if family.kind == 'histogram':
+                lines.extend(family.render(samples))
+            else:
+                for sample, labels, value in sorted(samples):
+                    lines.append(f'{sample}{{{labels}}} {_number(value)}' if labels
+                                 else f'{sample} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def reset_directory(self) -> None:
+        """Remove files of processes that are gone and the merged totals
+        (gunicorn master start — a new server starts its counters at zero)."""
+        with self._dir_lock():
+            for pid, path in self._value_files():
+                if pid != os.getpid() and not _alive(pid):
+                    os.unlink(path)
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(os.path.join(self.directory, _MERGED))
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _escape_help(text: str) -> str:
+    return text.replace('\\', r'\\').replace('\n', r'\n')
+
+
+def _number(value: float) -> str:
+    value = float(value)
+    return '+Inf' if value == float('inf') else repr(value)
+
+
+# ── metric families ──────────────────────────────────────────────────────────
+
+class _Family:
+    kind = ''
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 registry: Registry = None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.registry = registry or REGISTRY
+        self.registry.register(self)
+
+    def _labels_text(self, values: Sequence) -> str:
+        if len(values) != len(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}')
+        return ','.join(f'{n}="{_escape_label(v)}"' for n, v in zip(self.labelnames, values))
+
+    def labels(self, *values, **kwargs) -> '_Child':
+        if kwargs:
+            values = tuple(kwargs[n] for n in self.labelnames)
+        return _Child(self, self._labels_text(values))
+
+
+class _Child:
+    """A family bound to one label set."""
+
+    def __init__(self, family: _Family, labels: str):
+        self.family = family
+        self.labels = labels
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.family._inc(self.labels, amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.family._inc(self.labels, -amount)
+
+    def set(self, value: float) -> None:
+        self.family._set(self.labels, value)
+
+    def observe(self, value: float) -> None:
+        self.family._observe(self.labels, value)
+
+    @contextlib.contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Counter(_Family):
+    kind = 'counter'
+
+    def _inc(self, labels: str, amount: float) -> None:
+        self.registry.add(f'{self.name}|{self.name}|{labels}', amount)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._inc('', amount)
+
+
+class Gauge(_Family):
+    """Per-process value; the export is the sum over live processes."""
+    kind = 'gauge'
+
+    def _inc(self, labels: str, amount: float) -> None:
+        self.registry.add(f'{self.name}|{self.name}|{labels}', amount)
+
+    def _set(self, labels: str, value: float) -> None:
+        self.registry.set(f'{self.name}|{self.name}|{labels}', value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._inc('', amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._inc('', -amount)
+
+    def set(self, value: float) -> None:
+        self._set('', value)
+
+
+class Histogram(_Family):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Iterable[float] = None, registry: Registry = None):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = tuple(sorted(buckets or METRICS_EXPORT['latency_buckets']))
+
+    def _observe(self, labels: str, value: float) -> None:
+        # Non-cumulative bucket counts are stored; render() accumulates them
+        bound = next((b for b in self.buckets if value <= b), float('inf'))
+        sep = ',' if labels else ''
+        registry = self.registry
+        registry.add(f'{self.name}|{self.name}_bucket|{labels}{sep}le="{_number(bound)}"', 1.0)
+        registry.add(f'{self.name}|{self.name}_sum|{labels}', value)
+        registry.add(f'{self.name}|{self.name}_count|{labels}', 1.0)
+
+    def observe(self, value: float) -> None:
+        self._observe('', value)
+
+    def time(self):
+        return _Child(self, '').time()
+
+    def bucket_counts(self, totals: Dict[str, float] = None) -> Dict[float, float]:
+        """Observations per bucket upper bound (+Inf included), summed over
+        label sets and processes; totals defaults to the registry's collect()."""
+        if totals is None:
+            totals = self.registry.collect()
+        prefix = f'{self.name}|{self.name}_bucket|'
+        counts = dict.fromkeys(self.buckets + (float('inf'),), 0.0)
+        for key, value in totals.items():
+            if key.startswith(prefix):
+                bound = float(key.rpartition('le="')[2].rstrip('"').replace('+Inf', 'inf'))
+                counts[bound] = counts.get(bound, 0.0) + value
+        return counts
+
+    def render(self, samples: List[Tuple[str, str, float]]) -> List[str]:
+        series: Dict[str, Dict] = {}
+        for sample, labels, value in samples:
+            if sample.endswith('_bucket'):
+                base, _, le = labels.rpartition('le="')
+                base = base.rstrip(',')
+                bound = float(le.rstrip('"').replace('+Inf', 'inf'))
+                series.setdefault(base, {}).setdefault('buckets', {})[bound] = value
+            else:
+                series.setdefault(labels, {})[sample[len(self.name):]] = value
+        lines = []
+        for labels in sorted(series):
+            data = series[labels]
+            sep = ',' if labels else ''
+            cumulative = 0.0
+            counts = data.get('buckets', {})
+            for bound in self.buckets + (float('inf'),):
+                cumulative += counts.get(bound, 0.0)
+                lines.append(f'{self.name}_bucket{{{labels}{sep}le="{_number(bound)}"}} {_number(cumulative)}')
+            label_text = f'{{{labels}}}' if labels else ''
+            lines.append(f'{self.name}_sum{label_text} {_number(data.get("_sum", 0.0))}')
+            lines.append(f'{self.name}_count{label_text} {_number(data.get("_count", cumulative))}')
+        return lines
+
+
+REGISTRY = Registry()
+
+
+def instrument_db_pools() -> None:
+    """Count checkouts of every SQLAlchemy pool (idempotent)."""
+    from sqlalchemy import event
+    from sqlalchemy.pool import Pool
+    if not event.contains(Pool, 'checkout', _on_checkout):
+        event.listen(Pool, 'checkout', _on_checkout)
+        event.listen(Pool, 'checkin', _on_checkin)
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy) -> None:
+    DB_POOL_CHECKOUTS.inc()
+    DB_POOL_IN_USE.inc()
+
+
+def _on_checkin(dbapi_connection, connection_record) -> None:
+    DB_POOL_IN_USE.dec()
+
+
+# ── MGG_SYS metrics ──────────────────────────────────────────────────────────
+
+HTTP_REQUESTS = Counter(
+    'mgg_http_requests_total', 'HTTP requests by Flask endpoint, method and status.',
+    ('endpoint', 'method', 'status'))
+HTTP_LATENCY = Histogram(
+    'mgg_http_request_duration_seconds', 'HTTP request duration by Flask endpoint and status.',
+    ('endpoint', 'status'))
+MODEL_INFERENCE = Histogram(
+    'mgg_model_inference_seconds', 'Forward model inference time by mode (surface/exact/mixed).',
+    ('mode',))
+EXCEL_PARSE = Histogram(
+    'mgg_excel_parse_seconds', 'Time to read one P-T curve workbook.')
+SIMILARITY_SEARCH = Histogram(
+    'mgg_similarity_search_seconds', 'Work-order similarity search time by mode.', ('mode',))
+DB_POOL_CHECKOUTS = Counter(
+    'mgg_db_pool_checkouts_total', 'Connections checked out of the SQLAlchemy pool.')
+DB_POOL_IN_USE = Gauge(
+    'mgg_db_pool_connections_in_use', 'Connections currently checked out of the SQLAlchemy pool.')
+DB_QUERY_DURATION = Histogram(
+    'mgg_db_query_duration_seconds', 'SQL statement execution time (see app/utils/query_stats.py).',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+LOG_QUEUE_DEPTH = Gauge(
+    'mgg_log_queue_depth', 'Entries waiting in the log writer queues.')
+LOG_DROPPED = Counter(
+    'mgg_log_entries_dropped_total', 'Log entries dropped because a writer queue was full.')
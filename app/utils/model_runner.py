@@ -2,13 +2,24 @@
 
 Loads the .pkl model file once on first use and keeps it cached for the
 lifetime of the process.  Eliminates subprocess overhead on every 计算 call.
+
+The .pkl holds one fitted estimator per timestep.  When every estimator is a
+polynomial-linear model sharing the same feature map, the coefficients are
+stacked at load time into a single (F, T) matrix so that N inputs × T
+timesteps are evaluated with one matrix product (see `run_batch_inference`).
+Any other estimator type falls back to calling `predict` once per timestep.
+
+On top of that, `predict_pressure_curves` answers from a precomputed response
+surface (see response_surface.py) unless an admin has forced exact inference.
 """
-import json
+import logging
 import os
 import pickle
+import time
+import tracemalloc
+from typing import Iterable, Optional
 
 import numpy as np
-import plotly.graph_objects as go
 
 # Compatibility patch: models saved with newer numpy expose numpy._core;
 # unpickling them on older numpy would fail without this shim.
@@ -16,23 +27,90 @@ if not hasattr(np, '_core'):
     import numpy.core as _nc
     np._core = _nc
 
+from app.config.constants import EXACT_INFERENCE_FLAG
+from app.config.network_config import WORKER_CONFIG
+from . import figure_spec, response_surface, weight_store
+from .deadline import check_deadline
 from .errors import SimulationError
+from .metrics_registry import MODEL_INFERENCE
 from .paths import get_models_path
 
 _model_data = None  # module-level cache; populated on first call to _load_model()
+_flat_model = None  # stacked coefficient arrays, or None if the models cannot be flattened
+_surface = None     # response-surface dict, or None if disabled / rejected
+_model_source = None  # 'weight_store' (memory-mapped) or 'pickle'
 
 
-def _load_model() -> dict:
-    """Load the most-recent .pkl from the models directory and cache it.
+def _split_estimator(model):
+    """Return (poly_step, linear_step) for a flattenable estimator, else None.
 
-    SECURITY NOTE: pickle.load() can execute arbitrary code. Model files must
-    come exclusively from the controlled models directory managed by the
-    development team — never from user uploads or external sources.
+    Accepted shapes:
+      * Pipeline([... PolynomialFeatures ..., <linear estimator>])
+      * a bare linear estimator (anything exposing coef_ / intercept_)
     """
-    global _model_data
-    if _model_data is not None:
-        return _model_data
+    steps = getattr(model, 'steps', None)
+    if steps is None:
+        poly, linear = None, model
+    else:
+        if len(steps) not in (1, 2):
+            return None
+        linear = steps[-1][1]
+        poly = steps[0][1] if len(steps) == 2 else None
+        if poly is not None and not hasattr(poly, 'powers_'):
+            return None
+
+    coef = getattr(linear, 'coef_', None)
+    if coef is None or not hasattr(linear, 'intercept_'):
+        return None
+    if np.ndim(coef) != 1:
+        return None  # multi-output estimators are not supported
+    return poly, linear
+
+
+def _flatten_models(models) -> Optional[dict]:
+    """
+    Stack per-timestep estimators into dense NumPy arrays.
+
+    Returns:
+        {'powers': (F, n_in) int array or None, 'coef': (F, T), 'intercept': (T,)}
+        or None if any estimator cannot be expressed as the shared feature map
+        followed by a linear layer.
+    """
+    if not models:
+        return None
+
+    powers = None
+    coefs = []
+    intercepts = []
+    for i, model in enumerate(models):
+        parts = _split_estimator(model)
+        if parts is None:
+            return None
+        poly, linear = parts
+
+        model_powers = np.asarray(poly.powers_) if poly is not None else None
+        if i == 0:
+            powers = model_powers
+        elif (powers is None) != (model_powers is None) or (
+            powers is not None and not np.array_equal(powers, model_powers)
+        ):
+            return None  # estimators do not share one feature map
 
+        coef = np.asarray(linear.coef_, dtype=float)
+        if coefs and coef.shape != coefs[0].shape:
+            return None
+        coefs.append(coef)
+        intercepts.append(float(np.asarray(linear.intercept_, dtype=float).reshape(-1)[0]))
+
+    return {
+        'powers': powers,
+        'coef': np.column_stack(coefs),
+        'intercept': np.asarray(intercepts, dtype=float),
+    }
+
+
+def _resolve_model_path() -> str:
+    """Return the absolute path of the most-recent .pkl in the models directory."""
     models_path = get_models_path()
     # Resolve to absolute path so traversal attempts are rejected below
     models_abs = os.path.realpath(models_path)
@@ -49,70 +127,348 @@ def _load_model() -> dict:
     model_path = os.path.realpath(os.path.join(models_abs, model_files[-1]))
     if not model_path.startswith(models_abs + os.sep) and model_path != models_abs:
         raise SimulationError('Model path outside the expected models directory')
+    return model_path
+
 
+def _unpickle(model_path: str) -> dict:
+    """Unpickle a model file, wrapping failures in SimulationError."""
     try:
         with open(model_path, 'rb') as f:
-            _model_data = pickle.load(f)
+            return pickle.load(f)
     except Exception as e:
-        raise SimulationError(f'Failed to load model "{model_files[-1]}": {e}')
+        raise SimulationError(f'Failed to load model "{os.path.basename(model_path)}": {e}')
+
+
+def _load_model() -> dict:
+    """Load the most-recent model from the models directory and cache it.
+
+    If an up-to-date weight store exists (see weight_store.py) the stacked
+    arrays are memory-mapped from it and the .pkl is never unpickled;
+    otherwise the .pkl is unpickled and flattened in-process.
+
+    SECURITY NOTE: pickle.load() can execute arbitrary code. Model files must
+    come exclusively from the controlled models directory managed by the
+    development team — never from user uploads or external sources.
+    """
+    global _model_data, _flat_model, _surface, _model_source
+    if _model_data is not None:
+        return _model_data
+
+    model_path = _resolve_model_path()
+
+    store = weight_store.open_store(model_path)
+    if store is not None:
+        arrays = store['arrays']
+        header = store['header']
+        flat = {
+            'powers': arrays.get('powers'),
+            'coef': arrays['coef'],
+            'intercept': arrays['intercept'],
+        }
+        model_data = {
+            'models': None,  # estimators are not unpickled in store mode
+            'common_times': arrays['common_times'],
+            'metadata': header.get('metadata', {}),
+            'feature_range': header.get('feature_range', {}),
+        }
+        source = 'weight_store'
+    else:
+        model_data = _unpickle(model_path)
+        flat = _flatten_models(model_data.get('models'))
+        source = 'pickle'
+
+    model_data['num_models'] = (
+        flat['coef'].shape[1] if flat is not None else len(model_data['models'])
+    )
+    model_data['model_path'] = model_path
+    model_data['weight_store'] = store['header'] if store is not None else None
+    _flat_model = flat
+    _model_source = source
+    _model_data = model_data
+
+    try:
+        _surface = response_surface.load_or_build(model_path, model_data, run_batch_inference)
+    except Exception as e:
+        # The surface is an optimisation only — exact inference still works.
+        _surface = None
+        logging.getLogger(__name__).warning('Response surface unavailable: %s', e)
 
     return _model_data
 
 
-def run_forward_inference(nc_usage_1: float) -> dict:
+def _reset_cache() -> None:
+    """Drop the cached model so the next call reloads it (tests, re-export)."""
+    global _model_data, _flat_model, _surface, _model_source
+    _model_data = _flat_model = _surface = _model_source = None
+
+
+def export_weight_store() -> dict:
     """
-    Run forward simulation in-process using the cached ML model.
+    Export the current .pkl into the shared weight store.
+
+    Run once in the gunicorn master (see gunicorn.conf.py) or by hand via
+    ``python scripts/export_weights.py``.  Also measures how much heap one
+    worker would spend on the unpickled estimators, for the admin monitor.
+
+    Returns:
+        The store header (see weight_store.py).
+
+    Raises:
+        SimulationError: if the model cannot be loaded or its estimators cannot
+            be flattened into plain arrays.
+    """
+    model_path = _resolve_model_path()
+
+    # First load pulls in scikit-learn; the second, traced load then measures
+    # only the estimator objects themselves.
+    model_data = _unpickle(model_path)
+    tracemalloc.start()
+    try:
+        _unpickle(model_path)
+        unpickled_bytes = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    flat = _flatten_models(model_data.get('models'))
+    if flat is None:
+        raise SimulationError('Model estimators cannot be exported to a flat weight store')
+
+    n_times = flat['coef'].shape[1]
+    arrays = {
+        'coef': flat['coef'],
+        'intercept': flat['intercept'],
+        'common_times': np.asarray(model_data['common_times'][:n_times], dtype=float),
+    }
+    if flat['powers'] is not None:
+        arrays['powers'] = flat['powers']
+
+    try:
+        return weight_store.export_store(
+            model_path, arrays,
+            metadata=model_data.get('metadata', {}),
+            feature_range=model_data.get('feature_range', {}),
+            unpickled_bytes=unpickled_bytes,
+        )
+    except OSError as e:
+        raise SimulationError(f'Cannot write weight store: {e}')
+
+
+def preload_shared_weights() -> dict:
+    """
+    Make sure the weight store is current and map it into this process.
+
+    Called from the gunicorn master before workers fork, so every worker
+    inherits the same read-only mappings instead of unpickling its own copy.
+    """
+    model_path = _resolve_model_path()
+    if weight_store.open_store(model_path) is None:
+        export_weight_store()
+    _reset_cache()
+    _load_model()
+    return get_inference_status()
+
+
+def get_common_times() -> np.ndarray:
+    """Return the model's timestep grid (ms), one entry per estimator."""
+    model_data = _load_model()
+    return np.asarray(model_data['common_times'][:model_data['num_models']], dtype=float)
+
+
+def run_batch_inference(nc_usage_values: Iterable[float]) -> np.ndarray:
+    """
+    Predict the full P-T curve for many nc_usage_1 inputs at once.
 
     Args:
-        nc_usage_1: NC用量1 value (the sole input feature used by the model).
+        nc_usage_values: N input values (NC用量1, mg).
 
     Returns:
-        dict with keys 'plot_data' (Plotly JSON dict) and 'statistics'.
+        (N, T) float array — row i is the pressure curve for input i,
+        column j corresponds to get_common_times()[j].
 
     Raises:
         SimulationError: if the model cannot be loaded or prediction fails.
     """
     model_data = _load_model()
+    X = np.asarray(nc_usage_values, dtype=float).reshape(-1, 1)
+    flat = _flat_model
 
-    X = np.array([[nc_usage_1]])
-    times = []
-    pressures = []
     try:
-        for i, model in enumerate(model_data['models']):
-            pressures.append(float(model.predict(X)[0]))
-            times.append(float(model_data['common_times'][i]))
+        if flat is not None:
+            if flat['powers'] is not None:
+                # Polynomial feature map: Phi[n, f] = prod_k X[n, k] ** powers[f, k]
+                features = np.prod(X[:, None, :] ** flat['powers'][None, :, :], axis=2)
+            else:
+                features = X
+            return features @ flat['coef'] + flat['intercept']
+
+        # Fallback: estimators we cannot flatten — one predict() per timestep,
+        # still vectorised across the N inputs.
+        models = model_data['models']
+        pressures = np.empty((X.shape[0], len(models)), dtype=float)
+        for j, model in enumerate(models):
+            check_deadline()
+            pressures[:, j] = np.asarray(model.predict(X), dtype=float).reshape(-1)
+        return pressures
     except Exception as e:
         raise SimulationError(f'Prediction failed: {e}')
 
-    times_arr = np.array(times)
-    pressures_arr = np.array(pressures)
-
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(
-        x=times_arr.tolist(),
-        y=pressures_arr.tolist(),
-        mode='lines',
-        name=f'NC用量1: {nc_usage_1}mg',
-        line=dict(color='#667eea', width=2)
-    ))
-    fig.update_layout(
-        xaxis_title='时间 (ms)',
-        yaxis_title='压力 (MPa)',
-        hovermode='x unified',
-        template='plotly_white',
-        showlegend=True,
-        margin=dict(l=50, r=50, t=30, b=50)
-    )
 
-    plot_data = json.loads(fig.to_json())
+def is_exact_inference_forced() -> bool:
+    """True if an admin switched forward simulation to exact inference."""
+    return os.path.exists(os.path.join(get_models_path(), EXACT_INFERENCE_FLAG))
+
+
+def set_exact_inference(forced: bool) -> None:
+    """
+    Force (or stop forcing) exact inference.
+
+    The switch is a flag file in models/ so every gunicorn worker sees it
+    without a restart.
+    """
+    flag_path = os.path.join(get_models_path(), EXACT_INFERENCE_FLAG)
+    if forced:
+        with open(flag_path, 'w', encoding='utf-8') as f:
+            f.write('exact\n')
+    elif os.path.exists(flag_path):
+        os.remove(flag_path)
+
+
+def get_inference_status() -> dict:
+    """Summary of the inference engine for the admin monitor."""
+    model_data = _load_model()
+    surface = _surface
+    forced = is_exact_inference_forced()
+    return {
+        'mode': 'surface' if surface is not None and not forced else 'exact',
+        'exact_forced': forced,
+        'flattened': _flat_model is not None,
+        'num_models': model_data['num_models'],
+        'surface_ready': surface is not None,
+        'surface_rows': surface['count'] if surface else 0,
+        'surface_range': (
+            [round(surface['start'], 3),
+             round(surface['start'] + surface['step'] * (surface['count'] - 1), 3)]
+            if surface else None
+        ),
+        'surface_max_error': surface['max_error'] if surface else None,
+        'model_file': os.path.basename(model_data['model_path']),
+        **_shared_memory_report(model_data),
+    }
+
+
+def _shared_memory_report(model_data: dict) -> dict:
+    """Memory each worker saves by mapping the weight store instead of unpickling."""
+    workers = WORKER_CONFIG['workers']
+    header = model_data.get('weight_store')
+    if _model_source != 'weight_store' or not header:
+        return {
+            'weights_source': _model_source,
+            'workers': workers,
+            'store_bytes': 0,
+            'per_worker_saved_bytes': 0,
+            'total_saved_bytes': 0,
+        }
+    per_worker = int(header.get('unpickled_bytes', 0))
+    store_bytes = int(header.get('store_bytes', 0))
+    return {
+        'weights_source': _model_source,
+        'workers': workers,
+        'store_bytes': store_bytes,
+        'per_worker_saved_bytes': per_worker,
+        # N private heaps replaced by one shared page-cache copy
+        'total_saved_bytes': max(workers * per_worker - store_bytes, 0),
+    }
+
+
+def predict_pressure_curves(nc_usage_values: Iterable[float]) -> tuple:
+    """
+    Pressure curves for the given inputs, via the response surface when allowed.
+
+    Inputs outside the surface grid (or all inputs, when exact inference is
+    forced or the surface is unavailable) go through run_batch_inference.
+
+    Returns:
+        (pressures, mode) — pressures is (N, T); mode is 'surface' when every
+        row came from the surface, 'exact' when none did, 'mixed' otherwise.
+    """
+    start = time.perf_counter()
+    pressures, mode = _predict_pressure_curves(nc_usage_values)
+    MODEL_INFERENCE.labels(mode).observe(time.perf_counter() - start)
+    return pressures, mode
+
+
+def _predict_pressure_curves(nc_usage_values: Iterable[float]) -> tuple:
+    _load_model()
+    values = np.asarray(nc_usage_values, dtype=float).reshape(-1)
+    surface = _surface
+    if surface is None or is_exact_inference_forced():
+        return run_batch_inference(values), 'exact'
+
+    pressures, inside = response_surface.interpolate(surface, values)
+    if not inside.all():
+        pressures[~inside] = run_batch_inference(values[~inside])
+        return pressures, 'exact' if not inside.any() else 'mixed'
+    return pressures, 'surface'
+
+
+def run_forward_inference(nc_usage_1: float) -> dict:
+    """
+    Run forward simulation in-process using the cached ML model.
+
+    Args:
+        nc_usage_1: NC用量1 value (the sole input feature used by the model).
+
+    Returns:
+        dict with keys 'plot_data' (Plotly JSON dict) and 'statistics'.
+
+    Raises:
+        SimulationError: if the model cannot be loaded or prediction fails.
+    """
+    curves, mode = predict_pressure_curves([nc_usage_1])
+    return expand_forward_result(build_forward_result(nc_usage_1, curves[0], mode))
+
+
+def build_forward_result(nc_usage_1: float, pressures_arr: np.ndarray, mode: str) -> dict:
+    """
+    Compact record of one predicted P-T curve, as stored in
+    Simulation.result_data: {'curve': {'time', 'pressure'}, 'statistics'}.
+
+    The chart is not stored; expand_forward_result rebuilds it on read.
+    """
+    model_data = _load_model()
+    times_arr = get_common_times()
 
     return {
-        'plot_data': plot_data,
+        'curve': {
+            'time': times_arr.tolist(),
+            'pressure': np.asarray(pressures_arr).tolist(),
+        },
         'statistics': {
             'peak_pressure': float(np.max(pressures_arr)),
-            'num_models': len(model_data['models']),
+            'num_models': model_data['num_models'],
             'r_squared': float(model_data['metadata'].get('r_squared', 0.999)),
             'nc_usage_1': nc_usage_1,
             'num_points': len(times_arr),
+            'inference_mode': mode,
         }
     }
+
+
+def expand_forward_result(record: dict) -> dict:
+    """
+    Turn a stored result record into the API shape {'plot_data', 'statistics'}.
+
+    Records written before results were stored compactly already carry the
+    full 'plot_data' figure and are returned unchanged.
+    """
+    if 'plot_data' in record or 'curve' not in record:
+        return record
+    curve = record['curve']
+    statistics = record.get('statistics', {})
+    return {
+        'plot_data': figure_spec.line_figure(
+            curve['time'], curve['pressure'],
+            name=f"NC用量1: {statistics.get('nc_usage_1')}mg",
+        ),
+        'statistics': statistics,
+    }
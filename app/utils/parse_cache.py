@@ -0,0 +1,134 @@
+"""Content-addressed cache of parsed upload workbooks.
+
+An upload is typically parsed once by /simulation/validate_upload and again
+by /simulation/upload.  Both steps hash the file bytes (SHA-256) first; the
+first one to parse stores the numeric arrays and the validation result under
+that hash, and the other step reuses them.
+
+Entries are single files ``<sha256>.v<N>.bin`` in a directory shared by all
+gunicorn workers::
+
+    offset  size  field
+    0       4     JSON header length (uint32, little-endian)
+    4       ...   JSON header: {'width': int, 'validation': dict}
+    ...     ...   curve blob (app/utils/curve_codec.py, uncompressed float64)
+
+Writes go to a temporary file that is renamed into place, so readers never
+see a partial entry.  A hit bumps the entry's mtime; when the directory
+grows beyond ``max_bytes`` the least recently used entries are deleted.
+Concurrent workers may race on eviction — every filesystem error is treated
+as a cache miss.
+"""
+import hashlib
+import json
+import logging
+import os
+import struct
+from typing import Dict, Optional, Tuple
+
+from .curve_codec import decode_curve, encode_curve
+
+logger = logging.getLogger(__name__)
+
+# Bump when parsing or validation rules change: old entries are then ignored
+PARSE_CACHE_VERSION = 1
+
+_CHUNK = 1024 * 1024
+_LENGTH = struct.Struct('<I')
+
+
+def hash_stream(stream) -> Tuple[str, int]:
+    """
+    SHA-256 hex digest and byte size of a seekable stream, read in chunks.
+    The stream is rewound afterwards.
+    """
+    stream.seek(0)
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: stream.read(_CHUNK), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    stream.seek(0)
+    return digest.hexdigest(), size
+
+
+class ParseCache:
+    """On-disk LRU of {'time', 'pressure', 'width', 'validation'} by content hash."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.v{PARSE_CACHE_VERSION}.bin')
+
+    def get(self, key: str) -> Optional[Dict]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+            (header_len,) = _LENGTH.unpack_from(blob)
+            header = json.loads(blob[_LENGTH.size:_LENGTH.size + header_len])
+            time, pressure = decode_curve(blob[_LENGTH.size + header_len:])
+            os.utime(path)   # LRU: mtime is the last access
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning('Discarding unreadable parse cache entry %s: %s', path, e)
+            self._remove(path)
+            return None
+        return {'time': time, 'pressure': pressure,
+                'width': header['width'], 'validation': header['validation']}
+
+    def put(self, key: str, parsed: Dict) -> None:
+        header = json.dumps({'width': parsed['width'],
+                             'validation': parsed['validation']}).encode()
+        blob = (_LENGTH.pack(len(header)) + header +
+                encode_curve(parsed['time'], parsed['pressure'],
+                             dtype='float64', compression='none'))
+        if len(blob) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, 'wb') as f:
+                f.write(blob)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning('Could not write parse cache entry %s: %s', path, e)
+            self._remove(tmp)
+            return
+        self._evict()
+
+    def _evict(self) -> None:
+        """Delete least recently used entries until the total fits max_bytes."""
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.endswith('.bin'):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+        except OSError:
+            return
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            self._remove(path)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,159 @@
+"""Process pool for parsing uploaded workbooks off the request thread.
+
+/simulation/experiment may receive dozens of captures at once; parsing them
+one after another in the request thread can exceed the worker timeout.
+`parse_files` fans the files out over a lazily created, per-process
+``ProcessPoolExecutor`` (``spawn`` context — safe in threaded gunicorn
+workers and on Windows).  Each job returns the encoded curve blob
+(app/utils/curve_codec.py) rather than arrays or lists, and at most
+``max_workers * in_flight_per_worker`` files are queued at a time, so the
+parent's memory stays bounded regardless of batch size.  The pool allows
+one process per CPU but starts them on demand (``spawn`` executors grow only
+when no process is idle), so a batch runs on at most
+``min(cpu_count, len(files))`` of them, and a pool left unused for
+``EXPERIMENT_PARSE['idle_shutdown']`` seconds is shut down — the parser
+interpreters are not kept resident between batches.  Waiting for the
+pool stops at the request's deadline (app/utils/deadline.py); files not yet
+started are then cancelled.
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional, Tuple
+
+from app.config.constants import EXPERIMENT_PARSE
+from app.utils.deadline import check_deadline, remaining_time
+from app.utils.errors import DeadlineExceededError
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_active = 0                                   # batches currently using _pool
+_idle_timer: Optional[threading.Timer] = None
+
+
+def parse_to_blob(path: str) -> Tuple[Optional[bytes], Optional[str]]:
+    """
+    Pool job: parse one workbook into a curve_codec blob.
+
+    Returns:
+        (blob, None) on success, (None, error message) on failure — errors
+        are returned, not raised, so every file gets its own message.
+    """
+    from app.utils.curve_codec import encode_curve
+    from app.utils.file_handler import FileHandler
+    try:
+        time_arr, pressure_arr = FileHandler.load_excel_arrays(path)
+        return encode_curve(time_arr, pressure_arr), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _max_workers() -> int:
+    """Configured size, else the CPU count."""
+    return EXPERIMENT_PARSE['max_workers'] or os.cpu_count() or 1
+
+
+def _acquire_pool() -> ProcessPoolExecutor:
+    """The pool, for one batch; pair with _release_pool()."""
+    global _pool, _active, _idle_timer
+    with _pool_lock:
+        if _idle_timer is not None:
+            _idle_timer.cancel()
+            _idle_timer = None
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=_max_workers(),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        _active += 1
+        return _pool
+
+
+def _release_pool() -> None:
+    """End of a batch: shut the pool down once it stays unused for idle_shutdown seconds."""
+    global _active, _idle_timer
+    with _pool_lock:
+        _active -= 1
+        if _active or _pool is None:
+            return
+        _idle_timer = threading.Timer(EXPERIMENT_PARSE['idle_shutdown'], _shutdown_if_idle)
+        _idle_timer.daemon = True
+        _idle_timer.start()
+
+
+def _shutdown_if_idle() -> None:
+    global _pool, _idle_timer
+    with _pool_lock:
+        # A batch may have started, or a newer timer replaced this one
+        if _active or _pool is None or threading.current_thread() is not _idle_timer:
+            return
+        pool, _pool, _idle_timer = _pool, None, None
+    logger.info('Parse pool idle for %ss; shutting it down', EXPERIMENT_PARSE['idle_shutdown'])
+    pool.shutdown(wait=False)
+
+
+def _reset_pool() -> None:
+    global _pool, _idle_timer
+    with _pool_lock:
+        if _idle_timer is not None:
+            _idle_timer.cancel()
+            _idle_timer = None
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(_reset_pool)
+
+
+def parse_files(paths: List[str]) -> Iterator[Tuple[int, Optional[bytes], Optional[str]]]:
+    """
+    Parse workbooks, yielding (index into paths, blob, error) as each one
+    finishes (not in input order).
+    """
+    if len(paths) < EXPERIMENT_PARSE['min_files']:
+        for i, path in enumerate(paths):
+            yield (i, *parse_to_blob(path))
+        return
+
+    limit = _max_workers() * EXPERIMENT_PARSE['in_flight_per_worker']
+    queue = iter(enumerate(paths))
+    pending = {}
+    done_indexes = set()
+    pool = _acquire_pool()
+    try:
+        while True:
+            while len(pending) < limit:
+                item = next(queue, None)
+                if item is None:
+                    break
+                pending[pool.submit(parse_to_blob, item[1])] = item[0]
+            if not pending:
+                return
+            finished, _ = wait(pending, timeout=remaining_time(), return_when=FIRST_COMPLETED)
+            if not finished:
+                check_deadline()
+            for future in finished:
+                index = pending.pop(future)
+                blob, error = future.result()
+                done_indexes.add(index)
+                yield index, blob, error
+    except DeadlineExceededError:
+        for future in pending:
+            future.cancel()
+        raise
+    except BrokenProcessPool:
+        # A parser process died (e.g. OOM-killed): finish the batch inline
+        logger.warning('Parse pool broke; parsing the remaining files in-process')
+        _reset_pool()
+        for i, path in enumerate(paths):
+            if i not in done_indexes:
+                yield (i, *parse_to_blob(path))
+    finally:
+        _release_pool()
@@ -1,4 +1,5 @@
 """Plotting utilities for generating Plotly charts"""
+import numpy as np
 import plotly.graph_objects as go
 from typing import List, Dict, Optional
 from app.config.plot_config import (
@@ -184,7 +185,7 @@ class Plotter:
         Create a chart overlaying multiple experimental runs.
 
         Args:
-            datasets: List of {'time': [...], 'pressure': [...]} dicts
+            datasets: List of {'time': [...], 'pressure': [...]} dicts (lists or NumPy arrays)
             labels: Display name for each run (e.g. filename), same length as datasets
 
         Returns:
@@ -193,12 +194,16 @@ class Plotter:
         colors = Plotter._MULTI_RUN_COLORS
         traces = []
         for i, (ds, label) in enumerate(zip(datasets, labels)):
-            if not ds.get('time') or not ds.get('pressure'):
+            if ds.get('time') is None or ds.get('pressure') is None:
+                continue
+            # Plain lists: plotly would otherwise emit arrays as base64 typed-array dicts
+            x, y = np.asarray(ds['time']).tolist(), np.asarray(ds['pressure']).tolist()
+            if not x or not y:
                 continue
             color = colors[i % len(colors)]
             traces.append(go.Scatter(
-                x=ds['time'],
-                y=ds['pressure'],
+                x=x,
+                y=y,
                 mode='lines',
                 name=label,
                 line={'color': color, 'width': 2}
@@ -0,0 +1,195 @@
+"""SQL statement statistics: per request, per statement and slow-query log.
+
+`instrument_queries()` (called by create_app) hooks SQLAlchemy's
+``before_cursor_execute`` / ``after_cursor_execute`` events on every engine.
+Each statement's duration goes to:
+
+* the current request's `RequestQueries` on ``g`` — statement count, total
+  DB time and the slowest few statements.  logging_middleware adds all three
+  to the request's log row; slow-query rows carry the same ``request_id``.
+* per-statement call and time counters keyed by the normalized SQL
+  (literals and placeholders become ``?``, ``IN (?, ?, …)`` lists and
+  multi-row VALUES collapse to one entry).  They live in a multiprocess
+  registry of their own (app/utils/metrics_registry.py, directory
+  ``<multiproc_dir>/queries``) so `top_statements()` sums all workers for the
+  admin monitor without putting SQL text into /metrics labels.  /metrics gets
+  the unlabelled ``mgg_db_query_duration_seconds`` histogram instead.
+* the slow-query log (LogManager.log_slow_query, its own daily CSV) when it
+  took QUERY_LOG['slow_threshold_ms'] or longer.
+"""
+import os
+import re
+import sys
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from flask import g, has_request_context
+
+from app.config.logging_config import QUERY_LOG
+from app.config.network_config import METRICS_EXPORT
+from .log_manager import log_manager
+from .metrics_registry import DB_QUERY_DURATION, Counter, Registry
+
+_OTHER = '(other statements)'   # label once QUERY_LOG['max_statements'] are tracked
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b')
+_PLACEHOLDER = re.compile(r'%\(\w+\)s|%s|(?<![:\w]):\w+')
+_GROUP = r'\(\?(?:, \?)*\)'
+_VALUES_ROWS = re.compile(rf'({_GROUP})(?:, {_GROUP})+')
+_IN_LIST = re.compile(r'\(\?(?:, \?)+\)')
+
+QUERY_REGISTRY = Registry(os.path.join(METRICS_EXPORT['multiproc_dir'], 'queries'))
+STATEMENT_CALLS = Counter(
+    'mgg_db_statement_calls_total', 'Executions per normalized SQL statement.',
+    ('sql',), registry=QUERY_REGISTRY)
+STATEMENT_SECONDS = Counter(
+    'mgg_db_statement_seconds_total', 'Execution time per normalized SQL statement.',
+    ('sql',), registry=QUERY_REGISTRY)
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(statement: str) -> str:
+    """Statement text with literals, placeholders and value lists collapsed."""
+    sql = _STRING.sub('?', statement)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = ' '.join(sql.split())
+    sql = sql.replace('( ', '(').replace(' )', ')').replace(' ,', ',').replace(',?', ', ?')
+    sql = _VALUES_ROWS.sub(r'\1, ...', sql)
+    sql = _IN_LIST.sub('(?, ...)', sql)
+    return sql[:QUERY_LOG['max_sql_length']]
+
+
+class RequestQueries:
+    """Statements executed while serving one request."""
+
+    __slots__ = ('count', 'time_ms', 'slowest')
+
+    def __init__(self):
+        self.count = 0
+        self.time_ms = 0.0
+        self.slowest: List[Tuple[str, float]] = []   # (normalized SQL, ms), slowest first
+
+    def add(self, sql: str, ms: float) -> None:
+        self.count += 1
+        self.time_ms += ms
+        keep = QUERY_LOG['slowest_per_request']
+        if len(self.slowest) < keep or ms > self.slowest[-1][1]:
+            self.slowest.append((sql, ms))
+            self.slowest.sort(key=lambda item: -item[1])
+            del self.slowest[keep:]
+
+
+def request_queries() -> Optional[RequestQueries]:
+    """The current request's statistics (None outside a request or before its first query)."""
+    return g.get('db_queries') if has_request_context() else None
+
+
+_tracked: set = set()
+_tracked_lock = threading.Lock()
+
+
+def _statement_label(sql: str) -> str:
+    if sql in _tracked:
+        return sql
+    with _tracked_lock:
+        if len(_tracked) >= QUERY_LOG['max_statements']:
+            return _OTHER
+        _tracked.add(sql)
+    return sql
+
+
+def record_statement(statement: str, seconds: float) -> None:
+    """Account one executed statement (called from the cursor events)."""
+    sql = normalize_sql(statement)
+    ms = seconds * 1000
+    DB_QUERY_DURATION.observe(seconds)
+    label = _statement_label(sql)
+    STATEMENT_CALLS.labels(label).inc()
+    STATEMENT_SECONDS.labels(label).inc(seconds)
+
+    in_request = has_request_context()
+    if in_request:
+        stats = g.get('db_queries')
+        if stats is None:
+            stats = g.db_queries = RequestQueries()
+        stats.add(sql, ms)
+
+    if ms >= QUERY_LOG['slow_threshold_ms']:
+        info = g.get('request_info', {}) if in_request else {}
+        log_manager.log_slow_query(
+            sql, ms,
+            request_id=g.get('request_id') if in_request else None,
+            method=info.get('method'),
+            path=info.get('path'),
+            endpoint=info.get('endpoint'),
+            ip_address=info.get('ip_address'),
+        )
+
+
+def top_statements(limit: int = None) -> List[Dict]:
+    """Normalized statements by total time across all workers, largest first."""
+    calls: Dict[str, float] = {}
+    seconds: Dict[str, float] = {}
+    for key, value in QUERY_REGISTRY.collect().items():
+        family, _, labels = key.split('|', 2)
+        sql = _unescape(labels[len('sql="'):-1])
+        if family == STATEMENT_CALLS.name:
+            calls[sql] = calls.get(sql, 0.0) + value
+        elif family == STATEMENT_SECONDS.name:
+            seconds[sql] = seconds.get(sql, 0.0) + value
+
+    total = sum(seconds.values()) or 1.0
+    ranked = sorted(seconds.items(), key=lambda item: -item[1])[:limit or QUERY_LOG['top_statements']]
+    return [
+        {
+            'sql':           sql,
+            'calls':         int(calls.get(sql, 0)),
+            'total_ms':      round(spent * 1000, 2),
+            'mean_ms':       round(spent * 1000 / calls[sql], 2) if calls.get(sql) else 0.0,
+            'share_percent': round(spent / total * 100, 1),
+        }
+        for sql, spent in ranked
+    ]
+
+
+def _unescape(text: str) -> str:
+    return re.sub(r'\\(.)', lambda m: '\n' if m.group(1) == 'n' else m.group(1), text)
+
+
+# ── SQLAlchemy events ────────────────────────────────────────────────────────
+
+def instrument_queries() -> None:
+    """Time every statement of every engine (idempotent)."""
+    if not QUERY_LOG['enabled']:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    starts = conn.info.get('query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    try:
+        record_statement(statement, elapsed)
+    except Exception as e:   # statistics must never fail a query
+        print(f'[QUERY STATS ERROR] {e}', file=sys.stderr)
+
+
+def _handle_error(exception_context) -> None:
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('query_start'):
+        conn.info['query_start'].pop()   # after_cursor_execute will not run
@@ -0,0 +1,220 @@
+"""Sampling profiler for slow requests (opt-in, REQUEST_PROFILER).
+
+profiling_middleware starts a `ProfileSession` for a random
+REQUEST_PROFILER['sample_rate'] fraction of requests.  One daemon thread per
+process (`StackSampler`) wakes every REQUEST_PROFILER['interval'] seconds
+while any session is open, reads the profiled request threads' frames with
+``sys._current_frames()`` and counts each distinct call stack.  The request
+threads are never traced or interrupted: the cost is one stack walk per
+profiled request per interval, and a session stops counting after
+REQUEST_PROFILER['max_samples'].
+
+A finished profile is kept only when its request took
+REQUEST_PROFILER['threshold_ms'] or longer, as two files keyed by request_id
+in REQUEST_PROFILER['directory']:
+
+* ``<request_id>.folded`` — flamegraph-ready folded stacks (one
+  ``root;caller;...;leaf count`` line per stack), readable by flamegraph.pl,
+  speedscope and inferno;
+* ``<request_id>.json`` — the request's method, path, duration and sample count.
+
+Beyond REQUEST_PROFILER['max_profiles'] the oldest profiles are deleted.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from app.config.logging_config import REQUEST_PROFILER
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_REQUEST_ID = re.compile(r'[0-9A-Za-z-]{1,64}')
+
+
+@lru_cache(maxsize=8192)
+def _frame_label(code) -> str:
+    """'function (path:line)' — path relative to the project or site-packages."""
+    path = code.co_filename
+    if path.startswith(_PROJECT_ROOT + os.sep):
+        path = path[len(_PROJECT_ROOT) + 1:]
+    elif 'site-packages' + os.sep in path:
+        path = path.split('site-packages' + os.sep, 1)[1]
+    label = f'{code.co_name} ({path}:{code.co_firstlineno})'
+    return label.replace(';', ':')   # ';' separates frames in folded stacks
+
+
+class ProfileSession:
+    """Stack counts of one request thread."""
+
+    def __init__(self, thread_id: int, max_samples: int = None):
+        self.thread_id = thread_id
+        self.max_samples = max_samples or REQUEST_PROFILER['max_samples']
+        self.stacks: Counter = Counter()   # (code, ...) leaf first → samples
+        self.samples = 0
+        self.started = time.perf_counter()
+
+    def record(self, frame) -> None:
+        if self.samples >= self.max_samples:
+            return
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        self.stacks[tuple(codes)] += 1
+        self.samples += 1
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def folded(self) -> str:
+        """Folded-stack text, root frame first, heaviest stacks first."""
+        lines = [
+            ';'.join(_frame_label(code) for code in reversed(stack)) + f' {count}'
+            for stack, count in self.stacks.most_common()
+        ]
+        return '\n'.join(lines) + '\n' if lines else ''
+
+
+class StackSampler:
+    """
+    Background thread sampling the stacks of every open ProfileSession.
+
+    Args:
+        interval: Seconds between samples (default REQUEST_PROFILER['interval']).
+    """
+
+    def __init__(self, interval: float = None):
+        self.interval = interval or REQUEST_PROFILER['interval']
+        self._sessions: Dict[int, ProfileSession] = {}
+        self._lock = threading.Lock()
+        self._active = threading.Event()   # set while any session is open
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, thread_id: int = None) -> ProfileSession:
+        """Open a session for thread_id (default: the calling thread)."""
+        session = ProfileSession(thread_id or threading.get_ident())
+        with self._lock:
+            self._sessions[session.thread_id] = session
+            self._active.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+        return session
+
+    def stop(self, session: ProfileSession) -> None:
+        with self._lock:
+            if self._sessions.get(session.thread_id) is session:
+                del self._sessions[session.thread_id]
+            if not self._sessions:
+                self._active.clear()
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                sessions = list(self._sessions.values())
+            if not sessions:
+                continue
+            frames = sys._current_frames()
+            for session in sessions:
+                frame = frames.get(session.thread_id)
+                if frame is not None and session.thread_id != me:
+                    session.record(frame)
+            frames = frame = None   # do not keep the request threads' frames alive
+
+
+_sampler: Optional[StackSampler] = None
+_sampler_pid: Optional[int] = None
+_sampler_lock = threading.Lock()
+
+
+def get_stack_sampler() -> StackSampler:
+    """This process's sampler (a forked child gets its own thread)."""
+    global _sampler, _sampler_pid
+    with _sampler_lock:
+        if _sampler is None or _sampler_pid != os.getpid():
+            _sampler, _sampler_pid = StackSampler(), os.getpid()
+        return _sampler
+
+
+# ── stored profiles ──────────────────────────────────────────────────────────
+
+def _directory(directory: str = None) -> str:
+    return directory or REQUEST_PROFILER['directory']
+
+
+def save_profile(session: ProfileSession, request_id: str, info: Dict,
+                 directory: str = None) -> Optional[str]:
+    """
+    Write session's folded stacks and info as <request_id>.folded/.json.
+
+    Returns:
+        The .folded path, or None for an unusable request_id.
+    """
+    if not request_id or not _REQUEST_ID.fullmatch(request_id):
+        return None
+    directory = _directory(directory)
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, request_id)
+    with open(base + '.folded', 'w', encoding='utf-8') as f:
+        f.write(session.folded())
+    meta = dict(info, request_id=request_id, samples=session.samples,
+                interval_ms=round(get_stack_sampler().interval * 1000, 2),
+                created=datetime.now().isoformat(timespec='seconds'))
+    tmp = base + '.json.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp, base + '.json')   # listed only once both files are complete
+    _prune(directory)
+    return base + '.folded'
+
+
+def _prune(directory: str) -> None:
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith('.json'):
+            try:
+                entries.append((os.path.getmtime(os.path.join(directory, name)), name[:-5]))
+            except OSError:
+                pass
+    entries.sort()
+    for _, request_id in entries[:max(len(entries) - REQUEST_PROFILER['max_profiles'], 0)]:
+        for ext in ('.json', '.folded'):
+            try:
+                os.unlink(os.path.join(directory, request_id + ext))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(directory: str = None, limit: int = None) -> List[Dict]:
+    """Kept profiles' info, newest first."""
+    directory = _directory(directory)
+    try:
+        names = [n for n in os.listdir(directory) if n.endswith('.json')]
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for name in names:
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    profiles.sort(key=lambda p: p.get('created', ''), reverse=True)
+    return profiles[:limit] if limit else profiles
+
+
+def profile_path(request_id: str, directory: str = None) -> Optional[str]:
+    """Path of the request's .folded file, or None if there is none."""
+    if not request_id or not _REQUEST_ID.fullmatch(request_id):
+        return None
+    path = os.path.join(_directory(directory), request_id + '.folded')
+    return path if os.path.exists(path) else None
@@ -0,0 +1,165 @@
+"""Precomputed NC-usage response surface for forward inference.
+
+The forward model is a deterministic function of a single input (nc_usage_1),
+so the full P-T curve can be tabulated once on a dense grid and answered by
+linear interpolation between neighbouring grid rows.
+
+The table is stored as ``<model>.surface.npy`` next to the ``.pkl`` in
+``models/`` and opened with ``mmap_mode='r'`` so every process maps the same
+pages.  Layout: shape (G, T + 1) — column 0 holds the nc_usage_1 grid, the
+remaining T columns the pressure at each model timestep.
+
+This module knows nothing about how the curves are produced; callers pass a
+``predict(values) -> (N, T) array`` function (see model_runner).
+"""
+import logging
+import os
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from app.config.constants import RESPONSE_SURFACE
+
+logger = logging.getLogger(__name__)
+
+SURFACE_SUFFIX = '.surface.npy'
+
+
+def surface_path_for(model_path: str) -> str:
+    """Return the .npy path that belongs to the given .pkl model file."""
+    return os.path.splitext(model_path)[0] + SURFACE_SUFFIX
+
+
+def _grid_bounds(model_data: dict) -> tuple:
+    """Grid start, step and row count derived from the model's training range."""
+    feature_range = model_data.get('feature_range') or {}
+    pad = float(RESPONSE_SURFACE['range_padding_mg'])
+    step = float(RESPONSE_SURFACE['grid_step_mg'])
+    lo = float(feature_range.get('min', 0.0)) - pad
+    hi = float(feature_range.get('max', 0.0)) + pad
+    lo = max(lo, 0.0)  # negative NC usage is not a valid input
+    count = int(np.floor((hi - lo) / step)) + 1
+    return lo, step, count
+
+
+def _is_current(table: np.ndarray, start: float, step: float, count: int,
+                n_times: int) -> bool:
+    """True if an on-disk table matches the grid the current config asks for."""
+    if table.ndim != 2 or table.shape != (count, n_times + 1):
+        return False
+    return (np.isclose(table[0, 0], start) and
+            np.isclose(table[-1, 0], start + step * (count - 1)))
+
+
+def _write_table(path: str, table: np.ndarray) -> None:
+    """Write atomically so concurrent workers never map a half-written file."""
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, table)
+    os.replace(tmp_path, path)
+
+
+def load_or_build(model_path: str, model_data: dict,
+                  predict: Callable[[np.ndarray], np.ndarray]) -> Optional[Dict]:
+    """
+    Open the response surface for a model, building it first if missing/stale.
+
+    Args:
+        model_path: Absolute path to the .pkl the surface is derived from.
+        model_data: The loaded model dict (needs 'feature_range').
+        predict: Exact batch predictor, values (N,) → pressures (N, T).
+
+    Returns:
+        Surface dict {'start', 'step', 'count', 'curves', 'max_error', 'path'}
+        or None when the surface is disabled or fails its tolerance check.
+    """
+    if not RESPONSE_SURFACE.get('enabled', True):
+        return None
+
+    start, step, count = _grid_bounds(model_data)
+    if count < 2:
+        return None
+    n_times = predict(np.array([start])).shape[1]
+    path = surface_path_for(model_path)
+
+    table = None
+    if os.path.isfile(path) and os.path.getmtime(path) >= os.path.getmtime(model_path):
+        try:
+            table = np.load(path, mmap_mode='r')
+            if not _is_current(table, start, step, count, n_times):
+                table = None
+        except (OSError, ValueError):
+            table = None
+
+    if table is None:
+        grid = start + step * np.arange(count)
+        built = np.empty((count, n_times + 1), dtype=np.float64)
+        built[:, 0] = grid
+        built[:, 1:] = predict(grid)
+        try:
+            _write_table(path, built)
+            table = np.load(path, mmap_mode='r')
+        except OSError as e:
+            # Read-only models directory: keep a private in-memory copy.
+            logger.warning('Could not write response surface %s: %s', path, e)
+            table = built
+
+    surface = {
+        'start': start,
+        'step': step,
+        'count': count,
+        'curves': table[:, 1:],
+        'path': path,
+    }
+    surface['max_error'] = check_tolerance(surface, predict)
+    if surface['max_error'] > RESPONSE_SURFACE['tolerance']:
+        logger.warning(
+            'Response surface rejected: relative error %.2e exceeds tolerance %.2e',
+            surface['max_error'], RESPONSE_SURFACE['tolerance'],
+        )
+        return None
+    return surface
+
+
+def check_tolerance(surface: Dict, predict: Callable[[np.ndarray], np.ndarray]) -> float:
+    """
+    Compare interpolated curves with the exact model on a fixed random sample.
+
+    Returns:
+        max |interpolated − exact| divided by the largest exact pressure.
+    """
+    lo = surface['start']
+    hi = surface['start'] + surface['step'] * (surface['count'] - 1)
+    rng = np.random.default_rng(0)  # fixed seed → reproducible check
+    sample = rng.uniform(lo, hi, int(RESPONSE_SURFACE['sample_size']))
+
+    exact = predict(sample)
+    approx, _ = interpolate(surface, sample)
+    scale = max(float(np.max(np.abs(exact))), 1e-9)
+    return float(np.max(np.abs(approx - exact)) / scale)
+
+
+def interpolate(surface: Dict, values) -> tuple:
+    """
+    Linearly interpolate curves for the given nc_usage_1 values.
+
+    Returns:
+        (curves, inside) — curves is (N, T); inside is a bool mask of rows that
+        fell within the grid.  Rows outside the grid are left as NaN so the
+        caller can fill them with exact inference.
+    """
+    x = np.asarray(values, dtype=float).reshape(-1)
+    curves_table = surface['curves']
+    count = surface['count']
+
+    pos = (x - surface['start']) / surface['step']
+    inside = (pos >= 0) & (pos <= count - 1)
+
+    out = np.full((x.size, curves_table.shape[1]), np.nan)
+    if inside.any():
+        p = pos[inside]
+        lower = np.minimum(p.astype(np.intp), count - 2)
+        weight = (p - lower)[:, None]
+        out[inside] = (curves_table[lower] * (1.0 - weight) +
+                       curves_table[lower + 1] * weight)
+    return out, inside
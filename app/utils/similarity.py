@@ -4,10 +4,18 @@ PT-curve similarity scoring — modular and easy to swap.
 Architecture
 ------------
 * `compute_features(time, pressure)` — extract a feature dict from one curve.
+* `compute_features_batch(time, pressure)` — the same for many curves at once,
+  returned as a structured array with `FEATURE_DTYPE` fields.
 * `score_pair(query, candidate)` — scalar similarity ∈ [0, 1] from two
   feature dicts (higher = more similar).
 * `rank_candidates(...)` — convenience wrapper: score a list of candidates
   and return them sorted best-first.
+* `rank_features(...)` — the same for candidates with precomputed features.
+* `combined_errors(query, matrix)` — vectorized `score_pair` over a matrix of
+  `FEATURE_KEYS` rows; `error_to_score` maps its output to the score.
+* Whole-curve shape modes (`SEARCH_MODES` 'l2' / 'dtw'): `resample_shape`,
+  `l2_errors`, `lb_keogh`, `dtw_distance` — curves resampled onto a common
+  0–FALLING_SLOPE_END_TIME grid and compared point by point.
 
 To change the scoring logic: edit only the two "Configuration" blocks
 below and/or the bodies of `compute_features` / `score_pair`.
@@ -35,6 +43,21 @@ FALLING_SLOPE_END_TIME = 35.0
 IGNITION_METHOD = 'threshold'
 IGNITION_THRESHOLD = 0.02      # 2 % of peak pressure
 
+# Features compared by score_pair, in the column order of feature matrices
+FEATURE_KEYS = ('max_pressure', 'max_pressure_time', 'rising_slope', 'falling_slope')
+
+# ── Configuration: whole-curve shape modes ────────────────────────────────────
+# 'features' — score_pair on the four features above (default)
+# 'l2'       — RMS pressure difference on the resampled curves
+# 'dtw'      — dynamic time warping within a Sakoe-Chiba band; candidates go
+#              through a cascade: feature score → LB_Keogh → full DTW
+SEARCH_MODES = ('features', 'l2', 'dtw')
+
+SHAPE_SAMPLES = 128      # resampling points over 0 … FALLING_SLOPE_END_TIME
+DTW_BAND = 0.1           # Sakoe-Chiba band half-width, fraction of SHAPE_SAMPLES
+LB_SEGMENTS = 16         # envelope resolution of the LB_Keogh bound (divides SHAPE_SAMPLES)
+DTW_PREFILTER = 200      # best feature-score candidates that reach the DTW stages
+
 
 # ── Feature extraction ────────────────────────────────────────────────────────
 
@@ -64,7 +87,7 @@ def compute_features(time: List[float], pressure: List[float]) -> Dict:
     # Ignition timing
     if IGNITION_METHOD == 'threshold' and max_pressure > 0:
         thresh = max_pressure * IGNITION_THRESHOLD
-        ignition_idx = next((i for i, v in enumerate(p) if v >= thresh), 0)
+        ignition_idx = int(np.argmax(p >= thresh))   # first crossing (0 if none)
         ignition_time = float(t[ignition_idx])
     else:
         ignition_time = float(t[0])
@@ -88,6 +111,128 @@ def compute_features(time: List[float], pressure: List[float]) -> Dict:
     }
 
 
+# Field order of compute_features_batch results
+FEATURE_DTYPE = np.dtype([(name, np.float64) for name in (
+    'max_pressure', 'max_pressure_time', 'ignition_time',
+    'rising_slope', 'falling_slope', 'pressure_at_end',
+)])
+
+
+def _padded(time, pressure, lengths):
+    """(t, p, valid) 2-D arrays for the accepted batch layouts."""
+    if isinstance(pressure, np.ndarray) and pressure.ndim == 2:
+        p = np.asarray(pressure, dtype=float)
+        n = (np.full(len(p), p.shape[1], dtype=np.int64) if lengths is None
+             else np.asarray(lengths, dtype=np.int64))
+    else:
+        rows = [np.asarray(row, dtype=float).ravel() for row in pressure]
+        n = np.array([len(row) for row in rows], dtype=np.int64)
+        p = np.zeros((len(rows), int(n.max()) if len(rows) else 0))
+        for i, row in enumerate(rows):
+            p[i, :len(row)] = row
+    width = p.shape[1]
+
+    if isinstance(time, np.ndarray) and time.ndim == 2:
+        t = np.asarray(time, dtype=float)[:, :width]
+    elif isinstance(time, (list, tuple)) and time and np.ndim(time[0]) == 1:
+        t = np.zeros_like(p)
+        for i, row in enumerate(time):
+            row = np.asarray(row, dtype=float).ravel()[:width]
+            t[i, :len(row)] = row
+    else:   # one time axis shared by every curve
+        t = np.broadcast_to(np.asarray(time, dtype=float).ravel()[:width], p.shape)
+
+    if width == 0 or np.any(n < 1) or np.any(n > width):
+        raise ValueError('Every curve needs at least one sample')
+    valid = np.arange(width) < n[:, None]
+    return t, p, valid
+
+
+def compute_features_batch(time, pressure, lengths=None) -> np.ndarray:
+    """
+    `compute_features` for many curves at once; values are identical to
+    calling it per curve.
+
+    Parameters
+    ----------
+    pressure : 2-D array (one curve per row, right-padded; see `lengths`)
+               or a list of 1-D arrays of any length
+    time     : matching 2-D array / list of arrays, or one 1-D time axis
+               shared by all curves; must be increasing per curve
+    lengths  : samples per row of a padded 2-D `pressure` (default: all)
+
+    Returns
+    -------
+    Structured array of shape (n_curves,) with `FEATURE_DTYPE` fields.
+    """
+    t, p, valid = _padded(time, pressure, lengths)
+    rows = np.arange(len(p))
+    last = valid.sum(axis=1) - 1
+    padded = not valid.all()
+
+    # Peak — padding can never win the argmax
+    peak_idx = np.argmax(np.where(valid, p, -np.inf) if padded else p, axis=1)
+    max_pressure = p[rows, peak_idx]
+    max_pressure_time = t[rows, peak_idx]
+
+    # Ignition timing: first sample at or above the threshold
+    if IGNITION_METHOD == 'threshold':
+        thresh = max_pressure * IGNITION_THRESHOLD
+        crossed = p >= thresh[:, None]
+        if padded:
+            crossed &= valid
+        ignition_idx = np.where(max_pressure > 0, np.argmax(crossed, axis=1), 0)
+    else:
+        ignition_idx = np.zeros(len(p), dtype=np.int64)
+    ignition_time = t[rows, ignition_idx]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dt_rise = max_pressure_time - ignition_time
+        rising_slope = np.where(dt_rise > 1e-9, max_pressure / dt_rise, 0.0)
+
+        pressure_at_end = _interp_rows(FALLING_SLOPE_END_TIME, t, p, valid, last)
+        dt_fall = FALLING_SLOPE_END_TIME - max_pressure_time
+        falling_slope = np.where(dt_fall > 1e-9, (pressure_at_end - max_pressure) / dt_fall, 0.0)
+
+    out = np.empty(len(p), dtype=FEATURE_DTYPE)
+    out['max_pressure'] = max_pressure
+    out['max_pressure_time'] = max_pressure_time
+    out['ignition_time'] = ignition_time
+    out['rising_slope'] = rising_slope
+    out['falling_slope'] = falling_slope
+    out['pressure_at_end'] = pressure_at_end
+    return out
+
+
+def _interp_rows(x: float, t, p, valid, last) -> np.ndarray:
+    """np.interp(x, t[i], p[i]) for every row, following NumPy's own formula."""
+    rows = np.arange(len(p))
+    before = t <= x
+    if not valid.all():
+        before &= valid
+    j = np.sum(before, axis=1) - 1                    # last sample at or before x
+    j0 = np.clip(j, 0, np.maximum(last - 1, 0))
+    j1 = np.minimum(j0 + 1, last)
+    xp0, xp1 = t[rows, j0], t[rows, j1]
+    fp0, fp1 = p[rows, j0], p[rows, j1]
+
+    slope = (fp1 - fp0) / (xp1 - xp0)
+    value = slope * (x - xp0) + fp0
+    retry = np.isnan(value)
+    value = np.where(retry, slope * (x - xp1) + fp1, value)
+    value = np.where(retry & np.isnan(value) & (fp0 == fp1), fp0, value)
+    value = np.where(xp0 == x, fp0, value)
+
+    value = np.where(x >= t[rows, last], p[rows, last], value)
+    return np.where(x < t[:, 0], p[:, 0], value)
+
+
+def features_to_dicts(batch: np.ndarray) -> List[Dict]:
+    """compute_features_batch rows as compute_features-style dicts."""
+    names = batch.dtype.names
+    return [dict(zip(names, map(float, row))) for row in batch.tolist()]
+
+
 # ── Similarity scoring ────────────────────────────────────────────────────────
 
 def score_pair(query: Dict, candidate: Dict) -> float:
@@ -111,14 +256,37 @@ def score_pair(query: Dict, candidate: Dict) -> float:
     lp_fall = _rel_err(query['falling_slope'], candidate['falling_slope'])
     low_err = (lp_rise + lp_fall) / 2.0
 
-    # Weighted combined error, clamped
+    # Weighted combined error
     total_err = WEIGHTS['high'] * high_err + WEIGHTS['low'] * low_err
-    total_err = min(total_err, 10.0)   # prevent exp underflow
+    return error_to_score(total_err)
 
-    # Exponential decay: score = 1 when error = 0, approaches 0 for large errors
+
+def error_to_score(total_err: float) -> float:
+    """Exponential decay: score = 1 when error = 0, approaches 0 for large errors."""
+    total_err = min(float(total_err), 10.0)   # prevent exp underflow
     return float(math.exp(-3.0 * total_err))
 
 
+def combined_errors(query: Dict, matrix: np.ndarray) -> np.ndarray:
+    """
+    Weighted combined error of `score_pair` for many candidates at once.
+
+    `matrix` holds one candidate per row with columns in FEATURE_KEYS order.
+    The arithmetic mirrors `score_pair` operation for operation, so
+    `error_to_score(combined_errors(q, M)[i])` equals `score_pair(q, row i)`
+    bit for bit.  The error is monotonic in the score: the smallest errors
+    are the best matches.
+    """
+    def _rel_err(key: str, col: int) -> np.ndarray:
+        a = query[key]
+        denom = max(abs(a), 1e-6)
+        return np.abs(a - matrix[:, col]) / denom
+
+    high_err = (_rel_err('max_pressure', 0) + _rel_err('max_pressure_time', 1)) / 2.0
+    low_err = (_rel_err('rising_slope', 2) + _rel_err('falling_slope', 3)) / 2.0
+    return WEIGHTS['high'] * high_err + WEIGHTS['low'] * low_err
+
+
 # ── Convenience ranking ───────────────────────────────────────────────────────
 
 def rank_candidates(
@@ -139,16 +307,124 @@ def rank_candidates(
     -------
     List of dicts: {label, score, features}  — best match first.
     """
-    query_features = compute_features(query_time, query_pressure)
-    ranked = []
+    featured = []
     for label, ct, cp in candidates:
-        if not ct or not cp:
+        if len(ct) == 0 or len(cp) == 0:
             continue
         try:
-            feat = compute_features(ct, cp)
-            s = score_pair(query_features, feat)
-            ranked.append({'label': label, 'score': s, 'features': feat})
+            featured.append((label, compute_features(ct, cp)))
         except Exception:
             pass
+    return rank_features(compute_features(query_time, query_pressure), featured)
+
+
+def rank_features(
+    query_features: Dict,
+    candidates: List[Tuple[str, Dict]],
+) -> List[Dict]:
+    """
+    Like `rank_candidates`, for candidates whose feature dicts are already
+    known (e.g. the cached work-order curves).
+
+    Parameters
+    ----------
+    query_features : compute_features() of the query curve
+    candidates : list of (label, feature_dict)
+
+    Returns
+    -------
+    List of dicts: {label, score, features}  — best match first.
+    """
+    ranked = [
+        {'label': label, 'score': score_pair(query_features, feat), 'features': feat}
+        for label, feat in candidates
+    ]
     ranked.sort(key=lambda x: x['score'], reverse=True)
     return ranked
+
+
+# ── Whole-curve shape comparison ─────────────────────────────────────────────
+#
+# Shape errors are RMS pressure differences divided by the query's peak
+# pressure, so `error_to_score` maps them onto the same [0, 1] scale as the
+# feature score.
+
+def resample_shape(time: List[float], pressure: List[float]) -> np.ndarray:
+    """Pressure interpolated onto SHAPE_SAMPLES points over 0 … FALLING_SLOPE_END_TIME."""
+    grid = np.linspace(0.0, FALLING_SLOPE_END_TIME, SHAPE_SAMPLES)
+    return np.interp(grid, np.asarray(time, dtype=float), np.asarray(pressure, dtype=float))
+
+
+def shape_scale(query_shape: np.ndarray) -> float:
+    """Normaliser of shape errors: the query's peak pressure."""
+    return max(float(np.max(np.abs(query_shape))), 1e-6)
+
+
+def l2_errors(query_shape: np.ndarray, shapes: np.ndarray) -> np.ndarray:
+    """Relative RMS difference between the query and every row of `shapes`."""
+    rms = np.sqrt(np.mean((shapes - query_shape) ** 2, axis=1))
+    return rms / shape_scale(query_shape)
+
+
+def dtw_radius() -> int:
+    return max(int(round(DTW_BAND * SHAPE_SAMPLES)), 0)
+
+
+def lb_keogh(query_shape: np.ndarray, shapes: np.ndarray, radius: int) -> np.ndarray:
+    """
+    LB_Keogh lower bound of `dtw_distance` for every row of `shapes`, on
+    LB_SEGMENTS-point envelopes.
+
+    The query's band envelope is reduced to per-segment max / min and each
+    candidate to per-segment means; by convexity the result never exceeds
+    the full-resolution LB_Keogh, which never exceeds the DTW distance.
+    """
+    n = len(query_shape)
+    padded = np.pad(query_shape, radius, mode='edge')
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * radius + 1)
+    seg = n // LB_SEGMENTS
+    upper = windows.max(axis=1).reshape(LB_SEGMENTS, seg).max(axis=1)
+    lower = windows.min(axis=1).reshape(LB_SEGMENTS, seg).min(axis=1)
+    means = shapes.reshape(len(shapes), LB_SEGMENTS, seg).mean(axis=2)
+    above = np.clip(means - upper, 0.0, None)
+    below = np.clip(lower - means, 0.0, None)
+    return seg * np.sum(above ** 2 + below ** 2, axis=1)
+
+
+def dtw_distance(a: np.ndarray, b: np.ndarray, radius: int,
+                 cutoff: float = math.inf) -> float:
+    """
+    Sum of squared differences along the best warping path of two equal-length
+    series, restricted to |i - j| <= radius.
+
+    Returns math.inf as soon as every cell of a row exceeds `cutoff`
+    (early abandoning: the result could not beat it).
+    """
+    a, b = a.tolist(), b.tolist()
+    n = len(a)
+    inf = math.inf
+    prev = [0.0] + [inf] * n
+    for i in range(1, n + 1):
+        cur = [inf] * (n + 1)
+        ai = a[i - 1]
+        lo, hi = max(1, i - radius), min(n, i + radius)
+        row_min = inf
+        for j in range(lo, hi + 1):
+            d = ai - b[j - 1]
+            best = prev[j - 1]
+            if prev[j] < best:
+                best = prev[j]
+            if cur[j - 1] < best:
+                best = cur[j - 1]
+            cur[j] = d * d + best
+            if cur[j] < row_min:
+                row_min = cur[j]
+        if row_min > cutoff:
+            return inf
+        prev = cur
+    return prev[n]
+
+
+def dtw_error(distance: float, query_shape: np.ndarray) -> float:
+    """`dtw_distance` on the same relative-RMS scale as `l2_errors`."""
+    return math.sqrt(distance / len(query_shape)) / shape_scale(query_shape)
@@ -8,7 +8,6 @@ from app.config.constants import SUBPROCESS_TIMEOUT, ERROR_MESSAGES
 from .errors import SubprocessError, SubprocessTimeoutError, SimulationError
 from .paths import (
     get_simulation_script_path,
-    get_load_test_data_script_path,
     get_models_path
 )
 
@@ -109,6 +108,9 @@ class SubprocessRunner:
         """
         Run the data loader script to process test data.
 
+        The script runs in a warm loader process (app/utils/loader_pool.py)
+        instead of a fresh interpreter; output and errors are unchanged.
+
         Args:
             file_path: Path to the Excel file to load
 
@@ -119,12 +121,10 @@ class SubprocessRunner:
             SubprocessTimeoutError: If loading times out
             SubprocessError: If loading fails
         """
-        script_path = get_load_test_data_script_path()
-
-        args = [file_path]
+        from .loader_pool import get_loader_pool
 
         try:
-            return SubprocessRunner.execute_script(script_path, args)
+            return get_loader_pool().load(file_path)
         except SubprocessError as e:
             # Customize error message for file processing
             raise SubprocessError(
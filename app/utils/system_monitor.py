@@ -3,18 +3,23 @@
 No direct Flask imports at module level. Uses SQLAlchemy ORM for DB queries
 (requires an active app context — always called from within a request handler).
 Works with both SQLite (dev) and PostgreSQL (production).
+
+Log statistics and CPU/memory readings come from per-process state kept up to
+date incrementally (app/utils/metrics_aggregator.py), so a refresh neither
+re-parses the day's log nor waits for a CPU sample.  Upload/backup directory
+scans are reused for MONITOR['disk_interval'] seconds.  The same sampler
+records the time series behind /admin/monitor/history
+(app/utils/metrics_history.py).
 """
 import os
-from collections import defaultdict
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
 
 import psutil
 
-from app.config.network_config import NETWORK_LOGGING
-
-# Slow-request threshold in milliseconds (config stores it in seconds)
-_SLOW_MS = NETWORK_LOGGING['slow_request_threshold'] * 1000
+from app.config.constants import MONITOR
+from app.utils.metrics_aggregator import get_log_metrics, get_resource_sampler
 
 # Current 3-table schema
 _DB_TABLES = ['user', 'simulation', 'test_result']
@@ -46,8 +51,21 @@ def _resolve_db_path() -> str:
     return str(project_root / 'instance' / 'simulation_system.db')
 
 
+# Directory scans are reused for MONITOR['disk_interval'] seconds: path → (monotonic, result)
+_dir_scans: dict = {}
+
+
 def _dir_size_and_count(path: str):
     """Return (total_bytes, file_count) for a directory, or (0, 0) if missing."""
+    cached = _dir_scans.get(path)
+    if cached is not None and time.monotonic() - cached[0] < MONITOR['disk_interval']:
+        return cached[1]
+    result = _scan_dir(path)
+    _dir_scans[path] = (time.monotonic(), result)
+    return result
+
+
+def _scan_dir(path: str):
     total, count = 0, 0
     if not os.path.isdir(path):
         return 0, 0
@@ -65,21 +83,25 @@ def _mb(byte_count: int) -> float:
     return round(byte_count / (1024 ** 2), 2)
 
 
+def _monitor_paths():
+    """(db_path, uploads_path, backups_path) watched by the monitor."""
+    db_path = _resolve_db_path()
+    uploads_path = str(Path(__file__).parent.parent / 'static' / 'uploads')
+    backups_path = (
+        os.path.join(os.path.dirname(db_path), 'backups')
+        if db_path
+        else str(Path(__file__).parent.parent.parent / 'instance' / 'backups')
+    )
+    return db_path, uploads_path, backups_path
+
+
 # ---------------------------------------------------------------------------
 # Public metric functions
 # ---------------------------------------------------------------------------
 
 def get_system_resources() -> dict:
-    """CPU and RAM snapshot using psutil."""
-    cpu = psutil.cpu_percent(interval=0.5)
-    mem = psutil.virtual_memory()
-    return {
-        'cpu_percent':         round(cpu, 1),
-        'memory_percent':      round(mem.percent, 1),
-        'memory_used_mb':      _mb(mem.used),
-        'memory_total_mb':     _mb(mem.total),
-        'memory_available_mb': _mb(mem.available),
-    }
+    """CPU and RAM snapshot — the background sampler's latest reading."""
+    return get_resource_sampler().latest()
 
 
 def get_disk_usage(db_path: str, uploads_path: str, backups_path: str) -> dict:
@@ -111,6 +133,16 @@ def get_disk_usage(db_path: str, uploads_path: str, backups_path: str) -> dict:
     }
 
 
+def sample_disk_usage() -> dict:
+    """Disk figures recorded in the monitor history (no DB access, any thread)."""
+    _, uploads_path, backups_path = _monitor_paths()
+    return {
+        'disk_percent': psutil.disk_usage(str(Path(__file__).parent.parent.parent)).percent,
+        'uploads_mb':   _mb(_dir_size_and_count(uploads_path)[0]),
+        'backups_mb':   _mb(_dir_size_and_count(backups_path)[0]),
+    }
+
+
 def get_db_stats(db_path: str) -> dict:
     """Row counts per table and backup inventory. Uses SQLAlchemy ORM — works for
     both SQLite and PostgreSQL without raw SQL or file-path assumptions."""
@@ -168,104 +200,27 @@ def get_db_stats(db_path: str) -> dict:
 
 
 def get_request_stats() -> dict:
-    """Analyse today's CSV log for request-level statistics."""
-    from app.utils.log_manager import log_manager
-    entries = log_manager.read_log_file(filename=None, max_rows=50000)
-
-    total = errors = slow = 0
-    error_entries = []
-    for row in entries:
-        sc = row.get('status_code', '')
-        dm = row.get('duration_ms', '')
-        if not sc:
-            continue
-        total += 1
-        try:
-            if int(sc) >= 400:
-                errors += 1
-                error_entries.append({
-                    'time':        row.get('time', ''),
-                    'method':      row.get('method', ''),
-                    'path':        row.get('path', ''),
-                    'status_code': sc,
-                    'username':    row.get('username', ''),
-                    'message':     row.get('message', ''),
-                })
-        except ValueError:
-            pass
-        try:
-            if float(dm) >= _SLOW_MS:
-                slow += 1
-        except (ValueError, TypeError):
-            pass
-
-    error_rate = round(errors / total * 100, 1) if total else 0.0
-    return {
-        'total_requests':     total,
-        'error_count':        errors,
-        'slow_request_count': slow,
-        'error_rate_percent': error_rate,
-        'recent_errors':      error_entries[-20:][::-1],  # newest first, up to 20
-    }
+    """Request-level statistics for today's CSV log."""
+    return get_log_metrics().request_stats()
 
 
 def get_crash_events() -> list:
-    """Return up to 50 ERROR/CRITICAL log entries since the last app startup."""
-    from app.utils.log_manager import log_manager
-    entries = log_manager.read_log_file(filename=None, max_rows=50000)
-
-    last_startup_ts = None
-    for row in entries:
-        if row.get('action') == 'system_startup':
-            ts = row.get('timestamp', '')
-            if ts and (last_startup_ts is None or ts > last_startup_ts):
-                last_startup_ts = ts
-
-    crashes = [
-        {
-            'time':     row.get('time', ''),
-            'level':    row.get('level', ''),
-            'message':  row.get('message', ''),
-            'error':    row.get('error', ''),
-            'path':     row.get('path', ''),
-            'username': row.get('username', ''),
-        }
-        for row in entries
-        if row.get('level') in ('ERROR', 'CRITICAL')
-        and (last_startup_ts is None or row.get('timestamp', '') >= last_startup_ts)
-    ]
-    return crashes[:50]
+    """Return up to 50 ERROR/CRITICAL log entries since the last app startup, newest first."""
+    return get_log_metrics().crash_events()
 
 
 def get_access_failures() -> dict:
     """Return failed-login stats from today's log. Flag IPs with >5 failures."""
-    from app.utils.log_manager import log_manager
-    entries = log_manager.read_log_file(filename=None, max_rows=50000)
-
-    failures = [row for row in entries if row.get('action') == 'user_login_failed']
-
-    ip_counts: dict = defaultdict(int)
-    for row in failures:
-        ip_counts[row.get('ip_address', 'unknown')] += 1
-
+    stats = get_log_metrics().access_failures()
     flagged = [
         {'ip': ip, 'count': count}
-        for ip, count in sorted(ip_counts.items(), key=lambda x: -x[1])
+        for ip, count in sorted(stats['failures_by_ip'].items(), key=lambda x: -x[1])
         if count > _BRUTE_FORCE_THRESHOLD
     ]
-    recent = [
-        {
-            'time':     row.get('time', ''),
-            'ip':       row.get('ip_address', ''),
-            'username': row.get('username', ''),
-        }
-        for row in failures[:10]
-    ]
-
     return {
-        'total_failures':  len(failures),
+        'total_failures':  stats['total_failures'],
         'flagged_ips':     flagged,
-        'recent_failures': recent,
+        'recent_failures': stats['recent_failures'],
     }
 
 
@@ -298,19 +253,29 @@ def get_active_users(db_path: str) -> list:
     ]
 
 
+def get_top_queries() -> dict:
+    """Normalized SQL statements by total execution time, all workers."""
+    from app.config.logging_config import QUERY_LOG
+    from app.utils.query_stats import top_statements
+    return {
+        'statements':        top_statements(),
+        'slow_threshold_ms': QUERY_LOG['slow_threshold_ms'],
+    }
+
+
+def get_inference_engine() -> dict:
+    """Forward-inference engine state (response surface vs. exact)."""
+    from app.utils.model_runner import get_inference_status
+    return get_inference_status()
+
+
 # ---------------------------------------------------------------------------
 # Single public entry point
 # ---------------------------------------------------------------------------
 
 def get_system_metrics() -> dict:
     """Collect all metrics. Each section is isolated — one failure won't crash the page."""
-    db_path = _resolve_db_path()
-    uploads_path = str(Path(__file__).parent.parent / 'static' / 'uploads')
-    backups_path = (
-        os.path.join(os.path.dirname(db_path), 'backups')
-        if db_path
-        else str(Path(__file__).parent.parent.parent / 'instance' / 'backups')
-    )
+    db_path, uploads_path, backups_path = _monitor_paths()
 
     metrics: dict = {}
 
@@ -322,6 +287,8 @@ def get_system_metrics() -> dict:
         ('crashes',         get_crash_events,       []),
         ('access_failures', get_access_failures,    []),
         ('active_users',    get_active_users,       [db_path]),
+        ('inference',       get_inference_engine,   []),
+        ('top_queries',     get_top_queries,        []),
     ]
 
     for key, fn, args in sections:
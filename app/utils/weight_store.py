@@ -0,0 +1,137 @@
+"""Flat binary weight store shared by all gunicorn workers.
+
+Every worker that unpickles the .pkl model holds a private copy of the fitted
+estimators.  The export step below writes the stacked coefficient arrays
+(see model_runner._flatten_models) into one raw little-endian file,
+``<model>.weights.bin``, described by a JSON header ``<model>.weights.json``.
+Workers open the arrays with ``np.memmap(mode='r')``, so the kernel keeps a
+single physical copy in the page cache no matter how many processes map it.
+
+Header layout::
+
+    {
+      "version": 1,
+      "source": "<model>.pkl",          # file the store was exported from
+      "source_mtime": <float>,          # .pkl mtime at export time
+      "arrays": {"coef": {"offset", "shape", "dtype"}, ...},
+      "metadata": {...}, "feature_range": {...},
+      "unpickled_bytes": <int>,         # heap one worker saves by not unpickling
+      "store_bytes": <int>
+    }
+"""
+import json
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+STORE_VERSION = 1
+STORE_SUFFIX = '.weights.bin'
+HEADER_SUFFIX = '.weights.json'
+
+# Offsets are rounded up to this many bytes so every array is cache-line aligned
+_ALIGNMENT = 64
+
+
+def store_paths_for(model_path: str) -> tuple:
+    """Return (bin_path, header_path) for the given .pkl model file."""
+    stem = os.path.splitext(model_path)[0]
+    return stem + STORE_SUFFIX, stem + HEADER_SUFFIX
+
+
+def _to_builtin(value):
+    """json.dump fallback for NumPy scalars/arrays found in model metadata."""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def export_store(model_path: str, arrays: Dict[str, np.ndarray], metadata: dict,
+                 feature_range: dict, unpickled_bytes: int = 0) -> dict:
+    """
+    Write the weight store for a model and return its header.
+
+    Args:
+        model_path: The .pkl the arrays were extracted from.
+        arrays: name → array; stored as little-endian float64 / int64.
+        metadata: model_data['metadata'] (copied into the header).
+        feature_range: model_data['feature_range'].
+        unpickled_bytes: measured heap size of the unpickled estimators.
+    """
+    bin_path, header_path = store_paths_for(model_path)
+
+    layout = {}
+    offset = 0
+    prepared = {}
+    for name, arr in arrays.items():
+        arr = np.asarray(arr)
+        dtype = '<i8' if np.issubdtype(arr.dtype, np.integer) else '<f8'
+        arr = np.ascontiguousarray(arr, dtype=dtype)
+        offset = -(-offset // _ALIGNMENT) * _ALIGNMENT
+        layout[name] = {'offset': offset, 'shape': list(arr.shape), 'dtype': dtype}
+        prepared[name] = arr
+        offset += arr.nbytes
+
+    tmp_bin = f'{bin_path}.{os.getpid()}.tmp'
+    with open(tmp_bin, 'wb') as f:
+        for name, arr in prepared.items():
+            f.seek(layout[name]['offset'])
+            f.write(arr.tobytes())
+        f.truncate(offset)
+
+    header = {
+        'version': STORE_VERSION,
+        'source': os.path.basename(model_path),
+        'source_mtime': os.path.getmtime(model_path),
+        'arrays': layout,
+        'metadata': metadata or {},
+        'feature_range': feature_range or {},
+        'unpickled_bytes': int(unpickled_bytes),
+        'store_bytes': offset,
+    }
+    tmp_header = f'{header_path}.{os.getpid()}.tmp'
+    with open(tmp_header, 'w', encoding='utf-8') as f:
+        json.dump(header, f, default=_to_builtin, indent=2)
+
+    # Binary first, header last: a reader only trusts the store once the
+    # header pointing at it exists.
+    os.replace(tmp_bin, bin_path)
+    os.replace(tmp_header, header_path)
+    return header
+
+
+def open_store(model_path: str) -> Optional[Dict]:
+    """
+    Memory-map the weight store for a model.
+
+    Returns:
+        {'arrays': {name: read-only memmap}, 'header': dict} or None when the
+        store is missing, from an older format, or stale relative to the .pkl.
+    """
+    bin_path, header_path = store_paths_for(model_path)
+    if not (os.path.isfile(bin_path) and os.path.isfile(header_path)):
+        return None
+
+    try:
+        with open(header_path, 'r', encoding='utf-8') as f:
+            header = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if (header.get('version') != STORE_VERSION
+            or header.get('source') != os.path.basename(model_path)
+            or header.get('source_mtime') != os.path.getmtime(model_path)
+            or os.path.getsize(bin_path) != header.get('store_bytes')):
+        return None
+
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        shape = tuple(spec['shape'])
+        if 0 in shape:
+            arrays[name] = np.empty(shape, dtype=spec['dtype'])
+            continue
+        arrays[name] = np.memmap(bin_path, mode='r', dtype=spec['dtype'],
+                                 offset=spec['offset'], shape=shape)
+    return {'arrays': arrays, 'header': header}
@@ -39,6 +39,7 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 # ── Single app instance shared across all test classes ─────────────────────────
 from app import create_app, db as _db
+from app.services.work_order_summary_service import WorkOrderSummaryService
 
 _app = create_app()
 _app.config['TESTING'] = True
@@ -90,6 +91,8 @@ class AppTestCase(unittest.TestCase):
         )
         self.db.session.add(s)
         self.db.session.flush()
+        # Mirror the app's write paths: keep work_order_summary in step
+        WorkOrderSummaryService(self.db).on_simulation_saved(s)
         return s
 
     def _make_test_result(self, user_id, simulation_id, filename='run.xlsx',
@@ -109,6 +112,7 @@ class AppTestCase(unittest.TestCase):
         )
         self.db.session.add(tr)
         self.db.session.flush()
+        WorkOrderSummaryService(self.db).add_datasets([tr])
         return tr
 
 
@@ -1356,6 +1360,2269 @@ class TestDropLegacyTablesMigration(unittest.TestCase):
         self.assertFalse(result, 'Migration should have aborted with non-empty recipe table')
 
 
+# ═══════════════════════════════════════════════════════════════════════════════
+# 10. Model runner — batch inference engine
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestModelRunner(unittest.TestCase):
+    """app/utils/model_runner.py — stacked-coefficient batch inference"""
+
+    @classmethod
+    def setUpClass(cls):
+        import numpy as np
+        from app.utils import model_runner
+        cls.np = np
+        cls.mr = model_runner
+        # Unpickle directly: _load_model() skips the estimators in weight-store mode
+        cls.models = model_runner._unpickle(model_runner._resolve_model_path())['models']
+
+    def _loop_predict(self, values):
+        np = self.np
+        return np.array([
+            [float(m.predict(np.array([[v]]))[0]) for m in self.models]
+            for v in values
+        ])
+
+    def test_shipped_model_is_flattened(self):
+        self.assertIsNotNone(self.mr._flat_model)
+
+    def test_batch_shape_is_n_by_t(self):
+        out = self.mr.run_batch_inference([700.0, 750.0, 800.0])
+        self.assertEqual(out.shape, (3, len(self.models)))
+        self.assertEqual(len(self.mr.get_common_times()), len(self.models))
+
+    def test_batch_matches_per_timestep_predict(self):
+        values = [710.0, 755.5, 840.0, 870.0]
+        self.np.testing.assert_allclose(
+            self.mr.run_batch_inference(values), self._loop_predict(values),
+            rtol=1e-9, atol=1e-9,
+        )
+
+    def test_fallback_used_for_unflattenable_estimators(self):
+        np = self.np
+
+        class _Const:
+            def __init__(self, v):
+                self.v = v
+
+            def predict(self, X):
+                return np.full(len(X), self.v)
+
+        fake = {'models': [_Const(1.0), _Const(2.0)], 'common_times': np.array([0.0, 1.0]),
+                'metadata': {}}
+        self.assertIsNone(self.mr._flatten_models(fake['models']))
+        with patch.object(self.mr, '_model_data', fake), \
+                patch.object(self.mr, '_flat_model', None):
+            out = self.mr.run_batch_inference([5.0, 6.0])
+        np.testing.assert_array_equal(out, [[1.0, 2.0], [1.0, 2.0]])
+
+    def test_forward_inference_peak_matches_batch(self):
+        result = self.mr.run_forward_inference(800.0)
+        expected = float(self.mr.run_batch_inference([800.0])[0].max())
+        self.assertAlmostEqual(result['statistics']['peak_pressure'], expected)
+        self.assertEqual(result['statistics']['num_points'], len(self.models))
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 11. Response surface — interpolated forward inference
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestResponseSurface(unittest.TestCase):
+    """app/utils/response_surface.py + model_runner surface / exact switch"""
+
+    @classmethod
+    def setUpClass(cls):
+        import numpy as np
+        from app.utils import model_runner, response_surface
+        cls.np = np
+        cls.mr = model_runner
+        cls.rs = response_surface
+        model_runner._load_model()
+
+    def setUp(self):
+        self._flag_dir = tempfile.mkdtemp()
+        patcher = patch.object(self.mr, 'get_models_path', return_value=self._flag_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self._flag_dir, ignore_errors=True)
+
+    def test_surface_built_next_to_model(self):
+        surface = self.mr._surface
+        self.assertIsNotNone(surface)
+        self.assertTrue(surface['path'].endswith(self.rs.SURFACE_SUFFIX))
+        self.assertTrue(os.path.isfile(surface['path']))
+
+    def test_surface_is_memory_mapped(self):
+        self.assertIsInstance(self.mr._surface['curves'].base, self.np.memmap)
+
+    def test_interpolated_curve_within_tolerance(self):
+        from app.config.constants import RESPONSE_SURFACE
+        values = [712.3, 777.7, 861.1]
+        approx, mode = self.mr.predict_pressure_curves(values)
+        exact = self.mr.run_batch_inference(values)
+        self.assertEqual(mode, 'surface')
+        rel = self.np.max(self.np.abs(approx - exact)) / self.np.max(self.np.abs(exact))
+        self.assertLessEqual(rel, RESPONSE_SURFACE['tolerance'])
+
+    def test_value_outside_grid_uses_exact_model(self):
+        out, mode = self.mr.predict_pressure_curves([5000.0])
+        self.assertEqual(mode, 'exact')
+        self.np.testing.assert_array_equal(out, self.mr.run_batch_inference([5000.0]))
+
+    def test_exact_flag_bypasses_surface(self):
+        self.mr.set_exact_inference(True)
+        self.assertTrue(self.mr.is_exact_inference_forced())
+        result = self.mr.run_forward_inference(790.0)
+        self.assertEqual(result['statistics']['inference_mode'], 'exact')
+        self.mr.set_exact_inference(False)
+        self.assertFalse(self.mr.is_exact_inference_forced())
+        self.assertEqual(self.mr.get_inference_status()['mode'], 'surface')
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 12. Weight store — memory-mapped model weights shared across workers
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestWeightStore(unittest.TestCase):
+    """app/utils/weight_store.py + model_runner export / store-mode loading"""
+
+    @classmethod
+    def setUpClass(cls):
+        import numpy as np
+        from app.utils import model_runner, weight_store
+        from app.utils.paths import get_models_path
+        cls.np = np
+        cls.mr = model_runner
+        cls.ws = weight_store
+        cls.real_models = get_models_path()
+
+    def setUp(self):
+        import shutil
+        self.models_dir = tempfile.mkdtemp()
+        for name in os.listdir(self.real_models):
+            if name.endswith('.pkl'):
+                shutil.copy2(os.path.join(self.real_models, name), self.models_dir)
+        patcher = patch.object(self.mr, 'get_models_path', return_value=self.models_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mr._reset_cache()
+
+    def tearDown(self):
+        import shutil
+        self.mr._reset_cache()
+        shutil.rmtree(self.models_dir, ignore_errors=True)
+
+    def test_without_store_model_is_unpickled(self):
+        self.mr._load_model()
+        self.assertEqual(self.mr._model_source, 'pickle')
+
+    def test_export_writes_bin_and_header(self):
+        header = self.mr.export_weight_store()
+        bin_path, header_path = self.ws.store_paths_for(self.mr._resolve_model_path())
+        self.assertTrue(os.path.isfile(bin_path))
+        self.assertTrue(os.path.isfile(header_path))
+        self.assertEqual(os.path.getsize(bin_path), header['store_bytes'])
+        self.assertGreater(header['unpickled_bytes'], 0)
+
+    def test_store_mode_matches_pickle_predictions(self):
+        values = [700.0, 780.0, 865.0]
+        self.mr._load_model()
+        expected = self.mr.run_batch_inference(values)
+        self.mr.preload_shared_weights()
+        self.assertEqual(self.mr._model_source, 'weight_store')
+        self.assertIsNone(self.mr._model_data['models'])
+        self.assertIsInstance(self.mr._flat_model['coef'], self.np.memmap)
+        self.np.testing.assert_array_equal(self.mr.run_batch_inference(values), expected)
+
+    def test_stale_store_is_ignored(self):
+        self.mr.export_weight_store()
+        model_path = self.mr._resolve_model_path()
+        st = os.stat(model_path)
+        os.utime(model_path, (st.st_atime, st.st_mtime + 10))
+        self.assertIsNone(self.ws.open_store(model_path))
+
+    def test_status_reports_memory_saved(self):
+        status = self.mr.preload_shared_weights()
+        self.assertEqual(status['weights_source'], 'weight_store')
+        self.assertGreater(status['per_worker_saved_bytes'], 0)
+        self.assertGreaterEqual(status['total_saved_bytes'], 0)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 13. Parameter sweep — /simulation/sweep (batched inference, NDJSON, bulk insert)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestSimulationSweep(AppTestCase):
+    """SimulationService sweep helpers + the streamed /simulation/sweep route"""
+
+    RECIPE = {'ignition_model': 'SWEEP-IGN', 'nc_type_1': 'NC-SW', 'shell_model': '18'}
+
+    def tearDown(self):
+        from app.models import Simulation
+        super().tearDown()
+        with self.app.app_context():
+            Simulation.query.filter_by(ignition_model='SWEEP-IGN').delete()
+            self.db.session.commit()
+
+    def _sweep(self, body):
+        from datetime import date as _date
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['login_date'] = _date.today().isoformat()
+        client.post('/auth/login', data={'employee_id': 'admin', 'password': 'TestAdmin1!'})
+        resp = client.post('/simulation/sweep', json={**self.RECIPE, **body})
+        lines = [json.loads(l) for l in resp.get_data(as_text=True).splitlines() if l]
+        return resp, lines
+
+    def test_range_is_inclusive_and_deduplicated(self):
+        from app.services.simulation_service import SimulationService
+        parse = SimulationService.parse_sweep_values
+        self.assertEqual(parse({'start': 700, 'stop': 701, 'step': 0.5}), [700.0, 700.5, 701.0])
+        self.assertEqual(parse({'values': '750, 760,750'}), [750.0, 760.0])
+
+    def test_invalid_sweep_parameters_rejected(self):
+        from app.services.simulation_service import SimulationService
+        from app.utils.errors import SimulationError
+        for bad in ({}, {'start': 800, 'stop': 700, 'step': 1},
+                    {'start': 0, 'stop': 1e6, 'step': 0.01}, {'values': [-5]}):
+            with self.assertRaises(SimulationError):
+                SimulationService.parse_sweep_values(bad)
+
+    def test_sweep_matches_single_point_inference(self):
+        import numpy as np
+        from app.utils.model_runner import predict_pressure_curves
+        result = self.app.simulation_service.run_sweep({'values': [720, 800]})
+        single, _ = predict_pressure_curves([800.0])
+        np.testing.assert_allclose(result['pressures'][1], single[0])
+        self.assertEqual(result['peak_pressure'][1], single[0].max())
+        self.assertEqual(result['peak_time'][1], result['times'][single[0].argmax()])
+
+    def test_route_streams_ndjson_and_persists(self):
+        from app.models import Simulation
+        resp, lines = self._sweep({'start': 750, 'stop': 752, 'step': 1})
+        self.assertEqual(resp.mimetype, 'application/x-ndjson')
+        self.assertEqual([l['type'] for l in lines], ['meta', 'point', 'point', 'point', 'summary'])
+        self.assertEqual(len(lines[1]['pressure']), len(lines[0]['time']))
+        self.assertEqual(lines[-1]['created'], 3)
+        self.assertEqual(Simulation.query.filter_by(ignition_model='SWEEP-IGN').count(), 3)
+
+        # Second sweep overlapping the first reuses the stored recipes
+        _, lines = self._sweep({'values': [751, 752, 753]})
+        summary = lines[-1]
+        self.assertEqual((summary['created'], summary['reused']), (1, 2))
+        self.assertNotIn(None, summary['simulation_ids'])
+
+    def test_route_rejects_bad_range(self):
+        resp, _ = self._sweep({'start': 760, 'stop': 750, 'step': 1})
+        self.assertEqual(resp.status_code, 400)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 14. Figure spec — plotly JSON without go.Figure, compact result_data
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestFigureSpec(AppTestCase):
+    """app/utils/figure_spec.py + compact Simulation.result_data records"""
+
+    def test_line_figure_matches_go_figure_json(self):
+        import numpy as np
+        import plotly.graph_objects as go
+        from app.utils.figure_spec import line_figure
+        x, y = np.linspace(0, 10, 7), np.linspace(1, 4, 7) ** 2
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(x=x.tolist(), y=y.tolist(), mode='lines', name='NC用量1: 800.0mg',
+                                 line=dict(color='#667eea', width=2)))
+        fig.update_layout(xaxis_title='时间 (ms)', yaxis_title='压力 (MPa)', hovermode='x unified',
+                          template='plotly_white', showlegend=True,
+                          margin=dict(l=50, r=50, t=30, b=50))
+        self.assertEqual(line_figure(x, y, 'NC用量1: 800.0mg'), json.loads(fig.to_json()))
+
+    def test_record_is_compact_and_expands_to_api_shape(self):
+        from app.utils.model_runner import expand_forward_result, run_forward_inference
+        from app.utils import model_runner
+        curves, mode = model_runner.predict_pressure_curves([800.0])
+        record = model_runner.build_forward_result(800.0, curves[0], mode)
+        self.assertEqual(set(record), {'curve', 'statistics'})
+        self.assertEqual(expand_forward_result(record), run_forward_inference(800.0))
+
+    def test_legacy_plot_data_record_passes_through(self):
+        from app.utils.model_runner import expand_forward_result
+        legacy = {'plot_data': {'data': [], 'layout': {}}, 'statistics': {'peak_pressure': 1.0}}
+        self.assertIs(expand_forward_result(legacy), legacy)
+
+    def test_run_forward_simulation_stores_compact_record(self):
+        from app.models import Simulation
+        user = self._make_user('figspec01')
+        params = {'ignition_model': 'FIG-IGN', 'nc_usage_1': '812.5'}
+        result = self.app.simulation_service.run_forward_simulation(user.id, params)
+        self.assertIn('plot_data', result['data'])
+        stored = json.loads(self.db.session.get(Simulation, result['simulation_id']).result_data)
+        self.assertNotIn('plot_data', stored)
+        self.assertEqual(stored['curve']['pressure'], result['data']['plot_data']['data'][0]['y'])
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 15. Binary curve storage — curve_codec, TestResult dual read, migration
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestCurveStorage(AppTestCase):
+    """app/utils/curve_codec.py + TestResult.get_curve/set_curve + migration"""
+
+    TIME = [0.0, 0.5, 1.0, 1.5, 2.0]
+    PRESSURE = [0.0, 1.5, 3.1234567891, 2.0, 0.5]
+
+    def test_float64_roundtrip_is_exact(self):
+        from app.utils.curve_codec import decode_curve, encode_curve
+        for compression in ('none', 'zlib'):
+            t, p = decode_curve(encode_curve(self.TIME, self.PRESSURE, compression=compression))
+            self.assertEqual(t.tolist(), self.TIME)
+            self.assertEqual(p.tolist(), self.PRESSURE)
+
+    def test_float32_is_smaller_and_close(self):
+        import numpy as np
+        from app.utils.curve_codec import decode_curve, encode_curve
+        blob32 = encode_curve(self.TIME, self.PRESSURE, dtype='float32', compression='none')
+        blob64 = encode_curve(self.TIME, self.PRESSURE, dtype='float64', compression='none')
+        self.assertLess(len(blob32), len(blob64))
+        _, p = decode_curve(blob32)
+        self.assertEqual(p.dtype, np.float64)
+        np.testing.assert_allclose(p, self.PRESSURE, rtol=1e-6)
+
+    def test_malformed_blob_rejected(self):
+        from app.utils.curve_codec import decode_curve, encode_curve
+        from app.utils.errors import DataProcessingError
+        blob = encode_curve(self.TIME, self.PRESSURE, compression='none')
+        for bad in (b'', b'JUNKJUNKJUNKJUNK', blob[:-3]):
+            with self.assertRaises(DataProcessingError):
+                decode_curve(bad)
+        with self.assertRaises(DataProcessingError):
+            encode_curve([1.0, 2.0], [1.0])
+
+    def test_get_curve_reads_binary_and_legacy_json(self):
+        user = self._make_user('curve01')
+        sim = self._make_simulation(user.id, work_order='WO-CURVE-1')
+        legacy = self._make_test_result(user.id, sim.id, time_data=self.TIME,
+                                        pressure_data=self.PRESSURE)
+        binary = self._make_test_result(user.id, sim.id)
+        binary.set_curve(self.TIME, self.PRESSURE)
+        self.assertIsNone(binary.data)
+        for tr in (legacy, binary):
+            curve = tr.get_curve()
+            self.assertEqual(curve['time'].tolist(), self.TIME)
+            self.assertEqual(curve['pressure'].tolist(), self.PRESSURE)
+        detail = self.app.work_order_service.get_work_order_detail('WO-CURVE-1')
+        self.assertEqual(detail['statistics']['count'], 2)
+
+    def test_migration_converts_json_rows(self):
+        import importlib
+        from app.models import TestResult
+        migration = importlib.import_module('migrations.convert_test_result_curves')
+        self.assertFalse(migration.ensure_curve_column(self.db))
+
+        user = self._make_user('curve02')
+        tr = self._make_test_result(user.id, None, time_data=self.TIME,
+                                    pressure_data=self.PRESSURE)
+        broken = self._make_test_result(user.id, None, filename='bad.xlsx')
+        broken.data = '{not json'
+        ids = (tr.id, broken.id, user.id)
+        self.db.session.commit()
+        try:
+            with patch('builtins.print'):
+                stats = migration.convert_rows(self.db, batch_size=1)
+            self.assertGreaterEqual(stats['converted'], 1)
+            self.assertGreaterEqual(stats['skipped'], 1)
+            self.db.session.expire_all()
+            row = self.db.session.get(TestResult, ids[0])
+            self.assertIsNone(row.data)
+            self.assertEqual(row.get_curve()['pressure'].tolist(), self.PRESSURE)
+            self.assertEqual(self.db.session.get(TestResult, ids[1]).data, '{not json')
+        finally:
+            from app.models import User
+            TestResult.query.filter(TestResult.id.in_(ids[:2])).delete()
+            User.query.filter_by(id=ids[2]).delete()
+            self.db.session.commit()
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 16. Work order summary table — maintained on write
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestWorkOrderSummary(AppTestCase):
+    """app/services/work_order_summary_service.py + get_all_work_orders"""
+
+    CURVES = [
+        ([0, 1, 2, 3], [0, 2.0, 4.0, 1.0]),
+        ([0, 1, 2, 3], [0, 5.5, 3.0, 1.0]),
+        ([0, 1, 2, 3], [0, 1.0, 2.0, 3.5]),
+    ]
+
+    def _entry(self, wo):
+        svc = self.app.work_order_service
+        return next((r for r in svc.get_all_work_orders() if r['work_order'] == wo), None)
+
+    def _setup_work_order(self, wo):
+        u = self._make_user(f'SUM_{wo}')
+        s = self._make_simulation(u.id, work_order=wo)
+        trs = [self._make_test_result(u.id, s.id, f'{wo}_{i}.xlsx', t, p)
+               for i, (t, p) in enumerate(self.CURVES)]
+        return u, s, trs
+
+    def test_stats_match_detail_statistics(self):
+        self._setup_work_order('WO-SUM-1')
+        entry = self._entry('WO-SUM-1')
+        stats = self.app.work_order_service.get_work_order_detail('WO-SUM-1')['statistics']
+        self.assertEqual(entry['dataset_count'], 3)
+        self.assertEqual(entry['mean_peak_pressure'], stats['mean_p'])
+        self.assertEqual(entry['std_peak_pressure'], stats['std_p'])
+        self.assertEqual(entry['mean_peak_time'], stats['mean_t'])
+        self.assertTrue(entry['last_upload_at'])
+
+    def test_work_order_without_data_is_listed(self):
+        u = self._make_user('SUM_EMPTY')
+        self._make_simulation(u.id, work_order='WO-SUM-EMPTY')
+        entry = self._entry('WO-SUM-EMPTY')
+        self.assertEqual(entry['dataset_count'], 0)
+        self.assertIsNone(entry['mean_peak_pressure'])
+
+    def test_delete_test_result_updates_incrementally(self):
+        u, _, trs = self._setup_work_order('WO-SUM-2')
+        self.app.work_order_service.delete_test_result(trs[1].id, u.id)
+        entry = self._entry('WO-SUM-2')
+        self.assertEqual(entry['dataset_count'], 2)
+        self.assertAlmostEqual(entry['mean_peak_pressure'], (4.0 + 3.5) / 2, places=3)
+        self.assertAlmostEqual(entry['mean_peak_time'], (2 + 3) / 2, places=3)
+
+    def test_delete_work_order_removes_row(self):
+        u, _, _ = self._setup_work_order('WO-SUM-3')
+        self.app.work_order_service.delete_work_order('WO-SUM-3', u.id)
+        self.assertIsNone(self._entry('WO-SUM-3'))
+
+    def test_rebuild_matches_incremental_state(self):
+        from app.models import WorkOrderSummary
+        u, _, trs = self._setup_work_order('WO-SUM-4')
+        self.app.work_order_service.delete_test_result(trs[0].id, u.id)
+        incremental = self._entry('WO-SUM-4')
+        WorkOrderSummaryService(self.db).rebuild_all()
+        rebuilt = self._entry('WO-SUM-4')
+        self.assertEqual(incremental, rebuilt)
+        self.assertIsNotNone(self.db.session.get(WorkOrderSummary, 'WO-SUM-4'))
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 17. Averaged-curve cache per work order (work_order_curve)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestWorkOrderCurveCache(AppTestCase):
+    """WorkOrderSummaryService.get_averaged_curves + its consumers"""
+
+    CURVES = [
+        ([0, 1, 2, 3, 4], [0, 2.0, 4.0, 1.0, 0.5]),
+        ([0, 1, 2, 3], [0, 5.5, 3.0, 1.0]),
+    ]
+
+    def _setup(self, wo):
+        u = self._make_user(f'CUR_{wo}')
+        s = self._make_simulation(u.id, work_order=wo)
+        for i, (t, p) in enumerate(self.CURVES):
+            self._make_test_result(u.id, s.id, f'{wo}_{i}.xlsx', t, p)
+        return u, s
+
+    def test_cached_curve_matches_average_datasets(self):
+        import numpy as np
+        from app.services.comparison_service import ComparisonService
+        self._setup('WO-CACHE-1')
+        entry = self.app.work_order_service.summaries.get_averaged_curves(['WO-CACHE-1'])['WO-CACHE-1']
+        expected = ComparisonService.average_datasets(
+            [{'time': t, 'pressure': p} for t, p in self.CURVES])
+        np.testing.assert_array_equal(entry['time'], expected['time'])
+        np.testing.assert_array_equal(entry['pressure'], expected['pressure'])
+        self.assertEqual(entry['count'], 2)
+        self.assertIn('max_pressure', entry['features'])
+
+    def test_second_read_does_not_reinterpolate(self):
+        self._setup('WO-CACHE-2')
+        svc = self.app.work_order_service
+        first = svc.get_work_order_averaged_curve('WO-CACHE-2')
+        with patch('app.services.comparison_service.ComparisonService.average_datasets',
+                   side_effect=AssertionError('cache miss')):
+            self.assertEqual(svc.get_work_order_averaged_curve('WO-CACHE-2'), first)
+
+    def test_new_test_result_invalidates_cache(self):
+        u, s = self._setup('WO-CACHE-3')
+        summaries = self.app.work_order_service.summaries
+        self.assertEqual(summaries.get_averaged_curves(['WO-CACHE-3'])['WO-CACHE-3']['count'], 2)
+        self._make_test_result(u.id, s.id, 'extra.xlsx', [0, 1, 2], [0, 9.0, 1.0])
+        self.assertEqual(summaries.get_averaged_curves(['WO-CACHE-3'])['WO-CACHE-3']['count'], 3)
+
+    def test_hash_mismatch_triggers_rebuild(self):
+        from app.models import TestResult
+        u, s = self._setup('WO-CACHE-4')
+        summaries = self.app.work_order_service.summaries
+        summaries.get_averaged_curves(['WO-CACHE-4'])
+        # Written behind the service's back: only the source hash can notice
+        tr = TestResult(user_id=u.id, simulation_id=s.id, filename='raw.xlsx', file_path='/fake/raw.xlsx')
+        tr.set_curve([0, 1, 2], [0, 7.0, 1.0])
+        self.db.session.add(tr)
+        self.db.session.flush()
+        self.assertEqual(summaries.get_averaged_curves(['WO-CACHE-4'])['WO-CACHE-4']['count'], 3)
+
+    def test_rebuild_leaves_callers_transaction_open(self):
+        from app.models import User
+        self._setup('WO-CACHE-6')
+        pending = User(username='CUR_PENDING', employee_id='CUR_PENDING', role='research_engineer')
+        pending.set_password('Test@1234')
+        self.db.session.add(pending)
+        summaries = self.app.work_order_service.summaries
+        self.assertEqual(summaries.get_averaged_curves(['WO-CACHE-6'])['WO-CACHE-6']['count'], 2)
+        # Neither committed (the test's SAVEPOINT is still open) nor rolled back
+        self.assertTrue(self.db.session().in_nested_transaction())
+        self.assertIn(pending, self.db.session)
+        with patch('app.services.comparison_service.ComparisonService.average_datasets',
+                   side_effect=AssertionError('cache miss')):
+            self.assertEqual(summaries.get_averaged_curves(['WO-CACHE-6'])['WO-CACHE-6']['count'], 2)
+
+    def test_similarity_search_uses_cached_features(self):
+        from app.utils.similarity import rank_candidates
+        self._setup('WO-CACHE-5')
+        t, p = self.CURVES[0]
+        result = self.app.work_order_service.search_similar_work_orders(t, p, {}, top_n=50)
+        entry = next(r for r in result['results'] if r['work_order'] == 'WO-CACHE-5')
+        avg = self.app.work_order_service.get_work_order_averaged_curve('WO-CACHE-5')
+        expected = rank_candidates(t, p, [('WO-CACHE-5', avg['time'], avg['pressure'])])[0]
+        self.assertEqual(entry['score'], round(expected['score'], 4))
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 18. Similarity feature index (逆向搜索)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestFeatureIndex(unittest.TestCase):
+    """FeatureIndex / similarity.combined_errors — must match score_pair exactly"""
+
+    @staticmethod
+    def _random_features(rng, n):
+        from app.utils.similarity import FEATURE_KEYS
+        feats = [dict(zip(FEATURE_KEYS, rng.uniform(-5, 50, 4))) for _ in range(n)]
+        for f in feats[::7]:          # duplicates → ties
+            f.update(feats[0])
+        return feats
+
+    def test_vectorized_errors_match_score_pair_bitwise(self):
+        import numpy as np
+        from app.utils.similarity import FEATURE_KEYS, combined_errors, error_to_score, score_pair
+        rng = np.random.default_rng(1)
+        feats = self._random_features(rng, 200)
+        matrix = np.array([[f[k] for k in FEATURE_KEYS] for f in feats])
+        for query in feats[:5] + [dict.fromkeys(FEATURE_KEYS, 0.0)]:
+            errors = combined_errors(query, matrix)
+            self.assertEqual([error_to_score(e) for e in errors],
+                             [score_pair(query, f) for f in feats])
+
+    def test_search_matches_rank_features(self):
+        import numpy as np
+        from app.utils.feature_index import FeatureIndex
+        from app.utils.similarity import rank_features
+        rng = np.random.default_rng(2)
+        feats = self._random_features(rng, 120)
+        sims = [(i + 1, f'WO-{i:03d}', {}) for i in range(len(feats))]
+        index = FeatureIndex(sims, {f'WO-{i:03d}': f for i, f in enumerate(feats)})
+        query = feats[3]
+        expected = rank_features(query, [(f'WO-{i:03d}', f) for i, f in enumerate(feats)])
+        for top_n in (1, 5, 20, 500):
+            hits = index.search(query, {}, top_n)
+            self.assertEqual([(h['work_order'], h['score']) for h in hits],
+                             [(e['label'], e['score']) for e in expected[:top_n]])
+
+    def test_filters_follow_sql_equality(self):
+        from app.utils.feature_index import FeatureIndex
+        feat = {'max_pressure': 10.0, 'max_pressure_time': 2.0,
+                'rising_slope': 5.0, 'falling_slope': -1.0}
+        sims = [
+            (1, 'WO-A', {'shell_model': '18', 'current': 1.2}),
+            (2, 'WO-A', {'shell_model': '20', 'current': 1.5}),
+            (3, 'WO-B', {'shell_model': '18', 'current': None}),
+            (4, 'WO-C', {'shell_model': '18', 'current': 1.2}),
+        ]
+        index = FeatureIndex(sims, {'WO-A': feat, 'WO-B': feat, 'WO-C': None},
+                             numeric_columns=['current'])
+
+        def labels(filters):
+            return [(h['work_order'], h['simulation_id']) for h in index.search(feat, filters, 10)]
+
+        self.assertEqual(labels({}), [('WO-A', 1), ('WO-B', 3)])   # WO-C has no features
+        self.assertEqual(labels({'shell_model': 20}), [('WO-A', 2)])
+        self.assertEqual(labels({'current': '1.50'}), [('WO-A', 2)])
+        self.assertEqual(labels({'shell_model': '18', 'current': 1.2}), [('WO-A', 1)])
+        self.assertEqual(labels({'current': 'abc'}), [])
+        self.assertEqual(index.search(feat, {}, 0), [])
+
+
+class TestFeatureIndexSearch(AppTestCase):
+    """WorkOrderService.search_similar_work_orders on the feature index"""
+
+    def test_index_rebuilt_after_new_upload(self):
+        svc = self.app.work_order_service
+        u = self._make_user('FIDX')
+        s = self._make_simulation(u.id, work_order='WO-FIDX-1')
+        self._make_test_result(u.id, s.id, 'a.xlsx', [0, 1, 2, 3], [0, 4.0, 2.0, 1.0])
+        query = ([0, 1, 2, 3], [0, 8.0, 2.0, 1.0])
+        svc.search_similar_work_orders(*query, {}, top_n=20)
+        first_index = svc._index
+
+        s2 = self._make_simulation(u.id, work_order='WO-FIDX-2')
+        self._make_test_result(u.id, s2.id, 'b.xlsx', *query)
+        result = svc.search_similar_work_orders(*query, {'shell_model': '18'}, top_n=20)
+        self.assertIsNot(svc._index, first_index)
+        self.assertEqual(result['results'][0]['work_order'], 'WO-FIDX-2')
+        self.assertEqual(result['results'][0]['score'], 1.0)
+
+    def test_filter_excludes_non_matching_recipes(self):
+        svc = self.app.work_order_service
+        u = self._make_user('FIDX2')
+        s = self._make_simulation(u.id, work_order='WO-FIDX-3')
+        self._make_test_result(u.id, s.id, 'a.xlsx', [0, 1, 2], [0, 3.0, 1.0])
+        found = svc.search_similar_work_orders([0, 1, 2], [0, 3.0, 1.0], {'current': 1.2}, 50)
+        self.assertIn('WO-FIDX-3', [r['work_order'] for r in found['results']])
+        missing = svc.search_similar_work_orders([0, 1, 2], [0, 3.0, 1.0], {'current': 9.9}, 50)
+        self.assertNotIn('WO-FIDX-3', [r['work_order'] for r in missing['results']])
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 19. Whole-curve shape similarity (L2 / DTW)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestShapeSimilarity(AppTestCase):
+    """similarity shape metrics, the DTW cascade and /simulation/search_similar?mode="""
+
+    @staticmethod
+    def _curves(n, seed=0):
+        import numpy as np
+        rng = np.random.default_rng(seed)
+        t = np.linspace(0, 40, 300)
+        return t, [rng.uniform(5, 20) * np.exp(-((t - rng.uniform(3, 15)) / rng.uniform(2, 8)) ** 2)
+                   for _ in range(n)]
+
+    def test_dtw_bounds(self):
+        import numpy as np
+        from app.utils.similarity import dtw_distance, dtw_radius, lb_keogh, resample_shape
+        t, curves = self._curves(30)
+        shapes = np.array([resample_shape(t, c) for c in curves])
+        q, r = shapes[0], dtw_radius()
+        self.assertEqual(dtw_distance(q, q, r), 0.0)
+        dtw = np.array([dtw_distance(q, s, r) for s in shapes])
+        l2 = np.sum((shapes - q) ** 2, axis=1)
+        self.assertTrue(np.all(dtw <= l2 + 1e-9))                        # diagonal path is in the band
+        self.assertTrue(np.all(lb_keogh(q, shapes, r) <= dtw + 1e-9))     # valid lower bound
+        self.assertAlmostEqual(dtw_distance(q, shapes[1], 0), l2[1])      # zero band == L2
+
+    def test_dtw_cascade_matches_exhaustive_search(self):
+        import numpy as np
+        from app.utils import similarity as sim
+        from app.utils.feature_index import FeatureIndex
+        t, curves = self._curves(400, seed=3)
+        labels = [f'WO-{i:03d}' for i in range(len(curves))]
+        index = FeatureIndex([(i, wo, {}) for i, wo in enumerate(labels)],
+                             {wo: sim.compute_features(t, c) for wo, c in zip(labels, curves)})
+        index.set_shapes({wo: sim.resample_shape(t, c) for wo, c in zip(labels, curves)})
+        q_time, q_pressure = t, curves[7]
+        qf, qs = sim.compute_features(q_time, q_pressure), sim.resample_shape(q_time, q_pressure)
+
+        pool = np.argsort(sim.combined_errors(qf, index.matrix), kind='stable')[:sim.DTW_PREFILTER]
+        exhaustive = sorted((sim.dtw_distance(qs, index.shapes[p], sim.dtw_radius()), p) for p in pool)
+        hits = index.search(qf, {}, 5, mode='dtw', query_shape=qs)
+        self.assertEqual([h['work_order'] for h in hits], [labels[p] for _, p in exhaustive[:5]])
+        self.assertEqual(hits[0]['work_order'], 'WO-007')
+
+        l2 = index.search(qf, {}, 3, mode='l2', query_shape=qs)
+        errors = sim.l2_errors(qs, index.shapes)
+        self.assertEqual(l2[0]['score'], sim.error_to_score(errors.min()))
+
+    def test_search_similar_route_modes(self):
+        from datetime import date as _date
+        u = self._make_user('SHAPE')
+        s = self._make_simulation(u.id, work_order='WO-SHAPE-1')
+        self._make_test_result(u.id, s.id, 'a.xlsx', [0, 5, 10, 20, 35], [0, 8.0, 5.0, 2.0, 1.0])
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['login_date'] = _date.today().isoformat()
+        client.post('/auth/login', data={'employee_id': 'admin', 'password': 'TestAdmin1!'})
+        body = {'time': [0, 5, 10, 20, 35], 'pressure': [0, 8.0, 5.0, 2.0, 1.0], 'top_n': 20}
+        for mode in ('features', 'l2', 'dtw'):
+            resp = client.post('/simulation/search_similar', json={**body, 'mode': mode})
+            self.assertEqual(resp.status_code, 200, mode)
+            top = {r['work_order']: r['score'] for r in resp.get_json()['results']}
+            self.assertEqual(top.get('WO-SHAPE-1'), 1.0, mode)
+        resp = client.post('/simulation/search_similar', json={**body, 'mode': 'cosine'})
+        self.assertEqual(resp.status_code, 400)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 20. Batched feature extraction (compute_features_batch)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestFeaturesBatch(unittest.TestCase):
+    """compute_features_batch must reproduce compute_features exactly"""
+
+    @staticmethod
+    def _ragged(n=300, seed=0):
+        import numpy as np
+        rng = np.random.default_rng(seed)
+        times, pressures = [], []
+        for i in range(n):
+            size = int(rng.integers(1, 300))
+            t = np.sort(rng.uniform(0, 60, size))
+            if i % 5 == 0:
+                t = np.linspace(0, 35, size)       # ends exactly at FALLING_SLOPE_END_TIME
+            if i % 7 == 0:
+                t = np.round(t)                    # repeated time stamps
+            p = rng.normal(5, 3, size)
+            if i % 11 == 0:
+                p = -np.abs(p)                     # no positive peak
+            times.append(t)
+            pressures.append(p)
+        return times, pressures
+
+    def test_ragged_batch_matches_scalar(self):
+        from app.utils.similarity import compute_features, compute_features_batch, features_to_dicts
+        times, pressures = self._ragged()
+        batch = features_to_dicts(compute_features_batch(times, pressures))
+        self.assertEqual(batch, [compute_features(t, p) for t, p in zip(times, pressures)])
+
+    def test_padded_and_shared_time_layouts(self):
+        import numpy as np
+        from app.utils.similarity import compute_features, compute_features_batch
+        times, pressures = self._ragged(50, seed=1)
+        lengths = [len(p) for p in pressures]
+        width = max(lengths)
+        t2 = np.full((50, width), 99.0)
+        p2 = np.full((50, width), 1e9)             # padding must be ignored
+        for i, (t, p) in enumerate(zip(times, pressures)):
+            t2[i, :len(t)], p2[i, :len(p)] = t, p
+        padded = compute_features_batch(t2, p2, lengths=lengths)
+        for i, (t, p) in enumerate(zip(times, pressures)):
+            self.assertEqual(padded[i]['max_pressure'], compute_features(t, p)['max_pressure'])
+            self.assertEqual(padded[i]['pressure_at_end'], compute_features(t, p)['pressure_at_end'])
+
+        axis = np.linspace(0, 50, 200)
+        grid = np.vstack([np.sin(axis / k) * k for k in range(1, 6)])
+        shared = compute_features_batch(axis, grid)
+        self.assertEqual(shared['falling_slope'].tolist(),
+                         [compute_features(axis, row)['falling_slope'] for row in grid])
+
+    def test_empty_curve_rejected(self):
+        from app.utils.similarity import compute_features_batch
+        with self.assertRaises(ValueError):
+            compute_features_batch([[0.0], []], [[1.0], []])
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 21. Streaming Excel ingestion (excel_reader)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestExcelStreaming(unittest.TestCase):
+    """FileHandler.load_excel_data / validate_test_data_file on openpyxl streaming"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _xlsx(self, rows, name='curve.xlsx'):
+        from openpyxl import Workbook
+        wb = Workbook()
+        ws = wb.active
+        for row in rows:
+            ws.append(list(row))
+        path = os.path.join(self.tmpdir, name)
+        wb.save(path)
+        return path
+
+    def test_matches_pandas_loader(self):
+        import pandas as pd
+        from app.utils.file_handler import FileHandler
+        rows = [('时间', '压力'), ('[ms]', '[MPa]'), (0, 0.0), ('0.5', ' 1.25 '),
+                (1.0, None), (1.5, 'n/a'), (2, 3), (2.5, 2.75), ('注释', None)]
+        path = self._xlsx(rows)
+
+        df = pd.read_excel(path, header=None)
+        col_t = pd.to_numeric(df.iloc[:, 0], errors='coerce')
+        col_p = pd.to_numeric(df.iloc[:, 1], errors='coerce')
+        mask = col_t.notna() & col_p.notna()
+        expected = (col_t[mask].astype(float).tolist(), col_p[mask].astype(float).tolist())
+
+        self.assertEqual(FileHandler.load_excel_data(path), expected)
+        t, p = FileHandler.load_excel_arrays(path, skip_rows=3)
+        self.assertEqual(t.tolist(), expected[0][1:])
+
+    def test_large_file_grows_buffers(self):
+        from app.utils.file_handler import FileHandler
+        n = 10_000
+        path = self._xlsx([(i * 0.01, float(i % 97)) for i in range(n)])
+        t, p = FileHandler.load_excel_arrays(path)
+        self.assertEqual(len(t), n)
+        self.assertEqual(p[-1], float((n - 1) % 97))
+        stats = FileHandler.validate_test_data_file(path)['stats']
+        self.assertEqual(stats['rows'], n)
+        self.assertEqual(stats['pressure_range'], [0.0, 96.0])
+
+    def test_validation_rules_and_precedence(self):
+        from app.utils.file_handler import FileHandler
+        validate = FileHandler.validate_test_data_file
+        ok = validate(self._xlsx([('t', 'p'), (0, 1.0), (1, 5.0), (2, 2.0)], 'ok.xlsx'))
+        self.assertEqual(ok, {'valid': True, 'stats': {
+            'rows': 3, 'time_range': [0.0, 2.0], 'pressure_range': [1.0, 5.0]}})
+
+        cases = {
+            'cols.xlsx': ([(0, 1.0), (1, 2.0, None, 'x')], '文件包含 4 列'),
+            # column count wins over a descent seen earlier in the same pass
+            'both.xlsx': ([(0, 1.0), (2, 1.0), (1, 1.0), (3, 1.0, 9)], '文件包含 3 列'),
+            'one.xlsx': ([(0,), (1,)], '必须包含2列'),
+            'few.xlsx': ([('t', 'p'), (0, 1.0)], '行数不足'),
+            'start.xlsx': ([(5, 1.0), (6, 1.0)], '必须从 0 开始'),
+            'desc.xlsx': ([('t', 'p'), (0, 1.0), (2, 1.0), (1, 1.0)], '第 3 行出现下降'),
+        }
+        for name, (rows, message) in cases.items():
+            result = validate(self._xlsx(rows, name))
+            self.assertFalse(result['valid'], name)
+            self.assertIn(message, result['errors'][0], name)
+
+    def test_unreadable_file_raises_data_processing_error(self):
+        from app.utils.errors import DataProcessingError
+        from app.utils.file_handler import FileHandler
+        path = os.path.join(self.tmpdir, 'broken.xlsx')
+        with open(path, 'wb') as f:
+            f.write(b'not a zip')
+        with self.assertRaises(DataProcessingError):
+            FileHandler.load_excel_data(path)
+        self.assertFalse(FileHandler.validate_test_data_file(path)['valid'])
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 22. Parse-once upload pipeline (parse_cache)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestParseCache(AppTestCase):
+    """ParseCache + FileService.parse_upload shared by validate_upload and upload"""
+
+    def setUp(self):
+        super().setUp()
+        from app.utils.parse_cache import ParseCache
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = ParseCache(os.path.join(self.tmpdir, 'cache'), 10 * 1024 * 1024)
+
+    def tearDown(self):
+        import shutil
+        super().tearDown()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    @staticmethod
+    def _workbook_bytes(rows):
+        from io import BytesIO
+        from openpyxl import Workbook
+        wb = Workbook()
+        for row in rows:
+            wb.active.append(list(row))
+        buf = BytesIO()
+        wb.save(buf)
+        return buf.getvalue()
+
+    def _upload(self, data, name='run.xlsx'):
+        from io import BytesIO
+        from werkzeug.datastructures import FileStorage
+        return FileStorage(stream=BytesIO(data), filename=name)
+
+    def _parsed(self, n=10):
+        import numpy as np
+        t = np.arange(n, dtype=float)
+        return {'time': t, 'pressure': t * 2, 'width': 2,
+                'validation': {'valid': True, 'stats': {'rows': n}}}
+
+    def test_roundtrip_and_hash(self):
+        import hashlib
+        from io import BytesIO
+        from app.utils.parse_cache import hash_stream
+        stream = BytesIO(b'x' * 3_000_000)
+        stream.seek(123)
+        key, size = hash_stream(stream)
+        self.assertEqual((key, size, stream.tell()),
+                         (hashlib.sha256(b'x' * 3_000_000).hexdigest(), 3_000_000, 0))
+
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, self._parsed())
+        hit = self.cache.get(key)
+        self.assertEqual(hit['time'].tolist(), list(range(10)))
+        self.assertEqual(hit['validation'], {'valid': True, 'stats': {'rows': 10}})
+
+    def test_lru_eviction_and_corrupt_entries(self):
+        from app.utils.parse_cache import ParseCache
+        cache = ParseCache(self.cache.directory, max_bytes=3 * 9000)
+        for i, key in enumerate(('a', 'b', 'c')):
+            cache.put(key, self._parsed(500))       # ~8 KB each
+            os.utime(cache._path(key), (1000 + i, 1000 + i))
+        self.assertIsNotNone(cache.get('a'))        # 'a' becomes most recent
+        cache.put('d', self._parsed(500))
+        self.assertIsNone(cache.get('b'))           # least recently used evicted
+        self.assertIsNotNone(cache.get('a'))
+
+        with open(cache._path('a'), 'wb') as f:
+            f.write(b'garbage')
+        self.assertIsNone(cache.get('a'))
+        self.assertFalse(os.path.exists(cache._path('a')))
+
+    def test_validate_then_upload_parses_once(self):
+        from app.utils.file_handler import FileHandler
+        service = self.app.file_service
+        data = self._workbook_bytes([('t', 'p'), (0, 0.0), (0.5, 4.0), (1.0, 2.0)])
+        parse = FileHandler.parse_test_data_file
+        with patch.object(service, 'parse_cache', self.cache), \
+             patch('app.services.file_service.get_upload_directory', return_value=self.tmpdir), \
+             patch.object(FileHandler, 'parse_test_data_file', side_effect=parse) as spy:
+            result = service.validate_upload_file(self._upload(data))
+            self.assertTrue(result['valid'])
+            self.assertEqual(result['stats']['rows'], 3)
+
+            user = self._make_user('PARSE1')
+            uploaded = service.process_test_result_upload(self._upload(data), user.id)
+            self.assertEqual(uploaded['data'], {'time': [0.0, 0.5, 1.0], 'pressure': [0.0, 4.0, 2.0]})
+            self.assertEqual(spy.call_count, 1)
+
+            # Different bytes → parsed again, invalid result cached as well
+            bad = self._workbook_bytes([(5, 1.0), (6, 1.0)])
+            self.assertFalse(service.validate_upload_file(self._upload(bad))['valid'])
+            self.assertFalse(service.validate_upload_file(self._upload(bad))['valid'])
+            self.assertEqual(spy.call_count, 2)
+
+    def test_unreadable_upload_reported_as_invalid(self):
+        service = self.app.file_service
+        with patch.object(service, 'parse_cache', self.cache):
+            result = service.validate_upload_file(self._upload(b'not a workbook'))
+        self.assertFalse(result['valid'])
+        self.assertIn('文件解析失败', result['errors'][0])
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 23. Parallel /simulation/experiment batches (parse_pool)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestExperimentBatch(AppTestCase):
+    """parse_pool.parse_files + FileService.process_experiment_upload"""
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        from app.utils import parse_pool
+        parse_pool._reset_pool()
+        super().tearDown()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _workbook(self, name, peak):
+        from openpyxl import Workbook
+        wb = Workbook()
+        for row in [('t', 'p'), (0, 0.0), (1, peak), (2, peak / 2)]:
+            wb.active.append(row)
+        path = os.path.join(self.tmpdir, name)
+        wb.save(path)
+        return path
+
+    def _broken(self, name='broken.xlsx'):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'wb') as f:
+            f.write(b'not a workbook')
+        return path
+
+    def test_pool_and_inline_parsing_agree(self):
+        from app.config.constants import EXPERIMENT_PARSE
+        from app.utils.curve_codec import decode_curve
+        from app.utils.parse_pool import parse_files
+        paths = [self._workbook(f'f{i}.xlsx', 2.0 + i) for i in range(4)] + [self._broken()]
+
+        inline = {i: (b, e) for i, b, e in parse_files(paths[:2])}
+        self.assertEqual(decode_curve(inline[1][0])[1].tolist(), [0.0, 3.0, 1.5])
+
+        with patch.dict(EXPERIMENT_PARSE, {'min_files': 1, 'max_workers': 2,
+                                           'in_flight_per_worker': 1}):
+            pooled = {i: (b, e) for i, b, e in parse_files(paths)}
+        self.assertEqual(sorted(pooled), [0, 1, 2, 3, 4])
+        self.assertEqual(pooled[1][0], inline[1][0])
+        self.assertIsNone(pooled[4][0])
+        self.assertIn('文件解析错误', pooled[4][1])
+
+    def test_pool_uses_a_process_per_file_up_to_cpu_count(self):
+        from app.config.constants import EXPERIMENT_PARSE
+        from app.utils import parse_pool
+        with patch('os.cpu_count', return_value=16):
+            self.assertEqual(parse_pool._max_workers(), 16)
+
+        paths = [self._workbook(f'c{i}.xlsx', 1.0 + i) for i in range(3)]
+        parse_pool._reset_pool()
+        with patch.dict(EXPERIMENT_PARSE, {'min_files': 1}), patch('os.cpu_count', return_value=4):
+            self.assertEqual(len(list(parse_pool.parse_files(paths))), 3)
+            processes = len(parse_pool._pool._processes)
+            parse_pool._reset_pool()
+        self.assertGreater(processes, 1)
+        self.assertLessEqual(processes, len(paths))
+
+    def test_pool_shut_down_when_idle(self):
+        import time
+        from app.config.constants import EXPERIMENT_PARSE
+        from app.utils import parse_pool
+        paths = [self._workbook(f'i{i}.xlsx', 1.0 + i) for i in range(2)]
+        with patch.dict(EXPERIMENT_PARSE, {'min_files': 1, 'max_workers': 1, 'idle_shutdown': 0.2}):
+            self.assertEqual(len(list(parse_pool.parse_files(paths))), 2)
+            self.assertIsNotNone(parse_pool._pool)
+            self.assertEqual(parse_pool._active, 0)
+            time.sleep(0.6)
+        self.assertIsNone(parse_pool._pool)
+
+    def test_batch_bulk_inserts_and_reports_failures(self):
+        from io import BytesIO
+        from werkzeug.datastructures import FileStorage
+        from app.config.constants import EXPERIMENT_PARSE
+        from app.models import Simulation, TestResult, WorkOrderSummary
+        user = self._make_user('EXPB')
+        sources = [self._workbook(f'run{i}.xlsx', 4.0 + i) for i in range(3)]
+        sources.insert(1, self._broken('bad.xlsx'))
+        files = []
+        for path in sources:
+            with open(path, 'rb') as f:
+                files.append(FileStorage(stream=BytesIO(f.read()), filename=os.path.basename(path)))
+        out_dir = os.path.join(self.tmpdir, 'out')
+        os.makedirs(out_dir)
+
+        with patch.dict(EXPERIMENT_PARSE, {'min_files': 1, 'max_workers': 2}):
+            result = self.app.file_service.process_experiment_upload(
+                files, user.id, 'WO-EXPB-1', out_dir)
+
+        self.assertEqual(result['files'], ['WO-EXPB-1_run0.xlsx', 'WO-EXPB-1_bad.xlsx',
+                                           'WO-EXPB-1_run1.xlsx', 'WO-EXPB-1_run2.xlsx'])
+        self.assertEqual([f['filename'] for f in result['failed']], ['WO-EXPB-1_bad.xlsx'])
+        rows = TestResult.query.filter(TestResult.id.in_(result['test_result_ids'])).order_by(TestResult.id).all()
+        self.assertEqual([r.filename for r in rows],
+                         ['WO-EXPB-1_run0.xlsx', 'WO-EXPB-1_run1.xlsx', 'WO-EXPB-1_run2.xlsx'])
+        self.assertEqual(rows[2].get_curve()['pressure'].tolist(), [0.0, 6.0, 3.0])
+        stub = Simulation.query.filter_by(work_order='WO-EXPB-1').one()
+        self.assertTrue(all(r.simulation_id == stub.id for r in rows))
+        self.assertEqual(self.db.session.get(WorkOrderSummary, 'WO-EXPB-1').dataset_count, 3)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 24. Background jobs — job table, worker threads, /jobs endpoints
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestBackgroundJobs(unittest.TestCase):
+    """JobService + /jobs routes. Jobs run on worker threads with their own
+    sessions, so these tests commit instead of using a nested transaction."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = _app
+        cls.db = _db
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.service = self.app.job_service
+        self.kinds = []
+
+    def tearDown(self):
+        from app.models import Job, Simulation
+        from app.services.job_service import JOB_HANDLERS
+        self.db.session.rollback()
+        Job.query.delete()
+        Simulation.query.filter_by(ignition_model='JOB-IGN').delete()
+        self.db.session.commit()
+        for kind in self.kinds:
+            JOB_HANDLERS.pop(kind, None)
+        self.ctx.pop()
+
+    def _handler(self, kind, fn):
+        from app.services.job_service import job_handler
+        self.kinds.append(kind)
+        job_handler(kind)(fn)
+
+    def _wait(self, job_id, timeout=30):
+        import time
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            job = self.service.get(job_id)
+            if job.finished:
+                return job
+            time.sleep(0.05)
+        self.fail(f'job {job_id} did not finish')
+
+    def _login(self, employee_id='admin', password='TestAdmin1!'):
+        from datetime import date as _date
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['login_date'] = _date.today().isoformat()
+        client.post('/auth/login', data={'employee_id': employee_id, 'password': password})
+        return client
+
+    def test_job_runs_and_stores_result(self):
+        def handler(job, params):
+            job.progress(0.5, 'halfway', force=True)
+            return {'doubled': params['n'] * 2, 'user': job.user_id}
+        self._handler('test_double', handler)
+
+        job = self.service.submit('test_double', None, {'n': 21})
+        self.assertEqual(job.status, 'queued')
+        done = self._wait(job.id)
+        self.assertEqual(done.status, 'succeeded')
+        self.assertEqual(done.progress, 1.0)
+        self.assertEqual(done.message, 'halfway')
+        self.assertEqual(done.to_dict()['result'], {'doubled': 42, 'user': None})
+        self.assertIsNotNone(done.started_at)
+        with self.assertRaises(ValueError):
+            self.service.submit('no_such_kind', None)
+
+    def test_failure_is_recorded(self):
+        def handler(job, params):
+            raise RuntimeError('boom')
+        self._handler('test_fail', handler)
+        done = self._wait(self.service.submit('test_fail', None).id)
+        self.assertEqual(done.status, 'failed')
+        self.assertIn('boom', done.error)
+
+    def test_running_job_stops_at_next_progress_report(self):
+        import threading
+        started, release = threading.Event(), threading.Event()
+
+        def handler(job, params):
+            started.set()
+            release.wait(10)
+            job.progress(0.9, force=True)
+            return {'finished': True}
+        self._handler('test_cancel', handler)
+
+        job = self.service.submit('test_cancel', None)
+        self.assertTrue(started.wait(10))
+        self.assertTrue(self.service.cancel(job.id))
+        release.set()
+        done = self._wait(job.id)
+        self.assertEqual(done.status, 'cancelled')
+        self.assertIsNone(done.result)
+        self.assertFalse(self.service.cancel(job.id))
+
+    def test_running_sweep_job_cancelled_between_batches(self):
+        import threading
+        from app.models import Simulation
+        from app.services import simulation_service
+        real_predict = simulation_service.predict_pressure_curves
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def predict(values):
+            calls.append(len(values))
+            started.set()
+            release.wait(10)
+            return real_predict(values)
+
+        params = {'ignition_model': 'JOB-IGN', 'nc_type_1': 'NC-J', 'shell_model': '18',
+                  'values': [700, 710, 720]}
+        with patch.object(simulation_service, 'SWEEP_CHUNK_POINTS', 1), \
+                patch.object(simulation_service, 'predict_pressure_curves', side_effect=predict):
+            job = self.service.submit('sweep', None, {'params': params})
+            self.assertTrue(started.wait(10))
+            self.assertTrue(self.service.cancel(job.id))
+            release.set()
+            done = self._wait(job.id)
+        self.assertEqual(done.status, 'cancelled')
+        self.assertEqual(calls, [1])
+        self.assertEqual(Simulation.query.filter_by(ignition_model='JOB-IGN').count(), 0)
+
+    def test_queued_job_cancelled_before_it_runs(self):
+        from app.models import Job
+        self._handler('test_noop', lambda job, params: {})
+        with patch.object(self.service, '_pool') as pool:
+            job = self.service.submit('test_noop', None)
+        self.assertTrue(self.service.cancel(job.id))
+        self.service._execute(job.id)   # a late worker must not claim it
+        self.assertEqual(self.service.get(job.id).status, 'cancelled')
+        self.assertEqual(pool.return_value.submit.call_count, 1)
+        self.assertEqual(Job.query.count(), 1)
+
+    def test_recovery_fails_jobs_of_dead_processes(self):
+        import socket
+        import subprocess
+        from app.models import Job
+        dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+        dead.wait()
+        now = datetime.utcnow()
+        self.db.session.add_all([
+            Job(id='a' * 32, kind='x', status='running', params='{}',
+                worker=f'{socket.gethostname()}:{dead.pid}', created_at=now),
+            Job(id='b' * 32, kind='x', status='running', params='{}',
+                worker=f'{socket.gethostname()}:{os.getpid()}', created_at=now),
+            Job(id='c' * 32, kind='x', status='succeeded', params='{}',
+                created_at=now - timedelta(days=30), finished_at=now - timedelta(days=30)),
+        ])
+        self.db.session.commit()
+        self.service._recover_jobs()
+        self.assertEqual(self.service.get('a' * 32).status, 'failed')
+        self.assertEqual(self.service.get('b' * 32).status, 'running')
+        self.assertIsNone(self.service.get('c' * 32))
+
+    def test_start_recovers_without_a_submission(self):
+        import socket
+        import subprocess
+        import time
+        from app.models import Job
+        from app.services.job_service import JobService
+        dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+        dead.wait()
+        self.db.session.add(Job(id='d' * 32, kind='x', status='running', params='{}',
+                                worker=f'{socket.gethostname()}:{dead.pid}',
+                                created_at=datetime.utcnow()))
+        self.db.session.commit()
+        service = JobService(self.db, self.app)   # a freshly started process
+        service.start()
+        try:
+            deadline = time.monotonic() + 10
+            while self.service.get('d' * 32).status == 'running' and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(self.service.get('d' * 32).status, 'failed')
+        finally:
+            service.shutdown()
+
+    def test_async_sweep_route_and_job_endpoints(self):
+        from app.models import Simulation, User
+        client = self._login()
+        resp = client.post('/simulation/sweep', json={
+            'ignition_model': 'JOB-IGN', 'nc_type_1': 'NC-J', 'shell_model': '18',
+            'values': [730, 740], 'async': 1})
+        self.assertEqual(resp.status_code, 202)
+        body = resp.get_json()
+        done = self._wait(body['job_id'])
+        self.assertEqual(done.status, 'succeeded', done.error)
+
+        status = client.get(body['status_url']).get_json()['job']
+        self.assertEqual(status['result']['count'], 2)
+        self.assertEqual(status['result']['created'], 2)
+        self.assertEqual(Simulation.query.filter_by(ignition_model='JOB-IGN').count(), 2)
+        listed = client.get('/jobs/').get_json()['jobs']
+        self.assertEqual([j['id'] for j in listed], [body['job_id']])
+        self.assertNotIn('result', listed[0])
+        self.assertEqual(client.post(f'/jobs/{done.id}/cancel').status_code, 409)
+
+        # Bad sweep parameters are rejected before a job is created
+        resp = client.post('/simulation/sweep', json={'start': 9, 'stop': 1, 'step': 1, 'async': 1})
+        self.assertEqual(resp.status_code, 400)
+
+        # Other users cannot see the job
+        other = User(username='JOBU', employee_id='JOBU', role='research_engineer')
+        other.set_password('Test@1234')
+        self.db.session.add(other)
+        self.db.session.commit()
+        try:
+            with self.app.app_context():   # fresh g: no cached admin login
+                resp = self._login('JOBU', 'Test@1234').get(body['status_url'])
+            self.assertEqual(resp.status_code, 404)
+        finally:
+            self.db.session.delete(other)
+            self.db.session.commit()
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 25. Warm loader pool — /simulation/load_test_data without a fresh interpreter
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestLoaderPool(unittest.TestCase):
+    """app/utils/loader_pool.py behind SubprocessRunner.run_data_loader_script"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.pools = []
+
+    def tearDown(self):
+        import shutil
+        for pool in self.pools:
+            pool.shutdown()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _pool(self, script_body=None):
+        from app.utils.loader_pool import LoaderPool
+        script = None
+        if script_body is not None:
+            script = os.path.join(self.tmpdir, 'loader.py')
+            with open(script, 'w') as f:
+                f.write(script_body)
+        pool = LoaderPool(size=1, script_path=script)
+        self.pools.append(pool)
+        return pool
+
+    def _workbook(self):
+        from openpyxl import Workbook
+        wb = Workbook()
+        for row in [('header', 'x')] * 4 + [(i * 0.5, (i % 5) * 1.5) for i in range(50)]:
+            wb.active.append(row)
+        path = os.path.join(self.tmpdir, 'cmp.xlsx')
+        wb.save(path)
+        return path
+
+    def test_matches_loader_script_output(self):
+        from app.utils.paths import get_load_test_data_script_path
+        from app.utils.subprocess_runner import SubprocessRunner
+        path = self._workbook()
+        expected = SubprocessRunner.execute_script(get_load_test_data_script_path(), [path])
+        pool = self._pool()
+        self.assertEqual(pool.load(path), expected)
+        self.assertEqual(pool.load(path), expected)   # same loader, reused
+        self.assertEqual(len(pool._idle), 1)
+
+    def test_failures_raise_subprocess_errors(self):
+        from app.utils.errors import SubprocessError
+        pool = self._pool()
+        with self.assertRaises(SubprocessError) as ctx:
+            pool.load(os.path.join(self.tmpdir, 'missing.xlsx'))
+        self.assertIn('Script execution failed', str(ctx.exception))
+        with patch('app.utils.loader_pool.get_loader_pool', return_value=pool):
+            from app.utils.subprocess_runner import SubprocessRunner
+            with self.assertRaises(SubprocessError) as ctx:
+                SubprocessRunner.run_data_loader_script(os.path.join(self.tmpdir, 'missing.xlsx'))
+        self.assertTrue(str(ctx.exception).startswith('Failed to process file'))
+
+    def test_timeout_kills_and_replaces_loader(self):
+        from app.utils.errors import SubprocessTimeoutError
+        pool = self._pool(
+            'import time\n'
+            'def load_test_data(path):\n'
+            '    if path.endswith("slow"):\n'
+            '        time.sleep(30)\n'
+            '    return [0.0, 1.0], [2.0, 3.0]\n')
+        open(os.path.join(self.tmpdir, 'slow'), 'w').close()
+        open(os.path.join(self.tmpdir, 'fast'), 'w').close()
+        pool.warm()
+        with self.assertRaises(SubprocessTimeoutError):
+            pool.load(os.path.join(self.tmpdir, 'slow'), timeout=1)
+        self.assertEqual(pool._idle, [])
+        result = pool.load(os.path.join(self.tmpdir, 'fast'), timeout=30)
+        self.assertEqual(result['data'], {'time': [0.0, 1.0], 'pressure': [2.0, 3.0]})
+        self.assertEqual(result['statistics']['peak_time'], 1.0)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 26. Asynchronous LogManager writer — queued, batched CSV appends
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestLogWriter(unittest.TestCase):
+    """LogManager background writer (app/utils/log_manager.py)"""
+
+    def setUp(self):
+        from app.utils.log_manager import LogManager
+        self.tmpdir = tempfile.mkdtemp()
+        # An explicit log_dir gives a private instance, not the singleton
+        self.lm = LogManager(log_dir=self.tmpdir)
+
+    def tearDown(self):
+        import shutil
+        self.lm.close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _rows(self, path):
+        import csv
+        with open(path, newline='', encoding='utf-8') as f:
+            return list(csv.reader(f))
+
+    def test_entries_are_batched_into_current_file(self):
+        from app.config.logging_config import CSV_HEADERS
+        with patch.object(self.lm, '_get_total_log_size', wraps=self.lm._get_total_log_size) as scan:
+            for i in range(250):
+                self.lm.log_info(f'entry {i}', action='test')
+            self.assertTrue(self.lm.flush(timeout=10))
+        rows = self._rows(self.lm.current_log_file)
+        self.assertEqual(rows[0], CSV_HEADERS)
+        self.assertEqual([r[CSV_HEADERS.index('message')] for r in rows[1:]],
+                         [f'entry {i}' for i in range(250)])
+        self.assertEqual(scan.call_count, 1)   # measured once at start, not per entry
+        self.assertEqual(self.lm._total_size, os.path.getsize(self.lm.current_log_file)
+                         + os.path.getsize(self.lm.current_log_file + '.idx'))
+
+        entries = self.lm.read_log_file(max_rows=5)   # newest first
+        self.assertEqual([e['message'] for e in entries], [f'entry {i}' for i in range(249, 244, -1)])
+
+    def test_write_never_blocks_when_queue_is_full(self):
+        import queue
+        full = queue.Queue(maxsize=1)
+        full.put('pending')
+        with patch.object(self.lm, '_writer_queue', return_value=full):
+            self.lm.log_warning('lost')
+        self.assertEqual(self.lm.dropped, 1)
+
+    def test_close_drains_and_rotation_opens_new_file(self):
+        names = iter(['mgg_system_log_2030-01-01.csv'] * 2 + ['mgg_system_log_2030-01-02.csv'] * 2)
+        with patch('app.utils.log_manager.get_current_log_filename', side_effect=lambda *_: next(names)):
+            for day in (1, 1, 2, 2):
+                self.lm.log_info(f'day {day}')
+        self.lm.close()
+        for day in (1, 2):
+            rows = self._rows(os.path.join(self.tmpdir, f'mgg_system_log_2030-01-0{day}.csv'))
+            self.assertEqual(len(rows), 3)   # header + 2 entries
+            self.assertTrue(all(r[13] == f'day {day}' for r in rows[1:]))
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 27. Log collector — one writer for all gunicorn workers
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestLogCollector(unittest.TestCase):
+    """app/utils/log_collector.py + LogManager's datagram sink"""
+
+    def setUp(self):
+        from app.utils.log_collector import LogCollector
+        self.tmpdir = tempfile.mkdtemp()
+        self.log_dir = os.path.join(self.tmpdir, 'log')
+        self.socket_path = os.path.join(self.tmpdir, 'c.sock')
+        self.collector = LogCollector(log_dir=self.log_dir, socket_path=self.socket_path)
+        self.collector.start()
+        self.sink = patch.dict('app.config.logging_config.LOG_SINK',
+                               {'socket_path': self.socket_path, 'reorder_window': 0.2})
+        self.sink.start()
+
+    def tearDown(self):
+        import shutil
+        self.sink.stop()
+        self.collector.stop()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _rows(self):
+        import csv
+        from app.config.logging_config import get_current_log_filename
+        with open(os.path.join(self.log_dir, get_current_log_filename()), newline='',
+                  encoding='utf-8') as f:
+            return list(csv.reader(f))
+
+    def test_writer_sends_to_collector_instead_of_writing(self):
+        from app.utils.log_manager import LogManager
+        own_dir = os.path.join(self.tmpdir, 'worker')
+        lm = LogManager(log_dir=own_dir)
+        for i in range(300):
+            lm.log_info(f'msg {i}', request_id=f'r{i:03d}', traceback='x' * 500)
+        lm.close()
+        self.collector.stop()
+        messages = [r[13] for r in self._rows()[1:] if r[13].startswith('msg ')]
+        self.assertEqual(messages, [f'msg {i}' for i in range(300)])
+        self.assertGreaterEqual(self.collector.written, 300)
+        with open(os.path.join(own_dir, os.listdir(own_dir)[0])) as f:
+            self.assertEqual(len(f.readlines()), 1)   # header only
+
+    def test_processes_share_one_ordered_file(self):
+        import subprocess
+        script = (
+            'import sys, os\n'
+            f'sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r})\n'
+            'from app.utils.log_manager import LogManager\n'
+            'lm = LogManager(log_dir=sys.argv[1])\n'
+            'for i in range(400):\n'
+            '    lm.log_request("GET", f"/p/{i}", 200, 1.0, request_id=f"{os.getpid()}-{i}")\n'
+            'lm.close()\n'
+        )
+        env = {**os.environ, 'MGG_LOG_SOCKET': self.socket_path}
+        procs = [subprocess.Popen([sys.executable, '-c', script, os.path.join(self.tmpdir, f'w{n}')],
+                                  env=env) for n in range(4)]
+        for p in procs:
+            self.assertEqual(p.wait(timeout=120), 0)
+        self.collector.stop()
+        # (this process's own log_manager may have sent entries too)
+        rows = [r for r in self._rows()[1:] if r[9].startswith('/p/')]
+        self.assertEqual(len(rows), 1600)
+        self.assertTrue(all(len(r) == 18 for r in rows))
+        stamps = [r[0] for r in rows]
+        self.assertEqual(stamps, sorted(stamps))
+        self.assertEqual(len({r[17] for r in rows}), 1600)
+
+    def test_entries_stay_local_when_collector_is_gone(self):
+        from app.utils.log_manager import LogManager
+        self.collector.stop()
+        own_dir = os.path.join(self.tmpdir, 'worker')
+        lm = LogManager(log_dir=own_dir)
+        lm.log_warning('no collector')
+        lm.close()
+        with open(os.path.join(own_dir, os.listdir(own_dir)[0]), encoding='utf-8') as f:
+            self.assertIn('no collector', f.read())
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 28. Log index — tail reads and indexed log queries
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestLogIndex(unittest.TestCase):
+    """app/utils/log_index.py + LogManager.query_logs"""
+
+    def setUp(self):
+        from app.utils.log_manager import LogManager
+        self.tmpdir = tempfile.mkdtemp()
+        self.lm = LogManager(log_dir=self.tmpdir)
+
+    def tearDown(self):
+        import shutil
+        self.lm.close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _write(self, count):
+        # Times 10:00:00 … spaced 10 s apart; every 4th entry an ERROR with a traceback
+        lm_module = sys.modules['app.utils.log_manager']   # app.utils.log_manager is the instance
+        base = datetime(2030, 1, 1, 10, 0, 0)
+        for i in range(count):
+            with patch.object(lm_module, 'datetime') as dt:
+                dt.now.return_value = base + timedelta(seconds=10 * i)
+                self.lm.write_log(level='ERROR' if i % 4 == 0 else 'INFO', message=f'entry {i}',
+                                  user_id=i % 3 + 1, status_code=500 if i % 4 == 0 else 200,
+                                  traceback='Traceback:\n  line' if i % 4 == 0 else None)
+        self.assertTrue(self.lm.flush(timeout=10))
+
+    def _expected(self, count, keep):
+        return [f'entry {i}' for i in reversed(range(count)) if keep(i)]
+
+    def test_index_records_every_row(self):
+        from app.utils.log_index import load_index
+        self._write(100)
+        path = self.lm.current_log_file
+        records = load_index(path, os.path.getsize(path))
+        self.assertEqual(len(records), 100)
+        self.assertEqual(records['second'][0], 10 * 3600)
+        self.assertEqual(records['level'][0], 40)
+        self.assertEqual(records['user_id'][1], 2)
+        with open(path, 'rb') as f:
+            f.seek(int(records['offset'][4]))
+            self.assertTrue(f.read(int(records['length'][4])).startswith(b'2030-01-01T10:00:40'))
+
+    def test_filtered_query_reads_only_matching_rows(self):
+        from app.utils.log_index import parse_clock
+        self._write(600)   # 10:00:00 – 11:39:50
+        with patch('app.utils.log_index.reverse_rows') as scan:
+            entries = self.lm.query_logs(level='ERROR', user_id=1,
+                                         start=parse_clock('10:00'), end=parse_clock('11:00'))
+        scan.assert_not_called()
+        expected = self._expected(600, lambda i: i % 4 == 0 and i % 3 == 0 and i <= 360)
+        self.assertEqual([e['message'] for e in entries], expected)
+        self.assertEqual(entries[0]['traceback'], 'Traceback:\n  line')
+
+        newest = self.lm.read_log_file(max_rows=3)
+        self.assertEqual([e['message'] for e in newest], ['entry 599', 'entry 598', 'entry 597'])
+
+    def test_unindexed_file_is_read_backwards(self):
+        self._write(300)
+        os.remove(self.lm.current_log_file + '.idx')
+        entries = self.lm.query_logs(max_rows=1000, status_code=500, user_id=2)
+        self.assertEqual([e['message'] for e in entries],
+                         self._expected(300, lambda i: i % 4 == 0 and i % 3 == 1))
+        self.assertEqual(len(self.lm.read_log_file(max_rows=1000)), 300)
+
+    def test_view_route_filters_and_rejects_bad_time(self):
+        from datetime import date as _date
+        from unittest.mock import ANY
+        with _app.app_context():
+            client = _app.test_client()
+            with client.session_transaction() as sess:
+                sess['login_date'] = _date.today().isoformat()
+            client.post('/auth/login', data={'employee_id': 'admin', 'password': 'TestAdmin1!'})
+            with patch('app.routes.admin.log_manager.query_logs', return_value=[]) as query:
+                resp = client.get('/admin/logs/view?level=ERROR&user_id=7&start=10:00&end=11:00:30')
+                self.assertEqual(resp.status_code, 200)
+                query.assert_called_once_with(None, max_rows=ANY, level=['ERROR'], user_id=7,
+                                              status_code=None, start=36000, end=39630)
+            self.assertEqual(client.get('/admin/logs/view?start=25:00').status_code, 400)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 29. Monitor metrics — incremental log aggregation and resource sampler
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestMetricsAggregator(unittest.TestCase):
+    """app/utils/metrics_aggregator.py"""
+
+    def setUp(self):
+        from app.utils.log_manager import LogManager
+        from app.utils.metrics_aggregator import LogMetrics
+        self.tmpdir = tempfile.mkdtemp()
+        self.lm = LogManager(log_dir=self.tmpdir)
+        self.metrics = LogMetrics(log_dir=self.tmpdir)
+
+    def tearDown(self):
+        import shutil
+        self.lm.close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _requests(self, statuses, duration_ms=10.0):
+        for i, status in enumerate(statuses):
+            self.lm.log_request('GET', f'/p/{i}', status, duration_ms, username='u1')
+        self.assertTrue(self.lm.flush(timeout=10))
+
+    def test_refresh_parses_only_new_rows(self):
+        from app.utils import log_index
+        self._requests([200, 404, 200])
+        self.metrics.refresh()
+        self.assertEqual(self.metrics.request_stats()['total_requests'], 3)
+
+        with patch('app.utils.metrics_aggregator.parse_rows', wraps=log_index.parse_rows) as parse:
+            self.metrics.refresh()   # nothing new: no parsing at all
+            parse.assert_not_called()
+            self._requests([500, 200], duration_ms=60000.0)
+            self.metrics.refresh()
+            self.assertEqual(len(parse.call_args[0][0].splitlines()), 2)
+
+        stats = self.metrics.request_stats()
+        self.assertEqual((stats['total_requests'], stats['error_count'], stats['slow_request_count']),
+                         (5, 2, 2))
+        self.assertEqual(stats['error_rate_percent'], 40.0)
+        self.assertEqual([e['path'] for e in stats['recent_errors']], ['/p/0', '/p/1'])  # newest first
+
+    def test_ring_buffers_and_startup_reset(self):
+        from app.config.constants import MONITOR
+        for i in range(3):
+            self.lm.log_error(f'old crash {i}')
+        self.lm.log_info('MGG System started', action='system_startup')
+        for i in range(MONITOR['crash_events'] + 5):
+            self.lm.log_error(f'crash {i}')
+        for i in range(12):
+            self.lm.log_warning('User login failed', action='user_login_failed',
+                                ip_address='10.0.0.1' if i < 7 else '10.0.0.2')
+        self.assertTrue(self.lm.flush(timeout=10))
+        self.metrics.refresh()
+
+        crashes = self.metrics.crash_events()
+        self.assertEqual(len(crashes), MONITOR['crash_events'])
+        self.assertEqual(crashes[0]['message'], f"crash {MONITOR['crash_events'] + 4}")
+        self.assertFalse(any(c['message'].startswith('old') for c in crashes))
+
+        failures = self.metrics.access_failures()
+        self.assertEqual(failures['total_failures'], 12)
+        self.assertEqual(failures['failures_by_ip'], {'10.0.0.1': 7, '10.0.0.2': 5})
+        self.assertEqual(len(failures['recent_failures']), MONITOR['recent_login_failures'])
+
+    def test_new_day_file_starts_afresh(self):
+        self._requests([200, 200])
+        self.metrics.refresh()
+        with patch('app.config.logging_config.get_current_log_filename',
+                   return_value='mgg_system_log_2099-01-01.csv'):
+            self.metrics.refresh()
+        self.assertEqual(self.metrics.request_stats()['total_requests'], 0)
+
+    def test_sampler_serves_latest_reading_without_blocking(self):
+        import time
+        from app.utils.metrics_aggregator import ResourceSampler
+        sampler = ResourceSampler(interval=0.05)
+        try:
+            first = sampler.latest(timeout=5)
+            self.assertIn('cpu_percent', first)
+            self.assertIn('memory_total_mb', first)
+            with patch('psutil.cpu_percent', return_value=0.0) as cpu:
+                start = time.perf_counter()
+                sampler.latest()
+                self.assertLess(time.perf_counter() - start, 0.05)
+                self.assertTrue(all(c.kwargs.get('interval') is None for c in cpu.call_args_list))
+        finally:
+            sampler.stop()
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 30. Monitor history — ring buffer, on-disk buckets, /admin/monitor/history
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestMetricsHistory(unittest.TestCase):
+    """app/utils/metrics_history.py + the sampler feeding it"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _store(self, **kwargs):
+        from app.utils.metrics_history import HistoryStore
+        return HistoryStore(path=os.path.join(self.tmpdir, 'history.npy'), **kwargs)
+
+    def test_ring_buffer_keeps_newest_and_downsamples(self):
+        from app.utils.metrics_history import MetricsHistory
+        history = MetricsHistory(ring_size=100, store=False)
+        for i in range(250):
+            history.record({'cpu_percent': float(i), 'p95_ms': float(i % 10)}, ts=1000.0 + i)
+        recent = history.recent()
+        self.assertEqual(len(recent), 100)
+        self.assertEqual(recent[0, 0], 1150.0)   # oldest kept, in order
+        self.assertEqual(recent[-1, 0], 1249.0)
+
+        data = history.series(['cpu_percent', 'p95_ms'], since=1150, until=1250, points=10)
+        self.assertEqual(data['source'], 'memory')
+        self.assertEqual(len(data['t']), 10)
+        self.assertEqual(data['series']['cpu_percent'][0], 154.5)   # mean of 150..159
+        self.assertEqual(data['series']['p95_ms'][0], 9.0)          # max, not mean
+        self.assertIsNone(history.series(['memory_percent'], 1150, 1250)['series']['memory_percent'][0])
+        with self.assertRaises(ValueError):
+            history.series(['nope'], 0)
+
+    def test_store_buckets_wrap_and_have_one_writer(self):
+        import numpy as np
+        store = self._store(resolution=60, days=1)   # 1440 slots
+        base = 1_700_000_000 - 1_700_000_000 % 60
+        for minute in range(3):
+            for s in range(0, 60, 20):
+                row = np.full(7, np.nan)
+                row[0] = minute * 10 + s / 20   # cpu_percent
+                store.add(base + minute * 60 + s, row)
+        store.flush()
+        rows = store.read(base, base + 3600)
+        self.assertEqual(rows[:, 0].tolist(), [base, base + 60, base + 120])
+        self.assertEqual(rows[:, 1].tolist(), [1.0, 11.0, 21.0])
+
+        # A day later the same slot is reused; the old bucket is gone
+        row = np.full(7, np.nan)
+        row[0] = 99.0
+        store.add(base + 86400, row)
+        store.flush()
+        self.assertEqual(store.read(base, base).shape[0], 0)
+        self.assertEqual(store.read(base, base + 90000)[-1, 1], 99.0)
+
+        other = self._store(resolution=60, days=1)
+        self.assertFalse(other._is_writer())   # flock held by `store`
+        store.close()
+        self.assertTrue(other._is_writer())
+        other.close()
+
+    def test_sampler_records_request_rate_and_p95(self):
+        import numpy as np
+        from app.config.logging_config import LOG_EVENTS
+        from app.utils.metrics_aggregator import ResourceSampler, _bucket_quantile
+        from app.utils.metrics_history import FIELDS, MetricsHistory
+        from app.utils.metrics_registry import HTTP_LATENCY
+        self.assertFalse(LOG_EVENTS['all_requests'])   # successful requests are not logged
+        history = MetricsHistory(ring_size=10, store=False)
+        sampler = ResourceSampler(interval=60, history=history, latency=HTTP_LATENCY)
+        sampler._tick()   # baseline: earlier tests' requests
+        client = _app.test_client()
+        for _ in range(20):
+            self.assertEqual(client.get('/health').status_code, 200)
+        sampler._tick()
+        row = dict(zip(FIELDS, history.recent()[-1, 1:]))
+        self.assertGreater(row['requests_per_s'], 0)
+        self.assertGreater(row['p95_ms'], 0)
+        self.assertFalse(np.isnan(row['cpu_percent']))
+        self.assertFalse(np.isnan(row['disk_percent']))
+
+        sampler._tick()   # no requests since
+        self.assertTrue(np.isnan(dict(zip(FIELDS, history.recent()[-1, 1:]))['p95_ms']))
+        self.assertAlmostEqual(_bucket_quantile(0.95, {0.01: 10, 0.1: 10, float('inf'): 0}), 0.091)
+        self.assertEqual(_bucket_quantile(0.95, {0.01: 1, float('inf'): 9}), 0.01)
+
+    def test_history_endpoint(self):
+        import time
+        from datetime import date as _date
+        from app.utils.metrics_history import MetricsHistory
+        history = MetricsHistory(ring_size=50, store=False)
+        now = time.time()
+        for i in range(30):
+            history.record({'cpu_percent': 10.0, 'requests_per_s': 2.0}, ts=now - 600 + i * 20)
+        with _app.app_context():
+            client = _app.test_client()
+            with client.session_transaction() as sess:
+                sess['login_date'] = _date.today().isoformat()
+            client.post('/auth/login', data={'employee_id': 'admin', 'password': 'TestAdmin1!'})
+            with patch('app.routes.admin.get_metrics_history', return_value=history), \
+                    patch('app.routes.admin.get_resource_sampler'):
+                resp = client.get('/admin/monitor/history?fields=cpu_percent,requests_per_s&minutes=5')
+                self.assertEqual(resp.status_code, 200)
+                body = resp.get_json()
+                self.assertEqual(body['source'], 'memory')
+                self.assertEqual(set(body['series']), {'cpu_percent', 'requests_per_s'})
+                self.assertTrue(0 < len(body['t']) <= 16)
+                self.assertTrue(all(v == 10.0 for v in body['series']['cpu_percent']))
+                self.assertEqual(client.get('/admin/monitor/history?fields=bogus').status_code, 400)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 31. Prometheus /metrics — multiprocess registry and instrumentation
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestPrometheusMetrics(unittest.TestCase):
+    """app/utils/metrics_registry.py + /metrics"""
+
+    def setUp(self):
+        from app.utils.metrics_registry import Counter, Gauge, Histogram, Registry
+        self.tmpdir = tempfile.mkdtemp()
+        self.registry = Registry(self.tmpdir)
+        self.counter = Counter('t_requests_total', 'Requests.', ('endpoint',), registry=self.registry)
+        self.histogram = Histogram('t_seconds', 'Latency.', ('endpoint',), buckets=(0.1, 1.0),
+                                   registry=self.registry)
+        self.gauge = Gauge('t_depth', 'Depth.', registry=self.registry)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_values_are_summed_across_processes(self):
+        import time
+        self.counter.labels('a').inc()
+        self.gauge.set(5)
+        children = []
+        for keep_running in (False, True):
+            pid = os.fork()
+            if pid == 0:
+                for _ in range(500):
+                    self.counter.labels('a').inc()
+                self.gauge.set(1)
+                if keep_running:
+                    time.sleep(3)
+                os._exit(0)
+            children.append(pid)
+        os.waitpid(children[0], 0)   # first child has exited
+        time.sleep(0.3)
+        totals = self.registry.collect()
+        self.assertEqual(totals['t_requests_total|t_requests_total|endpoint="a"'], 1001.0)
+        self.assertEqual(totals['t_depth|t_depth|'], 6.0)   # exited child's gauge dropped
+        files = sorted(os.listdir(self.tmpdir))
+        self.assertIn('merged.json', files)
+        self.assertNotIn(f'values_{children[0]}.db', files)
+        os.kill(children[1], 9)
+        os.waitpid(children[1], 0)
+        totals = self.registry.collect()
+        self.assertEqual(totals['t_requests_total|t_requests_total|endpoint="a"'], 1001.0)
+        self.assertEqual(totals['t_depth|t_depth|'], 5.0)
+
+    def test_exposition_format(self):
+        for value in (0.05, 0.5, 0.5, 5.0):
+            self.histogram.labels('sim.run').observe(value)
+        self.counter.labels('say "hi"\n').inc(2)
+        text = self.registry.exposition()
+        self.assertIn('# TYPE t_seconds histogram', text)
+        self.assertIn('t_seconds_bucket{endpoint="sim.run",le="0.1"} 1.0', text)
+        self.assertIn('t_seconds_bucket{endpoint="sim.run",le="1.0"} 3.0', text)   # cumulative
+        self.assertIn('t_seconds_bucket{endpoint="sim.run",le="+Inf"} 4.0', text)
+        self.assertIn('t_seconds_sum{endpoint="sim.run"} 6.05', text)
+        self.assertIn('t_seconds_count{endpoint="sim.run"} 4.0', text)
+        self.assertIn('t_requests_total{endpoint="say \\"hi\\"\\n"} 2.0', text)
+        self.assertIn('# TYPE t_depth gauge', text)
+
+    def test_metrics_endpoint_counts_requests(self):
+        from app.config.network_config import METRICS_EXPORT
+        from app.utils.metrics_registry import REGISTRY
+        key = 'mgg_http_requests_total|mgg_http_requests_total|endpoint="main.health_check",method="GET",status="200"'
+        client = _app.test_client()
+        before = REGISTRY.collect().get(key, 0.0)
+        client.get('/health')
+        client.get('/health')
+        resp = client.get('/metrics')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.content_type.startswith('text/plain; version=0.0.4'))
+        self.assertEqual(REGISTRY.collect()[key], before + 2)
+        text = resp.get_data(as_text=True)
+        for family in ('mgg_http_request_duration_seconds', 'mgg_model_inference_seconds',
+                       'mgg_excel_parse_seconds', 'mgg_similarity_search_seconds',
+                       'mgg_db_pool_checkouts_total', 'mgg_log_queue_depth'):
+            self.assertIn(f'# TYPE {family} ', text)
+
+        with patch.dict(METRICS_EXPORT, {'token': 's3cret'}):
+            self.assertEqual(client.get('/metrics').status_code, 401)
+            ok = client.get('/metrics', headers={'Authorization': 'Bearer s3cret'})
+            self.assertEqual(ok.status_code, 200)
+
+    def test_excel_parse_is_timed(self):
+        from openpyxl import Workbook
+        from app.utils.excel_reader import read_curve
+        from app.utils.metrics_registry import REGISTRY
+        key = 'mgg_excel_parse_seconds|mgg_excel_parse_seconds_count|'
+        path = os.path.join(self.tmpdir, 'curve.xlsx')
+        wb = Workbook()
+        for i in range(10):
+            wb.active.append([i * 0.1, i * 2.0])
+        wb.save(path)
+        before = REGISTRY.collect().get(key, 0.0)
+        read_curve(path)
+        self.assertEqual(REGISTRY.collect()[key], before + 1)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 32. SQL query statistics — per-request totals, slow-query log, top statements
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TestQueryStats(unittest.TestCase):
+    """app/utils/query_stats.py"""
+
+    def test_normalize_sql(self):
+        from app.utils.query_stats import normalize_sql
+        self.assertEqual(
+            normalize_sql("SELECT t.id FROM test_result t\n  WHERE t.work_order IN (?, ?, ?) "
+                          "AND t.name = 'it''s' AND t.x > 3.5 LIMIT ?"),
+            'SELECT t.id FROM test_result t WHERE t.work_order IN (?, ...) '
+            'AND t.name = ? AND t.x > ? LIMIT ?')
+        self.assertEqual(
+            normalize_sql('INSERT INTO t (a, b) VALUES (%(a_m0)s, %(b_m0)s), (%(a_m1)s, %(b_m1)s)'),
+            'INSERT INTO t (a, b) VALUES (?, ...), ...')
+        self.assertEqual(normalize_sql('SELECT x::text FROM t WHERE id = :id_1 AND col_2 = 7'),
+                         'SELECT x::text FROM t WHERE id = ? AND col_2 = ?')
+
+    def test_request_collects_count_time_and_slowest(self):
+        from app.models import User
+        from app.utils.log_manager import log_manager
+        from app.utils.query_stats import request_queries
+        with _app.test_request_context('/work_order/x'):
+            self.assertIsNone(request_queries())
+            User.query.filter(User.id.in_([1, 2, 3])).all()
+            User.query.filter(User.id.in_([4, 5])).all()
+            User.query.count()
+            stats = request_queries()
+            self.assertEqual(stats.count, 3)
+            self.assertGreater(stats.time_ms, 0)
+            self.assertEqual(len(stats.slowest), 3)
+            self.assertEqual([ms for _, ms in stats.slowest],
+                             sorted((ms for _, ms in stats.slowest), reverse=True))
+            self.assertIn('IN (?, ...)', stats.slowest[0][0] + stats.slowest[1][0] + stats.slowest[2][0])
+
+        logged = []
+        with patch.object(log_manager, 'write_log', side_effect=lambda **kw: logged.append(kw)):
+            log_manager.log_request('GET', '/x', 404, 12.0, request_id='r1', db_queries=3, db_time_ms=4.25)
+        self.assertEqual(logged[0]['message'], 'Client error: GET /x [DB: 3 queries, 4.2 ms]')
+
+        # The logging middleware adds the slowest statements to the row
+        logged = []
+        with patch.dict('app.config.logging_config.LOG_EVENTS', {'all_requests': True}), \
+                patch.object(log_manager, 'write_log', side_effect=lambda **kw: logged.append(kw)):
+            _app.test_client().get('/health')
+        message = logged[-1]['message']
+        self.assertRegex(message, r'^Request: GET /health \[DB: \d+ queries, [\d.]+ ms \| [\d.]+ ms: SELECT ')
+
+    def test_slow_statements_go_to_slow_query_log(self):
+        from flask import g
+        from app.config.logging_config import CSV_HEADERS, QUERY_LOG, SLOW_QUERY_LOG_PREFIX
+        from app.models import User
+        from app.utils.log_manager import log_manager
+        logged = []
+        with patch.dict(QUERY_LOG, {'slow_threshold_ms': 0}), \
+                patch.object(log_manager, 'write_log', side_effect=lambda **kw: logged.append(kw)):
+            with _app.test_request_context('/admin/logs'):
+                g.request_id = 'req-42'
+                g.request_info = {'method': 'GET', 'path': '/admin/logs', 'endpoint': 'admin.logs'}
+                User.query.filter(User.id == 7).all()
+        self.assertEqual(len(logged), 1)
+        entry = logged[0]
+        self.assertEqual(entry['log_prefix'], SLOW_QUERY_LOG_PREFIX)
+        self.assertEqual(entry['action'], 'slow_query')
+        self.assertEqual(entry['request_id'], 'req-42')
+        self.assertEqual(entry['path'], '/admin/logs')
+        self.assertTrue(entry['message'].endswith('WHERE user.id = ?'))
+
+        # Slow-query rows get their own file; the system log stays current
+        from app.utils.log_manager import LogManager
+        tmpdir = tempfile.mkdtemp()
+        try:
+            manager = LogManager(tmpdir)
+            manager._total_size = 0
+            handles = {}
+            row = [''] * len(CSV_HEADERS)
+            manager._write_batch([('mgg_system_log_2026-01-01.csv', row),
+                                  (f'{SLOW_QUERY_LOG_PREFIX}_2026-01-01.csv', row),
+                                  ('mgg_system_log_2026-01-01.csv', row)], handles)
+            self.assertEqual(len(handles), 2)
+            self.assertTrue(manager.current_log_file.endswith('mgg_system_log_2026-01-01.csv'))
+            for f, idx in handles.values():
+                f.close()
+                idx.close()
+        finally:
+            import shutil
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def test_top_statements_by_total_time(self):
+        import uuid
+        from app.utils.log_manager import log_manager
+        from app.utils.query_stats import record_statement, top_statements
+        table = f't_{uuid.uuid4().hex}'   # counters persist across test runs
+        with patch.object(log_manager, 'log_slow_query') as slow_log:
+            record_statement(f'SELECT slow FROM {table} WHERE id IN (1, 2)', 2.0)
+            record_statement(f'SELECT slow FROM {table} WHERE id IN (3, 4, 5)', 1.0)
+            record_statement(f'SELECT fast FROM {table}', 0.5)
+        self.assertEqual(slow_log.call_count, 3)
+        rows = {r['sql']: r for r in top_statements(limit=1000)}
+        slow = rows[f'SELECT slow FROM {table} WHERE id IN (?, ...)']
+        self.assertEqual(slow['calls'], 2)
+        self.assertEqual(slow['total_ms'], 3000.0)
+        self.assertEqual(slow['mean_ms'], 1500.0)
+        ranked = [r['sql'] for r in top_statements(limit=1000)]
+        self.assertLess(ranked.index(slow['sql']), ranked.index(f'SELECT fast FROM {table}'))
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 33. Request profiler — sampled stacks of slow requests as folded files
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _profiled_busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestRequestProfiler(unittest.TestCase):
+    """app/utils/request_profiler.py + profiling_middleware + /admin/profiles"""
+
+    def setUp(self):
+        from app.config.logging_config import REQUEST_PROFILER
+        self.tmpdir = tempfile.mkdtemp()
+        self.config = patch.dict(REQUEST_PROFILER, {
+            'enabled': True, 'sample_rate': 1.0, 'threshold_ms': 30,
+            'interval': 0.001, 'directory': self.tmpdir})
+        self.config.start()
+
+    def tearDown(self):
+        import shutil
+        self.config.stop()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _counts(self, text):
+        lines = text.strip().split('\n')
+        for line in lines:
+            self.assertRegex(line, r'^\S.*;.* \d+$')
+        return lines, sum(int(line.rsplit(' ', 1)[1]) for line in lines)
+
+    def test_sampler_counts_stacks_of_the_session_thread(self):
+        import threading
+        import time
+        from app.utils.request_profiler import StackSampler
+        stop = threading.Event()
+        worker = threading.Thread(target=_profiled_busy_loop, args=(stop,))
+        worker.start()
+        sampler = StackSampler(interval=0.001)
+        session = sampler.start(worker.ident)
+        session.max_samples = 20
+        time.sleep(0.3)
+        sampler.stop(session)
+        stop.set()
+        worker.join()
+        self.assertEqual(session.samples, 20)   # capped
+        lines, total = self._counts(session.folded())
+        self.assertEqual(total, 20)
+        self.assertTrue(all('_profiled_busy_loop (app_regression_test.py:' in line for line in lines))
+        self.assertFalse(sampler._active.is_set())
+
+    def test_slow_request_profile_is_kept(self):
+        import time
+        from flask import g
+        from app.utils.request_profiler import list_profiles
+        with _app.test_request_context('/simulation/run', method='POST'):
+            _app.preprocess_request()
+            request_id = g.request_id
+            deadline = time.perf_counter() + 0.08
+            while time.perf_counter() < deadline:
+                sum(range(1000))
+            _app.do_teardown_request()
+        with _app.test_request_context('/health'):   # fast: not kept
+            _app.preprocess_request()
+            _app.do_teardown_request()
+
+        profiles = list_profiles()
+        self.assertEqual([p['request_id'] for p in profiles], [request_id])
+        self.assertEqual(profiles[0]['path'], '/simulation/run')
+        self.assertGreaterEqual(profiles[0]['duration_ms'], 80)
+        with open(os.path.join(self.tmpdir, f'{request_id}.folded'), encoding='utf-8') as f:
+            lines, total = self._counts(f.read())
+        self.assertEqual(total, profiles[0]['samples'])
+        self.assertTrue(any('test_slow_request_profile_is_kept' in line for line in lines))
+
+    def test_disabled_or_unsampled_requests_are_not_profiled(self):
+        from flask import g
+        from app.config.logging_config import REQUEST_PROFILER
+        for settings in ({'enabled': False}, {'sample_rate': 0.0}):
+            with patch.dict(REQUEST_PROFILER, settings), _app.test_request_context('/health'):
+                _app.preprocess_request()
+                self.assertNotIn('profile', g)
+                _app.do_teardown_request()
+
+    def test_admin_list_download_and_pruning(self):
+        from datetime import date as _date
+        from app.config.logging_config import REQUEST_PROFILER
+        from app.utils.request_profiler import ProfileSession, list_profiles, save_profile
+        session = ProfileSession(0)
+        session.stacks[(self.test_admin_list_download_and_pruning.__code__,)] = 3
+        session.samples = 3
+        with patch.dict(REQUEST_PROFILER, {'max_profiles': 2}):
+            for i in range(3):
+                save_profile(session, f'req-{i}', {'method': 'GET', 'path': f'/p{i}'})
+                os.utime(os.path.join(self.tmpdir, f'req-{i}.json'), (1000 + i, 1000 + i))
+        self.assertEqual(sorted(p['request_id'] for p in list_profiles()), ['req-1', 'req-2'])
+        self.assertIsNone(save_profile(session, '../escape', {}))
+
+        REQUEST_PROFILER['enabled'] = False   # do not profile the admin requests below
+        client = _app.test_client()
+        with client.session_transaction() as sess:
+            sess['login_date'] = _date.today().isoformat()
+        client.post('/auth/login', data={'employee_id': 'admin', 'password': 'TestAdmin1!'})
+        listed = client.get('/admin/profiles').get_json()
+        self.assertEqual(sorted(p['request_id'] for p in listed['profiles']), ['req-1', 'req-2'])
+        resp = client.get('/admin/profiles/req-2/download')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('test_admin_list_download_and_pruning (app_regression_test.py:',
+                      resp.get_data(as_text=True))
+        self.assertTrue(resp.get_data(as_text=True).endswith(' 3\n'))
+        self.assertEqual(client.get('/admin/profiles/req-0/download').status_code, 404)
+        self.assertIn('慢请求剖析', client.get('/admin/logs').get_data(as_text=True))
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 34. Request deadlines — cooperative checkpoints and matching statement timeouts
+# ═══════════════════════════════════════════════════════════════════════════════
+
+_LONG_SQL = ('WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 100000000) '
+             'SELECT count(*) FROM n')
+
+
+class TestRequestDeadline(unittest.TestCase):
+    """app/utils/deadline.py + timeout middleware"""
+
+    def test_budget_comes_from_timeouts(self):
+        from flask import g
+        from app.config.network_config import TIMEOUTS
+        from app.middleware.timeout import get_timeout_for_endpoint
+        with _app.test_request_context('/health'):
+            self.assertEqual(get_timeout_for_endpoint('simulation.sweep'), TIMEOUTS['simulation'])
+            self.assertEqual(get_timeout_for_endpoint('wp.compare_run'), TIMEOUTS['simulation'])
+            self.assertEqual(get_timeout_for_endpoint('simulation.experiment'), TIMEOUTS['file_upload'])
+            self.assertEqual(get_timeout_for_endpoint('admin.logs'), TIMEOUTS['default_request'])
+            self.assertEqual(get_timeout_for_endpoint(None), TIMEOUTS['default_request'])
+            _app.preprocess_request()
+            self.assertEqual(g.deadline.budget, TIMEOUTS['default_request'])
+            self.assertGreater(g.deadline.remaining(), TIMEOUTS['default_request'] - 5)
+
+    def test_expired_deadline_answers_504_through_except_exception(self):
+        from app.config.network_config import TIMEOUTS
+        from app.utils.deadline import check_deadline, current_deadline
+        seen = []
+
+        def slow_view():
+            try:
+                check_deadline()
+            except Exception:   # the routes' fallback must not swallow it
+                return 'swallowed'
+            return 'finished'
+
+        def after_view(response):
+            seen.append(current_deadline())
+            return response
+
+        with patch.dict(_app.view_functions, {'main.health_check': slow_view}), \
+                patch.dict(TIMEOUTS, {'default_request': 0}), \
+                patch.object(_app, 'after_request_funcs', {None: [after_view]}):
+            resp = _app.test_client().get('/health')
+        self.assertEqual(resp.status_code, 504)
+        self.assertFalse(resp.get_json()['success'])
+        self.assertIn('超时', resp.get_json()['message'])
+        self.assertEqual(seen, [None])   # after_request hooks run without a deadline
+
+        with patch.dict(_app.view_functions, {'main.health_check': slow_view}):
+            self.assertEqual(_app.test_client().get('/health').get_data(as_text=True), 'finished')
+
+    def test_deadline_in_before_request_hook_answers_504(self):
+        from app.config.network_config import TIMEOUTS
+        from app.utils.deadline import check_deadline, current_deadline
+        seen = []
+
+        def after_view(response):
+            seen.append(current_deadline())
+            return response
+
+        hooks = {None: _app.before_request_funcs[None] + [check_deadline]}
+        with patch.dict(TIMEOUTS, {'default_request': 0}), \
+                patch.object(_app, 'before_request_funcs', hooks), \
+                patch.object(_app, 'after_request_funcs', {None: [after_view]}):
+            resp = _app.test_client().get('/health')
+        self.assertEqual(resp.status_code, 504)
+        self.assertIn('超时', resp.get_json()['message'])
+        self.assertEqual(seen, [None])
+
+    def test_sqlite_statement_stops_at_deadline(self):
+        import time
+        from flask import g
+        from sqlalchemy import text
+        from sqlalchemy.exc import OperationalError
+        from app.config.network_config import TIMEOUTS
+        from app.utils.deadline import Deadline
+        from app.utils.errors import DeadlineExceededError
+        with _app.test_request_context('/work_order/compare/run'):
+            g.deadline = Deadline(0.2)
+            started = time.monotonic()
+            with self.assertRaises(DeadlineExceededError):
+                _db.session.execute(text(_LONG_SQL)).scalar()
+            self.assertLess(time.monotonic() - started, 5)
+            _db.session.rollback()
+
+            # Capped by TIMEOUTS['database_query'] before the deadline: a plain DB error
+            g.deadline = Deadline(30)
+            with patch.dict(TIMEOUTS, {'database_query': 0.2}):
+                with self.assertRaises(OperationalError):
+                    _db.session.execute(text(_LONG_SQL)).scalar()
+            _db.session.rollback()
+            self.assertEqual(_db.session.execute(text('SELECT 1')).scalar(), 1)
+            _db.session.rollback()
+
+    def test_deadline_still_cleans_up_saved_files(self):
+        import uuid
+        from io import BytesIO
+        from flask import g
+        from openpyxl import Workbook
+        from werkzeug.datastructures import FileStorage
+        from app.utils.deadline import Deadline
+        from app.utils.errors import DeadlineExceededError
+        from app.utils.paths import get_temp_directory, get_upload_directory
+        wb = Workbook()
+        for row in [('t', 'p'), (0, 0.0), (1, float(uuid.uuid4().int % 1000))]:   # unseen content
+            wb.active.append(row)
+        content = BytesIO()
+        wb.save(content)
+        name = f'deadline_{uuid.uuid4().hex}.xlsx'
+        service = _app.file_service
+
+        with _app.test_request_context('/simulation/upload', method='POST'):
+            g.deadline = Deadline(0)
+            upload = FileStorage(stream=BytesIO(content.getvalue()), filename=name)
+            with self.assertRaises(DeadlineExceededError):
+                service.process_test_result_upload(upload, user_id=1)
+            self.assertFalse(os.path.exists(os.path.join(get_upload_directory(), name)))
+
+            upload = FileStorage(stream=BytesIO(content.getvalue()), filename=name)
+            with patch('app.services.file_service.SubprocessRunner.run_data_loader_script',
+                       side_effect=DeadlineExceededError(1)):
+                with self.assertRaises(DeadlineExceededError):
+                    service.load_test_data_file(upload)
+            self.assertFalse(os.path.exists(os.path.join(get_temp_directory(), name)))
+
+    def test_postgresql_statement_timeout_set_when_it_changes(self):
+        from types import SimpleNamespace
+        from unittest.mock import MagicMock
+        from flask import g
+        from app.utils.deadline import (
+            Deadline, _clear_connection_limit, _forget_statement_timeout, _limit_statement)
+        cursor = MagicMock()
+        record = SimpleNamespace(info={})
+        conn = SimpleNamespace(info=record.info, dialect=SimpleNamespace(name='postgresql'),
+                               connection=SimpleNamespace(cursor=lambda: cursor))
+
+        def executed():
+            sql = [c.args[0] for c in cursor.execute.call_args_list]
+            cursor.execute.reset_mock()
+            return sql
+
+        _limit_statement(conn, None, 'SELECT 1', {}, None, False)   # no request: unlimited
+        self.assertEqual(executed(), ['SET statement_timeout = 0'])
+        with _app.test_request_context('/work_order/list'):
+            g.deadline = Deadline(30)
+            for _ in range(3):
+                _limit_statement(conn, None, 'SELECT 1', {}, None, False)
+            self.assertEqual(executed(), ['SET statement_timeout = 10000'])
+            g.deadline = Deadline(2.5)
+            _limit_statement(conn, None, 'SELECT 1', {}, None, False)
+            self.assertEqual(executed(), ['SET statement_timeout = 3000'])
+            _forget_statement_timeout(conn)   # rolled back: set again
+            _limit_statement(conn, None, 'SELECT 1', {}, None, False)
+            self.assertEqual(executed(), ['SET statement_timeout = 3000'])
+            _clear_connection_limit(None, record)   # returned to the pool
+            _limit_statement(conn, None, 'SELECT 1', {}, None, False)
+            self.assertEqual(executed(), ['SET statement_timeout = 3000'])
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # Runner
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -1384,6 +3651,32 @@ if __name__ == '__main__':
         loader.loadTestsFromTestCase(TestHealthEndpoint),
         loader.loadTestsFromTestCase(TestUI),
         loader.loadTestsFromTestCase(TestDropLegacyTablesMigration),
+        loader.loadTestsFromTestCase(TestModelRunner),
+        loader.loadTestsFromTestCase(TestResponseSurface),
+        loader.loadTestsFromTestCase(TestWeightStore),
+        loader.loadTestsFromTestCase(TestSimulationSweep),
+        loader.loadTestsFromTestCase(TestFigureSpec),
+        loader.loadTestsFromTestCase(TestCurveStorage),
+        loader.loadTestsFromTestCase(TestWorkOrderSummary),
+        loader.loadTestsFromTestCase(TestWorkOrderCurveCache),
+        loader.loadTestsFromTestCase(TestFeatureIndex),
+        loader.loadTestsFromTestCase(TestFeatureIndexSearch),
+        loader.loadTestsFromTestCase(TestShapeSimilarity),
+        loader.loadTestsFromTestCase(TestFeaturesBatch),
+        loader.loadTestsFromTestCase(TestExcelStreaming),
+        loader.loadTestsFromTestCase(TestParseCache),
+        loader.loadTestsFromTestCase(TestExperimentBatch),
+        loader.loadTestsFromTestCase(TestBackgroundJobs),
+        loader.loadTestsFromTestCase(TestLoaderPool),
+        loader.loadTestsFromTestCase(TestLogWriter),
+        loader.loadTestsFromTestCase(TestLogCollector),
+        loader.loadTestsFromTestCase(TestLogIndex),
+        loader.loadTestsFromTestCase(TestMetricsAggregator),
+        loader.loadTestsFromTestCase(TestMetricsHistory),
+        loader.loadTestsFromTestCase(TestPrometheusMetrics),
+        loader.loadTestsFromTestCase(TestQueryStats),
+        loader.loadTestsFromTestCase(TestRequestProfiler),
+        loader.loadTestsFromTestCase(TestRequestDeadline),
     ]
 
     runner = unittest.TextTestRunner(verbosity=2, stream=sys.stdout)
@@ -46,6 +46,39 @@ preload_app = GUNICORN_CONFIG['preload_app']
 def on_starting(server):
     """Called just before the master process is initialized."""
     server.log.info('Starting MGG Simulation System')
+    _reset_metrics_dir(server)
+    if preload_app:
+        _preload_model_weights(server)
+
+
+def _preload_model_weights(server):
+    """Export/map the shared model weight store in the master before forking.
+
+    Workers inherit the read-only np.memmap views, so the estimator weights
+    live once in the page cache instead of once per worker.  Failure is not
+    fatal — workers then load the .pkl themselves on first use.
+    """
+    try:
+        from app.utils.model_runner import preload_shared_weights
+        status = preload_shared_weights()
+        server.log.info(
+            f"Model weights mapped from {status['weights_source']} "
+            f"({status['store_bytes']} B shared, "
+            f"~{status['per_worker_saved_bytes']} B saved per worker)"
+        )
+    except Exception as e:
+        server.log.warning(f'Shared model weights unavailable: {e}')
+
+def _reset_metrics_dir(server):
+    """Drop /metrics and query-statistics value files left by a previous
+    server (counters restart at 0)."""
+    try:
+        from app.utils.metrics_registry import REGISTRY
+        from app.utils.query_stats import QUERY_REGISTRY
+        REGISTRY.reset_directory()
+        QUERY_REGISTRY.reset_directory()
+    except Exception as e:
+        server.log.warning(f'Metrics directory not reset: {e}')
 
 def on_reload(server):
     """Called to recycle workers during a reload via SIGHUP."""
@@ -54,6 +87,19 @@ def on_reload(server):
 def when_ready(server):
     """Called just after the server is started."""
     server.log.info('Server is ready. Spawning workers')
+    _start_log_collector(server)
+
+
+def _start_log_collector(server):
+    """Run the CSV log collector in the master so workers share one writer
+    (see app/utils/log_collector.py). Without it workers append directly."""
+    try:
+        from app.utils.log_collector import start_log_collector
+        collector = start_log_collector()
+        if collector is not None:
+            server.log.info(f'Log collector listening on {collector.socket_path}')
+    except Exception as e:
+        server.log.warning(f'Log collector not started, workers write logs directly: {e}')
 
 def pre_fork(server, worker):
     """Called just before a worker is forked."""
@@ -62,10 +108,45 @@ def pre_fork(server, worker):
 def post_fork(server, worker):
     """Called just after a worker has been forked."""
     server.log.info(f'Worker spawned (pid: {worker.pid})')
+    if preload_app:
+        from app.utils import model_runner
+        if model_runner._model_source == 'weight_store':
+            server.log.info(f'Worker {worker.pid} shares the memory-mapped model weights')
 
 def post_worker_init(worker):
     """Called just after a worker has initialized the application."""
     worker.log.info(f'Worker initialized (pid: {worker.pid})')
+    _warm_data_loaders(worker)
+    _start_resource_sampler(worker)
+    _start_job_workers(worker)
+
+
+def _warm_data_loaders(worker):
+    """Start this worker's comparison-file loader processes ahead of the first
+    /simulation/load_test_data request (they import pandas + plotly once)."""
+    try:
+        from app.config.constants import DATA_LOADER_POOL
+        if DATA_LOADER_POOL.get('warm_on_start', True):
+            from app.utils.loader_pool import get_loader_pool
+            get_loader_pool().warm()
+    except Exception as e:
+        worker.log.warning(f'Data loader pool not started: {e}')
+
+def _start_resource_sampler(worker):
+    """Take the first CPU/memory sample before the admin monitor asks for it."""
+    try:
+        from app.utils.metrics_aggregator import get_resource_sampler
+        get_resource_sampler()
+    except Exception as e:
+        worker.log.warning(f'Resource sampler not started: {e}')
+
+def _start_job_workers(worker):
+    """Start this worker's job threads now, so jobs orphaned by a dead worker
+    are failed or adopted at startup rather than on the next submission."""
+    try:
+        worker.wsgi.job_service.start()
+    except Exception as e:
+        worker.log.warning(f'Job workers not started: {e}')
 
 def worker_int(worker):
     """Called just after a worker received the SIGINT or SIGQUIT signal."""
@@ -93,7 +174,8 @@ def child_exit(server, worker):
 
 def worker_exit(server, worker):
     """Called just after a worker has been exited, in the worker process."""
-    pass
+    from app.utils.log_manager import log_manager
+    log_manager.close()   # hand queued entries to the collector before exiting
 
 def nworkers_changed(server, new_value, old_value):
     """Called just after num_workers has been changed."""
@@ -102,3 +184,5 @@ def nworkers_changed(server, new_value, old_value):
 def on_exit(server):
     """Called just before exiting Gunicorn."""
     server.log.info('Shutting down MGG Simulation System')
+    from app.utils.log_collector import stop_log_collector
+    stop_log_collector()   # write every entry the collector still holds
@@ -0,0 +1,40 @@
+"""
+Migration: Build the work_order_summary table
+
+Creates work_order_summary (via db.create_all) and fills it from the existing
+simulation / test_result rows.  From then on the application keeps it up to
+date on every upload and delete; re-run this script only if the table is
+suspected to have drifted (e.g. after manual SQL edits).
+
+Works on both SQLite and PostgreSQL (uses the app's DATABASE_URL).
+
+Usage:
+    python migrations/build_work_order_summary.py
+
+Author: MGG_SYS
+Date:   2026-10-17
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    os.environ.setdefault('SECRET_KEY', 'migration_temp_key')
+    from app import create_app, db
+    from app.services.work_order_summary_service import WorkOrderSummaryService
+    app = create_app()
+
+    with app.app_context():
+        print(f'Starting migration on: {db.engine.url.render_as_string(hide_password=True)}')
+        db.create_all()
+        count = WorkOrderSummaryService(db).rebuild_all()
+        db.session.commit()
+        print(f'\nMigration complete: {count} work order(s) summarised.')
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
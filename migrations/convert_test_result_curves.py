@@ -0,0 +1,157 @@
+"""
+Migration: Convert TestResult curves from JSON text to binary
+
+Adds the test_result.curve column (BLOB / BYTEA) if it is missing, then
+re-encodes every row whose curve still lives in the JSON `data` column into
+the binary format of app/utils/curve_codec.py.  Rows are processed in
+id-ordered batches, one commit per batch, so the migration can run against a
+live database and be interrupted and resumed at any point.
+
+The application reads both formats (TestResult.get_curve), so old and new
+rows may coexist while the migration is in progress.
+
+Works on both SQLite and PostgreSQL (uses the app's DATABASE_URL).
+
+Usage:
+    python migrations/convert_test_result_curves.py [--batch-size N] [--keep-json]
+    python migrations/convert_test_result_curves.py --rollback   # binary → JSON
+
+    --batch-size N   Rows per transaction (default: 500)
+    --keep-json      Leave the JSON `data` column populated after conversion
+
+Author: MGG_SYS
+Date:   2026-10-17
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def ensure_curve_column(db) -> bool:
+    """Add test_result.curve when missing. Returns True if it was added."""
+    from sqlalchemy import inspect
+    columns = {c['name'] for c in inspect(db.engine).get_columns('test_result')}
+    if 'curve' in columns:
+        return False
+    col_type = db.LargeBinary().compile(dialect=db.engine.dialect)
+    with db.engine.begin() as conn:
+        conn.execute(db.text(f'ALTER TABLE test_result ADD COLUMN curve {col_type}'))
+    return True
+
+
+def convert_rows(db, batch_size: int = 500, keep_json: bool = False) -> dict:
+    """
+    Encode JSON curves into test_result.curve batch by batch.
+
+    Returns:
+        {'converted': N, 'skipped': N} — skipped rows hold no parseable curve
+        and are left untouched.
+    """
+    from app.utils.curve_codec import encode_curve
+
+    select_batch = db.text(
+        'SELECT id, data FROM test_result '
+        'WHERE curve IS NULL AND data IS NOT NULL AND id > :last_id '
+        'ORDER BY id LIMIT :limit'
+    )
+    update_sql = db.text(
+        'UPDATE test_result SET curve = :curve' +
+        ('' if keep_json else ', data = NULL') +
+        ' WHERE id = :id'
+    )
+
+    converted = skipped = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select_batch, {'last_id': last_id, 'limit': batch_size}
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        updates = []
+        for row_id, data in rows:
+            try:
+                d = json.loads(data)
+                if not d.get('time') or not d.get('pressure'):
+                    raise ValueError('empty curve')
+                updates.append({'id': row_id, 'curve': encode_curve(d['time'], d['pressure'])})
+            except Exception:
+                skipped += 1
+
+        if updates:
+            db.session.execute(update_sql, updates)
+        db.session.commit()
+        converted += len(updates)
+        print(f'  [BATCH]   up to id {last_id}: converted {len(updates)}, '
+              f'skipped {len(rows) - len(updates)}')
+
+    return {'converted': converted, 'skipped': skipped}
+
+
+def rollback_rows(db, batch_size: int = 500) -> int:
+    """Write binary curves back into JSON `data` and clear `curve`."""
+    from app.utils.curve_codec import decode_curve
+
+    select_batch = db.text(
+        'SELECT id, curve FROM test_result '
+        'WHERE curve IS NOT NULL AND id > :last_id ORDER BY id LIMIT :limit'
+    )
+    update_sql = db.text('UPDATE test_result SET data = :data, curve = NULL WHERE id = :id')
+
+    restored = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select_batch, {'last_id': last_id, 'limit': batch_size}
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        updates = []
+        for row_id, blob in rows:
+            time, pressure = decode_curve(blob)
+            updates.append({'id': row_id, 'data': json.dumps(
+                {'time': time.tolist(), 'pressure': pressure.tolist()})})
+        db.session.execute(update_sql, updates)
+        db.session.commit()
+        restored += len(updates)
+    return restored
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert TestResult curves to binary')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--keep-json', action='store_true')
+    parser.add_argument('--rollback', action='store_true')
+    args = parser.parse_args()
+
+    os.environ.setdefault('SECRET_KEY', 'migration_temp_key')
+    from app import create_app, db
+    app = create_app()
+
+    with app.app_context():
+        print(f'Starting migration on: {db.engine.url.render_as_string(hide_password=True)}')
+        if ensure_curve_column(db):
+            print('  [ALTER]   Added column test_result.curve')
+        else:
+            print('  [SKIP]    Column test_result.curve already exists')
+
+        if args.rollback:
+            restored = rollback_rows(db, args.batch_size)
+            print(f'\nRollback complete: {restored} row(s) restored to JSON.')
+            return True
+
+        stats = convert_rows(db, args.batch_size, args.keep_json)
+        print(f"\nMigration complete: {stats['converted']} converted, "
+              f"{stats['skipped']} skipped (no usable curve).")
+        return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -161,14 +161,16 @@ def main():
             if pg_db.session.get(TestResult, r['id']):
                 skipped += 1
                 continue
+            row = dict(r)
+            row.setdefault('curve', None)  # SQLite db predating binary curves
             pg_db.session.execute(
                 pg_db.text(
                     'INSERT INTO test_result (id, user_id, simulation_id, filename, '
-                    'file_path, data, uploaded_at) '
+                    'file_path, data, curve, uploaded_at) '
                     'VALUES (:id, :user_id, :simulation_id, :filename, '
-                    ':file_path, :data, :uploaded_at)'
+                    ':file_path, :data, :curve, :uploaded_at)'
                 ),
-                dict(r)
+                row
             )
             inserted += 1
         pg_db.session.commit()
@@ -18,4 +18,5 @@ app = create_app()
 
 if __name__ == '__main__':
     debug_mode = os.environ.get('FLASK_DEBUG', 'false').lower() == 'true'
+    app.job_service.start()   # recover jobs left by a previous run
     app.run(debug=debug_mode, host='0.0.0.0', port=5001)
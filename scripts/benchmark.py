@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+MGG_SYS micro-benchmarks for hot code paths.
+
+Each benchmark times the current implementation against the one it replaced
+and checks that both produce the same output before reporting numbers.
+
+Benchmarks:
+  forward   Forward-simulation result building: go.Figure + to_json round-trip
+            (before) vs figure_spec.line_figure (after), and the size of the
+            stored Simulation.result_data for each.
+  search    Similarity ranking of 10 000 work orders: per-candidate
+            rank_features (before) vs the vectorized FeatureIndex (after).
+  excel     Loading a 100 000-row P-T workbook: pd.read_excel + pd.to_numeric
+            (before) vs the streaming openpyxl reader (after).
+  features  Feature extraction for 1 000 and 10 000 curves: compute_features
+            per curve (before) vs one compute_features_batch call (after).
+
+Usage:
+    python scripts/benchmark.py {forward,search,excel,features} [--repeat N]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+
+# ── Helpers ────────────────────────────────────────────────────────────────────
+
+def _time_calls(fn, repeat: int) -> list:
+    """Per-call latency in milliseconds for `repeat` calls of fn()."""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def _report(label: str, samples: list) -> float:
+    median = statistics.median(samples)
+    p95 = sorted(samples)[int(len(samples) * 0.95) - 1]
+    print(f'  {label:<28} median {median:9.3f} ms   p95 {p95:9.3f} ms')
+    return median
+
+
+# ── Benchmarks ─────────────────────────────────────────────────────────────────
+
+def _legacy_forward_result(nc_usage_1, times_arr, pressures_arr, statistics_):
+    """Forward result as run_forward_inference built it before figure_spec."""
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=times_arr.tolist(),
+        y=pressures_arr.tolist(),
+        mode='lines',
+        name=f'NC用量1: {nc_usage_1}mg',
+        line=dict(color='#667eea', width=2)
+    ))
+    fig.update_layout(
+        xaxis_title='时间 (ms)',
+        yaxis_title='压力 (MPa)',
+        hovermode='x unified',
+        template='plotly_white',
+        showlegend=True,
+        margin=dict(l=50, r=50, t=30, b=50)
+    )
+    return {'plot_data': json.loads(fig.to_json()), 'statistics': statistics_}
+
+
+def bench_forward(repeat: int) -> int:
+    from app.utils.model_runner import (
+        build_forward_result, expand_forward_result, get_common_times,
+        predict_pressure_curves,
+    )
+
+    nc_usage_1 = 800.0
+    curves, mode = predict_pressure_curves([nc_usage_1])
+    times_arr, pressures_arr = get_common_times(), curves[0]
+
+    record = build_forward_result(nc_usage_1, pressures_arr, mode)
+    before = _legacy_forward_result(nc_usage_1, times_arr, pressures_arr, record['statistics'])
+    after = expand_forward_result(record)
+    if json.dumps(before, sort_keys=True) != json.dumps(after, sort_keys=True):
+        print('  [ERROR]   figure_spec output differs from go.Figure output')
+        return 1
+
+    print(f'Forward result building ({repeat} calls, {len(times_arr)} points)')
+    t_before = _report('before: go.Figure', _time_calls(
+        lambda: json.dumps(_legacy_forward_result(
+            nc_usage_1, times_arr, pressures_arr, record['statistics'])), repeat))
+    t_after = _report('after:  record + figure_spec', _time_calls(
+        lambda: (json.dumps(build_forward_result(nc_usage_1, pressures_arr, mode)),
+                 expand_forward_result(record)), repeat))
+    print(f'  speed-up                     {t_before / t_after:9.1f}x')
+    print(f'  result_data size             {len(json.dumps(before)):>6} B -> '
+          f'{len(json.dumps(record))} B')
+    return 0
+
+
+def bench_search(repeat: int) -> int:
+    import numpy as np
+    from app.utils.feature_index import FeatureIndex
+    from app.utils.similarity import FEATURE_KEYS, rank_features
+
+    n, top_n = 10_000, 5
+    rng = np.random.default_rng(0)
+    feats = {f'WO-{i:05d}': dict(zip(FEATURE_KEYS, rng.uniform(0.1, 50, 4))) for i in range(n)}
+    index = FeatureIndex([(i, wo, {}) for i, wo in enumerate(feats)], feats)
+    candidates = list(feats.items())
+    query = feats['WO-00042']
+
+    before = [(r['label'], r['score']) for r in rank_features(query, candidates)[:top_n]]
+    after = [(h['work_order'], h['score']) for h in index.search(query, {}, top_n)]
+    if before != after:
+        print('  [ERROR]   FeatureIndex ranking differs from rank_features')
+        return 1
+
+    print(f'Similarity ranking ({repeat} calls, {n} candidates, top {top_n})')
+    t_before = _report('before: rank_features', _time_calls(
+        lambda: rank_features(query, candidates)[:top_n], repeat))
+    t_after = _report('after:  FeatureIndex.search', _time_calls(
+        lambda: index.search(query, {}, top_n), repeat))
+    print(f'  speed-up                     {t_before / t_after:9.1f}x')
+    return 0
+
+
+def bench_features(repeat: int) -> int:
+    import numpy as np
+    from app.utils.similarity import compute_features, compute_features_batch, features_to_dicts
+
+    samples = 1000
+    rng = np.random.default_rng(0)
+    time_axis = np.linspace(0.0, 50.0, samples)
+    for n in (1_000, 10_000):
+        peaks = rng.uniform(5, 20, (n, 1))
+        centres = rng.uniform(3, 15, (n, 1))
+        widths = rng.uniform(2, 8, (n, 1))
+        pressure = peaks * np.exp(-((time_axis - centres) / widths) ** 2)
+        pressure += rng.normal(0, 0.05, pressure.shape)
+
+        before = [compute_features(time_axis, row) for row in pressure]
+        after = features_to_dicts(compute_features_batch(time_axis, pressure))
+        if before != after:
+            print('  [ERROR]   compute_features_batch differs from compute_features')
+            return 1
+
+        print(f'Feature extraction ({repeat} calls, {n} curves x {samples} samples)')
+        t_before = _report('before: per-curve loop', _time_calls(
+            lambda: [compute_features(time_axis, row) for row in pressure], repeat))
+        t_after = _report('after:  batch', _time_calls(
+            lambda: compute_features_batch(time_axis, pressure), repeat))
+        print(f'  speed-up                     {t_before / t_after:9.1f}x')
+    return 0
+
+
+def _legacy_load_excel(path):
+    """FileHandler.load_excel_data as it was before excel_reader."""
+    import pandas as pd
+    df = pd.read_excel(path, header=None)
+    col_t, col_p = df.iloc[:, 0], df.iloc[:, 1]
+    mask = pd.to_numeric(col_t, errors='coerce').notna() & pd.to_numeric(col_p, errors='coerce').notna()
+    return (pd.to_numeric(col_t[mask], errors='coerce').tolist(),
+            pd.to_numeric(col_p[mask], errors='coerce').tolist())
+
+
+def bench_excel(repeat: int) -> int:
+    import tempfile
+    from openpyxl import Workbook
+    from app.utils.file_handler import FileHandler
+
+    n = 100_000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'capture.xlsx')
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(['时间', '压力'])
+        ws.append(['[ms]', '[MPa]'])
+        for i in range(n):
+            ws.append([i * 0.001, (i % 5000) * 0.01])
+        wb.save(path)
+
+        before = _legacy_load_excel(path)
+        after = FileHandler.load_excel_data(path)
+        if before != after:
+            print('  [ERROR]   streaming reader differs from the pandas loader')
+            return 1
+
+        print(f'Excel ingestion ({repeat} calls, {n} rows)')
+        t_before = _report('before: pandas', _time_calls(lambda: _legacy_load_excel(path), repeat))
+        t_after = _report('after:  streaming arrays', _time_calls(
+            lambda: FileHandler.load_excel_arrays(path), repeat))
+        print(f'  speed-up                     {t_before / t_after:9.1f}x')
+    return 0
+
+
+BENCHMARKS = {
+    'forward': bench_forward,
+    'search': bench_search,
+    'excel': bench_excel,
+    'features': bench_features,
+}
+
+# Timed calls per variant when --repeat is not given
+DEFAULT_REPEAT = {'forward': 200, 'search': 200, 'excel': 3, 'features': 5}
+
+
+# ── Entry point ────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description='MGG_SYS micro-benchmarks')
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=None,
+                        help='Timed calls per variant (default: see DEFAULT_REPEAT)')
+    args = parser.parse_args()
+    repeat = args.repeat or DEFAULT_REPEAT[args.benchmark]
+    sys.exit(BENCHMARKS[args.benchmark](repeat))
+
+
+if __name__ == '__main__':
+    main()
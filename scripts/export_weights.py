@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Export the current ML model into the shared weight store.
+
+Reads the newest models/*.pkl, stacks its per-timestep estimators into flat
+arrays and writes:
+  models/<model>.weights.bin   — raw little-endian arrays (np.memmap'd by workers)
+  models/<model>.weights.json  — header: array offsets/shapes, metadata
+
+gunicorn.conf.py runs the same export automatically in the master process
+when preload_app is enabled; use this script after dropping a new .pkl into
+models/ on a server started without preloading.
+
+Usage:
+    python scripts/export_weights.py
+"""
+
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+
+def main():
+    from app.utils.errors import SimulationError
+    from app.utils.model_runner import export_weight_store
+
+    try:
+        header = export_weight_store()
+    except SimulationError as exc:
+        print(f'  [ERROR]   {exc.message}')
+        sys.exit(1)
+
+    print(f"Exported:    {header['source']}")
+    print(f"Arrays:      {', '.join(header['arrays'])}")
+    print(f"Store size:  {header['store_bytes']} B")
+    print(f"Saved/worker: ~{header['unpickled_bytes']} B of unpickled estimators")
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()